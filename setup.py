@@ -0,0 +1,25 @@
+from setuptools import setup
+
+# the utils directory is installed as the mpn_aml_pairtree package, e.g.
+#   pip3 install .
+#   mpn-aml-pairtree process -h
+# modules keep finding each other through UTILS_DIR, which defaults to the installed package (see utils/__init__.py)
+
+with open("requirements.txt") as requirements:
+    install_requires = [line.strip() for line in requirements if line.strip() and not line.startswith("#")]
+
+setup(
+    name="mpn-aml-pairtree",
+    version="0.1.0",
+    description="Source code used in combination with Pairtree for studying the cancer evolution from MPN to AML",
+    url="https://github.com/ethanumn/mpn-aml-pairtree",
+    python_requires=">=3.6",
+    packages=["mpn_aml_pairtree"],
+    package_dir={"mpn_aml_pairtree": "utils"},
+    package_data={"mpn_aml_pairtree": ["*/*.py", "*/*/*.py", "*/*/*/*.py", "pipeline_scripts/*"]},
+    exclude_package_data={"mpn_aml_pairtree": ["tests/*", "*/tests/*", "*/*/tests/*"]},
+    install_requires=install_requires,
+    entry_points={
+        "console_scripts": ["mpn-aml-pairtree=mpn_aml_pairtree.cli:main"]
+    }
+)
@@ -0,0 +1,20 @@
+import os
+import sys
+
+# every module finds the rest of the tree through UTILS_DIR, so point it at the installed package if it isn't set
+os.environ.setdefault("UTILS_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+# directories of the modules the api imports, the tools and the modules they share import each other by name
+TOOL_DIRS = ["common", "ssm_file", "ssm_file/utils", "xls_file", "subpop_file", "tsv_file", "pop_file"]
+
+
+def add_tool_paths(directories=TOOL_DIRS):
+    """
+    Puts directories (relative to UTILS_DIR) on the path once, so the modules in them can be imported by name
+    """
+    for directory in directories:
+
+        path = os.path.normpath(os.path.join(os.environ["UTILS_DIR"], directory))
+
+        if path not in sys.path:
+            sys.path.append(path)
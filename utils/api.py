@@ -0,0 +1,199 @@
+import os
+
+import pandas as pd
+
+from . import add_tool_paths
+
+# the tools import each other by name (as scripts do), so they're imported by name as well, rather than loading a second copy of each
+add_tool_paths()
+
+from ssm_columns import *
+from variant_ids import Variant_Id_Registry
+from input_validation import DEFAULT_VALIDATION
+
+# python api of the pipeline, every function takes dataframes or file names and returns its result in memory, e.g.
+#   from mpn_aml_pairtree import api
+#   aggregated_df = api.aggregate("example.primary.xlsx", "example.calls.xlsx", "example.populations.xlsx")
+#   ssm_df, params = api.process(aggregated_df, processor="MPN_AML_Processor")
+#   ssm_df = api.modify(ssm_df, [{"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5]}])
+
+
+def _is_xls(value):
+    """
+    Whether value is a [<file_name or dataframe>, <sheet_name>, <header>] list (rather than a list of names)
+    """
+    return isinstance(value, (list, tuple)) and len(value) > 0 and \
+           (isinstance(value[0], pd.DataFrame) or str(value[0]).endswith((".xls", ".xlsx", ".parquet", ".pq", ".feather", ".arrow")))
+
+
+def _xls(xls, header=0):
+    """
+    Returns the [<file_name or dataframe>, <sheet_name>, <header>] list the aggregator reads a spreadsheet from
+    """
+    if isinstance(xls, (list, tuple)):
+        return list(xls)
+
+    return [xls, 0, header]
+
+
+def _ssm(ssm):
+    """
+    Returns an .ssm dataframe from a dataframe or an .ssm file
+    """
+    from modify_ssm import load_ssm
+
+    return ssm.copy() if isinstance(ssm, pd.DataFrame) else load_ssm(ssm)
+
+
+def aggregate(primary, calls, populations, out_file=None, metrics_file="", impute_technique=None, previous=None, aggregator="MPN_AML_Aggregator",
+              low_memory=False, regions="", panel_only=False, validation=DEFAULT_VALIDATION, cache_dir=""):
+    """
+    Aggregates the primary and call spreadsheets for each population, returns the aggregated dataframe.
+
+    primary, calls and previous can be dataframes, xlsx file names (first sheet) or [<file_name>, <sheet_name>] lists,
+    populations can also be a list of population names (an xlsx file of populations has no header).
+    The aggregated dataframe is only written if out_file (a file name or [<file_name>, <sheet_name>]) is passed.
+    With low_memory, the aggregated dataframe has categorical/32-bit columns (see MPN_AML_Aggregator).
+    regions (a BED/GTF file or dataframe, see region_annotation.py) fills in missing genes, with panel_only the loci outside of them are dropped.
+    Inputs missing a column, or (with validation "raise") with rows failing the integrity checks of input_validation.py,
+    raise an Input_Validation_Error (by default failing rows are only reported).
+    With cache_dir, xlsx inputs that haven't changed since an earlier run with the same cache_dir aren't parsed again.
+    """
+    from run_aggregator import aggregator_dict, IMPUTE_ZERO
+
+    if isinstance(populations, (list, tuple)) and not _is_xls(populations):
+        populations = pd.DataFrame({0: list(populations)})
+
+    if out_file and not isinstance(out_file, (list, tuple)):
+        out_file = [out_file, "Sheet1"]
+
+    return aggregator_dict[aggregator](_xls(primary),
+                                       _xls(calls),
+                                       _xls(populations, None),
+                                       list(out_file) if out_file else [],
+                                       metrics_file,
+                                       write_xls_file=bool(out_file),
+                                       impute_technique=impute_technique or IMPUTE_ZERO,
+                                       previous_xls=_xls(previous) if previous is not None else [],
+                                       low_memory=low_memory,
+                                       regions=regions,
+                                       panel_only=panel_only,
+                                       validation=validation,
+                                       cache_dir=cache_dir).aggregated_df
+
+
+def process(data, out_file="", processor="MPN_AML_Processor_Txt", previous_ssm="", id_registry="", garbage_thresholds=None, segments="", regions="",
+            panel_only=False, validation=DEFAULT_VALIDATION):
+    """
+    Processes a dataframe (or an xlsx/txt file) into an .ssm, returns (.ssm dataframe, params dictionary).
+    The .ssm and its .params.json are only written if out_file is passed.
+    garbage_thresholds overrides any of garbage_detector.GARBAGE_THRESHOLDS.
+    segments (a copy-number segments file or dataframe, see copy_number.py) sets var_read_prob from the copy number of each variant.
+    regions (a BED/GTF file or dataframe, see region_annotation.py) fills in missing genes, with panel_only the variants outside of them are dropped.
+    Rows failing the integrity checks of input_validation.py are reported, or raise an Input_Validation_Error with validation "raise".
+    """
+    from run_processor import PROCESSORS
+
+    ssm_processor = PROCESSORS[processor](data, out_file, previous_ssm=previous_ssm, id_registry=id_registry, garbage_thresholds=garbage_thresholds, segments=segments,
+                                        regions=regions, panel_only=panel_only, validation=validation)
+
+    params = ssm_processor.out_params(ssm_processor.samples_col, ssm_processor.sort_samples)
+    params[SAMPLES] = list(params[SAMPLES])
+
+    return ssm_processor.out_df[ssm_processor.COL_ORDER], params
+
+
+def modify(ssm, operations, out_file=None, id_registry=None):
+    """
+    Applies a list of operations (see run_modify_ssm.load_operations) to an .ssm dataframe (or .ssm file),
+    returns the modified dataframe. operations can also be the name of a .json/.yaml chain file.
+    For an .ssm file with a .params.json, the params remapped to the ids of the modified .ssm (see modify_ssm.remap_params)
+    are written next to out_file.
+    """
+    from run_modify_ssm import load_operations, run_operations
+    from modify_ssm import save_ssm, save_remapped_params
+    from ssm_io import params_file_for
+
+    if isinstance(operations, str):
+        operations = load_operations(operations)
+
+    dataframe = _ssm(ssm)
+
+    params_file = params_file_for(ssm) if isinstance(ssm, str) else ""
+    in_index = dataframe[[COL_ID, COL_NAME]].copy()
+
+    registry = None
+
+    if id_registry:
+        registry = Variant_Id_Registry(id_registry) if isinstance(id_registry, str) else id_registry
+        registry.register(dataframe)
+
+    dataframe = run_operations(dataframe, operations, registry)
+
+    if registry:
+        registry.save()
+
+    if out_file:
+        save_ssm(dataframe, out_file)
+
+        if os.path.isfile(params_file) and operations and operations[-1]["mod_method"] != "PYCLONE_FMT":
+            save_remapped_params(params_file, in_index, out_file)
+
+    return dataframe
+
+
+def split(ssm, params, data, out_dir):
+    """
+    Writes the rows of the original data (dataframe or .txt file) belonging to each cluster and to the garbage mutations
+    of params (a .params.json file or dictionary) into out_dir
+    """
+    from split_data import read_fn, read_params, split_data
+
+    if isinstance(params, dict):
+        clusters, garbage = params.get(CLUSTERS, []), params.get(GARBAGE, [])
+    else:
+        clusters, garbage = read_params(params)
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    split_data(_ssm(ssm), clusters, garbage, data if isinstance(data, pd.DataFrame) else read_fn(data), out_dir)
+
+
+def subpop(ssm_file, params_file, xls_file, out_file):
+    """
+    Writes the rows of the aggregated xlsx belonging to each cluster into its own sheet of out_file
+    """
+    from generate_subpop_xls import create_subpop_file
+
+    create_subpop_file(ssm_file, params_file, xls_file, out_file)
+
+
+def tsv(tsv_file, ssm_file, params_file):
+    """
+    Updates the clusters of params_file from a PyClone-VI results .tsv
+    """
+    from modify_tsv import match_tsv_to_ssm
+
+    match_tsv_to_ssm(tsv_file, ssm_file, params_file)
+
+
+def pop(populations, pops, mod_method="SELECT_POPS", out_file=None):
+    """
+    Selects (SELECT_POPS) or removes (REMOVE_POPS) pops (a list of names) from populations (a list of names,
+    a dataframe or [<file_name>, <sheet_name>, <header>]), returns the dataframe of populations
+    """
+    from run_modify_pop import MOD_METHODS
+    from modify_pop import load_excel, save_excel
+
+    if _is_xls(populations):
+        populations = load_excel(*populations)
+
+    elif not isinstance(populations, pd.DataFrame):
+        populations = pd.DataFrame({0: list(populations)})
+
+    dataframe = MOD_METHODS[mod_method](populations, pd.DataFrame({0: list(pops)}))
+
+    if out_file:
+        save_excel(dataframe, *out_file)
+
+    return dataframe
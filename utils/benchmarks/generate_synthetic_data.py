@@ -0,0 +1,289 @@
+import argparse
+import json
+import sys, os
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+
+import mpn_aml_columns as xls_cols
+import mpn_aml_columns_txt as txt_cols
+from ssm_columns import *
+
+# to generate a cohort, use the following command:
+#   python3 $UTILS_DIR/benchmarks/generate_synthetic_data.py -o $DATA_DIR/synthetic/ -l 1000 -s 20 -c 5
+
+
+CHROMOSOMES = ["chr" + str(num) for num in range(1, 23)] + ["chrX", "chrY"]
+
+PATIENT = "patient"
+CELLS = "cells"
+SAMPLE = "sample"
+
+# pyclone-vi output columns read by match_tsv_to_ssm
+MUTATION_ID = "mutation_id"
+SAMPLE_ID = "sample_id"
+CLUSTER_ID = "cluster_id"
+CELLULAR_PREVALENCE = "cellular_prevalence"
+
+
+def simulate_cohort(n_loci, n_samples, n_clusters, mean_depth=100, seed=0):
+    """
+    Simulates a single patient with n_samples samples and n_loci variants spread over n_clusters clusters.
+
+    Returns a dictionary containing the per locus annotations (chromosome, position, gene, cluster, copy number)
+    and the (n_loci x n_samples) var_reads/total_reads matrices.
+    """
+    rng = np.random.default_rng(seed)
+
+    n_clusters = max(1, min(n_clusters, n_loci))
+
+    # unique positions across the genome make both <gene>_<position> and <chromosome>_<position> names unique
+    positions = rng.choice(np.arange(1000, 1000 + 100 * n_loci), size=n_loci, replace=False)
+    chromosomes = rng.choice(CHROMOSOMES, size=n_loci)
+    genes = np.array(["G" + str(number) for number in rng.integers(0, max(1, n_loci // 3), size=n_loci)])
+
+    # every cluster gets at least one locus
+    clusters = np.concatenate([np.arange(n_clusters), rng.integers(0, n_clusters, size=n_loci - n_clusters)])
+    rng.shuffle(clusters)
+
+    # cellular prevalence of each cluster in each sample
+    prevalence = rng.uniform(0.0, 1.0, size=(n_clusters, n_samples))
+
+    copy_number = rng.choice([1, 2, 3], size=n_loci, p=[0.05, 0.9, 0.05])
+    sex_chromosome = np.isin(chromosomes, ["chrX", "chrY"])
+    var_read_prob = np.where(sex_chromosome | (copy_number == 1), 1.0, 1 / copy_number)
+
+    total_reads = rng.poisson(mean_depth, size=(n_loci, n_samples)) + 1
+    vaf = np.clip(prevalence[clusters] * var_read_prob[:, None], 0.0, 1.0)
+    var_reads = rng.binomial(total_reads, vaf)
+
+    return {
+        xls_cols.CHR: chromosomes,
+        xls_cols.POSITION: positions,
+        xls_cols.GENE: genes,
+        CLUSTERS: clusters,
+        txt_cols.COPY_NUMBER: copy_number,
+        COL_VAR_READ_PROB: var_read_prob,
+        COL_VAR_READS: var_reads,
+        COL_TOTAL_READS: total_reads,
+        SAMPLES: ["S" + str(number) for number in range(0, n_samples)],
+        CELLULAR_PREVALENCE: prevalence
+    }
+
+
+def cohort_long_df(cohort):
+    """
+    Flattens a simulated cohort into one row per locus x sample
+    """
+    n_loci, n_samples = cohort[COL_VAR_READS].shape
+
+    long_df = pd.DataFrame({
+        xls_cols.CHR: np.repeat(cohort[xls_cols.CHR], n_samples),
+        xls_cols.POSITION: np.repeat(cohort[xls_cols.POSITION], n_samples),
+        xls_cols.GENE: np.repeat(cohort[xls_cols.GENE], n_samples),
+        xls_cols.SAMPLE_NAMES: np.tile(cohort[SAMPLES], n_loci),
+        xls_cols.ALT_DEPTH: cohort[COL_VAR_READS].ravel(),
+        xls_cols.REF_DEPTH: (cohort[COL_TOTAL_READS] - cohort[COL_VAR_READS]).ravel(),
+        txt_cols.COPY_NUMBER: np.repeat(cohort[txt_cols.COPY_NUMBER], n_samples)
+    })
+
+    long_df[xls_cols.VAF] = (long_df[xls_cols.ALT_DEPTH] / (long_df[xls_cols.ALT_DEPTH] + long_df[xls_cols.REF_DEPTH])).round(2)
+
+    return long_df
+
+
+def primary_calls_dfs(cohort, primary_vaf=0.05, calls_fraction=0.5, seed=0):
+    """
+    Returns the (primary, calls) dataframes in the format read by MPN_AML_Aggregator.
+
+    The primary sheet contains the locus x sample cells with a VAF above primary_vaf (and at least one cell per locus),
+    the calls sheet contains every primary cell plus a random calls_fraction of the remaining cells.
+    """
+    rng = np.random.default_rng(seed)
+
+    long_df = cohort_long_df(cohort)
+    long_df.insert(0, PATIENT, "Pt0")
+
+    n_samples = len(cohort[SAMPLES])
+
+    in_primary = (long_df[xls_cols.VAF] > primary_vaf).values
+
+    # make sure that every locus shows up in the primary sheet at least once
+    strongest_sample = cohort[COL_VAR_READS].argmax(axis=1) + np.arange(0, len(cohort[COL_VAR_READS])) * n_samples
+    in_primary[strongest_sample] = True
+
+    in_calls = in_primary | (rng.uniform(size=len(long_df)) < calls_fraction)
+
+    primary_df = long_df.loc[in_primary, [PATIENT, xls_cols.SAMPLE_NAMES, xls_cols.CHR, xls_cols.POSITION,
+                                          xls_cols.REF_DEPTH, xls_cols.ALT_DEPTH, xls_cols.VAF, xls_cols.GENE]]
+
+    calls_df = long_df.loc[in_calls, [PATIENT, xls_cols.SAMPLE_NAMES, xls_cols.CHR, xls_cols.POSITION,
+                                      xls_cols.REF_DEPTH, xls_cols.ALT_DEPTH, xls_cols.VAF]]
+    calls_df = calls_df.rename(columns={xls_cols.CHR: xls_cols.SEQNAMES, xls_cols.POSITION: xls_cols.START})
+
+    return primary_df.reset_index(drop=True), calls_df.reset_index(drop=True)
+
+
+def txt_df(cohort):
+    """
+    Returns a dataframe in the tab separated format read by MPN_AML_Processor_Txt
+    """
+    long_df = cohort_long_df(cohort)
+
+    return pd.DataFrame({
+        txt_cols.CHR: long_df[xls_cols.CHR],
+        txt_cols.START: long_df[xls_cols.POSITION],
+        txt_cols.END: long_df[xls_cols.POSITION],
+        txt_cols.REF: "A",
+        txt_cols.ALT: "T",
+        txt_cols.REGION: "exonic",
+        txt_cols.GENE: long_df[xls_cols.GENE],
+        txt_cols.SAMPLEA: long_df[xls_cols.SAMPLE_NAMES],
+        txt_cols.ID: "Pt0",
+        txt_cols.SAMPLEB: long_df[xls_cols.SAMPLE_NAMES],
+        txt_cols.TIMEPOINT: long_df[xls_cols.SAMPLE_NAMES],
+        txt_cols.VAR_READS: long_df[xls_cols.ALT_DEPTH],
+        txt_cols.TOTAL_READS: long_df[xls_cols.ALT_DEPTH] + long_df[xls_cols.REF_DEPTH],
+        txt_cols.COPY_NUMBER: long_df[txt_cols.COPY_NUMBER]
+    })
+
+
+def ssm_df(cohort):
+    """
+    Returns an .ssm dataframe with <chromosome>_<position> names (matching the rows of txt_df)
+    """
+    array_string = lambda matrix: [", ".join(map(str, row)) for row in matrix]
+
+    n_loci, n_samples = cohort[COL_VAR_READS].shape
+
+    return pd.DataFrame({
+        COL_ID: ["s" + str(number) for number in range(0, n_loci)],
+        COL_NAME: [chr + "_" + str(pos) for chr, pos in zip(cohort[xls_cols.CHR], cohort[xls_cols.POSITION])],
+        COL_VAR_READS: array_string(cohort[COL_VAR_READS]),
+        COL_TOTAL_READS: array_string(cohort[COL_TOTAL_READS]),
+        COL_VAR_READ_PROB: array_string(np.repeat(cohort[COL_VAR_READ_PROB][:, None], n_samples, axis=1))
+    })
+
+
+def params_dict(cohort, garbage_fraction=0.05, seed=0):
+    """
+    Returns the contents of a .params.json file with the simulated clusters and a random subset of garbage ids
+    """
+    rng = np.random.default_rng(seed)
+
+    ids = np.array(["s" + str(number) for number in range(0, len(cohort[CLUSTERS]))])
+    is_garbage = rng.uniform(size=len(ids)) < garbage_fraction
+
+    clusters = [ids[(cohort[CLUSTERS] == cluster) & ~is_garbage].tolist() for cluster in np.unique(cohort[CLUSTERS])]
+
+    return {
+        SAMPLES: cohort[SAMPLES],
+        CLUSTERS: [cluster for cluster in clusters if cluster],
+        GARBAGE: ids[is_garbage].tolist()
+    }
+
+
+def pyclone_tsv_df(cohort):
+    """
+    Returns a dataframe in the format of PyClone-VI output (used by match_tsv_to_ssm)
+    """
+    n_loci, n_samples = cohort[COL_VAR_READS].shape
+
+    names = [chr + "_" + str(pos) for chr, pos in zip(cohort[xls_cols.CHR], cohort[xls_cols.POSITION])]
+
+    return pd.DataFrame({
+        MUTATION_ID: np.repeat(names, n_samples),
+        SAMPLE_ID: np.tile(cohort[SAMPLES], n_loci),
+        CLUSTER_ID: np.repeat(cohort[CLUSTERS], n_samples),
+        CELLULAR_PREVALENCE: cohort[CELLULAR_PREVALENCE][cohort[CLUSTERS]].ravel()
+    })
+
+
+def cells_df(cohort, seed=0):
+    """
+    Returns a dataframe of estimated cell counts per sample (used by SCALE_COUNTS)
+    """
+    rng = np.random.default_rng(seed)
+
+    return pd.DataFrame({
+        SAMPLE: cohort[SAMPLES],
+        CELLS: rng.integers(10, 50, size=len(cohort[SAMPLES]))
+    })
+
+
+def write_cohort(out_dir, prefix="synthetic", n_loci=100, n_samples=10, n_clusters=5, seed=0, write_xls=True):
+    """
+    Simulates a cohort and writes every input file used by the tools in this repository to out_dir.
+    Returns a dictionary of the file names that were written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    cohort = simulate_cohort(n_loci, n_samples, n_clusters, seed=seed)
+
+    files = {
+        "txt": os.path.join(out_dir, prefix + ".txt"),
+        "ssm": os.path.join(out_dir, prefix + ".ssm"),
+        "params": os.path.join(out_dir, prefix + ".params.json"),
+        "tsv": os.path.join(out_dir, prefix + ".pyclone.tsv"),
+        "cells": os.path.join(out_dir, prefix + ".cells.csv"),
+        "names": os.path.join(out_dir, prefix + ".names.txt")
+    }
+
+    txt_df(cohort).to_csv(files["txt"], sep="\t", index=False)
+
+    out_ssm_df = ssm_df(cohort)
+    out_ssm_df.to_csv(files["ssm"], sep="\t", index=False)
+
+    with open(files["params"], "w") as params_json:
+        json.dump(params_dict(cohort, seed=seed), params_json)
+
+    pyclone_tsv_df(cohort).to_csv(files["tsv"], sep="\t", index=False)
+    cells_df(cohort, seed=seed).to_csv(files["cells"], sep=",", index=False)
+
+    # keep every other variant
+    with open(files["names"], "w") as names_file:
+        names_file.write("\n".join(out_ssm_df[COL_NAME].values[::2]))
+
+    if write_xls:
+
+        files["primary"] = os.path.join(out_dir, prefix + ".primary.xlsx")
+        files["calls"] = os.path.join(out_dir, prefix + ".calls.xlsx")
+        files["populations"] = os.path.join(out_dir, prefix + ".populations.xlsx")
+
+        primary_df, calls_df = primary_calls_dfs(cohort, seed=seed)
+
+        primary_df.to_excel(files["primary"], sheet_name="Sheet1", index=False)
+        calls_df.to_excel(files["calls"], sheet_name="Sheet1", index=False)
+        pd.DataFrame(cohort[SAMPLES]).to_excel(files["populations"], sheet_name="Sheet1", header=False, index=False)
+
+    return files
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+
+        description='Generate a synthetic cohort (primary/calls/populations xlsx, txt, .ssm, .params.json, ...) for testing and benchmarking.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+
+    )
+
+    parser.add_argument('-o', '--out-dir', help='Directory to write synthetic files to', required=True)
+    parser.add_argument('-x', '--prefix', default="synthetic", help='Prefix of every file written')
+    parser.add_argument('-l', '--loci', type=int, default=100, help='Number of loci (variants)')
+    parser.add_argument('-s', '--samples', type=int, default=10, help='Number of samples')
+    parser.add_argument('-c', '--clusters', type=int, default=5, help='Number of clusters')
+    parser.add_argument('-r', '--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--no-xls', action='store_true', help='Do not write the primary/calls/populations xlsx files')
+
+    args = parser.parse_args()
+
+    files = write_cohort(args.out_dir, args.prefix, args.loci, args.samples, args.clusters, args.seed, not args.no_xls)
+
+    for file_type, file_name in files.items():
+        print("%-12s%s" % (file_type, file_name))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,293 @@
+import argparse
+import json
+import operator
+import shutil
+import subprocess
+import sys, os
+import time
+import tracemalloc
+
+sys.path.append(os.environ["UTILS_DIR"])
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/benchmarks")
+sys.path.append(os.environ["UTILS_DIR"] + "/xls_file/xls_aggregators")
+sys.path.append(os.environ["UTILS_DIR"] + "/ssm_file/ssm_processors")
+sys.path.append(os.environ["UTILS_DIR"] + "/ssm_file/utils")
+sys.path.append(os.environ["UTILS_DIR"] + "/subpop_file")
+sys.path.append(os.environ["UTILS_DIR"] + "/tsv_file")
+
+from ssm_columns import *
+from generate_synthetic_data import write_cohort
+
+# to run the benchmarks, use the following command:
+#   python3 $UTILS_DIR/benchmarks/run_benchmarks.py -o $DATA_DIR/benchmarks/ -l 1000 -s 20 -c 5
+# and compare against the results of an earlier commit with:
+#   python3 $UTILS_DIR/benchmarks/run_benchmarks.py -o $DATA_DIR/benchmarks/ -l 1000 -s 20 -c 5 --compare $DATA_DIR/benchmarks/results/<commit>.json
+
+
+def mod_method_args(files):
+    """
+    Arguments passed to each MOD_METHOD (after the loaded .ssm dataframe), built in the same way as run_modify_ssm.py does
+    """
+    with open(files["names"]) as names_file:
+        names = names_file.read().splitlines()
+
+    # a BED file with a 1bp region around the same loci as the names (<chromosome>_<position>)
+    regions_bed = os.path.join(os.path.dirname(files["names"]), "regions.bed")
+
+    with open(regions_bed, "w") as bed_file:
+        bed_file.write("".join("%s\t%d\t%s\n" % (chromosome, int(position) - 1, position) for chromosome, position in (name.rsplit("_", 1) for name in names)))
+
+    return {
+        "RM_VARS_BY_VAF": [operator.gt, 0.5],
+        "ORG_VARS_BY_VAF": [operator.gt, 0.5, "1.0"],
+        "SCALE_COUNTS": [files["params"], files["cells"]],
+        "SEPARATE_GARBAGE": [files["params"]],
+        "KEEP_VARS_BY_NAME": [names],
+        "KEEP_VARS_IN_REGIONS": [regions_bed],
+        "PYCLONE_FMT": [files["params"]]
+    }
+
+
+def collect_benchmarks(files, work_dir):
+    """
+    Returns a list of (name, function) pairs, in the order they have to be run in.
+    Each function runs one tool in-process on the synthetic cohort described by files.
+    """
+    from mpn_aml_aggregator import MPN_AML_Aggregator
+    from mpn_aml_processor import MPN_AML_Processor
+    from mpn_aml_processor_txt import MPN_AML_Processor_Txt
+    from run_modify_ssm import MOD_METHODS
+    from modify_ssm import load_ssm, save_ssm, partition_ssm
+    from ssm_io import iter_ssm
+    from split_data import read_fn, read_params, split_data
+    from generate_subpop_xls import create_subpop_file
+    from modify_tsv import match_tsv_to_ssm
+    from run_pipeline import run_pipeline
+
+    aggregated_xlsx = os.path.join(work_dir, "bench.aggregated.xlsx")
+    xls_ssm = os.path.join(work_dir, "bench.xls.ssm")
+    txt_ssm = os.path.join(work_dir, "bench.txt.ssm")
+
+    benchmarks = []
+
+    benchmarks.append(("aggregator:MPN_AML_Aggregator", lambda: MPN_AML_Aggregator(
+        primary_xls=[files["primary"], "Sheet1"],
+        calls_xls=[files["calls"], "Sheet1"],
+        populations_xls=[files["populations"], "Sheet1", None],
+        aggregated_xls=[aggregated_xlsx, "Sheet1"]
+    )))
+
+    # the same aggregation with categorical/32-bit columns, to compare the peak memory of both
+    benchmarks.append(("aggregator:MPN_AML_Aggregator:low_memory", lambda: MPN_AML_Aggregator(
+        primary_xls=[files["primary"], "Sheet1"],
+        calls_xls=[files["calls"], "Sheet1"],
+        populations_xls=[files["populations"], "Sheet1", None],
+        aggregated_xls=[os.path.join(work_dir, "bench.aggregated.low_memory.xlsx"), "Sheet1"],
+        low_memory=True
+    )))
+
+    benchmarks.append(("processor:MPN_AML_Processor", lambda: MPN_AML_Processor(aggregated_xlsx, xls_ssm)))
+
+    # the same aggregate -> process steps (and a modification), handing off dataframes in memory instead of through the xlsx
+    benchmarks.append(("pipeline:run_pipeline", lambda: run_pipeline(
+        [files["primary"], "Sheet1"],
+        [files["calls"], "Sheet1"],
+        [files["populations"], "Sheet1", None],
+        os.path.join(work_dir, "bench.pipeline.ssm"),
+        [{"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5]}]
+    )))
+    benchmarks.append(("processor:MPN_AML_Processor_Txt", lambda: MPN_AML_Processor_Txt(files["txt"], txt_ssm)))
+
+    # every method of run_modify_ssm (load -> modify -> save, as run_modify_ssm.py does)
+    method_args = mod_method_args(files)
+
+    def modify(mod_method):
+        def run():
+            if mod_method not in method_args:
+                raise NotImplementedError("no benchmark arguments defined for %s" % mod_method)
+            save_ssm(MOD_METHODS[mod_method](load_ssm(files["ssm"]), *method_args[mod_method]),
+                     os.path.join(work_dir, "bench.%s.ssm" % mod_method.lower()))
+        return run
+
+    for mod_method in MOD_METHODS:
+        benchmarks.append(("modify_ssm:" + mod_method, modify(mod_method)))
+
+    # every cluster and the garbage mutations written in one pass (run_modify_ssm.py -m PARTITION)
+    benchmarks.append(("modify_ssm:PARTITION", lambda: partition_ssm(iter_ssm(files["ssm"]), files["params"], os.path.join(work_dir, "bench.partition.ssm"))))
+
+    def split():
+        split_dir = os.path.join(work_dir, "split")
+        os.makedirs(split_dir, exist_ok=True)
+        clusters, garbage = read_params(files["params"])
+        split_data(read_fn(files["ssm"]), clusters, garbage, read_fn(files["txt"]), split_dir)
+
+    benchmarks.append(("split_data", split))
+
+    def subpop():
+        # the aggregated xlsx is looked up by <gene>_<position>, so we use the .ssm produced by MPN_AML_Processor
+        xls_params = xls_ssm.replace(".ssm", ".params.json")
+        with open(xls_params) as params_json:
+            params_data = json.load(params_json)
+        ids = load_ssm(xls_ssm)[COL_ID].values.tolist()
+        params_data[CLUSTERS] = [ids[i::3] for i in range(0, 3) if ids[i::3]]
+        with open(xls_params, "w") as params_json:
+            json.dump(params_data, params_json)
+        create_subpop_file(xls_ssm, xls_params, aggregated_xlsx, os.path.join(work_dir, "bench.subpops.xlsx"))
+
+    benchmarks.append(("subpop:create_subpop_file", subpop))
+
+    def tsv():
+        # match_tsv_to_ssm overwrites the params file, so work on a copy
+        params_copy = os.path.join(work_dir, "bench.tsv.params.json")
+        shutil.copyfile(files["params"], params_copy)
+        match_tsv_to_ssm(files["tsv"], files["ssm"], params_copy)
+
+    benchmarks.append(("tsv:match_tsv_to_ssm", tsv))
+
+    return benchmarks
+
+
+def measure(function, repeat=1, memory=True):
+    """
+    Returns (best wall time in seconds over repeat runs, peak traced memory in MB).
+    Memory is measured in a separate run since tracing allocations slows down the timed runs.
+    """
+    timings = []
+
+    for _ in range(0, repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    peak_mb = None
+
+    if memory:
+        tracemalloc.start()
+        function()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    return min(timings), peak_mb
+
+
+def git_commit():
+    """
+    Returns the short hash of the current commit (with a -dirty suffix for uncommitted changes)
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.environ["UTILS_DIR"], stderr=subprocess.DEVNULL).decode().strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=os.environ["UTILS_DIR"]).decode().strip()
+        return commit + ("-dirty" if dirty else "")
+    except (subprocess.CalledProcessError, OSError):
+        return "unknown"
+
+
+def run_benchmarks(out_dir, n_loci, n_samples, n_clusters, seed=0, repeat=1, memory=True, only=None):
+    """
+    Generates a synthetic cohort in out_dir and runs every benchmark against it.
+    Returns a dictionary describing the run (commit, sizes, and per benchmark timings).
+    """
+    data_dir = os.path.join(out_dir, "data_l%d_s%d_c%d" % (n_loci, n_samples, n_clusters))
+    work_dir = os.path.join(data_dir, "work")
+    os.makedirs(work_dir, exist_ok=True)
+
+    files = write_cohort(data_dir, "synthetic", n_loci, n_samples, n_clusters, seed)
+
+    results = []
+
+    for name, function in collect_benchmarks(files, work_dir):
+
+        if only and not any(pattern in name for pattern in only):
+            continue
+
+        result = {"name": name, "seconds": None, "peak_mb": None, "error": None}
+
+        try:
+            result["seconds"], result["peak_mb"] = measure(function, repeat, memory)
+        except Exception as e:
+            result["error"] = "%s: %s" % (type(e).__name__, e)
+
+        results.append(result)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "sizes": {"loci": n_loci, "samples": n_samples, "clusters": n_clusters, "seed": seed},
+        "results": results
+    }
+
+
+def print_report(run, baseline=None):
+    """
+    Prints a table of timings and peak memory (with the speedup relative to a baseline run if passed)
+    """
+    baseline_results = {}
+
+    if baseline:
+        baseline_results = {result["name"]: result for result in baseline["results"]}
+        print("Comparing %s against %s" % (run["commit"], baseline["commit"]))
+
+    print("%-36s%12s%12s%10s" % ("benchmark", "seconds", "peak MB", "speedup"))
+
+    for result in run["results"]:
+
+        if result["error"]:
+            print("%-36s%s" % (result["name"], "ERROR " + result["error"]))
+            continue
+
+        speedup = ""
+        base = baseline_results.get(result["name"])
+
+        if base and base["seconds"]:
+            speedup = "%.2fx" % (base["seconds"] / result["seconds"])
+
+        print("%-36s%12.4f%12s%10s" % (result["name"], result["seconds"],
+                                       "%.1f" % result["peak_mb"] if result["peak_mb"] is not None else "-", speedup))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+
+        description='Benchmark the aggregator, processors, modification methods, and file utilities on synthetic data.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+
+    )
+
+    parser.add_argument('-o', '--out-dir', help='Directory to write synthetic data and results to', required=True)
+    parser.add_argument('-l', '--loci', type=int, default=200, help='Number of loci (variants)')
+    parser.add_argument('-s', '--samples', type=int, default=10, help='Number of samples')
+    parser.add_argument('-c', '--clusters', type=int, default=5, help='Number of clusters')
+    parser.add_argument('-r', '--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('-n', '--repeat', type=int, default=1, help='Number of timed runs per benchmark (best is reported)')
+    parser.add_argument('-k', '--only', nargs='+', help='Only run benchmarks whose name contains one of these strings')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the (slower) peak memory measurement')
+    parser.add_argument('--compare', help='Results file of an earlier run to compare against')
+
+    args = parser.parse_args()
+
+    run = run_benchmarks(args.out_dir, args.loci, args.samples, args.clusters, args.seed, args.repeat, not args.no_memory, args.only)
+
+    # results are saved per commit so they can be compared later
+    results_dir = os.path.join(args.out_dir, "results")
+    os.makedirs(results_dir, exist_ok=True)
+
+    results_file = os.path.join(results_dir, "%s.l%d_s%d_c%d.json" % (run["commit"], args.loci, args.samples, args.clusters))
+
+    with open(results_file, "w") as results_json:
+        json.dump(run, results_json, indent=2)
+
+    baseline = None
+
+    if args.compare:
+        with open(args.compare) as baseline_json:
+            baseline = json.load(baseline_json)
+
+    print_report(run, baseline)
+    print("Results written to %s" % results_file)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,112 @@
+import argparse
+import json
+import subprocess
+import sys, os
+
+# to check the import time of every command line entry point, use the following command:
+#   python3 $UTILS_DIR/benchmarks/startup.py
+
+
+# command line entry points (relative to UTILS_DIR)
+CLI_ENTRY_POINTS = {
+    "run_processor": "ssm_file/run_processor.py",
+    "run_aggregator": "xls_file/run_aggregator.py",
+    "run_modify_ssm": "ssm_file/utils/run_modify_ssm.py",
+    "split_data": "ssm_file/utils/split_data.py",
+    "generate_subpop_xls": "subpop_file/generate_subpop_xls.py",
+    "tsv_to_ssm": "tsv_file/tsv_to_ssm.py",
+    "run_modify_pop": "pop_file/run_modify_pop.py",
+    "variant_db": "db_file/variant_db.py"
+}
+
+# import time budget of each entry point, as a multiple of the time it takes to import pandas
+# (every entry point needs pandas, anything on top of that should be small)
+IMPORT_BUDGETS = {
+    "run_processor": 1.75,
+    "run_aggregator": 1.75,
+    "run_modify_ssm": 1.75,
+    "split_data": 1.75,
+    "generate_subpop_xls": 1.75,
+    "tsv_to_ssm": 1.75,
+    "run_modify_pop": 1.75,
+    "variant_db": 1.75
+}
+
+# heavy modules that should only be imported once the code path that needs them runs
+LAZY_MODULES = ["matplotlib", "tqdm", "openpyxl"]
+
+
+IMPORT_SCRIPT = """
+import json, sys, time
+sys.path.insert(0, %r)
+start = time.perf_counter()
+import %s
+print(json.dumps([time.perf_counter() - start, sorted(set(name.split(".")[0] for name in sys.modules))]))
+"""
+
+
+def measure_import(module_path, repeat=3):
+    """
+    Returns (best time in seconds to import module_path in a fresh interpreter, lazy modules it imported).
+    module_path can also be the name of an installed module (e.g. "pandas").
+    """
+    if module_path.endswith(".py"):
+        module_dir, module_name = os.path.dirname(module_path), os.path.basename(module_path)[:-len(".py")]
+    else:
+        module_dir, module_name = "", module_path
+
+    timings, modules = [], []
+
+    for _ in range(0, repeat):
+        output = subprocess.check_output([sys.executable, "-c", IMPORT_SCRIPT % (module_dir, module_name)], env=os.environ)
+        seconds, modules = json.loads(output.decode().strip().splitlines()[-1])
+        timings.append(seconds)
+
+    return min(timings), [module for module in LAZY_MODULES if module in modules]
+
+
+def check_startup(repeat=3):
+    """
+    Measures every entry point against its budget.
+    Returns a list of (name, seconds, budget in seconds, lazy modules imported, passed).
+    """
+    baseline, _ = measure_import("pandas", repeat)
+
+    results = []
+
+    for name, path in CLI_ENTRY_POINTS.items():
+
+        seconds, lazy_modules = measure_import(os.path.join(os.environ["UTILS_DIR"], path), repeat)
+        budget = IMPORT_BUDGETS[name] * baseline
+
+        results.append((name, seconds, budget, lazy_modules, seconds <= budget and not lazy_modules))
+
+    return results
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+
+        description='Check the import time of every command line entry point against its budget.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+
+    )
+
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='Number of fresh interpreters to import each entry point in (best is reported)')
+
+    args = parser.parse_args()
+
+    results = check_startup(args.repeat)
+
+    print("%-24s%12s%12s  %s" % ("entry point", "seconds", "budget", "lazy modules imported"))
+
+    for name, seconds, budget, lazy_modules, passed in results:
+        print("%-24s%12.3f%12.3f  %s%s" % (name, seconds, budget, ", ".join(lazy_modules) or "-", "" if passed else "  FAILED"))
+
+    if not all(result[-1] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,33 @@
+import unittest
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from startup import check_startup
+
+
+class Startup_Tests(unittest.TestCase):
+    """
+    Test cases for the import time of the command line entry points.
+    use 'python3 test_startup.py' to run the test suite
+    """
+    @classmethod
+    def setUpClass(cls):
+
+        cls.results = check_startup()
+
+
+    def test_no_eager_heavy_imports(self):
+        for name, seconds, budget, lazy_modules, passed in self.results:
+            self.assertEqual(lazy_modules, [], '%s imports %s at startup' % (name, ", ".join(lazy_modules)))
+
+
+    # wall-clock budgets depend on the machine and its load, so they're only checked on request (or with startup.py)
+    @unittest.skipUnless(os.environ.get("CHECK_IMPORT_BUDGETS"), "set CHECK_IMPORT_BUDGETS=1 to check the import time budgets")
+    def test_import_budget(self):
+        for name, seconds, budget, lazy_modules, passed in self.results:
+            self.assertLessEqual(seconds, budget, '%s took %.3fs to import (budget %.3fs)' % (name, seconds, budget))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import importlib
+import os
+import sys
+
+from . import add_tool_paths
+
+# single entry point for every command line tool, e.g.
+#   mpn-aml-pairtree process -d $DATA_DIR/example/results/ -i example.aggregated.xlsx -o example.output.ssm -p MPN_AML_Processor
+# is the same as
+#   python3 $UTILS_DIR/ssm_file/run_processor.py -d $DATA_DIR/example/results/ -i example.aggregated.xlsx -o example.output.ssm -p MPN_AML_Processor
+
+
+# NEED to add any command line tool you want to be available as a subcommand (<directory relative to UTILS_DIR>, <module>)
+SUBCOMMANDS = {
+    "aggregate": ("xls_file", "run_aggregator"),
+    "process": ("ssm_file", "run_processor"),
+    "modify": ("ssm_file/utils", "run_modify_ssm"),
+    "split": ("ssm_file/utils", "split_data"),
+    "subpop": ("subpop_file", "generate_subpop_xls"),
+    "tsv": ("tsv_file", "tsv_to_ssm"),
+    "pop": ("pop_file", "run_modify_pop"),
+    "db": ("db_file", "variant_db"),
+    "daemon": ("daemon", "pipeline_daemon"),
+    "pipeline": ("", "run_pipeline"),
+    "batch": ("", "run_batch")
+}
+
+USAGE = """usage: mpn-aml-pairtree <subcommand> [arguments ...]
+
+subcommands (use mpn-aml-pairtree <subcommand> -h for their arguments):
+%s
+""" % "\n".join("  %-12s%s" % (name, os.path.join(directory, module + ".py")) for name, (directory, module) in SUBCOMMANDS.items())
+
+
+def main(argv=None):
+    """
+    Runs the main() of the tool named by the first argument with the rest of the arguments
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    if not argv or argv[0] in ("-h", "--help"):
+        print(USAGE)
+        return
+
+    if argv[0] not in SUBCOMMANDS:
+        sys.stderr.write("unknown subcommand %s\n\n%s" % (argv[0], USAGE))
+        sys.exit(2)
+
+    directory, module = SUBCOMMANDS[argv[0]]
+
+    # tools import their neighbouring modules by name, so their directory has to be on the path
+    add_tool_paths([directory])
+
+    # the tools parse sys.argv themselves
+    sys.argv = ["mpn-aml-pairtree " + argv[0]] + argv[1:]
+
+    importlib.import_module(".".join([""] + directory.split("/") + [module]) if directory else "." + module, __package__).main()
+
+
+if __name__ == '__main__':
+  main()
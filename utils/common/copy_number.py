@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+from table_io import read_table, table_format, FORMAT_XLSX
+from interval_index import Interval_Index, locus_names
+
+
+# columns of a copy-number segments file (closed, 1-based [start, end] segments), major/minor copy numbers and sample are optional
+SEG_CHR = "chr"
+SEG_START = "start"
+SEG_END = "end"
+SEG_CN = "cn"
+SEG_MAJOR_CN = "major_cn"
+SEG_MINOR_CN = "minor_cn"
+SEG_SAMPLE = "sample"
+
+SEG_COLUMNS = [SEG_CHR, SEG_START, SEG_END, SEG_CN]
+
+
+def read_segments(segments):
+    """
+    Returns the dataframe of a segments file (tab separated, .csv, or an excel/parquet/feather table), a dataframe is returned as is
+    """
+    if isinstance(segments, pd.DataFrame):
+        return segments
+
+    if segments.endswith(".csv"):
+        return pd.read_csv(segments)
+
+    if table_format(segments) != FORMAT_XLSX or segments.endswith((".xls", ".xlsx")):
+        return read_table(segments)
+
+    return pd.read_csv(segments, sep="\t")
+
+
+def major_minor_cn(copy_numbers):
+    """
+    Returns the (major, minor) copy numbers of total copy numbers without an allele-specific call:
+    a minor copy number of 1 (0 with fewer than 2 copies) and the rest on the major allele
+    """
+    copy_numbers = np.round(np.asarray(copy_numbers, dtype="float64"))
+
+    minor = np.minimum(1, np.floor(copy_numbers / 2))
+
+    return copy_numbers - minor, minor
+
+
+def cn_var_read_prob(copy_numbers):
+    """
+    Returns the var_read_prob of clonal variants on one of copy_numbers copies (1/copy number, rounded to 3 decimals),
+    1.0 with a copy number of 1 (assumed to be a LOH of the reference allele) and NaN with a copy number of 0 (not present)
+    """
+    copy_numbers = np.asarray(copy_numbers, dtype="float64")
+
+    with np.errstate(divide="ignore"):
+        var_read_prob = np.round(1 / copy_numbers, 3)
+
+    var_read_prob[copy_numbers == 1] = 1.0
+    var_read_prob[copy_numbers == 0] = np.nan
+
+    return var_read_prob
+
+
+class Copy_Number_Segments:
+    """
+    Assigns the copy number of the segment each variant is in, looked up in an Interval_Index of the segments.
+    If the segments have a sample column, variants are only matched to the segments of their own sample.
+    """
+
+    def __init__(self, segments):
+
+        self.segments_df = read_segments(segments)
+
+        missing = [column for column in SEG_COLUMNS if column not in self.segments_df.columns]
+
+        if missing:
+            raise ValueError("copy-number segments are missing the column(s) %s" % ", ".join(missing))
+
+        self.by_sample = SEG_SAMPLE in self.segments_df.columns
+
+        # allele-specific copy numbers are derived from the total copy number if they're not in the file
+        if SEG_MAJOR_CN not in self.segments_df.columns or SEG_MINOR_CN not in self.segments_df.columns:
+            major, minor = major_minor_cn(self.segments_df[SEG_CN])
+            self.segments_df = self.segments_df.assign(**{SEG_MAJOR_CN: major, SEG_MINOR_CN: minor})
+
+        self.index = Interval_Index(self.segments_df[SEG_CHR], self.segments_df[SEG_START], self.segments_df[SEG_END],
+                                    self.segments_df[SEG_SAMPLE] if self.by_sample else None)
+
+
+    def annotate(self, chromosomes, positions, samples=None):
+        """
+        Returns a dataframe with the cn, major_cn and minor_cn of the segment of each variant (NaN for variants in no segment)
+        """
+        rows = self.index.lookup(chromosomes, positions, samples if self.by_sample else None)
+
+        found = rows >= 0
+
+        return pd.DataFrame({
+            column: np.where(found, self.segments_df[column].values.astype("float64")[np.clip(rows, 0, None)], np.nan)
+            for column in [SEG_CN, SEG_MAJOR_CN, SEG_MINOR_CN]
+        })
+
+
+def pyclone_copy_numbers(names, samples, var_read_prob, segments=None, loci=None):
+    """
+    Returns the (loci x samples) major and minor copy numbers given to PyClone-VI for .ssm loci: those of the segment
+    a locus is in (see Copy_Number_Segments), otherwise 2 and 0 for a var_read_prob above 0.5 and 1 and 1 for the rest.
+    Loci are found from their <chromosome>_<position> names, other names are looked up in loci (see interval_index.locus_names).
+    """
+    var_read_prob = np.asarray(var_read_prob, dtype="float64")
+
+    major = np.where(var_read_prob > 0.5, 2, 1).astype("float64")
+    minor = 2 - major
+
+    if segments is None or len(names) == 0:
+        return major.astype(int), minor.astype(int)
+
+    if not isinstance(segments, Copy_Number_Segments):
+        segments = Copy_Number_Segments(segments)
+
+    chromosomes, positions = locus_names(names, loci, pd.unique(segments.segments_df[SEG_CHR]))
+
+    n_samples = len(samples)
+
+    cn = segments.annotate(np.repeat(chromosomes, n_samples), np.repeat(positions, n_samples), np.tile(np.asarray(samples, dtype="object"), len(names)))
+
+    found = cn[SEG_CN].notnull().values.reshape(major.shape)
+
+    major = np.where(found, cn[SEG_MAJOR_CN].values.reshape(major.shape), major)
+    minor = np.where(found, cn[SEG_MINOR_CN].values.reshape(minor.shape), minor)
+
+    return major.astype(int), minor.astype(int)
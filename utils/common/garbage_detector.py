@@ -0,0 +1,119 @@
+import numpy as np
+
+from ssm_columns import *
+from ssm_io import parse_vectors
+
+
+# thresholds of the checks a variant fails to be a garbage mutation (a check with a threshold of None is skipped)
+#   min_depth / min_covered_samples: fewer than min_covered_samples samples have at least min_depth total reads
+#   max_vaf_llr: in some sample, the VAF is above var_read_prob (the largest VAF a clonal variant can have) with a
+#                likelihood-ratio statistic (2 * log likelihood ratio, chi-squared with 1 degree of freedom) above max_vaf_llr
+#                (off by default, homozygous/LOH variants such as JAK2 V617F on 9p UPD have a VAF near 1 with a var_read_prob of 0.5
+#                until ORG_VARS_BY_VAF sets it, 19.5 is p ~ 1e-5 for a single sample)
+#   max_dispersion: the likelihood-ratio statistic of the samples sharing one VAF, per degree of freedom, is above max_dispersion
+#                   (off by default, the VAF of a subclonal variant is expected to differ between samples)
+MIN_DEPTH = "min_depth"
+MIN_COVERED_SAMPLES = "min_covered_samples"
+MAX_VAF_LLR = "max_vaf_llr"
+MAX_DISPERSION = "max_dispersion"
+
+GARBAGE_THRESHOLDS = {
+    MIN_DEPTH: 10,
+    MIN_COVERED_SAMPLES: 1,
+    MAX_VAF_LLR: None,
+    MAX_DISPERSION: None
+}
+
+
+def _xlogy(x, y):
+    """
+    x * log(y), with 0 wherever x is 0
+    """
+    return np.where(x > 0, x * np.log(np.where(x > 0, y, 1.0)), 0.0)
+
+
+def _binomial_llr(var_reads, total_reads, vaf, p):
+    """
+    2 * log likelihood ratio of var_reads ~ Binomial(total_reads, vaf) against Binomial(total_reads, p), element-wise
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 2 * (_xlogy(var_reads, vaf / p) + _xlogy(total_reads - var_reads, (1 - vaf) / (1 - p)))
+
+
+class Garbage_Detector:
+    """
+    Flags garbage mutations from the (loci x samples) var_reads, total_reads and var_read_prob matrices of an .ssm.
+    Every statistic is computed for all loci at once, see GARBAGE_THRESHOLDS for the checks.
+    """
+
+    def __init__(self, thresholds=None):
+
+        self.thresholds = dict(GARBAGE_THRESHOLDS, **(thresholds or {}))
+
+
+    def statistics(self, var_reads, total_reads, var_read_prob):
+        """
+        Returns a dictionary of the statistic of each check (one value per locus)
+        """
+        var_reads = np.asarray(var_reads, dtype="float64")
+        total_reads = np.asarray(total_reads, dtype="float64")
+        var_read_prob = np.asarray(var_read_prob, dtype="float64")
+
+        covered = total_reads > 0
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vaf = np.where(covered, var_reads / total_reads, 0.0)
+            pooled_vaf = var_reads.sum(axis=1) / total_reads.sum(axis=1)
+
+        statistics = {}
+
+        if self.thresholds[MIN_DEPTH] is not None:
+            statistics[MIN_DEPTH] = (total_reads >= self.thresholds[MIN_DEPTH]).sum(axis=1)
+
+        # only a VAF above var_read_prob counts (a var_read_prob of 1 allows any VAF)
+        above = covered & (vaf > var_read_prob) & (var_read_prob > 0) & (var_read_prob < 1)
+
+        statistics[MAX_VAF_LLR] = np.where(above, _binomial_llr(var_reads, total_reads, vaf, var_read_prob), 0.0).max(axis=1, initial=0.0)
+
+        # samples without reads don't count towards the degrees of freedom
+        dof = covered.sum(axis=1) - 1
+
+        pooled = np.nan_to_num(pooled_vaf)[:, None]
+        shared_vaf_llr = np.where(covered & (pooled > 0) & (pooled < 1), _binomial_llr(var_reads, total_reads, vaf, pooled), 0.0).sum(axis=1)
+
+        statistics[MAX_DISPERSION] = np.where(dof > 0, shared_vaf_llr / np.maximum(dof, 1), 0.0)
+
+        return statistics
+
+
+    def is_garbage(self, var_reads, total_reads, var_read_prob):
+        """
+        Returns a boolean array of the loci that fail any check
+        """
+        statistics = self.statistics(var_reads, total_reads, var_read_prob)
+
+        garbage = np.zeros(len(np.asarray(var_reads)), dtype=bool)
+
+        if self.thresholds[MIN_DEPTH] is not None and self.thresholds[MIN_COVERED_SAMPLES] is not None:
+            garbage |= statistics[MIN_DEPTH] < self.thresholds[MIN_COVERED_SAMPLES]
+
+        for check in [MAX_VAF_LLR, MAX_DISPERSION]:
+            if self.thresholds[check] is not None:
+                garbage |= statistics[check] > self.thresholds[check]
+
+        return garbage
+
+
+    def garbage_ids(self, ssm_df):
+        """
+        Returns the ids of the garbage mutations of an .ssm dataframe
+        """
+        if len(ssm_df) == 0:
+            return []
+
+        # loci missing samples have no reads for them
+        garbage = self.is_garbage(parse_vectors(ssm_df[COL_VAR_READS], "int64", 0),
+                                  parse_vectors(ssm_df[COL_TOTAL_READS], "int64", 0),
+                                  parse_vectors(ssm_df[COL_VAR_READ_PROB], "float64", 1.0))
+
+        return list(ssm_df.loc[garbage, COL_ID])
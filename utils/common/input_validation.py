@@ -0,0 +1,283 @@
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from table_io import FORMAT_FEATHER, FORMAT_PARQUET, table_format
+
+
+# what is done with the violations of the integrity checks (missing columns always raise, the input can't be read without them)
+VALIDATE_RAISE = "raise"    # raise an Input_Validation_Error with the report
+VALIDATE_REPORT = "report"  # keep the report (and print a summary), the rows are processed as they are
+VALIDATE_OFF = "off"        # skip the integrity checks
+
+VALIDATION_MODES = (VALIDATE_RAISE, VALIDATE_REPORT, VALIDATE_OFF)
+
+# inputs that ran before the integrity checks existed (e.g. with contigs outside of CHROMOSOME_PATTERN) keep running by default
+DEFAULT_VALIDATION = VALIDATE_REPORT
+
+# checks a violation is reported for
+CHECK_MISSING_COLUMN = "missing_column"
+CHECK_MISSING_VALUE = "missing_value"
+CHECK_POSITION = "invalid_position"
+CHECK_CHROMOSOME = "invalid_chromosome"
+CHECK_COUNT = "invalid_count"
+CHECK_VAR_ABOVE_TOTAL = "var_above_total"
+CHECK_VAF = "invalid_vaf"
+
+# chromosomes of the human genome, with or without a chr prefix (in any case), see Input_Schema for other chromosome sets
+CHROMOSOME_PATTERN = r"^(chr)?([1-9]|1[0-9]|2[0-2]|X|Y|M|MT)$"
+
+# VAFs are given to 2 decimals (of a fraction), so they can be up to 0.005 from altDepth / (altDepth + refDepth)
+VAF_TOLERANCE = 0.01
+
+# scales of the VAFs, as fractions or percentages (see Input_Schema)
+VAF_FRACTION = 1
+VAF_PERCENT = 100
+
+# number of offending rows listed for a violation (all of them are counted)
+MAX_EXAMPLE_ROWS = 10
+
+
+class Input_Validation_Error(ValueError):
+    """
+    Raised for an input that fails validation, report is the Validation_Report of its violations
+    """
+    def __init__(self, report):
+
+        super().__init__(report.summary())
+
+        self.report = report
+
+
+class Validation_Report:
+    """
+    Violations found in one input, each a dictionary of the source (file), check, column, number of offending rows,
+    the first MAX_EXAMPLE_ROWS of them (index labels) and a message
+    """
+    def __init__(self, source=""):
+
+        self.source = source
+        self.violations = []
+
+
+    @property
+    def ok(self):
+        return len(self.violations) == 0
+
+
+    def add(self, check, column, rows=None, message=""):
+        """
+        Adds a violation of check, rows is a boolean series of the offending rows (None for a violation of the whole input)
+        """
+        if rows is not None:
+
+            rows = rows.index[rows.values]
+
+            if len(rows) == 0:
+                return
+
+        self.violations.append({
+            "source": self.source,
+            "check": check,
+            "column": column,
+            "n_rows": 0 if rows is None else len(rows),
+            "rows": [] if rows is None else rows[:MAX_EXAMPLE_ROWS].tolist(),
+            "message": message
+        })
+
+
+    def extend(self, report):
+
+        self.violations += report.violations
+
+        return self
+
+
+    def to_df(self):
+        """
+        Returns the violations as a dataframe (one row per violation)
+        """
+        return pd.DataFrame(self.violations, columns=["source", "check", "column", "n_rows", "rows", "message"])
+
+
+    def summary(self):
+
+        if self.ok:
+            return "%s: no violations" % (self.source or "input")
+
+        return "\n".join(
+            "%s: %s in %s%s" % (violation["source"] or "input", violation["message"] or violation["check"], violation["column"],
+                                " (%d rows, e.g. %s)" % (violation["n_rows"], violation["rows"]) if violation["n_rows"] else "")
+            for violation in self.violations
+        )
+
+
+    def raise_if_failed(self):
+
+        if not self.ok:
+            raise Input_Validation_Error(self)
+
+
+class Input_Schema:
+    """
+    Columns an input needs and the integrity checks its rows go through (every check looks at all rows at once):
+        chromosome: column of chromosome names matching chromosome_pattern (by default the human chromosomes, see CHROMOSOME_PATTERN,
+                    e.g. r".*" accepts any contig)
+        positions: columns of positive integer positions
+        counts: columns of non-negative integer read counts
+        var_total: (variant reads, total reads) columns, there can't be more variant reads than total reads
+        vaf: (VAF, altDepth, refDepth) columns, VAF is in [0, vaf_scale] and matches the depths (within VAF_TOLERANCE of a fraction).
+             vaf_scale is VAF_FRACTION or VAF_PERCENT, by default whichever matches the depths for more of the rows.
+    Every column has to be in the input, and only the nullable columns can have missing values.
+    """
+    def __init__(self, columns, chromosome=None, positions=(), counts=(), var_total=None, vaf=None, nullable=(), chromosome_pattern=CHROMOSOME_PATTERN,
+                 vaf_scale=None):
+
+        self.columns = list(columns)
+        self.chromosome = chromosome
+        self.positions = list(positions)
+        self.counts = list(counts)
+        self.var_total = var_total
+        self.vaf = vaf
+        self.nullable = list(nullable)
+        self.chromosome_pattern = chromosome_pattern
+        self.vaf_scale = vaf_scale
+
+
+def read_header(file_name, sheet_name=0, header=0):
+    """
+    Returns the column names of a table (a dataframe, an excel/parquet/feather file, or a tab separated .txt/.tsv file)
+    without reading its rows. Without a header (header=None), the columns are numbered.
+    """
+    if isinstance(file_name, pd.DataFrame):
+        return list(file_name.columns)
+
+    if str(file_name).endswith((".txt", ".tsv")):
+        columns = list(pd.read_csv(file_name, sep="\t", nrows=0, header=header).columns)
+
+    elif table_format(file_name) == FORMAT_PARQUET:
+        import pyarrow.parquet
+        columns = pyarrow.parquet.read_schema(file_name).names
+
+    elif table_format(file_name) == FORMAT_FEATHER:
+        import pyarrow.feather
+        # memory-mapped, so the columns aren't read
+        columns = pyarrow.feather.read_table(file_name, memory_map=True).column_names
+
+    elif not zipfile.is_zipfile(file_name):
+        # older (.xls) workbooks are read by pandas
+        return list(pd.read_excel(file_name, sheet_name, header=header, nrows=0).columns)
+
+    else:
+        import openpyxl
+
+        # a read-only workbook only parses the rows that are asked for
+        workbook = openpyxl.load_workbook(file_name, read_only=True)
+
+        try:
+            worksheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+            header_row = 0 if header is None else header
+            columns = next(worksheet.iter_rows(min_row=header_row + 1, max_row=header_row + 1, values_only=True), ())
+        finally:
+            workbook.close()
+
+        # trailing empty cells aren't columns
+        columns = list(columns)
+        while columns and columns[-1] is None:
+            columns.pop()
+
+    return list(range(len(columns))) if header is None else columns
+
+
+def check_header(file_name, columns, sheet_name=0, header=0, source=None):
+    """
+    Returns a Validation_Report of the columns missing from the header of a table (see read_header)
+    """
+    source = source if source is not None else ("dataframe" if isinstance(file_name, pd.DataFrame) else os.path.basename(str(file_name)))
+
+    report = Validation_Report(source)
+
+    present = set(read_header(file_name, sheet_name, header))
+
+    for column in columns:
+        if column not in present:
+            report.add(CHECK_MISSING_COLUMN, column, message="missing column")
+
+    return report
+
+
+def validate_df(dataframe, schema, source=""):
+    """
+    Returns a Validation_Report of the rows of a dataframe that fail the integrity checks of schema (see Input_Schema)
+    """
+    report = Validation_Report(source)
+
+    missing = [column for column in schema.columns if column not in dataframe.columns]
+
+    for column in missing:
+        report.add(CHECK_MISSING_COLUMN, column, message="missing column")
+
+    if missing:
+        return report
+
+    for column in schema.columns:
+        if column not in schema.nullable:
+            report.add(CHECK_MISSING_VALUE, column, dataframe[column].isnull(), "missing values")
+
+    if schema.chromosome:
+        # only the distinct chromosome names are matched (missing ones are numbered -1)
+        codes, names = pd.factorize(dataframe[schema.chromosome])
+        known = np.append(pd.Series(names).astype(str).str.match(schema.chromosome_pattern, case=False).values, True)
+
+        report.add(CHECK_CHROMOSOME, schema.chromosome, pd.Series(~known[codes], index=dataframe.index), "unknown chromosomes")
+
+    # numeric values of the columns (NaN for anything that isn't a number)
+    numbers = {}
+
+    def number(column):
+        if column not in numbers:
+            numbers[column] = pd.to_numeric(dataframe[column], errors="coerce")
+        return numbers[column]
+
+    for column in schema.positions:
+        report.add(CHECK_POSITION, column, dataframe[column].notnull() & ~((number(column) > 0) & (number(column) % 1 == 0)), "positions that aren't positive integers")
+
+    for column in schema.counts:
+        report.add(CHECK_COUNT, column, dataframe[column].notnull() & ~((number(column) >= 0) & (number(column) % 1 == 0)), "counts that aren't non-negative integers")
+
+    if schema.var_total:
+        var, total = schema.var_total
+        report.add(CHECK_VAR_ABOVE_TOTAL, var, number(var) > number(total), "more variant reads than %s" % total)
+
+    if schema.vaf:
+        vaf_column, alt, ref = schema.vaf
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            expected = number(alt) / (number(alt) + number(ref))
+
+        # by default, the scale is the one that matches the depths for more of the rows
+        matching = lambda scale: ((number(vaf_column) / scale - expected).abs() <= VAF_TOLERANCE).sum()
+
+        vaf = number(vaf_column) / (schema.vaf_scale or (VAF_PERCENT if matching(VAF_PERCENT) > matching(VAF_FRACTION) else VAF_FRACTION))
+
+        out_of_range = dataframe[vaf_column].notnull() & ~((vaf >= 0) & (vaf <= 1))
+
+        report.add(CHECK_VAF, vaf_column, out_of_range | ((vaf - expected).abs() > VAF_TOLERANCE), "VAFs outside of [0, 1] or not matching %s/%s" % (alt, ref))
+
+    return report
+
+
+def handle_report(report, validation=DEFAULT_VALIDATION):
+    """
+    Raises an Input_Validation_Error for a report with violations (VALIDATE_RAISE), or prints its summary (VALIDATE_REPORT).
+    Returns the report.
+    """
+    if validation == VALIDATE_RAISE:
+        report.raise_if_failed()
+
+    elif validation == VALIDATE_REPORT and not report.ok:
+        print(report.summary())
+
+    return report
@@ -0,0 +1,122 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+# positions are packed with the number of their chromosome (and group) into one sortable int64 key
+POSITION_BITS = 32
+
+
+def normalize_chromosome(chromosomes):
+    """
+    Returns chromosome names without a "chr" prefix and in upper case (chr1 -> 1, chrX -> X), so differently named files match
+    """
+    return pd.Series(np.asarray(chromosomes, dtype="object")).astype(str).str.replace(r"^chr", "", flags=re.IGNORECASE, regex=True).str.upper().values
+
+
+def locus_names(names, loci=None, chromosomes=()):
+    """
+    Returns the chromosomes and positions of .ssm loci named <chromosome>_<position>. Other names (e.g. the <gene>_<position>
+    names of MPN_AML_Processor) are looked up in loci (name -> <chromosome>_<position>, e.g. the names of a Variant_Id_Registry).
+    A name is a <chromosome>_<position> if its chromosome is a human chromosome (see input_validation.CHROMOSOME_PATTERN) or one of
+    chromosomes, a ValueError is raised for any other name rather than leaving it out of every interval.
+    """
+    from input_validation import CHROMOSOME_PATTERN
+
+    names = pd.Series(np.asarray(names, dtype="object")).astype(str)
+
+    if loci:
+        names = names.map(loci).fillna(names).astype(str)
+
+    split = names.str.rsplit("_", n=1, expand=True).reindex(columns=[0, 1])
+    chromosome_names, positions = split[0].fillna(""), pd.to_numeric(split[1], errors="coerce")
+
+    parsed = positions.notnull() & (chromosome_names.str.match(CHROMOSOME_PATTERN) | pd.Series(normalize_chromosome(chromosome_names)).isin(set(normalize_chromosome(list(chromosomes)))))
+
+    if not parsed.all():
+        raise ValueError("%d of %d names are not <chromosome>_<position> (e.g. %s), pass the id registry (.ids.json) of the .ssm to look them up in"
+                         % ((~parsed).sum(), len(names), ", ".join(names[~parsed].head(3))))
+
+    return chromosome_names.values, positions.astype("int64").values
+
+
+class Interval_Index:
+    """
+    Index of closed, 1-based [start, end] intervals on chromosomes (e.g. copy-number segments or gene regions), optionally per group (e.g. sample).
+
+    Intervals are sorted by (chromosome, group, start) into one array of int64 keys, so a whole array of positions is
+    looked up with a single binary search (np.searchsorted). The running maximum of the interval ends (and which interval
+    it belongs to) is kept as well, so a position is also found in a long interval that starts before shorter ones.
+    """
+
+    def __init__(self, chromosomes, starts, ends, groups=None):
+
+        labels, inverse = self.labels(chromosomes, groups)
+
+        self.keys = pd.Index(pd.unique(labels))
+
+        codes = self.keys.get_indexer(labels).astype(np.int64)[inverse]
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+
+        # rows of the intervals, in key order
+        self.rows = np.lexsort((starts, codes))
+
+        self.start_keys = (codes << POSITION_BITS)[self.rows] + starts[self.rows]
+        self.end_keys = (codes << POSITION_BITS)[self.rows] + ends[self.rows]
+
+        # end (and sorted number) of the interval reaching furthest among the ones starting at or before each interval
+        self.max_end_keys = np.maximum.accumulate(self.end_keys) if len(self.rows) else self.end_keys
+        self.max_end_intervals = np.maximum.accumulate(np.where(self.end_keys == self.max_end_keys, np.arange(len(self.rows)), 0)) if len(self.rows) else self.rows
+
+
+    def labels(self, chromosomes, groups=None):
+        """
+        Returns the labels intervals are grouped by (the normalized chromosome, and the group if there is one) and the
+        label of each row, as (unique labels, inverse). Only the unique names are normalized, not every row.
+        """
+        chromosome_codes, chromosome_names = pd.factorize(np.asarray(chromosomes, dtype="object"))
+        chromosome_names = normalize_chromosome(chromosome_names)
+
+        if groups is None:
+            return chromosome_names, chromosome_codes
+
+        group_codes, group_names = pd.factorize(np.asarray(groups, dtype="object"))
+
+        pairs, inverse = np.unique(chromosome_codes.astype(np.int64) * max(len(group_names), 1) + group_codes, return_inverse=True)
+
+        labels = chromosome_names[pairs // max(len(group_names), 1)] + "\t" + pd.Series(group_names[pairs % max(len(group_names), 1)]).astype(str).values
+
+        return labels, inverse
+
+
+    def __len__(self):
+        return len(self.rows)
+
+
+    def lookup(self, chromosomes, positions, groups=None):
+        """
+        Returns the row of the interval each position is in (-1 if it's in none).
+        If intervals overlap, the one starting last is returned if it contains the position, otherwise the one reaching furthest.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+
+        if len(self) == 0:
+            return np.full(len(positions), -1, dtype=np.int64)
+
+        labels, inverse = self.labels(chromosomes, groups)
+        codes = self.keys.get_indexer(labels).astype(np.int64)[inverse]
+        keys = (codes << POSITION_BITS) + positions
+
+        # last interval starting at or before each position
+        intervals = np.searchsorted(self.start_keys, keys, side="right") - 1
+        found = (codes >= 0) & (positions >= 0) & (intervals >= 0)
+
+        intervals = np.clip(intervals, 0, None)
+
+        # the running maximum can't reach past its chromosome (the chromosome number is in the high bits of the keys)
+        furthest = np.where(self.max_end_keys[intervals] >= keys, self.max_end_intervals[intervals], -1)
+        intervals = np.where(self.end_keys[intervals] >= keys, intervals, furthest)
+
+        return np.where(found & (intervals >= 0), self.rows[np.clip(intervals, 0, None)], -1)
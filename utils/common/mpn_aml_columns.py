@@ -14,6 +14,12 @@ SAMPLE_NAMES = "sampleNames"
 VAF = "VAF"
 GENE = "gene"
 
+# for aggregated df only (where the values of a row came from)
+SOURCE = "source"
+SOURCE_PRIMARY = "primary"
+SOURCE_CALLS = "calls"
+SOURCE_IMPUTED = "imputed"
+
 
 # other constants
 CHR_NUM = "chr_num"
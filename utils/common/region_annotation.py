@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+from interval_index import Interval_Index, locus_names
+
+
+# columns of the regions (closed, 1-based [start, end] intervals) and of the annotations of loci
+ANN_CHR = "chr"
+ANN_START = "start"
+ANN_END = "end"
+ANN_GENE = "gene"
+ANN_REGION = "region"
+
+GTF_COLUMNS = ["seqname", "source", "feature", "start", "end", "score", "strand", "frame", "attribute"]
+
+# region of a locus in a GTF feature (see Region_Annotator for which feature a locus is in)
+REGION_OF_FEATURE = {
+    "gene": "intronic",
+    "transcript": "intronic",
+    "exon": "exonic",
+    "CDS": "exonic",
+    "start_codon": "exonic",
+    "stop_codon": "exonic",
+    "UTR": "UTR",
+    "five_prime_utr": "UTR5",
+    "three_prime_utr": "UTR3"
+}
+
+
+def is_gtf(file_name):
+    """
+    Returns whether file_name is a GTF/GFF file (otherwise it's read as a BED file)
+    """
+    return file_name.endswith((".gtf", ".gtf.gz", ".gff", ".gff.gz", ".gff3", ".gff3.gz"))
+
+
+def read_bed(file_name):
+    """
+    Returns the regions of a BED file, converted from 0-based half-open [chromStart, chromEnd) to 1-based [start, end].
+    The name column (if there is one) is the gene of a region.
+    """
+    import gzip
+
+    # the header (track/browser/comment lines) isn't tab separated like the regions
+    with (gzip.open(file_name, "rt") if file_name.endswith(".gz") else open(file_name)) as bed:
+        n_header = 0
+        for line in bed:
+            if not line.startswith(("track", "browser", "#")):
+                break
+            n_header += 1
+
+    bed_df = pd.read_csv(file_name, sep="\t", header=None, skiprows=n_header, dtype={0: str})
+
+    return pd.DataFrame({
+        ANN_CHR: bed_df[0].values,
+        ANN_START: bed_df[1].astype("int64").values + 1,
+        ANN_END: bed_df[2].astype("int64").values,
+        ANN_GENE: bed_df[3].values if 3 in bed_df.columns else np.nan,
+        ANN_REGION: np.nan
+    })
+
+
+def read_gtf(file_name, features=None):
+    """
+    Returns the regions of the features (all of them by default) of a GTF file, with the gene_name (or gene_id) of each
+    feature as its gene and its region (see REGION_OF_FEATURE)
+    """
+    gtf_df = pd.read_csv(file_name, sep="\t", header=None, names=GTF_COLUMNS, comment="#", dtype={"seqname": str, "attribute": str})
+
+    if features is not None:
+        gtf_df = gtf_df[gtf_df["feature"].isin(features)]
+
+    genes = gtf_df["attribute"].str.extract(r'gene_name "([^"]*)"', expand=False) \
+                               .fillna(gtf_df["attribute"].str.extract(r'gene_id "([^"]*)"', expand=False))
+
+    return pd.DataFrame({
+        ANN_CHR: gtf_df["seqname"].values,
+        ANN_START: gtf_df["start"].astype("int64").values,
+        ANN_END: gtf_df["end"].astype("int64").values,
+        ANN_GENE: genes.values,
+        ANN_REGION: gtf_df["feature"].map(REGION_OF_FEATURE).fillna(gtf_df["feature"]).values
+    })
+
+
+def read_regions(regions, features=None):
+    """
+    Returns the dataframe of the regions of a BED or GTF file, a dataframe (with chr/start/end and optionally gene/region columns,
+    1-based) is returned as is
+    """
+    if isinstance(regions, pd.DataFrame):
+        return regions
+
+    if is_gtf(regions):
+        return read_gtf(regions, features)
+
+    return read_bed(regions)
+
+
+class Region_Annotator:
+    """
+    Annotates loci with the gene and region of the BED/GTF region they're in, looked up in an Interval_Index of the regions
+    (every locus is looked up at once). Loci in no region are outside of the panel the regions describe.
+    Where regions overlap, the one starting last is used if it contains a locus (otherwise the one reaching furthest),
+    so for a GTF file the exon (or CDS/UTR) of a locus rather than its gene, and its gene for an intronic locus.
+    """
+
+    def __init__(self, regions, features=None):
+
+        self.regions_df = read_regions(regions, features)
+
+        for column in [ANN_GENE, ANN_REGION]:
+            if column not in self.regions_df.columns:
+                self.regions_df[column] = np.nan
+
+        self.index = Interval_Index(self.regions_df[ANN_CHR], self.regions_df[ANN_START], self.regions_df[ANN_END])
+
+
+    def rows(self, chromosomes, positions):
+        """
+        Returns the row of the region each locus is in (-1 if it's in none)
+        """
+        return self.index.lookup(chromosomes, pd.to_numeric(pd.Series(np.asarray(positions)), errors="coerce").fillna(-1).astype("int64").values)
+
+
+    def in_regions(self, chromosomes, positions):
+        """
+        Returns a boolean array of the loci that are in a region
+        """
+        return self.rows(chromosomes, positions) >= 0
+
+
+    def annotate(self, chromosomes, positions):
+        """
+        Returns a dataframe with the gene and region of each locus (NaN for loci in no region)
+        """
+        return self.annotations(self.rows(chromosomes, positions))
+
+
+    def annotations(self, rows):
+        """
+        Returns a dataframe with the gene and region of the regions in rows (NaN for a row of -1), see rows
+        """
+        found = rows >= 0
+
+        return pd.DataFrame({
+            column: np.where(found, self.regions_df[column].values.astype("object")[np.clip(rows, 0, None)], np.nan)
+            for column in [ANN_GENE, ANN_REGION]
+        })
+
+
+    def in_regions_by_name(self, names, loci=None):
+        """
+        Returns a boolean array of the .ssm loci that are in a region, for <chromosome>_<position> names,
+        other names are looked up in loci (see interval_index.locus_names)
+        """
+        chromosomes, positions = locus_names(names, loci, pd.unique(self.regions_df[ANN_CHR]))
+
+        return self.in_regions(chromosomes, positions)
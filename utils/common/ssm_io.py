@@ -0,0 +1,212 @@
+import gzip
+import numpy as np
+import pandas as pd
+
+from ssm_columns import *
+
+
+# number of loci read/written at a time when streaming an .ssm
+CHUNK_SIZE = 10000
+
+# .ssm files ending in .gz are read and written gzip compressed
+GZ_EXT = ".gz"
+GZ_LEVEL = 6
+
+# formats of the values in the var_reads/total_reads and var_read_prob vectors
+INT_FORMAT = "%d"
+PROB_FORMAT = "%r"
+
+
+def open_ssm(ssm_file, mode="r"):
+    """
+    Opens an .ssm (or .ssm.gz) as text
+    """
+    if str(ssm_file).endswith(GZ_EXT):
+        return gzip.open(ssm_file, mode + "t", compresslevel=GZ_LEVEL)
+
+    return open(ssm_file, mode)
+
+
+def params_file_for(ssm_file):
+    """
+    Returns the .params.json written alongside an .ssm (or .ssm.gz)
+    """
+    ssm_file = str(ssm_file)
+
+    if ssm_file.endswith(GZ_EXT):
+        ssm_file = ssm_file[:-len(GZ_EXT)]
+
+    return ssm_file.replace(".ssm", ".params.json")
+
+
+def read_ssm(ssm_file):
+    """
+    Return an ssm files dataframe (assumes tab delimited, .ssm.gz files are decompressed)
+    """
+    return pd.read_csv(ssm_file, sep="\t")
+
+
+def format_vectors(array, fmt=INT_FORMAT):
+    """
+    Returns the .ssm strings ("<value>, <value>, ...") of each row of a 2D array.
+    Every distinct value is only formatted once, so large arrays of read counts/probabilities are formatted in bulk.
+    """
+    array = np.asarray(array)
+
+    if array.size == 0:
+        return [""] * len(array)
+
+    values, inverse = np.unique(array, return_inverse=True)
+
+    strings = np.array([fmt % value for value in values.tolist()], dtype="object")[inverse].reshape(array.shape)
+
+    return [", ".join(row) for row in strings.tolist()]
+
+
+def parse_vectors(strings, dtype, fill_value=None):
+    """
+    Returns a 2D array of the values in the .ssm strings ("<value>, <value>, ...") of each locus,
+    loci with fewer values than the others are padded with fill_value
+    """
+    values = strings.str.split(",", expand=True)
+
+    if fill_value is not None:
+        values = values.fillna(fill_value)
+
+    return values.astype(dtype).values
+
+
+def grouped_vectors(grouped, column, fmt=INT_FORMAT):
+    """
+    Returns the .ssm strings of the values of column in each group of a groupby (in group order, values in row order),
+    equivalent to joining grouped[column].apply(list). Groups of the same size are formatted as one 2D array.
+    """
+    sizes = grouped.size().values
+
+    if len(sizes) and (sizes == sizes[0]).all():
+
+        # rows that are in no group (e.g. a missing name) are numbered -1, and sorted before every group
+        groups = grouped.ngroup().values
+        order = np.argsort(groups, kind="stable")[(groups < 0).sum():]
+        values = grouped.obj[column].values[order]
+
+        return format_vectors(values.reshape(len(sizes), sizes[0]), fmt)
+
+    return [", ".join(fmt % value for value in values.tolist()) for _, values in grouped[column]]
+
+
+def format_lines(batch):
+    """
+    Returns the tab delimited lines of a batch of loci (as to_csv would write them),
+    or None if it has columns that need to_csv (missing values, floats, ...)
+    """
+    columns = []
+
+    for column in batch.columns:
+
+        values = batch[column]
+
+        if values.dtype.kind in "iub":
+            columns.append(values.astype(str).tolist())
+
+        elif values.dtype == "object" and not values.isna().any():
+            columns.append(values.tolist())
+
+        else:
+            return None
+
+    try:
+        return "".join(["\t".join(row) + "\n" for row in zip(*columns)])
+
+    except TypeError:
+        return None
+
+
+def iter_ssm(ssm_file, chunk_size=CHUNK_SIZE, columns=None):
+    """
+    Yields the loci of an .ssm as dataframes of at most chunk_size rows (each indexed from 0, as load_ssm would be),
+    columns can be used to only parse some of the columns (e.g. [COL_ID, COL_NAME])
+    """
+    for chunk in pd.read_csv(ssm_file, sep="\t", usecols=columns, chunksize=chunk_size):
+        yield chunk.reset_index(drop=True)
+
+
+def read_ssm_rows(ssm_file, column, values, columns=None, chunk_size=CHUNK_SIZE):
+    """
+    Returns the rows of an .ssm whose column is in values, without loading the rest of the .ssm
+    """
+    chunks = [chunk[chunk[column].isin(values)] for chunk in iter_ssm(ssm_file, chunk_size, columns)]
+
+    return pd.concat(chunks).reset_index(drop=True) if chunks else pd.DataFrame(columns=columns)
+
+
+class SSM_Writer:
+    """
+    Writes an .ssm (or .ssm.gz) one batch of loci at a time, each batch is joined into one block of text
+    rather than written through to_csv.
+
+    If renumber is set, ids are numbered (s0, s1, ...) across batches as they're written, in the same way
+    modify_ssm.overwrite_ids numbers a whole dataframe. If an id registry (Variant_Id_Registry) is passed,
+    each variant is given its registered id instead.
+    """
+
+    def __init__(self, out_file, renumber=False, id_registry=None):
+
+        self.out_file = out_file
+        self.renumber = renumber
+        self.id_registry = id_registry
+
+        self.n_written = 0
+        self.ssm = None
+        self.header = False
+
+
+    def __enter__(self):
+
+        self.ssm = open_ssm(self.out_file, "w")
+
+        return self
+
+
+    def __exit__(self, *exc_info):
+
+        self.ssm.close()
+
+
+    def write(self, batch):
+        """
+        Writes a batch of loci, returns it as written (with its new ids)
+        """
+
+        if self.id_registry:
+            batch = batch.assign(**{COL_ID: self.id_registry.ids_for_names(batch[COL_NAME])})
+
+        elif self.renumber:
+            batch = batch.assign(**{COL_ID: ["s" + str(number) for number in range(self.n_written, self.n_written + len(batch))]})
+
+        # the header is written with the first batch (even if it's empty)
+        if not self.header:
+            self.ssm.write("\t".join(map(str, batch.columns)) + "\n")
+            self.header = True
+
+        for start in range(0, len(batch), CHUNK_SIZE):
+
+            block = batch.iloc[start:start + CHUNK_SIZE]
+            lines = format_lines(block)
+
+            if lines is None:
+                block.to_csv(self.ssm, sep="\t", index=False, header=False)
+            else:
+                self.ssm.write(lines)
+
+        self.n_written += len(batch)
+
+        return batch
+
+
+def write_ssm(dataframe, out_file):
+    """
+    Writes a dataframe to an .ssm (or .ssm.gz)
+    """
+    with SSM_Writer(out_file) as writer:
+        writer.write(dataframe)
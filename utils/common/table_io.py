@@ -0,0 +1,148 @@
+import os
+
+import pandas as pd
+
+
+# formats tables (aggregated data, populations, subpopulations) can be written in
+FORMAT_XLSX = "xlsx"
+FORMAT_PARQUET = "parquet"
+FORMAT_FEATHER = "feather"
+
+TABLE_FORMATS = (FORMAT_XLSX, FORMAT_PARQUET, FORMAT_FEATHER)
+
+# file extensions of each format (anything else is read/written as an excel file)
+FORMAT_EXTENSIONS = {
+    ".parquet": FORMAT_PARQUET,
+    ".pq": FORMAT_PARQUET,
+    ".feather": FORMAT_FEATHER,
+    ".arrow": FORMAT_FEATHER
+}
+
+
+def table_format(file_name, fmt=None):
+    """
+    Returns the format of a table file, either the one passed or the one matching its extension
+    """
+    if fmt:
+        return fmt
+
+    return FORMAT_EXTENSIONS.get(os.path.splitext(str(file_name))[1].lower(), FORMAT_XLSX)
+
+
+def with_format_extension(file_name, fmt=None):
+    """
+    Returns file_name with the extension of fmt (file_name is returned as is if it already matches fmt)
+    """
+    if not fmt or table_format(file_name) == fmt:
+        return file_name
+
+    return os.path.splitext(file_name)[0] + "." + fmt
+
+
+def _require_pyarrow(fmt):
+
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("pyarrow is required to read/write %s files (pip3 install pyarrow)" % fmt)
+
+
+def _require_yaml(file_name):
+
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError("PyYAML is required to read %s (pip3 install pyyaml), or pass the same spec as a .json file" % file_name)
+
+    return yaml
+
+
+def read_spec(file_name):
+    """
+    Returns the contents of a .json or .yaml/.yml spec file (e.g. a chain of operations or a batch)
+    """
+    with open(file_name) as spec:
+
+        if file_name.endswith((".yaml", ".yml")):
+            return _require_yaml(file_name).safe_load(spec)
+
+        import json
+        return json.load(spec)
+
+
+def read_table(file_name, sheet_name=0, header=0, fmt=None, memory_map=True, columns=None, dtype=None):
+    """
+    Returns a dataframe from an excel, parquet or feather file.
+    Columnar files have no sheets, and with header=None their columns are numbered (as pd.read_excel does).
+    Feather files are memory-mapped unless memory_map is False.
+    If columns is passed, only those columns are read. dtype ({column: dtype}) is only used to parse excel files,
+    columnar files keep the dtypes they were written with.
+    """
+    fmt = table_format(file_name, fmt)
+
+    if fmt == FORMAT_XLSX:
+        return pd.read_excel(file_name, sheet_name, header=header, usecols=columns, dtype=dtype)
+
+    _require_pyarrow(fmt)
+
+    if fmt == FORMAT_PARQUET:
+        dataframe = pd.read_parquet(file_name, columns=columns)
+    else:
+        import pyarrow.feather
+        dataframe = pyarrow.feather.read_table(file_name, columns=columns, memory_map=memory_map).to_pandas()
+
+    if header is None:
+        dataframe.columns = range(0, len(dataframe.columns))
+
+    return dataframe
+
+
+def write_table(dataframe, file_name, sheet_name="Sheet1", fmt=None, index=True, header=True):
+    """
+    Writes a dataframe to an excel, parquet or feather file (keeping its dtypes for the columnar formats).
+    Columnar files have no sheets or index, and their column names are always written (as strings).
+    Feather files are written uncompressed so they can be memory-mapped.
+    """
+    fmt = table_format(file_name, fmt)
+
+    if fmt == FORMAT_XLSX:
+        dataframe.to_excel(file_name, sheet_name=sheet_name, index=index, header=header)
+        return
+
+    _require_pyarrow(fmt)
+
+    dataframe = dataframe.reset_index(drop=True)
+    dataframe.columns = [str(column) for column in dataframe.columns]
+
+    if fmt == FORMAT_PARQUET:
+        dataframe.to_parquet(file_name, index=False)
+    else:
+        dataframe.to_feather(file_name, compression="uncompressed")
+
+
+def write_tables(dataframes, file_name, fmt=None, index=True):
+    """
+    Writes a dictionary of {sheet_name: dataframe}, as sheets of one excel file or as one
+    <file_name without extension>.<sheet_name>.<extension> file per sheet for the columnar formats.
+    Returns the list of files written.
+    """
+    fmt = table_format(file_name, fmt)
+
+    if fmt == FORMAT_XLSX:
+
+        with pd.ExcelWriter(file_name) as writer:
+            for sheet_name, dataframe in dataframes.items():
+                dataframe.to_excel(writer, sheet_name=sheet_name, index=index)
+
+        return [file_name]
+
+    stem, extension = os.path.splitext(file_name)
+
+    file_names = []
+
+    for sheet_name, dataframe in dataframes.items():
+
+        file_names.append("%s.%s%s" % (stem, sheet_name, extension))
+        write_table(dataframe, file_names[-1], fmt=fmt)
+
+    return file_names
@@ -0,0 +1,122 @@
+import json
+import os
+import re
+
+
+# keys of an id registry (.ids.json) file
+REGISTRY_NEXT_ID = "next_id"
+REGISTRY_IDS = "ids"
+REGISTRY_NAMES = "names"
+
+
+class Variant_Id_Registry:
+    """
+    Persistent mapping from a variant's <chromosome>_<position> key to its .ssm id (s<N>).
+
+    A variant keeps the id it was first given for as long as the registry file is reused (e.g. one registry per patient),
+    so filtering or reordering an .ssm does not renumber the variants, and new variants are numbered after every id
+    ever handed out. The .ssm name of each variant is also recorded so ids can be looked up by name.
+    """
+
+    def __init__(self, registry_file=""):
+
+        self.registry_file = registry_file
+
+        self.next_id = 0
+        self.ids = {}
+        self.names = {}
+
+        # every id handed out, so no two keys are given the same id
+        self.assigned = set()
+
+        if registry_file and os.path.exists(registry_file):
+            self.load()
+
+
+    def load(self):
+
+        with open(self.registry_file) as registry_json:
+            registry = json.load(registry_json)
+
+        self.next_id = registry[REGISTRY_NEXT_ID]
+        self.ids = registry[REGISTRY_IDS]
+        self.names = registry[REGISTRY_NAMES]
+
+        self.assigned = set(self.ids.values())
+
+
+    def save(self, registry_file=""):
+
+        if registry_file:
+            self.registry_file = registry_file
+
+        if self.registry_file:
+            with open(self.registry_file, "w") as registry_json:
+                json.dump({REGISTRY_NEXT_ID: self.next_id, REGISTRY_IDS: self.ids, REGISTRY_NAMES: self.names}, registry_json)
+
+
+    def new_id(self):
+        """
+        Returns the next id that was never handed out
+        """
+        while "s" + str(self.next_id) in self.assigned:
+            self.next_id += 1
+
+        id = "s" + str(self.next_id)
+        self.next_id += 1
+
+        self.assigned.add(id)
+
+        return id
+
+
+    def register(self, ssm_df, id_col="id", name_col="name"):
+        """
+        Adds the ids of an existing .ssm dataframe (keyed by name) to the registry. Variants that aren't registered yet keep their id,
+        unless the registry already gave it to another variant, in which case they're given a new one (see ids_for_names).
+        """
+        for id, name in zip(ssm_df[id_col], ssm_df[name_col]):
+
+            key = self.names.setdefault(name, name)
+
+            if key in self.ids:
+                continue
+
+            match = re.match(r"s(\d+)$", str(id))
+
+            if match:
+                self.next_id = max(self.next_id, int(match.group(1)) + 1)
+
+            if id in self.assigned:
+                id = self.new_id()
+
+            self.ids[key] = id
+            self.assigned.add(id)
+
+
+    def ids_for_keys(self, keys, names=None):
+        """
+        Returns the id of each <chromosome>_<position> key, giving new keys the next unused id.
+        If names are passed, they're recorded so the same ids can be found with ids_for_names.
+        """
+        names = keys if names is None else names
+
+        ids = []
+
+        for key, name in zip(keys, names):
+
+            if key not in self.ids:
+                self.ids[key] = self.new_id()
+
+            self.names[name] = key
+
+            ids.append(self.ids[key])
+
+        return ids
+
+
+    def ids_for_names(self, names):
+        """
+        Returns the id of each .ssm name (names that were never registered are used as their own key)
+        """
+        return self.ids_for_keys([self.names.get(name, name) for name in names], names)
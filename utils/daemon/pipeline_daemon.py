@@ -0,0 +1,271 @@
+import argparse
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/ssm_file")
+sys.path.append(os.environ["UTILS_DIR"] + "/ssm_file/utils")
+sys.path.append(os.environ["UTILS_DIR"] + "/xls_file")
+
+from run_processor import PROCESSORS
+from run_aggregator import aggregator_dict, run_aggregators, IMPUTE_ZERO
+from run_modify_ssm import load_operations, modify_file
+from ssm_io import CHUNK_SIZE
+from split_data import read_fn, read_params, split_data
+from input_validation import Input_Validation_Error, DEFAULT_VALIDATION
+
+# to start the daemon on a Unix socket, use the following command:
+#   python3 $UTILS_DIR/daemon/pipeline_daemon.py -s /tmp/pipeline.sock
+# or leave out -s to read jobs from stdin and write results to stdout (one JSON object per line), e.g.
+#   echo '{"id": 1, "job": "process", "processor": "MPN_AML_Processor_Txt", "in_file": "a.txt", "out_file": "a.ssm"}' | python3 $UTILS_DIR/daemon/pipeline_daemon.py
+#
+# every response is {"id": <id of the job>, "ok": true/false, "result": {...}, "error": "...", "seconds": <time spent on the job>}
+# (and "violations": [...] for an input that failed validation, see input_validation.Validation_Report)
+
+
+def process_job(job):
+    """
+    {"processor": <name in run_processor.PROCESSORS>, "in_file", "out_file", "previous_ssm" (optional), "id_registry" (optional),
+     "garbage_thresholds" (optional, see garbage_detector.GARBAGE_THRESHOLDS), "segments" (optional copy-number segments file, see copy_number.py),
+     "regions" (optional BED/GTF file, see region_annotation.py), "panel_only" (optional), "validation" (optional, see input_validation.py)}
+    """
+    processor = PROCESSORS[job["processor"]](job["in_file"], job["out_file"],
+                                             previous_ssm=job.get("previous_ssm", ""),
+                                             id_registry=job.get("id_registry", ""),
+                                             garbage_thresholds=job.get("garbage_thresholds"),
+                                             segments=job.get("segments", ""),
+                                             regions=job.get("regions", ""),
+                                             panel_only=job.get("panel_only", False),
+                                             validation=job.get("validation", DEFAULT_VALIDATION))
+
+    return {"out_file": job["out_file"], "variants": len(processor.out_df), "violations": processor.validation_report.violations}
+
+
+def aggregate_job(job):
+    """
+    {"aggregator": <name in run_aggregator.aggregator_dict>, "primary_file", "call_file", "population_file", "output_file",
+     "metrics_file" (optional), "input_directory" (optional), "output_directory" (optional), "impute_technique" (optional),
+     "previous_file" (optional), "output_format" (optional), "low_memory" (optional), "regions" (optional), "panel_only" (optional), "validation" (optional), "cache_dir" (optional)}, files are passed as lists in the same way as the command line arguments of run_aggregator.py
+    """
+    output_file = list(job["output_file"])
+
+    run_aggregators(aggregator_dict[job.get("aggregator", "MPN_AML_Aggregator")],
+                    list(job["primary_file"]),
+                    list(job["call_file"]),
+                    list(job["population_file"]),
+                    output_file,
+                    job.get("metrics_file", ""),
+                    job.get("input_directory"),
+                    job.get("output_directory"),
+                    job.get("impute_technique", IMPUTE_ZERO),
+                    list(job.get("previous_file", [])),
+                    job.get("output_format"),
+                    job.get("low_memory", False),
+                    regions=job.get("regions", ""),
+                    panel_only=job.get("panel_only", False),
+                    validation=job.get("validation", DEFAULT_VALIDATION),
+                    cache_dir=job.get("cache_dir", ""))
+
+    return {"output_file": output_file[0]}
+
+
+def modify_job(job):
+    """
+    {"in_file", "out_file", "id_registry" (optional), "params_file" (optional), "names_fn" (optional), "chunk_size" (optional)} and either
+    {"mod_method", "args"} (as in run_modify_ssm.py, including PARTITION), {"operations": [...]} or {"chain_file"} (as in run_modify_ssm.load_operations).
+    The in-file can be a read-count store, and the job is run in the same way as run_modify_ssm.py (see run_modify_ssm.modify_file)
+    """
+    if "operations" in job:
+        operations = job["operations"]
+    elif "chain_file" in job:
+        operations = load_operations(job["chain_file"])
+    else:
+        operations = [{"mod_method": job["mod_method"], "args": job.get("args", [])}]
+
+    n_written = modify_file(job["in_file"], job["out_file"], operations, job.get("params_file"), job.get("names_fn"),
+                            job.get("id_registry"), job.get("chunk_size", CHUNK_SIZE))
+
+    if isinstance(n_written, dict):
+        return {"out_file": job["out_file"], "partitions": n_written}
+
+    return {"out_file": job["out_file"], "variants": n_written}
+
+
+def split_job(job):
+    """
+    {"ssm_file", "params_file", "data_file", "out_dir"}
+    """
+    clusters, garbage = read_params(job["params_file"])
+
+    os.makedirs(job["out_dir"], exist_ok=True)
+    split_data(read_fn(job["ssm_file"]), clusters, garbage, read_fn(job["data_file"]), job["out_dir"])
+
+    return {"out_dir": job["out_dir"], "clusters": len(clusters)}
+
+
+def ping_job(job):
+    """
+    {} (used to check the daemon is up)
+    """
+    return {"pid": os.getpid()}
+
+
+# NEED to add any job you want the daemon to accept
+JOBS = {
+    "process": process_job,
+    "aggregate": aggregate_job,
+    "modify": modify_job,
+    "split": split_job,
+    "ping": ping_job
+}
+
+SHUTDOWN_JOB = "shutdown"
+
+
+def run_job(job):
+    """
+    Runs a single job (a dictionary with a "job" key naming one of JOBS) and returns its response
+    """
+    start = time.perf_counter()
+
+    response = {"id": job.get("id"), "ok": True, "result": None, "error": None}
+
+    try:
+        if job.get("job") not in JOBS:
+            raise ValueError('unknown job %s (expected one of %s)' % (job.get("job"), ", ".join(JOBS)))
+
+        # tools print progress to stdout, which is reserved for responses
+        with contextlib.redirect_stdout(sys.stderr):
+            response["result"] = JOBS[job["job"]](job)
+
+    except Exception as e:
+        traceback.print_exc(file=sys.stderr)
+        response["ok"] = False
+        response["error"] = "%s: %s" % (type(e).__name__, e)
+
+        # the violations of an input that failed validation are passed on as they are
+        if isinstance(e, Input_Validation_Error):
+            response["violations"] = e.report.violations
+
+    response["seconds"] = time.perf_counter() - start
+
+    return response
+
+
+def handle_line(line):
+    """
+    Parses a request line, returns (response, whether the daemon should shut down)
+    """
+    try:
+        job = json.loads(line)
+    except ValueError as e:
+        return {"id": None, "ok": False, "result": None, "error": "invalid request: %s" % e, "seconds": 0.0}, False
+
+    if job.get("job") == SHUTDOWN_JOB:
+        return {"id": job.get("id"), "ok": True, "result": None, "error": None, "seconds": 0.0}, True
+
+    return run_job(job), False
+
+
+def serve_stdin(in_stream=sys.stdin, out_stream=sys.stdout):
+    """
+    Reads one job per line from in_stream and writes one response per line to out_stream until EOF or a shutdown job
+    """
+    for line in in_stream:
+
+        if not line.strip():
+            continue
+
+        response, shutdown = handle_line(line)
+
+        out_stream.write(json.dumps(response) + "\n")
+        out_stream.flush()
+
+        if shutdown:
+            break
+
+
+class Job_Handler(socketserver.StreamRequestHandler):
+    """
+    Handles a connection to the daemon, a client can send any number of jobs (one per line) before closing it
+    """
+    def handle(self):
+
+        for line in self.rfile:
+
+            if not line.strip():
+                continue
+
+            response, shutdown = handle_line(line.decode())
+
+            self.wfile.write((json.dumps(response) + "\n").encode())
+            self.wfile.flush()
+
+            if shutdown:
+                # shutdown() waits for serve_forever() to return, so it can't be called from the serving thread
+                threading.Thread(target=self.server.shutdown).start()
+                break
+
+
+def serve_socket(socket_path):
+    """
+    Accepts connections on a Unix socket, jobs are run one at a time in the order they are received
+    """
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    with socketserver.UnixStreamServer(socket_path, Job_Handler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(socket_path)
+
+
+def submit_jobs(socket_path, jobs):
+    """
+    Sends jobs to a daemon listening on socket_path and returns their responses (in the same order)
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+
+        client.connect(socket_path)
+
+        with client.makefile("rw") as stream:
+
+            responses = []
+
+            for job in jobs:
+                stream.write(json.dumps(job) + "\n")
+                stream.flush()
+                responses.append(json.loads(stream.readline()))
+
+    return responses
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+
+        description='Keep the pipeline tools loaded and run jobs sent as JSON lines over stdin or a Unix socket.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+
+    )
+
+    parser.add_argument('-s', '--socket', help='Unix socket to listen on (jobs are read from stdin if not passed)')
+
+    args = parser.parse_args()
+
+    if args.socket:
+        serve_socket(args.socket)
+    else:
+        serve_stdin()
+
+
+if __name__ == '__main__':
+  main()
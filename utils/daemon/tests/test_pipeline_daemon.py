@@ -0,0 +1,138 @@
+import unittest
+import os, sys
+import io
+import json
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ssm_columns import *
+from pipeline_daemon import serve_stdin, serve_socket, submit_jobs
+from cohort_fixtures import write_cohort
+from mpn_aml_processor_txt import MPN_AML_Processor_Txt
+from modify_ssm import load_ssm, scale_counts, partition_file
+from ssm_store import ssm_to_store
+
+
+class Pipeline_Daemon_Tests(unittest.TestCase):
+    """
+    Test cases for running pipeline jobs through the daemon (pipeline_daemon.py).
+    use 'python3 test_pipeline_daemon.py' to run the test suite
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.files = write_cohort(self.tmp_dir.name, n_loci=20, n_samples=4, n_clusters=2, seed=5, write_xls=False)
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def path(self, name):
+
+        return os.path.join(self.tmp_dir.name, name)
+
+
+    def test_stdin_jobs(self):
+        # jobs run through the daemon should write the same files as calling the tools directly
+        jobs = [
+            {"id": 1, "job": "process", "processor": "MPN_AML_Processor_Txt", "in_file": self.files["txt"], "out_file": self.path("daemon.ssm")},
+            {"id": 2, "job": "modify", "in_file": self.files["ssm"], "out_file": self.path("daemon.scaled.ssm"), "mod_method": "SCALE_COUNTS", "args": [25]},
+            {"id": 3, "job": "split", "ssm_file": self.files["ssm"], "params_file": self.files["params"], "data_file": self.files["txt"], "out_dir": self.path("split")},
+            {"id": 4, "job": "not_a_job"},
+            {"id": 5, "job": "shutdown"},
+            {"id": 6, "job": "ping"}
+        ]
+
+        out_stream = io.StringIO()
+        serve_stdin(io.StringIO("\n".join(json.dumps(job) for job in jobs) + "\n"), out_stream)
+
+        responses = [json.loads(line) for line in out_stream.getvalue().splitlines()]
+
+        self.assertEqual([response["id"] for response in responses], [1, 2, 3, 4, 5],
+                         'Responses do not match jobs (or jobs after shutdown were run)')
+
+        self.assertEqual([response["ok"] for response in responses], [True, True, True, False, True],
+                         'Incorrect job status')
+
+        self.assertTrue(all(response["seconds"] >= 0 for response in responses), 'Responses are missing timings')
+
+        MPN_AML_Processor_Txt(self.files["txt"], self.path("direct.ssm"))
+
+        self.assertTrue(load_ssm(self.path("daemon.ssm")).equals(load_ssm(self.path("direct.ssm"))),
+                        'Processed .ssm does not match running the processor directly')
+
+        self.assertTrue(load_ssm(self.path("daemon.scaled.ssm")).equals(scale_counts(load_ssm(self.files["ssm"]), 25)),
+                        'Modified .ssm does not match running the method directly')
+
+        self.assertTrue(os.path.exists(os.path.join(self.path("split"), "garbage.txt")), 'split job did not write its files')
+
+
+    def test_modify_jobs_match_cli(self):
+        # modify jobs go through the same dispatch as run_modify_ssm.py (stores, params remapping and PARTITION)
+        ssm_to_store(self.files["ssm"], self.path("cohort.ssmstore"), self.files["params"])
+
+        jobs = [
+            {"id": 1, "job": "modify", "in_file": self.path("cohort.ssmstore"), "out_file": self.path("store.ssm"),
+             "operations": [{"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5]}]},
+            {"id": 2, "job": "modify", "in_file": self.files["ssm"], "out_file": self.path("rmvaf.ssm"), "mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5]},
+            {"id": 3, "job": "modify", "in_file": self.files["ssm"], "out_file": self.path("partition.ssm"), "mod_method": "PARTITION",
+             "params_file": self.files["params"]}
+        ]
+
+        out_stream = io.StringIO()
+        serve_stdin(io.StringIO("\n".join(json.dumps(job) for job in jobs) + "\n"), out_stream)
+
+        responses = [json.loads(line) for line in out_stream.getvalue().splitlines()]
+
+        self.assertTrue(all(response["ok"] for response in responses), 'modify jobs failed: %s' % [response.get("error") for response in responses])
+
+        self.assertTrue(load_ssm(self.path("store.ssm")).equals(load_ssm(self.path("rmvaf.ssm"))),
+                        'Modifying a store does not match modifying the .ssm')
+
+        self.assertEqual(responses[1]["result"]["variants"], len(load_ssm(self.path("rmvaf.ssm"))), 'Incorrect modify result')
+
+        self.assertTrue(os.path.exists(self.path("rmvaf.params.json")), 'Params were not remapped to the modified .ssm')
+
+        for name, n_loci in responses[2]["result"]["partitions"].items():
+            self.assertEqual(len(load_ssm(partition_file(self.path("partition.ssm"), name))), n_loci, 'Incorrect partition %s' % name)
+
+
+    def test_socket_jobs(self):
+
+        socket_path = self.path("daemon.sock")
+
+        server = threading.Thread(target=serve_socket, args=(socket_path,))
+        server.start()
+
+        for _ in range(0, 100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.05)
+
+        # the daemon keeps running between connections
+        first = submit_jobs(socket_path, [{"id": "a", "job": "ping"}])
+        second = submit_jobs(socket_path, [{"id": "b", "job": "modify", "in_file": self.files["ssm"], "out_file": self.path("socket.ssm"),
+                                            "operations": [{"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5]}]},
+                                           {"id": "c", "job": "shutdown"}])
+
+        server.join(10)
+
+        self.assertFalse(server.is_alive(), 'Daemon did not shut down')
+        self.assertTrue(first[0]["ok"] and first[0]["result"]["pid"] == os.getpid(), 'ping job failed')
+        self.assertTrue(second[0]["ok"], 'modify job failed: %s' % second[0]["error"])
+        self.assertEqual(second[0]["result"]["variants"], len(load_ssm(self.path("socket.ssm"))), 'Incorrect modify result')
+        self.assertFalse(os.path.exists(socket_path), 'Socket was not removed on shutdown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+import os, sys
+import json
+import tempfile
+
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
+sys.path.append(os.environ["UTILS_DIR"] + "/ssm_file/utils")
+sys.path.append(os.environ["UTILS_DIR"] + "/subpop_file")
+sys.path.append(os.environ["UTILS_DIR"] + "/tsv_file")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ssm_columns import *
+from mpn_aml_columns import CHR, POSITION, GENE, SAMPLE_NAMES
+from variant_db import Variant_DB, KIND_AGGREGATED, KIND_TXT, KEY_GENE, KEY_SAMPLE, LOCUS, DB_PATIENT
+from split_data import read_fn, read_params, split_data, split_data_from_store
+from generate_subpop_xls import create_subpop_file, create_subpop_file_from_store
+from modify_tsv import load_ssm, save_ssm, match_tsv_to_ssm, match_tsv_to_store
+from cohort_fixtures import write_cohort
+
+
+class Variant_DB_Tests(unittest.TestCase):
+    """
+    Test cases for the SQLite variant database (variant_db.py) and the tools that can read from it.
+    use 'python3 test_variant_db.py' to run the test suite
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.files = write_cohort(self.tmp_dir.name, n_loci=40, n_samples=4, n_clusters=3, seed=5)
+
+        self.db = Variant_DB(self.path("cohort.db"))
+        self.db.ingest("Pt0", self.files["ssm"], self.files["params"], self.files["primary"], self.files["txt"])
+
+
+    def tearDown(self):
+
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+
+    def path(self, name):
+
+        return os.path.join(self.tmp_dir.name, name)
+
+
+    def read(self, file_name):
+
+        with open(file_name) as in_file:
+            return in_file.read()
+
+
+    def test_queries(self):
+
+        txt_df = pd.read_csv(self.files["txt"], sep="\t")
+        primary_df = pd.read_excel(self.files["primary"])
+
+        # rows come back with the columns and row numbers of the file (the txt has both "sample" and "Sample")
+        self.assertTrue(self.db.data_rows("Pt0", KIND_TXT).equals(txt_df), '.txt changed after ingesting it')
+        self.assertTrue(self.db.ssm_rows("Pt0").equals(load_ssm(self.files["ssm"]).astype(str)), '.ssm changed after ingesting it')
+
+        with open(self.files["params"]) as params_json:
+            self.assertEqual(self.db.params("Pt0"), json.load(params_json), 'params changed after ingesting them')
+
+        # lookups, in the order of the keys
+        loci = list(zip(txt_df[CHR.lower()], txt_df["start"]))[::-5]
+
+        expected = pd.concat([txt_df[(txt_df["chr"] == chr) & (txt_df["start"] == pos)] for chr, pos in dict.fromkeys(loci)])
+
+        self.assertTrue(self.db.data_rows("Pt0", KIND_TXT, list(dict.fromkeys(loci)), LOCUS).equals(expected), 'Incorrect rows of loci')
+
+        gene = primary_df[GENE].iloc[0]
+
+        self.assertTrue(self.db.data_rows("Pt0", KIND_AGGREGATED, [(gene,)], (KEY_GENE,)).equals(primary_df[primary_df[GENE] == gene]),
+                        'Incorrect rows of a gene')
+
+        # every patient is queried if none is passed, ingesting a patient again replaces its rows
+        self.db.ingest_data("Pt1", KIND_AGGREGATED, primary_df.drop(columns=[GENE]))
+        self.db.ingest_data("Pt1", KIND_AGGREGATED, primary_df)
+
+        sample = primary_df[SAMPLE_NAMES].iloc[0]
+        rows = self.db.data_rows(None, KIND_AGGREGATED, [(sample,)], (KEY_SAMPLE,))
+
+        self.assertEqual(list(rows[DB_PATIENT].value_counts().sort_index()), [(primary_df[SAMPLE_NAMES] == sample).sum()] * 2, 'Incorrect rows of a sample')
+        self.assertEqual(self.db.patients(), ["Pt0", "Pt1"], 'Incorrect patients')
+
+
+    def test_tools_match_files(self):
+
+        # split_data
+        clusters, garbage = read_params(self.files["params"])
+
+        for name in ["files", "store"]:
+            os.makedirs(self.path("split_" + name))
+
+        split_data(read_fn(self.files["ssm"]), clusters, garbage, read_fn(self.files["txt"]), self.path("split_files"))
+        split_data_from_store(self.db, "Pt0", self.path("split_store"))
+
+        for file_name in os.listdir(self.path("split_files")):
+            self.assertEqual(self.read(os.path.join(self.path("split_files"), file_name)), self.read(os.path.join(self.path("split_store"), file_name)),
+                             'split_data from the store does not match the files (%s)' % file_name)
+
+        # generate_subpop_xls matches <gene>_<position> names to the aggregated rows
+        primary_df = pd.read_excel(self.files["primary"])
+        loci = primary_df.drop_duplicates([CHR, POSITION])
+
+        ssm_df = load_ssm(self.files["ssm"])
+        ssm_df[COL_NAME] = ssm_df[COL_NAME].map(dict(zip(loci[CHR] + "_" + loci[POSITION].astype(str), loci[GENE] + "_" + loci[POSITION].astype(str))))
+
+        save_ssm(ssm_df, self.path("genes.ssm"))
+        self.db.ingest("Pt0", ssm_file=self.path("genes.ssm"))
+
+        create_subpop_file(self.path("genes.ssm"), self.files["params"], self.files["primary"], self.path("subpop.files.xlsx"))
+        create_subpop_file_from_store(self.db, "Pt0", self.path("subpop.store.xlsx"))
+
+        files_sheets = pd.read_excel(self.path("subpop.files.xlsx"), sheet_name=None)
+        store_sheets = pd.read_excel(self.path("subpop.store.xlsx"), sheet_name=None)
+
+        self.assertEqual(list(files_sheets), list(store_sheets), 'Incorrect subpopulations from the store')
+        self.assertTrue(all(files_sheets[sheet].equals(store_sheets[sheet]) for sheet in files_sheets), 'Subpopulations from the store do not match the files')
+
+        # match_tsv_to_ssm
+        self.db.ingest("Pt0", ssm_file=self.files["ssm"])
+
+        match_tsv_to_ssm(self.files["tsv"], self.files["ssm"], self.files["params"])
+        match_tsv_to_store(self.files["tsv"], self.db, "Pt0", self.path("store.params.json"))
+
+        self.assertEqual(self.read(self.files["params"]), self.read(self.path("store.params.json")), 'Clusters from the store do not match the files')
+        self.assertEqual(self.db.params("Pt0")[CLUSTERS], json.loads(self.read(self.files["params"]))[CLUSTERS], 'Clusters are not updated in the store')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,408 @@
+import argparse
+import json
+import sqlite3
+import sys, os
+import warnings
+
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+
+from ssm_columns import *
+from ssm_io import read_ssm
+from table_io import read_table
+import mpn_aml_columns as aggregated_columns
+import mpn_aml_columns_txt as txt_columns
+
+# to load the files of a patient into a variant database, and to query it, use the following commands:
+#   python3 $UTILS_DIR/db_file/variant_db.py ingest -b cohort.db -P example -s example.output.ssm -p example.output.params.json -x example.aggregated.xlsx -d $DATA_DIR/example/results/
+#   python3 $UTILS_DIR/db_file/variant_db.py query -b cohort.db -P example -k aggregated -g JAK2
+#
+# a variant database is an SQLite file holding the aggregated data, .txt data, .ssm and params of any number of patients,
+# with indexes on (chromosome, position), gene, sample and patient, so tools only fetch the rows they need
+
+
+# logical columns of the data tables, and the column each kind of data file has them in
+KEY_CHR = "chr"
+KEY_POSITION = "position"
+KEY_GENE = "gene"
+KEY_SAMPLE = "sample"
+
+LOCUS = (KEY_CHR, KEY_POSITION)
+
+KIND_AGGREGATED = "aggregated"
+KIND_TXT = "txt"
+
+DATA_KINDS = {
+    KIND_AGGREGATED: {
+        KEY_CHR: aggregated_columns.CHR,
+        KEY_POSITION: aggregated_columns.POSITION,
+        KEY_GENE: aggregated_columns.GENE,
+        KEY_SAMPLE: aggregated_columns.SAMPLE_NAMES
+    },
+    KIND_TXT: {
+        KEY_CHR: txt_columns.CHR,
+        KEY_POSITION: txt_columns.START,
+        KEY_GENE: txt_columns.GENE,
+        KEY_SAMPLE: txt_columns.SAMPLEA
+    }
+}
+
+# columns of the indexes of every data table (patient is first so queries of one patient use them too)
+DATA_INDEXES = [(KEY_CHR, KEY_POSITION), (KEY_GENE,), (KEY_SAMPLE,)]
+
+PATIENT = "patient"
+
+# row number of each data row in the file it was read from (rows are returned indexed by it)
+FILE_ROW = "file_row"
+
+# column of the patient of each row in queries of every patient (files can have a patient column of their own)
+DB_PATIENT = "db_patient"
+
+SSM_COLUMNS = [COL_ID, COL_NAME, COL_VAR_READS, COL_TOTAL_READS, COL_VAR_READ_PROB]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ssm (patient TEXT, id TEXT, name TEXT, var_reads TEXT, total_reads TEXT, var_read_prob TEXT);
+CREATE INDEX IF NOT EXISTS ssm_patient_id ON ssm (patient, id);
+CREATE INDEX IF NOT EXISTS ssm_patient_name ON ssm (patient, name);
+CREATE TABLE IF NOT EXISTS params (patient TEXT PRIMARY KEY, params TEXT);
+CREATE TABLE IF NOT EXISTS data_columns (kind TEXT, patient TEXT, position INTEGER, name TEXT, sql_name TEXT);
+CREATE INDEX IF NOT EXISTS data_columns_kind_patient ON data_columns (kind, patient);
+"""
+
+
+def _quote(name):
+
+    return '"%s"' % name.replace('"', '""')
+
+
+class Variant_DB:
+    """
+    SQLite database of the aggregated data, .txt data, .ssm and params of a cohort, keyed by patient.
+
+    Each kind of data (DATA_KINDS) is kept in its own table (data_<kind>) with the columns of the files it was read from,
+    the names of which are recorded in data_columns, so rows come back with the columns (and order) of the patient's file.
+    Ingesting a patient again replaces everything previously ingested for it.
+    """
+
+    def __init__(self, db_file):
+
+        self.db_file = db_file
+
+        self.connection = sqlite3.connect(db_file)
+        self.connection.executescript(SCHEMA)
+
+
+    def close(self):
+
+        self.connection.close()
+
+
+    def __enter__(self):
+
+        return self
+
+
+    def __exit__(self, *exc_info):
+
+        self.close()
+
+
+    def patients(self):
+        """
+        Returns the patients with anything ingested
+        """
+        tables = ["ssm", "params"] + [self._data_table(kind) for kind in DATA_KINDS if self._has_table(self._data_table(kind))]
+
+        query = " UNION ".join("SELECT patient FROM %s" % table for table in tables)
+
+        return sorted(row[0] for row in self.connection.execute(query))
+
+
+    def _has_table(self, table):
+
+        return self.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+    def _data_table(self, kind):
+
+        return "data_" + kind
+
+
+    def _sql_names(self, kind):
+        """
+        Returns the column of the data table of kind that each column name is stored in
+        """
+        return dict(self.connection.execute("SELECT DISTINCT name, sql_name FROM data_columns WHERE kind = ?", (kind,)).fetchall())
+
+
+    def _key_sql_names(self, kind, keys):
+
+        sql_names = self._sql_names(kind)
+
+        return [sql_names.get(DATA_KINDS[kind][key], DATA_KINDS[kind][key]) for key in keys]
+
+
+    def ingest_data(self, patient, kind, dataframe):
+        """
+        Adds the rows of an aggregated (or .txt) dataframe of a patient to the data table of kind
+        """
+        table = self._data_table(kind)
+
+        with self.connection:
+
+            sql_names = self._sql_names(kind)
+
+            # SQLite column names are case-insensitive, so e.g. the "sample" and "Sample" columns of a .txt can't both be kept as is
+            taken = set(sql_name.lower() for sql_name in sql_names.values()) | {PATIENT, FILE_ROW}
+            new_names = {}
+
+            for name in map(str, dataframe.columns):
+
+                if name in sql_names:
+                    continue
+
+                sql_name = name
+
+                while sql_name.lower() in taken:
+                    sql_name += "_"
+
+                taken.add(sql_name.lower())
+                new_names[name] = sql_name
+
+            if self._has_table(table):
+
+                self.connection.execute("DELETE FROM %s WHERE patient = ?" % table, (patient,))
+
+                for sql_name in new_names.values():
+                    self.connection.execute("ALTER TABLE %s ADD COLUMN %s" % (table, _quote(sql_name)))
+
+            sql_names.update(new_names)
+
+            self.connection.execute("DELETE FROM data_columns WHERE kind = ? AND patient = ?", (kind, patient))
+            self.connection.executemany("INSERT INTO data_columns VALUES (?, ?, ?, ?, ?)",
+                                        [(kind, patient, position, str(name), sql_names[str(name)]) for position, name in enumerate(dataframe.columns)])
+
+            rows = dataframe.copy()
+            rows.columns = [sql_names[str(name)] for name in dataframe.columns]
+            rows.insert(0, PATIENT, patient)
+            rows.insert(1, FILE_ROW, range(0, len(rows)))
+
+            # (pandas warns that column names with spaces, e.g. "Unnamed: 0", are kept as they are)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                rows.to_sql(table, self.connection, if_exists="append", index=False)
+
+            for keys in [()] + DATA_INDEXES:
+
+                # (a file without e.g. a gene column is not indexed on it)
+                if not all(DATA_KINDS[kind][key] in sql_names for key in keys):
+                    continue
+
+                columns = [PATIENT] + [sql_names[DATA_KINDS[kind][key]] for key in keys]
+
+                self.connection.execute("CREATE INDEX IF NOT EXISTS %s ON %s (%s)" % (_quote("_".join([table, PATIENT] + list(keys))), table, ", ".join(map(_quote, columns))))
+
+
+    def ingest_ssm(self, patient, ssm_df):
+        """
+        Replaces the .ssm of a patient
+        """
+        with self.connection:
+
+            self.connection.execute("DELETE FROM ssm WHERE patient = ?", (patient,))
+            self.connection.executemany("INSERT INTO ssm VALUES (?, ?, ?, ?, ?, ?)",
+                                        [(patient,) + tuple(row) for row in ssm_df[SSM_COLUMNS].astype(str).itertuples(index=False)])
+
+
+    def ingest_params(self, patient, params):
+        """
+        Replaces the params (samples, clusters, garbage) of a patient
+        """
+        with self.connection:
+
+            self.connection.execute("INSERT OR REPLACE INTO params VALUES (?, ?)", (patient, json.dumps(params)))
+
+
+    def ingest(self, patient, ssm_file=None, params_file=None, aggregated_file=None, txt_file=None):
+        """
+        Loads any of the .ssm, .params.json, aggregated xlsx (or parquet/feather) and .txt of a patient
+        """
+        if ssm_file:
+            self.ingest_ssm(patient, read_ssm(ssm_file))
+
+        if params_file:
+            with open(params_file) as params_json:
+                self.ingest_params(patient, json.load(params_json))
+
+        if aggregated_file:
+            self.ingest_data(patient, KIND_AGGREGATED, read_table(aggregated_file))
+
+        if txt_file:
+            self.ingest_data(patient, KIND_TXT, pd.read_csv(txt_file, sep="\t"))
+
+
+    def params(self, patient):
+        """
+        Returns the params of a patient (None if it has none)
+        """
+        row = self.connection.execute("SELECT params FROM params WHERE patient = ?", (patient,)).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+
+    def _matching(self, table, select, key_columns, keys, patient, in_key_order=True):
+        """
+        Returns the rows of table matching one of keys on key_columns (in the order of keys, the rows of a key in the order they
+        were ingested, or only in the order they were ingested), or every row if keys is None.
+        The keys are put in a temporary table so any number of them can be looked up.
+        """
+        conditions = ["t.patient = ?"] if patient is not None else []
+        parameters = [patient] if patient is not None else []
+
+        if keys is None:
+            query = "SELECT %s FROM %s t %s ORDER BY t.rowid" % (select, table, "WHERE " + " AND ".join(conditions) if conditions else "")
+
+            return pd.read_sql_query(query, self.connection, params=parameters)
+
+        self.connection.execute("DROP TABLE IF EXISTS temp.lookup")
+        self.connection.execute("CREATE TEMP TABLE lookup (key_order INTEGER, %s)" % ", ".join("k%d" % i for i in range(len(key_columns))))
+        self.connection.executemany("INSERT INTO temp.lookup VALUES (%s)" % ", ".join(["?"] * (len(key_columns) + 1)),
+                                    [(order,) + tuple(key) for order, key in enumerate(keys)])
+
+        conditions += ["t.%s = k.k%d" % (_quote(column), i) for i, column in enumerate(key_columns)]
+
+        query = "SELECT %s FROM temp.lookup k JOIN %s t ON %s ORDER BY %s" % (select, table, " AND ".join(conditions),
+                                                                              "k.key_order, t.rowid" if in_key_order else "t.rowid")
+
+        dataframe = pd.read_sql_query(query, self.connection, params=parameters)
+
+        self.connection.execute("DROP TABLE temp.lookup")
+
+        return dataframe
+
+
+    def data_rows(self, patient, kind, keys=None, by=LOCUS):
+        """
+        Returns the rows of the data of kind whose by columns (e.g. (KEY_CHR, KEY_POSITION) or (KEY_GENE,)) match one of keys,
+        with the columns (and row numbers, as the index) of the patient's file. If patient is None, the rows of every patient are returned (with a DB_PATIENT column).
+        """
+        if not self._has_table(self._data_table(kind)):
+            return pd.DataFrame()
+
+        if patient is None:
+            columns = self.connection.execute("SELECT name, sql_name FROM data_columns WHERE kind = ? ORDER BY patient, position", (kind,)).fetchall()
+            columns = [(DB_PATIENT, PATIENT)] + list(dict.fromkeys(columns))
+        else:
+            columns = self.connection.execute("SELECT name, sql_name FROM data_columns WHERE kind = ? AND patient = ? ORDER BY position", (kind, patient)).fetchall()
+
+        if not columns:
+            return pd.DataFrame()
+
+        # positions are stored as integers
+        if keys is not None and KEY_POSITION in by:
+            keys = [tuple(int(value) if key == KEY_POSITION else value for key, value in zip(by, key)) for key in keys]
+
+        select = ", ".join("t.%s" % _quote(sql_name) for _, sql_name in [(FILE_ROW, FILE_ROW)] + columns)
+
+        dataframe = self._matching(self._data_table(kind), select, self._key_sql_names(kind, by), keys, patient)
+        dataframe.columns = [FILE_ROW] + [name for name, _ in columns]
+
+        return dataframe.set_index(FILE_ROW).rename_axis(None)
+
+
+    def ssm_rows(self, patient, ids=None, names=None):
+        """
+        Returns the .ssm rows (in .ssm order) of a patient with one of ids (or names), every row if neither is passed
+        """
+        column, keys = (COL_ID, ids) if ids is not None else (COL_NAME, names)
+
+        if keys is not None:
+            keys = [(key,) for key in dict.fromkeys(keys)]
+
+        select = ", ".join("t." + column for column in SSM_COLUMNS)
+
+        return self._matching("ssm", select, [column], keys, patient, in_key_order=False)
+
+
+def _parse_args():
+    """
+    Parses command line arguments.
+    """
+    parser = argparse.ArgumentParser(
+
+        description='Ingest the .ssm, params and data files of patients into a variant database (SQLite), or query it.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+
+    )
+
+    parser.add_argument('command', help='ingest files, query rows or list the patients', choices=("ingest", "query", "patients"))
+    parser.add_argument('-b', '--db-file', help='Variant database (created if it does not exist)', required=True)
+    parser.add_argument('-P', '--patients', nargs='+', help='Patient of each set of files (ingest) or patient to query (every patient if not passed)')
+    parser.add_argument('-s', '--ssm-files', nargs='+', help='.ssm file of each patient', default=[])
+    parser.add_argument('-p', '--params-files', nargs='+', help='.params.json file of each patient', default=[])
+    parser.add_argument('-x', '--aggregated-files', nargs='+', help='Aggregated xlsx (or parquet/feather) file of each patient', default=[])
+    parser.add_argument('-t', '--txt-files', nargs='+', help='.txt data file of each patient', default=[])
+    parser.add_argument('-k', '--kind', help='Data to query (ssm, or a kind of data file)', choices=("ssm",) + tuple(DATA_KINDS.keys()), default=KIND_AGGREGATED)
+    parser.add_argument('-l', '--loci', nargs='+', help='<chromosome>_<position> loci to query')
+    parser.add_argument('-g', '--genes', nargs='+', help='Genes to query')
+    parser.add_argument('-m', '--samples', nargs='+', help='Samples to query')
+    parser.add_argument('-i', '--ids', nargs='+', help='.ssm ids to query (ssm only)')
+    parser.add_argument('-o', '--out-file', help='Tab delimited file to write queried rows to (printed if not passed)')
+    parser.add_argument('-d', '--directory', help='Directory to read ingested files from (and write the out-file to).', default="")
+
+    return parser.parse_args()
+
+
+def main():
+    """
+    Performs checks on command line arguments, then ingests files into or queries the variant database.
+    """
+    args = _parse_args()
+
+    with Variant_DB(args.db_file) as db:
+
+        if args.command == "patients":
+            print("\n".join(db.patients()))
+
+        elif args.command == "ingest":
+
+            if not args.patients:
+                raise ValueError("Did not pass the patients to ingest")
+
+            for files in (args.ssm_files, args.params_files, args.aggregated_files, args.txt_files):
+                if files and len(files) != len(args.patients):
+                    raise ValueError("Number of files must match the number of patients")
+
+            for i, patient in enumerate(args.patients):
+
+                file_name = lambda files: args.directory + files[i] if files else None
+
+                db.ingest(patient, file_name(args.ssm_files), file_name(args.params_files), file_name(args.aggregated_files), file_name(args.txt_files))
+
+        else:
+
+            patient = args.patients[0] if args.patients else None
+
+            if args.kind == "ssm":
+                dataframe = db.ssm_rows(patient, ids=args.ids)
+
+            elif args.loci:
+                dataframe = db.data_rows(patient, args.kind, [locus.rsplit("_", 1) for locus in args.loci], LOCUS)
+
+            elif args.genes:
+                dataframe = db.data_rows(patient, args.kind, [(gene,) for gene in args.genes], (KEY_GENE,))
+
+            else:
+                dataframe = db.data_rows(patient, args.kind, [(sample,) for sample in args.samples] if args.samples else None, (KEY_SAMPLE,))
+
+            if args.out_file:
+                dataframe.to_csv(args.directory + args.out_file, sep="\t", index=False)
+            else:
+                print(dataframe.to_string(index=False))
+
+
+
+
+if __name__ == '__main__':
+  main()
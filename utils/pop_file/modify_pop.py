@@ -2,6 +2,10 @@ import pandas as pd
 import numpy as np
 import sys, os, math
 
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+
+from table_io import read_table, write_table
+
 
 def load_csv(csv_file, header=None):
     """
@@ -12,16 +16,16 @@ def load_csv(csv_file, header=None):
 
 def load_excel(file_name, sheet_name, header=0):
     """
-    Return a dataframe from an excel file
+    Return a dataframe from an excel (or parquet/feather) file
     """
-    return pd.read_excel(file_name, sheet_name, header=header)
+    return read_table(file_name, sheet_name, header=header)
 
 
-def save_excel(dataframe, file_name, sheet_name, header=0):
+def save_excel(dataframe, file_name, sheet_name, header=0, fmt=None):
     """
-    Save a dataframe to excel. Default is without any header
+    Save a dataframe to excel (or parquet/feather, by fmt or the extension of file_name). Default is without any header
     """
-    dataframe.to_excel(file_name, sheet_name=sheet_name, header=header, index=False)
+    write_table(dataframe, file_name, sheet_name=sheet_name, fmt=fmt, index=False, header=header)
 
 
 def select_pops(dataframe, pops):
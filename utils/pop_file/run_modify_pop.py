@@ -2,6 +2,7 @@ import operator
 import argparse
 
 from modify_pop import load_excel, load_csv, save_excel, select_pops, remove_pops
+from table_io import TABLE_FORMATS, with_format_extension
 
 # to run an example, use the following command:
 #   python3 $UTILS_DIR/ssm_file/utils/run_modify_pop.py -i example.output.ssm -o example.modified.ssm -d $DATA_DIR/example/results/ -a \> 0.5 -m RM_VARS_BY_VAF
@@ -28,6 +29,7 @@ def _parse_args():
     parser.add_argument('-o', '--out-file', nargs='+', help='Modified population file <file_name> <sheet_name> <header>', required=True)
     parser.add_argument('-c', '--mod-file', help='Csv of populations to modify.')
     parser.add_argument('-m', '--mod-method', help='Modification method to be applied to ssm file.', choices=tuple(MOD_METHODS.keys()), required=True)
+    parser.add_argument('-F', '--output-format', default=None, help='Format to write the modified population file in (default: from the extension of the out-file)', choices=TABLE_FORMATS)
 
 
     args = parser.parse_args()
@@ -47,6 +49,8 @@ def main():
     if args.out_file[-1] == 'None':
         args.out_file[-1] = None
 
+    args.out_file[0] = with_format_extension(args.out_file[0], args.output_format)
+
     # apply method
     save_excel(
 
@@ -54,7 +58,8 @@ def main():
             load_excel(*args.population_file),
             load_csv(args.mod_file)
         ),
-        *args.out_file
+        *args.out_file,
+        fmt=args.output_format
 
     )
 
@@ -0,0 +1,475 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+from functools import partial
+
+os.environ.setdefault("UTILS_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+# run as a script (or imported by name), the api is imported as part of the package in UTILS_DIR
+if not __package__:
+    sys.path.insert(0, os.path.dirname(os.path.normpath(os.environ["UTILS_DIR"])))
+    __package__ = os.path.basename(os.path.normpath(os.environ["UTILS_DIR"]))
+
+from . import api
+from input_validation import DEFAULT_VALIDATION
+from ssm_io import params_file_for
+from table_io import read_spec
+
+# runs aggregate -> process -> modify -> split for a batch of patients like make, e.g.
+#   python3 $UTILS_DIR/run_batch.py -b batch.json -w 4
+# with batch.json
+#   {"input_directory": "data/", "output_directory": "results/",
+#    "defaults": {"processor": "MPN_AML_Processor", "operations": [{"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5]}]},
+#    "patients": {"p1": {"primary": ["p1.primary.xlsx", "Sheet1"], "calls": ["p1.calls.xlsx", "Sheet1"],
+#                        "populations": ["p1.populations.xlsx", "Sheet1", null], "data": "p1.txt"}}}
+#
+# every stage writes into <output_directory>/<patient>/, and records in <patient>.manifest.json the content hashes of its
+# inputs and outputs, its parameters and the version of the code it ran. Running the batch again skips every stage whose
+# record still matches (so it resumes from the first stale or failed stage), and patients run concurrently.
+
+
+# stages of a patient, in the order they run (a stage only runs if the patient has its inputs, see patient_stages)
+STAGE_AGGREGATE = "aggregate"
+STAGE_PROCESS = "process"
+STAGE_MODIFY = "modify"
+STAGE_SPLIT = "split"
+
+STAGES = [STAGE_AGGREGATE, STAGE_PROCESS, STAGE_MODIFY, STAGE_SPLIT]
+
+# directories and files (relative to UTILS_DIR) with the code each stage runs (everything its entry point imports, and the api
+# for the stages run through it), the code version of a stage is the hash of their sources
+STAGE_CODE = {
+    STAGE_AGGREGATE: ["common", "xls_file", "pdf_templates/mpn_aml_metrics_pdf.py"],
+    STAGE_PROCESS: ["common", "ssm_file/ssm_processors", "ssm_file/run_processor.py"],
+    STAGE_MODIFY: ["common", "api.py", "ssm_file/utils/modify_ssm.py", "ssm_file/utils/run_modify_ssm.py", "ssm_file/utils/ssm_store.py"],
+    STAGE_SPLIT: ["common", "api.py", "ssm_file/utils/split_data.py", "ssm_file/utils/modify_ssm.py", "ssm_file/utils/ssm_store.py", "db_file/variant_db.py"]
+}
+
+# outcome of a stage in a run
+RAN = "ran"
+UP_TO_DATE = "up-to-date"
+STALE = "stale"        # would run (with dry_run)
+FAILED = "failed"
+BLOCKED = "blocked"    # an earlier stage failed
+
+MANIFEST_EXT = ".manifest.json"
+
+# size of the blocks files are hashed in
+HASH_BLOCK_SIZE = 2**20
+
+
+class File_Digests:
+    """
+    Content hashes (sha256) of files, a file whose size and modification time match the ones recorded with its hash isn't read again.
+    The hash of a directory is the hash of the names and hashes of the files in it.
+    """
+    def __init__(self, recorded=None):
+
+        self.recorded = dict(recorded or {})
+
+
+    def file_digest(self, file_name):
+
+        stat = os.stat(file_name)
+        recorded = self.recorded.get(file_name)
+
+        if recorded and recorded["size"] == stat.st_size and recorded["mtime_ns"] == stat.st_mtime_ns:
+            return recorded["sha256"]
+
+        sha256 = hashlib.sha256()
+
+        with open(file_name, "rb") as in_file:
+            for block in iter(lambda: in_file.read(HASH_BLOCK_SIZE), b""):
+                sha256.update(block)
+
+        self.recorded[file_name] = {"sha256": sha256.hexdigest(), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+        return sha256.hexdigest()
+
+
+    def digest(self, path):
+        """
+        Returns the hash of a file or directory (None if it doesn't exist)
+        """
+        if os.path.isdir(path):
+
+            sha256 = hashlib.sha256()
+
+            for root, _, files in sorted(os.walk(path)):
+                for name in sorted(files):
+                    file_name = os.path.join(root, name)
+                    sha256.update(("%s %s\n" % (os.path.relpath(file_name, path), self.file_digest(file_name))).encode())
+
+            return sha256.hexdigest()
+
+        if os.path.isfile(path):
+            return self.file_digest(path)
+
+        return None
+
+
+    def digests(self, paths):
+
+        return {path: self.digest(path) for path in paths}
+
+
+_code_versions = {}
+
+def code_version(stage):
+    """
+    Returns the hash of the sources of a stage (see STAGE_CODE), computed once per process
+    """
+    if stage not in _code_versions:
+
+        sha256 = hashlib.sha256()
+
+        for path in STAGE_CODE[stage]:
+
+            path = os.path.join(os.environ["UTILS_DIR"], path)
+            sources = [path] if os.path.isfile(path) else \
+                      sorted(os.path.join(root, name) for root, dirs, files in os.walk(path) if "tests" not in root.split(os.sep) for name in files if name.endswith(".py"))
+
+            for source in sources:
+                with open(source, "rb") as source_file:
+                    sha256.update(os.path.relpath(source, os.environ["UTILS_DIR"]).encode() + b"\n" + source_file.read())
+
+        _code_versions[stage] = sha256.hexdigest()
+
+    return _code_versions[stage]
+
+
+class Stage:
+    """
+    A stage of a patient: the files it reads and writes, its (json) parameters and the function that runs it
+    """
+    def __init__(self, name, inputs, outputs, params, run):
+
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params
+        self.run = run
+
+
+class Manifest:
+    """
+    Record of the stages of a patient that ran (<output directory>/<patient>.manifest.json), for every stage:
+    its status (done/failed), the hashes of its inputs and outputs, its parameters and code version
+    """
+    def __init__(self, manifest_file):
+
+        self.manifest_file = manifest_file
+
+        self.stages, files = {}, {}
+
+        if os.path.exists(manifest_file):
+            with open(manifest_file) as manifest_json:
+                manifest = json.load(manifest_json)
+                self.stages, files = manifest["stages"], manifest["files"]
+
+        self.digests = File_Digests(files)
+
+
+    def is_up_to_date(self, stage):
+        """
+        Whether the stage ran successfully with the same inputs, parameters and code, and its outputs are unchanged since
+        """
+        record = self.stages.get(stage.name)
+
+        return record is not None and record["status"] == "done" and \
+               record["code"] == code_version(stage.name) and \
+               record["params"] == json.loads(json.dumps(stage.params)) and \
+               record["inputs"] == self.digests.digests(stage.inputs) and \
+               record["outputs"] == self.digests.digests(stage.outputs)
+
+
+    def record(self, stage, status, seconds, error=None):
+
+        self.stages[stage.name] = {
+            "status": status,
+            "code": code_version(stage.name),
+            "params": stage.params,
+            "inputs": self.digests.digests(stage.inputs),
+            "outputs": self.digests.digests(stage.outputs) if status == "done" else {},
+            "seconds": round(seconds, 3),
+            "error": error
+        }
+
+        self.save()
+
+
+    def save(self):
+
+        # only the hashes of files (or files in directories) that are still recorded by a stage are kept
+        paths = set(path for record in self.stages.values() for files in (record["inputs"], record["outputs"]) for path in files)
+        files = {path: digest for path, digest in self.digests.recorded.items() if path in paths or os.path.dirname(path) in paths}
+
+        # written to a temporary file first, so an interrupted run never leaves a partial manifest
+        with open(self.manifest_file + ".tmp", "w") as manifest_json:
+            json.dump({"stages": self.stages, "files": files}, manifest_json, indent=2)
+
+        os.replace(self.manifest_file + ".tmp", self.manifest_file)
+
+
+def _files_in_args(args):
+    """
+    Returns the arguments of an operation that are files (e.g. the regions of KEEP_VARS_IN_REGIONS), their content is an input of the stage
+    """
+    return [arg for arg in args if isinstance(arg, str) and os.path.isfile(arg)]
+
+
+def _aggregate(aggregator, primary, calls, populations, out_file, impute_technique, regions, panel_only, validation):
+
+    from run_aggregator import aggregator_dict, run_aggregators, IMPUTE_ZERO
+
+    # run_aggregators joins the directories onto (and otherwise edits) the lists it is passed
+    run_aggregators(aggregator_dict[aggregator], list(primary), list(calls), list(populations), [out_file, "Sheet1"], "", None, None,
+                    impute_technique or IMPUTE_ZERO, regions=regions, panel_only=panel_only, validation=validation)
+
+
+def _process(processor, in_file, out_file, segments, garbage_thresholds, regions, panel_only, validation):
+
+    from run_processor import PROCESSORS, run_processors
+
+    run_processors([PROCESSORS[processor]], [in_file], [out_file], None, segments_files=[segments], garbage_thresholds=garbage_thresholds,
+                   regions=regions, panel_only=panel_only, validation=validation)
+
+
+def _modify(in_file, operations, out_file):
+
+    api.modify(in_file, operations, out_file)
+
+
+def _split(ssm_file, params_file, data_file, out_dir, params_ssm_file=None):
+
+    import shutil
+    from modify_ssm import load_index, remap_params
+
+    # the clusters of a previous run may not be there anymore
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    with open(params_file) as params_json:
+        params = json.load(params_json)
+
+    # params of an .ssm that was modified since are remapped to the ids of the modified .ssm
+    if params_ssm_file and params_ssm_file != ssm_file:
+        params = remap_params(params, load_index(params_ssm_file), load_index(ssm_file))
+
+    api.split(ssm_file, params, data_file, out_dir)
+
+
+def patient_stages(patient, spec, input_directory="", output_directory=""):
+    """
+    Returns the stages of a patient (see load_batch for its spec), each writing into <output_directory>/<patient>/:
+        aggregate: primary/calls/populations -> <patient>.aggregated.xlsx (if the patient has a primary file, otherwise
+                   in_file, an aggregated xlsx or .txt, is processed)
+        process:   -> <patient>.ssm and <patient>.params.json
+        modify:    operations (see run_modify_ssm.load_operations) -> <patient>.modified.ssm (if there are operations)
+        split:     data (the original .txt) -> split/cluster<N>.txt, split/garbage.txt for the clusters of params
+                   (a clustered .params.json of the processed .ssm, by default the processed one) (if the patient has data),
+                   their ids are remapped to the modified .ssm (see modify_ssm.remap_params)
+    """
+    in_path = lambda name: os.path.join(input_directory, name) if name else ""
+
+    out_dir = os.path.join(output_directory, patient)
+    out_path = lambda ext: os.path.join(out_dir, patient + ext)
+
+    regions = in_path(spec.get("regions", ""))
+    panel_only = spec.get("panel_only", False)
+    validation = spec.get("validation", DEFAULT_VALIDATION)
+
+    stages = []
+
+    if spec.get("primary"):
+
+        primary, calls, populations = ([in_path(xls[0])] + list(xls[1:]) for xls in (spec["primary"], spec["calls"], spec["populations"]))
+
+        in_file = out_path(".aggregated.xlsx")
+
+        params = {
+            "aggregator": spec.get("aggregator", "MPN_AML_Aggregator"),
+            "sheets": [primary[1:], calls[1:], populations[1:]],
+            "impute_technique": spec.get("impute_technique"),
+            "panel_only": panel_only,
+            "validation": validation
+        }
+
+        stages.append(Stage(STAGE_AGGREGATE, [primary[0], calls[0], populations[0]] + ([regions] if regions else []), [in_file], params,
+                            partial(_aggregate, params["aggregator"], primary, calls, populations, in_file, params["impute_technique"], regions, panel_only, validation)))
+
+    else:
+        in_file = in_path(spec["in_file"])
+
+    ssm_file, params_file = out_path(".ssm"), out_path(".params.json")
+    segments = in_path(spec.get("segments", ""))
+
+    process_params = {
+        "processor": spec.get("processor", "MPN_AML_Processor"),
+        "garbage_thresholds": spec.get("garbage_thresholds"),
+        "panel_only": panel_only,
+        "validation": validation
+    }
+
+    stages.append(Stage(STAGE_PROCESS, [in_file] + [path for path in (segments, regions) if path], [ssm_file, params_file], process_params,
+                        partial(_process, process_params["processor"], in_file, ssm_file, segments, process_params["garbage_thresholds"], regions, panel_only, validation)))
+
+    processed_file = ssm_file
+
+    if spec.get("operations"):
+
+        # operations without arguments use the processed .params.json (see run_pipeline.py)
+        operations = [operation if operation.get("args") else dict({"params_file": params_file}, **operation) for operation in spec["operations"]]
+        modified_file = out_path(".modified.ssm")
+
+        operation_files = [path for operation in operations
+                                for path in _files_in_args(operation.get("args", [])) + [operation.get(name) for name in ("params_file", "names_fn") if operation.get(name)]]
+
+        stages.append(Stage(STAGE_MODIFY, [ssm_file] + [path for path in dict.fromkeys(operation_files) if path != ssm_file], [modified_file, params_file_for(modified_file)], {"operations": spec["operations"]},
+                            partial(_modify, ssm_file, operations, modified_file)))
+
+        ssm_file = modified_file
+
+    if spec.get("data"):
+
+        data, clusters_file, split_dir = in_path(spec["data"]), in_path(spec["params"]) if spec.get("params") else params_file, os.path.join(out_dir, "split")
+
+        stages.append(Stage(STAGE_SPLIT, list(dict.fromkeys([processed_file, ssm_file, clusters_file, data])), [split_dir], {},
+                            partial(_split, ssm_file, clusters_file, data, split_dir, processed_file)))
+
+    return stages
+
+
+def run_patient(patient, spec, input_directory="", output_directory="", force=False, dry_run=False):
+    """
+    Runs the stages of a patient that aren't up to date (all of them with force), in order. A failed stage is recorded as failed
+    and stops the patient (the stages after it are blocked). With dry_run, the stages that would run are only reported as stale.
+    Returns a dictionary of the outcome of every stage.
+    """
+    import traceback
+
+    os.makedirs(os.path.join(output_directory, patient), exist_ok=True)
+
+    manifest = Manifest(os.path.join(output_directory, patient, patient + MANIFEST_EXT))
+
+    outcomes = {}
+
+    for stage in patient_stages(patient, spec, input_directory, output_directory):
+
+        previous = list(outcomes.values())[-1] if outcomes else None
+
+        if previous in (FAILED, BLOCKED):
+            outcomes[stage.name] = BLOCKED
+
+        # the outputs of a stale stage will change, so (without running it) the stages after it are stale as well
+        elif dry_run and previous == STALE:
+            outcomes[stage.name] = STALE
+
+        elif not force and manifest.is_up_to_date(stage):
+            outcomes[stage.name] = UP_TO_DATE
+
+        elif dry_run:
+            outcomes[stage.name] = STALE
+
+        else:
+            start = time.perf_counter()
+
+            try:
+                stage.run()
+
+            except Exception:
+                manifest.record(stage, "failed", time.perf_counter() - start, traceback.format_exc())
+                outcomes[stage.name] = FAILED
+
+            else:
+                manifest.record(stage, "done", time.perf_counter() - start)
+                outcomes[stage.name] = RAN
+
+    return outcomes
+
+
+def load_batch(batch_file):
+    """
+    Reads a batch from a .json or .yaml file: {"input_directory", "output_directory", "defaults", "patients"}, where patients maps
+    the name of each patient to its spec (the file names of its inputs and the parameters of its stages, see patient_stages),
+    and the defaults are used for anything a patient doesn't set
+    """
+    batch = read_spec(batch_file)
+
+    from run_modify_ssm import MOD_METHODS
+
+    batch["patients"] = {patient: dict(batch.get("defaults", {}), **spec) for patient, spec in batch["patients"].items()}
+
+    for patient, spec in batch["patients"].items():
+        for operation in spec.get("operations", []):
+            if operation.get("mod_method") not in MOD_METHODS:
+                raise argparse.ArgumentTypeError('unknown modification method %s of patient %s in %s' % (operation.get("mod_method"), patient, batch_file))
+
+    return batch
+
+
+def run_batch(patients, input_directory="", output_directory="", workers=None, force=False, dry_run=False):
+    """
+    Runs the stages of every patient (a dictionary of patient -> spec, see patient_stages) that aren't up to date.
+    Patients are independent, so they run concurrently in workers processes (by default one per patient, up to the number of CPUs,
+    1 runs them one after another in this process). Returns a dictionary of patient -> outcome of each stage (see run_patient).
+    """
+    if workers is None:
+        workers = min(len(patients), os.cpu_count() or 1)
+
+    if workers <= 1:
+        return {patient: run_patient(patient, spec, input_directory, output_directory, force, dry_run) for patient, spec in patients.items()}
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+
+        futures = {patient: pool.submit(run_patient, patient, spec, input_directory, output_directory, force, dry_run) for patient, spec in patients.items()}
+
+        return {patient: future.result() for patient, future in futures.items()}
+
+
+def main():
+    """
+    Performs checks on command line arguments, then runs the stages of the batch that aren't up to date.
+    """
+    parser = argparse.ArgumentParser(
+
+        description='Run aggregate -> process -> modify -> split for a batch of patients, skipping the stages whose outputs are up to date',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+
+    )
+
+    parser.add_argument('-b', '--batch-file', help='.json/.yaml file with the patients of the batch and their inputs (see load_batch)', required=True)
+    parser.add_argument('-P', '--patients', nargs='+', default=[], help='Only run these patients of the batch')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Number of patients run concurrently (default: one per patient, up to the number of CPUs)')
+    parser.add_argument('-f', '--force', action='store_true', help='Run every stage, even if it is up to date')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='Only print which stages would run')
+
+    args = parser.parse_args()
+
+    batch = load_batch(args.batch_file)
+
+    patients = batch["patients"]
+
+    for patient in args.patients:
+        if patient not in patients:
+            raise argparse.ArgumentTypeError('unknown patient %s' % patient)
+
+    if args.patients:
+        patients = {patient: patients[patient] for patient in args.patients}
+
+    outcomes = run_batch(patients, batch.get("input_directory", ""), batch.get("output_directory", ""), args.workers, args.force, args.dry_run)
+
+    for patient, stages in outcomes.items():
+        print("%s: %s" % (patient, ", ".join("%s %s" % stage for stage in stages.items())))
+
+    if any(outcome == FAILED for stages in outcomes.values() for outcome in stages.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import shlex
+import sys
+
+os.environ.setdefault("UTILS_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+# run as a script (or imported by name), the api is imported as part of the package in UTILS_DIR
+if not __package__:
+    sys.path.insert(0, os.path.dirname(os.path.normpath(os.environ["UTILS_DIR"])))
+    __package__ = os.path.basename(os.path.normpath(os.environ["UTILS_DIR"]))
+
+from . import api
+from input_validation import DEFAULT_VALIDATION, VALIDATION_MODES
+from garbage_detector import GARBAGE_THRESHOLDS, MIN_DEPTH, MIN_COVERED_SAMPLES, MAX_VAF_LLR, MAX_DISPERSION
+
+# to run the example pipeline (aggregate -> process -> modify) without writing the aggregated xlsx, use the following command:
+#   python3 $UTILS_DIR/run_pipeline.py -i $DATA_DIR/example/ -j $DATA_DIR/example/results/                   \
+#       -m example.primary.xlsx Sheet1 -c example.calls.xlsx Sheet1 -p example.populations.xlsx Sheet1 None   \
+#       -o example.pipeline.ssm -x MPN_AML_Processor -e "RM_VARS_BY_VAF > 0.5"
+
+
+def run_pipeline(primary_xls, calls_xls, populations_xls, out_file, operations=[], processor="MPN_AML_Processor",
+                 aggregator="MPN_AML_Aggregator", impute_technique=None, metrics_file="", aggregated_xls=None, processed_ssm="", id_registry="",
+                 low_memory=False, garbage_thresholds=None, segments="", regions="", panel_only=False, validation=DEFAULT_VALIDATION):
+    """
+    Aggregates the primary/call spreadsheets, processes the aggregated dataframe into an .ssm and applies operations to it
+    (see run_modify_ssm.load_operations), passing each result to the next step in memory.
+
+    Only out_file (and its .params.json) is written, unless the aggregated xlsx (aggregated_xls) or the .ssm before any
+    operations (processed_ssm) are requested. Operations without arguments or a params file use the params of the processed .ssm,
+    and the params written with out_file have their cluster/garbage ids remapped to the modified .ssm (see modify_ssm.remap_params).
+    garbage_thresholds, segments, regions, panel_only and validation are passed on as in api.process (and api.aggregate).
+    Returns (.ssm dataframe, params dictionary).
+    """
+    import tempfile
+    from modify_ssm import remap_params
+
+    aggregated_df = api.aggregate(primary_xls, calls_xls, populations_xls, aggregated_xls, metrics_file, impute_technique, aggregator=aggregator,
+                                  low_memory=low_memory, regions=regions, panel_only=panel_only, validation=validation)
+
+    ssm_df, params = api.process(aggregated_df, processed_ssm, processor, id_registry=id_registry, garbage_thresholds=garbage_thresholds,
+                                 segments=segments, regions=regions, panel_only=panel_only, validation=validation)
+
+    # operations that only read the params (SEPARATE_GARBAGE, PYCLONE_FMT) get the processed params, written to a temporary .params.json
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        params_file = os.path.join(tmp_dir, "processed.params.json")
+
+        with open(params_file, "w") as params_json:
+            json.dump(params, params_json)
+
+        operations = [operation if operation.get("args") else dict({"params_file": params_file}, **operation) for operation in operations]
+
+        modified_df = api.modify(ssm_df, operations, out_file, id_registry)
+
+    params = remap_params(params, ssm_df, modified_df)
+
+    if out_file:
+
+        from ssm_io import params_file_for
+
+        with open(params_file_for(out_file), "w") as params_json:
+            json.dump(params, params_json)
+
+    return modified_df, params
+
+
+def main():
+    """
+    Performs checks on command line arguments, then attempts to run the pipeline.
+    """
+    parser = argparse.ArgumentParser(
+
+        description='Aggregate, process and modify in memory, going from spreadsheets with sequencing data to an .ssm and .params.json',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+
+    )
+
+    parser.add_argument('-m', '--primary-file', nargs='+', help='primary file <file_name> <sheet_name>', required=True)
+    parser.add_argument('-c', '--call-file', nargs='+', help='Call file <file_name> <sheet_name>', required=True)
+    parser.add_argument('-p', '--population-file', nargs='+', help='Population file <file_name> <sheet_name> <header>', required=True)
+    parser.add_argument('-o', '--out-file', help='Name of the .ssm file to write (the .params.json is written next to it)', required=True)
+    parser.add_argument('-i', '--input-directory', default="", help='Directory to read primary/call/population files from')
+    parser.add_argument('-j', '--output-directory', default="", help='Directory to write files to')
+    parser.add_argument('-a', '--aggregator', default="MPN_AML_Aggregator", help='Aggregator to run on files')
+    parser.add_argument('-x', '--processor', default="MPN_AML_Processor", help='Processor to run on the aggregated data')
+    parser.add_argument('-t', '--impute-technique', default=None, help='Technique to use for imputing missing values (see run_aggregator.py)')
+    parser.add_argument('-d', '--metrics-file', default="", help='File to output aggregation metrics to')
+    parser.add_argument('-e', '--op', action='append', dest='ops', default=[], help='Operation "<MOD_METHOD> [args ...]" to apply to the .ssm, in order (can be repeated)')
+    parser.add_argument('--chain-file', help='.json/.yaml file with an ordered list of operations to apply (see run_modify_ssm.py)')
+    parser.add_argument('-r', '--id-registry', default="", help='Id registry (.ids.json) to keep variant ids stable with')
+    parser.add_argument('-w', '--aggregated-file', nargs='+', help='Also write the aggregated data <file_name> <sheet_name>')
+    parser.add_argument('-s', '--processed-file', default="", help='Also write the .ssm before any operations are applied')
+    parser.add_argument('-l', '--low-memory', action='store_true', help='Aggregate with categorical/32-bit columns to use less memory (see run_aggregator.py)')
+    parser.add_argument('-S', '--segments-file', default="", help='Copy-number segments file to set var_read_prob from (see copy_number.py)')
+    parser.add_argument('-g', '--regions-file', default="", help='BED/GTF file of the gene/regions that missing genes are filled in from (see region_annotation.py)')
+    parser.add_argument('--panel-only', action='store_true', help='Drop the loci outside of the regions of --regions-file')
+    parser.add_argument('--validation', default=DEFAULT_VALIDATION, choices=VALIDATION_MODES, help='Whether rows failing the integrity checks of the inputs (see input_validation.py) raise an error, are only reported, or are not checked')
+    parser.add_argument('--min-depth', type=int, default=GARBAGE_THRESHOLDS[MIN_DEPTH], help='Garbage mutations have fewer than --min-covered-samples samples with at least this many total reads')
+    parser.add_argument('--min-covered-samples', type=int, default=GARBAGE_THRESHOLDS[MIN_COVERED_SAMPLES], help='See --min-depth (0 turns the depth check off)')
+    parser.add_argument('--max-vaf-llr', type=float, default=GARBAGE_THRESHOLDS[MAX_VAF_LLR], help='Garbage mutations have a VAF above their var_read_prob in a sample with a likelihood-ratio statistic above this (off if not passed, e.g. 19.5, flags homozygous/LOH variants unless their var_read_prob is 1)')
+    parser.add_argument('--max-dispersion', type=float, default=GARBAGE_THRESHOLDS[MAX_DISPERSION], help='Garbage mutations have a likelihood-ratio statistic of sharing one VAF across samples (per degree of freedom) above this (off if not passed)')
+
+    args = parser.parse_args()
+
+    if args.ops and args.chain_file:
+        parser.error('only one of --op or --chain-file can be passed')
+
+    from run_modify_ssm import MOD_METHODS, load_operations
+
+    if args.chain_file:
+        operations = load_operations(args.chain_file)
+    else:
+        operations = [{"mod_method": op[0], "args": op[1:]} for op in map(shlex.split, args.ops)]
+
+    for operation in operations:
+        if operation["mod_method"] not in MOD_METHODS:
+            raise argparse.ArgumentTypeError('unknown modification method %s' % operation["mod_method"])
+
+    # workaround for passing header
+    for xls in [args.primary_file, args.call_file, args.population_file]:
+        xls[0] = args.input_directory + xls[0]
+
+        if xls[-1] == 'None':
+            xls[-1] = None
+
+    if args.aggregated_file:
+        args.aggregated_file[0] = args.output_directory + args.aggregated_file[0]
+
+    run_pipeline(args.primary_file,
+                 args.call_file,
+                 args.population_file,
+                 args.output_directory + args.out_file,
+                 operations,
+                 args.processor,
+                 args.aggregator,
+                 args.impute_technique,
+                 args.output_directory + args.metrics_file if args.metrics_file else "",
+                 args.aggregated_file,
+                 args.output_directory + args.processed_file if args.processed_file else "",
+                 args.output_directory + args.id_registry if args.id_registry else "",
+                 args.low_memory,
+                 {MIN_DEPTH: args.min_depth, MIN_COVERED_SAMPLES: args.min_covered_samples, MAX_VAF_LLR: args.max_vaf_llr, MAX_DISPERSION: args.max_dispersion},
+                 args.input_directory + args.segments_file if args.segments_file else "",
+                 args.regions_file,
+                 args.panel_only,
+                 args.validation)
+
+
+if __name__ == '__main__':
+  main()
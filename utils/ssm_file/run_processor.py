@@ -2,11 +2,14 @@ import argparse
 import os
 import sys
 
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
 sys.path.append(os.environ["UTILS_DIR"] + "/ssm_file/ssm_processors")
 
 from ssm_base_processor import SSM_Base_Processor
 from mpn_aml_processor import MPN_AML_Processor
 from mpn_aml_processor_txt import MPN_AML_Processor_Txt
+from garbage_detector import GARBAGE_THRESHOLDS, MIN_DEPTH, MIN_COVERED_SAMPLES, MAX_VAF_LLR, MAX_DISPERSION
+from input_validation import DEFAULT_VALIDATION, VALIDATION_MODES
 
 
 # NEED to add any processor you might want to use
@@ -53,13 +56,24 @@ def _parse_args(processor_choices=[]):
     parser.add_argument('-o', '--out-files', nargs='+', help='List of out-file names (must occur in same order as corresponding in-file)')
     parser.add_argument('-p', '--processors', nargs='+', help='List of processor types for each corresponding in-file', choices=tuple(processor_choices))
     parser.add_argument('-d', '--directories', nargs='+', help='List of directories to read/write files from')
+    parser.add_argument('-u', '--previous-files', nargs='+', help='List of previously written .ssm files to append the samples of each corresponding in-file to')
+    parser.add_argument('-r', '--id-registries', nargs='+', help='List of id registry files (.ids.json) used to give variants stable ids for each corresponding in-file')
+    parser.add_argument('-s', '--segments-files', nargs='+', help='List of copy-number segments files (see copy_number.py) that var_read_prob is derived from for each corresponding in-file')
+    parser.add_argument('-g', '--regions-file', default="", help='BED/GTF file of the gene/regions that missing genes of the in-files are filled in from (see region_annotation.py)')
+    parser.add_argument('--panel-only', action='store_true', help='Drop the variants outside of the regions of --regions-file')
+    parser.add_argument('--validation', default=DEFAULT_VALIDATION, choices=VALIDATION_MODES, help='Whether rows of the in-files failing their integrity checks (see input_validation.py) raise an error, are only reported, or are not checked')
+    parser.add_argument('--min-depth', type=int, default=GARBAGE_THRESHOLDS[MIN_DEPTH], help='Garbage mutations have fewer than --min-covered-samples samples with at least this many total reads')
+    parser.add_argument('--min-covered-samples', type=int, default=GARBAGE_THRESHOLDS[MIN_COVERED_SAMPLES], help='See --min-depth (0 turns the depth check off)')
+    parser.add_argument('--max-vaf-llr', type=float, default=GARBAGE_THRESHOLDS[MAX_VAF_LLR], help='Garbage mutations have a VAF above their var_read_prob in a sample with a likelihood-ratio statistic above this (off if not passed, e.g. 19.5, flags homozygous/LOH variants unless their var_read_prob is 1)')
+    parser.add_argument('--max-dispersion', type=float, default=GARBAGE_THRESHOLDS[MAX_DISPERSION], help='Garbage mutations have a likelihood-ratio statistic of sharing one VAF across samples (per degree of freedom) above this (off if not passed)')
 
     args = parser.parse_args()
 
     return args
 
 
-def run_processors(processors, in_files, out_files, directories):
+def run_processors(processors, in_files, out_files, directories, previous_files=None, id_registries=None, garbage_thresholds=None, segments_files=None, regions="", panel_only=False,
+                   validation=DEFAULT_VALIDATION):
     """
     Runs all processors dependent on what arguments are passed via the command line
     """
@@ -71,6 +85,27 @@ def run_processors(processors, in_files, out_files, directories):
     if len(in_files) != len(out_files):
         raise argparse.ArgumentTypeError('in-file count does not match out-file count')
 
+    # number of previous files (if any) needs to match the number of in-files
+    if previous_files == None:
+        previous_files = [""] * len(in_files)
+
+    elif len(previous_files) != len(in_files):
+        raise argparse.ArgumentTypeError('in-file count does not match previous file count')
+
+    # number of id registries (if any) needs to match the number of in-files
+    if id_registries == None:
+        id_registries = [""] * len(in_files)
+
+    elif len(id_registries) != len(in_files):
+        raise argparse.ArgumentTypeError('in-file count does not match id registry count')
+
+    # number of segments files (if any) needs to match the number of in-files
+    if segments_files == None:
+        segments_files = [""] * len(in_files)
+
+    elif len(segments_files) != len(in_files):
+        raise argparse.ArgumentTypeError('in-file count does not match segments file count')
+
     # concatenate directories with file names if necessary
     if directories != None:
 
@@ -78,11 +113,17 @@ def run_processors(processors, in_files, out_files, directories):
             for idx in range(0, len(in_files)):
                 in_files[idx] = directories[0] + in_files[idx]
                 out_files[idx] = directories[0] + out_files[idx]
+                previous_files[idx] = directories[0] + previous_files[idx] if previous_files[idx] else ""
+                id_registries[idx] = directories[0] + id_registries[idx] if id_registries[idx] else ""
+                segments_files[idx] = directories[0] + segments_files[idx] if segments_files[idx] else ""
 
         elif len(directories) == len(in_files):
             for idx in range(0, len(in_files)):
                 in_files[idx] = directories[idx] + in_files[idx]
                 out_files[idx] = directories[idx] + out_files[idx]
+                previous_files[idx] = directories[idx] + previous_files[idx] if previous_files[idx] else ""
+                id_registries[idx] = directories[idx] + id_registries[idx] if id_registries[idx] else ""
+                segments_files[idx] = directories[idx] + segments_files[idx] if segments_files[idx] else ""
         else:
             raise argparse.ArgumentTypeError('in-file count does not match directories count')
 
@@ -90,15 +131,17 @@ def run_processors(processors, in_files, out_files, directories):
 
     # if we only have one processor, use it for all of our files
     if len(processors) == 1:
-        for in_file, out_file in zip(in_files, out_files):
-            processors[0](in_file, out_file)
+        for in_file, out_file, previous_file, id_registry, segments_file in zip(in_files, out_files, previous_files, id_registries, segments_files):
+            processors[0](in_file, out_file, previous_ssm=previous_file, id_registry=id_registry, garbage_thresholds=garbage_thresholds, segments=segments_file,
+                          regions=regions, panel_only=panel_only, validation=validation)
 
     else:
         if len(in_files) != len(processors):
             raise argparse.ArgumentTypeError('in-file count does not match processor count')
 
-        for processor, in_file, out_file in zip(processors, in_files, out_files):
-            processor(in_file, out_file)
+        for processor, in_file, out_file, previous_file, id_registry, segments_file in zip(processors, in_files, out_files, previous_files, id_registries, segments_files):
+            processor(in_file, out_file, previous_ssm=previous_file, id_registry=id_registry, garbage_thresholds=garbage_thresholds, segments=segments_file,
+                      regions=regions, panel_only=panel_only, validation=validation)
 
 
 def main():
@@ -110,7 +153,14 @@ def main():
     run_processors([PROCESSORS[processor_name] for processor_name in args.processors],
                    args.in_files,
                    args.out_files,
-                   args.directories)
+                   args.directories,
+                   args.previous_files,
+                   args.id_registries,
+                   {MIN_DEPTH: args.min_depth, MIN_COVERED_SAMPLES: args.min_covered_samples, MAX_VAF_LLR: args.max_vaf_llr, MAX_DISPERSION: args.max_dispersion},
+                   args.segments_files,
+                   args.regions_file,
+                   args.panel_only,
+                   args.validation)
 
 
 if __name__ == '__main__':
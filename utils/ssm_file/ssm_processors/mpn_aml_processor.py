@@ -4,7 +4,11 @@ sys.path.append(os.environ["UTILS_DIR"] + "/common")
 
 from mpn_aml_columns import *
 from ssm_columns import *
+from ssm_io import grouped_vectors, INT_FORMAT, PROB_FORMAT
 from ssm_base_processor import SSM_Base_Processor
+from copy_number import cn_var_read_prob
+from input_validation import Input_Schema, DEFAULT_VALIDATION
+from region_annotation import ANN_GENE
 
 class MPN_AML_Processor(SSM_Base_Processor):
     """
@@ -12,9 +16,11 @@ class MPN_AML_Processor(SSM_Base_Processor):
     """
 
 
-    def __init__(self, in_file="", out_file="", write_out_file=True, write_out_params=True):
+    def __init__(self, in_file="", out_file="", write_out_file=True, write_out_params=True, previous_ssm="", id_registry="", garbage_thresholds=None, segments="", regions="", panel_only=False,
+                 validation=DEFAULT_VALIDATION):
 
-        super().__init__(in_file, out_file, write_out_file, write_out_params)
+        super().__init__(in_file, out_file, write_out_file, write_out_params, previous_ssm=previous_ssm, id_registry=id_registry, garbage_thresholds=garbage_thresholds, segments=segments,
+                         regions=regions, panel_only=panel_only, validation=validation)
 
 
     def format_out_df(self):
@@ -24,32 +30,56 @@ class MPN_AML_Processor(SSM_Base_Processor):
         """
         import pandas as pd
 
-        no_brackets_array_string = lambda arr: [", ".join(map(str, entry)) for entry in arr]
-
         # initialize out_df
         self.out_df = pd.DataFrame()
 
+        grouped = self.processed_df.groupby(COL_NAME)
+
         # set name column <gene>_<position> which we assume to be unique for a given <chromosome><position>
-        self.out_df[COL_NAME] = self.processed_df.groupby(COL_NAME)[COL_NAME].agg(pd.Series.mode).values
+        self.out_df[COL_NAME] = grouped[COL_NAME].agg(pd.Series.mode).values
 
         # set var_reads
-        self.out_df[COL_VAR_READS] = no_brackets_array_string(self.processed_df.groupby(COL_NAME)[COL_VAR_READS].apply(list).values)
+        self.out_df[COL_VAR_READS] = grouped_vectors(grouped, COL_VAR_READS, INT_FORMAT)
 
         # set total_reads
-        self.out_df[COL_TOTAL_READS] = no_brackets_array_string(self.processed_df.groupby(COL_NAME)[COL_TOTAL_READS].apply(list).values)
+        self.out_df[COL_TOTAL_READS] = grouped_vectors(grouped, COL_TOTAL_READS, INT_FORMAT)
 
         # set var_read_prob
-        self.out_df[COL_VAR_READ_PROB] = no_brackets_array_string(self.processed_df.groupby(COL_NAME)[COL_VAR_READ_PROB].apply(list).values)
+        self.out_df[COL_VAR_READ_PROB] = grouped_vectors(grouped, COL_VAR_READ_PROB, PROB_FORMAT)
 
         # set name
         # Provides each <chromosome><position> pair with a unique id (r's\d+').
         # We're purposely doing this after all of the other columns have been created.
-        self.out_df[COL_ID] = ["s" + str(number) for number in list(range(0, len(self.out_df)))]
+        chr_pos = (self.in_df[CHR].astype("object") + "_" + self.in_df[POSITION].apply(str)).groupby(self.processed_df[COL_NAME]).first()
+
+        self.out_df[COL_ID] = self.variant_ids(chr_pos.loc[self.out_df[COL_NAME]].values, self.out_df[COL_NAME].values)
+
+
+    def input_schema(self):
+        """
+        Override with the columns of the aggregated xlsx that are processed (genes can be missing)
+        """
+        return Input_Schema([CHR, POSITION, GENE, SAMPLE_NAMES, ALT_DEPTH, REF_DEPTH], chromosome=CHR, positions=[POSITION], counts=[ALT_DEPTH, REF_DEPTH],
+                            nullable=[GENE])
+
+
+    def annotate_in_df(self):
+        """
+        Override to fill in missing genes from the regions (and drop the variants outside of them with panel_only)
+        """
+        self.annotate_regions(CHR, POSITION, {ANN_GENE: GENE})
+
+
+    def garbage_mutations(self):
+        """
+        Override to flag low depth variants as garbage (and variants with a VAF above their var_read_prob, if garbage_thresholds has a max_vaf_llr)
+        """
+        return self.detect_garbage_mutations()
 
 
     def p_names(self):
 
-        self.processed_df[COL_NAME] = self.in_df[GENE] + "_" + self.in_df[POSITION].apply(str)
+        self.processed_df[COL_NAME] = self.in_df[GENE].astype("object") + "_" + self.in_df[POSITION].apply(str)
 
 
     def p_var_reads(self):
@@ -68,3 +98,11 @@ class MPN_AML_Processor(SSM_Base_Processor):
 
         self.processed_df.loc[self.in_df[CHR].str.match('(ch)(.*)((x|y))', flags=re.IGNORECASE), COL_VAR_READ_PROB] = 1.0
         self.processed_df.loc[self.in_df[CHR].str.match('(ch)(.*)(\d+)', flags=re.IGNORECASE), COL_VAR_READ_PROB] = 0.5
+
+        # variants in a copy-number segment get the var_read_prob of its copy number instead (segments without copies keep the default)
+        if self.copy_number is not None:
+
+            copy_number = self.segment_copy_number(CHR, POSITION)
+            in_segment = (copy_number > 0).values
+
+            self.processed_df.loc[in_segment, COL_VAR_READ_PROB] = cn_var_read_prob(copy_number[in_segment])
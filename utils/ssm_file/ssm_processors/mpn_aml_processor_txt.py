@@ -6,7 +6,11 @@ sys.path.append(os.environ["UTILS_DIR"] + "/common")
 
 from mpn_aml_columns_txt import *
 from ssm_columns import *
+from ssm_io import grouped_vectors, INT_FORMAT, PROB_FORMAT
 from ssm_base_processor import SSM_Base_Processor
+from copy_number import cn_var_read_prob
+from input_validation import Input_Schema, DEFAULT_VALIDATION
+from region_annotation import ANN_GENE, ANN_REGION
 
 class MPN_AML_Processor_Txt(SSM_Base_Processor):
     """
@@ -14,9 +18,11 @@ class MPN_AML_Processor_Txt(SSM_Base_Processor):
     """
 
 
-    def __init__(self, in_file="", out_file="", write_out_file=True, write_out_params=True):
+    def __init__(self, in_file="", out_file="", write_out_file=True, write_out_params=True, previous_ssm="", id_registry="", garbage_thresholds=None, segments="", regions="", panel_only=False,
+                 validation=DEFAULT_VALIDATION):
 
-        super().__init__(in_file, out_file, write_out_file, write_out_params, SAMPLEA, sort_samples=True)
+        super().__init__(in_file, out_file, write_out_file, write_out_params, SAMPLEA, sort_samples=True, previous_ssm=previous_ssm, id_registry=id_registry, garbage_thresholds=garbage_thresholds, segments=segments,
+                         regions=regions, panel_only=panel_only, validation=validation)
     
 
     def format_out_df(self):
@@ -25,22 +31,22 @@ class MPN_AML_Processor_Txt(SSM_Base_Processor):
         which will be written out as a .ssm file
         """
 
-        no_brackets_array_string = lambda arr: [", ".join(map(str, entry)) for entry in arr]
-
         # initialize out_df
         self.out_df = pd.DataFrame()
 
+        grouped = self.processed_df.groupby(COL_NAME)
+
         # set name column <gene>_<position> which we assume to be unique for a given <chromosome><position>
-        self.out_df[COL_NAME] = self.processed_df.groupby(COL_NAME)[COL_NAME].agg(pd.Series.mode).values
+        self.out_df[COL_NAME] = grouped[COL_NAME].agg(pd.Series.mode).values
 
         # set var_reads
-        self.out_df[COL_VAR_READS] = no_brackets_array_string(self.processed_df.groupby(COL_NAME)[COL_VAR_READS].apply(list).values)
+        self.out_df[COL_VAR_READS] = grouped_vectors(grouped, COL_VAR_READS, INT_FORMAT)
 
         # set total_reads
-        self.out_df[COL_TOTAL_READS] = no_brackets_array_string(self.processed_df.groupby(COL_NAME)[COL_TOTAL_READS].apply(list).values)
+        self.out_df[COL_TOTAL_READS] = grouped_vectors(grouped, COL_TOTAL_READS, INT_FORMAT)
 
         # set var_read_prob
-        self.out_df[COL_VAR_READ_PROB] = no_brackets_array_string(self.processed_df.groupby(COL_NAME)[COL_VAR_READ_PROB].apply(list).values)
+        self.out_df[COL_VAR_READ_PROB] = grouped_vectors(grouped, COL_VAR_READ_PROB, PROB_FORMAT)
 
         # make variants be listed in ascending order (by chromosome and position)
         idx1 = self.out_df[COL_NAME].apply(
@@ -61,9 +67,34 @@ class MPN_AML_Processor_Txt(SSM_Base_Processor):
         # set name
         # Provides each <chromosome><position> pair with a unique id (r's\d+').
         # We're purposely doing this after all of the other columns have been created.
-        self.out_df[COL_ID] = ["s" + str(number) for number in list(range(0, len(self.out_df)))]
+        # (names are already <chromosome>_<position>)
+        self.out_df[COL_ID] = self.variant_ids(self.out_df[COL_NAME].values)
         
 
+    def input_schema(self):
+        """
+        Override with the columns of the txt file that are processed (missing read counts are filled in, the copy number isn't needed with segments)
+        """
+        columns = [CHR, START, SAMPLEA, VAR_READS, TOTAL_READS] + ([] if self.copy_number is not None else [COPY_NUMBER])
+
+        return Input_Schema(columns, chromosome=CHR, positions=[START], counts=[VAR_READS, TOTAL_READS], var_total=(VAR_READS, TOTAL_READS),
+                            nullable=[VAR_READS, TOTAL_READS, COPY_NUMBER])
+
+
+    def annotate_in_df(self):
+        """
+        Override to fill in missing genes and regions from the regions (and drop the variants outside of them with panel_only)
+        """
+        self.annotate_regions(CHR, START, {ANN_GENE: GENE, ANN_REGION: REGION})
+
+
+    def garbage_mutations(self):
+        """
+        Override to flag low depth variants as garbage (and variants with a VAF above their var_read_prob, if garbage_thresholds has a max_vaf_llr)
+        """
+        return self.detect_garbage_mutations()
+
+
     def p_df_sort(self):
         # sort dataframe by sample 
         self.in_df = self.in_df.sort_values(by=[SAMPLEA])
@@ -90,13 +121,18 @@ class MPN_AML_Processor_Txt(SSM_Base_Processor):
     def p_var_read_prob(self):
 
         import re
-        
+
+        # the copy number of the segment a variant is in replaces its copy number (variants in no segment keep theirs, if they have one)
+        if self.copy_number is not None:
+            copy_number = self.segment_copy_number(CHR, START)
+            self.in_df[COPY_NUMBER] = copy_number.fillna(self.in_df[COPY_NUMBER]) if COPY_NUMBER in self.in_df.columns else copy_number
+
         # if it's a sex chromosome, then it should have a var_read_prob = 1
         self.processed_df.loc[self.in_df[CHR].str.match('(chr)(.*)((x|y))', flags=re.IGNORECASE), COL_VAR_READ_PROB] = 1.0
         
         # if it's an autosome, it should it should have a var_read_prob of M/N
         self.processed_df.loc[self.in_df[CHR].str.match('(chr)(.*)(\d+)', flags=re.IGNORECASE), COL_VAR_READ_PROB] = \
-                round(1 / (2 + (self.in_df[COPY_NUMBER].astype(float) - 2)), 3)
+                pd.Series(cn_var_read_prob(self.in_df[COPY_NUMBER]), index=self.in_df.index)
                 
         # if we have a copy number of 1, we're assuming a LOH of the reference allele
         self.processed_df.loc[self.in_df[COPY_NUMBER] == 1, COL_VAR_READ_PROB] = 1.0
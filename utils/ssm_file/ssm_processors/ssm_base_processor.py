@@ -5,6 +5,13 @@ sys.path.append(os.environ["UTILS_DIR"] + "/common")
 
 from mpn_aml_columns import *
 from ssm_columns import *
+from variant_ids import Variant_Id_Registry
+from table_io import read_table, table_format, FORMAT_XLSX
+from ssm_io import read_ssm, write_ssm, params_file_for, format_vectors, INT_FORMAT, PROB_FORMAT
+from garbage_detector import Garbage_Detector
+from copy_number import Copy_Number_Segments, SEG_CN
+from region_annotation import Region_Annotator
+from input_validation import Validation_Report, check_header, validate_df, handle_report, DEFAULT_VALIDATION, VALIDATE_OFF, CHECK_MISSING_COLUMN
 
 class SSM_Base_Processor:
     """
@@ -13,28 +20,67 @@ class SSM_Base_Processor:
     For an example of its use, see 'mpn_aml_processor.py'.
     """
 
-    def __init__(self, in_file="", out_file="", write_out_file=True, write_out_params=True, samples_col=SAMPLE_NAMES, sort_samples=False):
+    def __init__(self, in_file="", out_file="", write_out_file=True, write_out_params=True, samples_col=SAMPLE_NAMES, sort_samples=False, previous_ssm="", id_registry="", garbage_thresholds=None, segments="", regions="", panel_only=False,
+                 validation=DEFAULT_VALIDATION):
 
         # set up everything necessary to read/process/write
         self._init_constants()
         self._init_variables()
 
-        # start processing if we have all of the information we need (I/O file names)
-        if in_file:
+        self.samples_col = samples_col
+        self.sort_samples = sort_samples
+
+        # thresholds used by detect_garbage_mutations (see garbage_detector.GARBAGE_THRESHOLDS)
+        self.garbage_thresholds = garbage_thresholds
+
+        # copy-number segments (a file or dataframe, see copy_number.py) that var_read_prob is derived from
+        if isinstance(segments, pd.DataFrame) or segments:
+            self.copy_number = Copy_Number_Segments(segments)
+
+        # gene/region annotations (a BED/GTF file or dataframe, see region_annotation.py) that fill in missing genes,
+        # with panel_only the variants outside of the regions are dropped before processing
+        if isinstance(regions, pd.DataFrame) or regions:
+            self.regions = Region_Annotator(regions)
+
+        self.panel_only = panel_only
+
+        # what is done with the rows of the in-file failing the integrity checks of input_schema (see input_validation.py)
+        self.validation = validation
+
+        # ids are looked up in (and added to) a persistent registry rather than numbered by row
+        if id_registry:
+            self.id_registry = Variant_Id_Registry(id_registry)
+
+        # start processing if we have all of the information we need (I/O file names, or an in-memory dataframe)
+        if isinstance(in_file, pd.DataFrame) or in_file:
 
             # read and set the in-file
             self.read_in_file(in_file)
 
+            # check the rows of the in-file before processing them
+            self.validate_in_df()
+
+            # annotate (and filter) the variants with the regions
+            if self.regions is not None:
+                self.annotate_in_df()
+
             # run all processing functions
             self.process()
 
+            # append the samples of the in-file to a previously written .ssm (and its .params.json)
+            if previous_ssm:
+                self.append_to_previous(previous_ssm, samples_col, sort_samples)
+
             # write SSM file
             if write_out_file and out_file:
                 self.write_out_file(out_file)
 
             # write the params file
             if write_out_params and out_file:
-                self.write_out_params(out_file.replace(".ssm", ".params.json"), samples_col, sort_samples)
+                self.write_out_params(params_file_for(out_file), samples_col, sort_samples)
+
+            if self.id_registry:
+                self.id_registry.save()
 
 
     def _init_constants(self):
@@ -63,6 +109,14 @@ class SSM_Base_Processor:
         self.in_df = None
         self.processed_df = pd.DataFrame()
         self.out_df = None
+        self.previous_params = None
+        self.id_registry = None
+        self.garbage_thresholds = None
+        self.copy_number = None
+        self.regions = None
+        self.panel_only = False
+        self.validation = DEFAULT_VALIDATION
+        self.validation_report = Validation_Report()
 
         self.processing_functions = [
             # all functions used to translate input file to SSM file
@@ -75,21 +129,63 @@ class SSM_Base_Processor:
         This method may want to be used outside of t
         """
 
+        # a dataframe can be passed in place of the in-file (indexed by row, as if it had been read from a file)
+        if isinstance(in_file, pd.DataFrame):
+
+            self.in_df = in_file.reset_index(drop=True)
+            return
+
         if in_file:
 
             self.in_file = in_file
 
         if self.in_file:
-            
+
+            # fail before parsing the in-file if it's missing a column
+            if self.input_schema() is not None:
+                check_header(self.in_file, self.input_schema().columns).raise_if_failed()
+
             file_ext = self.in_file.split(".")[-1]
             
-            if file_ext == "xls" or file_ext == "xlsx": 
-                self.in_df = pd.read_excel(self.in_file)
+            if file_ext == "xls" or file_ext == "xlsx" or table_format(self.in_file) != FORMAT_XLSX:
+                self.in_df = read_table(self.in_file)
                 
             elif file_ext == "txt":
                 self.in_df = pd.read_csv(self.in_file, sep="\t")
 
 
+    def input_schema(self):
+        """
+        Base function that can be overriden in child class to return the Input_Schema (see input_validation.py) of the in-file,
+        whose header is checked before it's read and whose rows are checked before they're processed (None skips the checks)
+        """
+        return None
+
+
+    def validate_in_df(self):
+        """
+        Runs the integrity checks of input_schema on the in-file, its violations are in validation_report (printed by default,
+        an Input_Validation_Error is raised for them with VALIDATE_RAISE)
+        """
+        schema = self.input_schema()
+
+        if schema is None:
+            return
+
+        # a missing column always fails (dataframes passed in place of a file have no header to check before they're read)
+        if self.validation == VALIDATE_OFF:
+            check_header(self.in_df, schema.columns).raise_if_failed()
+            return
+
+        source = os.path.basename(self.in_file) if self.in_file else "dataframe"
+
+        self.validation_report = handle_report(validate_df(self.in_df, schema, source), self.validation)
+
+        # rows can't be processed without their columns
+        if any(violation["check"] == CHECK_MISSING_COLUMN for violation in self.validation_report.violations):
+            self.validation_report.raise_if_failed()
+
+
     def format_out_df(self):
         """
         Empty base function that should be overriden in child class that will translate the processed_df
@@ -98,6 +194,43 @@ class SSM_Base_Processor:
         pass
 
 
+    def segment_copy_number(self, chr_col, position_col):
+        """
+        Returns the copy number of the segment each row of the in-file is in (NaN outside of the segments), see copy_number.py
+        """
+        copy_number = self.copy_number.annotate(self.in_df[chr_col], self.in_df[position_col], self.in_df[self.samples_col])[SEG_CN]
+
+        return copy_number.set_axis(self.in_df.index)
+
+
+    def annotate_in_df(self):
+        """
+        Empty base function that should be overriden in child class that will annotate the in_df with the regions (see annotate_regions)
+        """
+        pass
+
+
+    def annotate_regions(self, chr_col, position_col, columns):
+        """
+        Fills in the missing values of the in-file columns (annotation column -> in-file column, see region_annotation.py) with the
+        annotations of the region each row is in, and drops the rows outside of the regions with panel_only
+        """
+        rows = self.regions.rows(self.in_df[chr_col], self.in_df[position_col])
+
+        if self.panel_only:
+            self.in_df = self.in_df[rows >= 0].reset_index(drop=True)
+            rows = rows[rows >= 0]
+
+        annotations = self.regions.annotations(rows).set_axis(self.in_df.index)
+
+        for annotation, column in columns.items():
+
+            if column in self.in_df.columns:
+                self.in_df[column] = self.in_df[column].astype("object").fillna(annotations[annotation])
+            else:
+                self.in_df[column] = annotations[annotation]
+
+
     def write_out_file(self, out_file=""):
 
         if out_file:
@@ -108,7 +241,7 @@ class SSM_Base_Processor:
 
             if set(self.COL_ORDER).issubset(self.out_df.columns):
 
-                self.out_df[self.COL_ORDER].to_csv(self.out_file, sep="\t", index=False)
+                write_ssm(self.out_df[self.COL_ORDER], self.out_file)
 
 
 
@@ -136,31 +269,158 @@ class SSM_Base_Processor:
             if set([samples_col]).issubset(self.in_df.columns):
 
                 with open(self.params_file, 'w') as outfile:
-                    
-                    sample_names = self.in_df[samples_col].unique()
-                    
-                    if sort_samples:
-                        sample_names=sorted(sample_names)
-
-                    json_dict = json.dumps(
-                                    {
-                                      SAMPLES: sample_names,
-#                                      CLUSTERS: [],
-                                      GARBAGE: self.garbage_mutations()
-                                    },
-                                    default=convert
-                                )
+
+                    json_dict = json.dumps(self.out_params(samples_col, sort_samples), default=convert)
 
                     outfile.write(json_dict)
 
 
+    def out_params(self, samples_col=SAMPLE_NAMES, sort_samples=False):
+        """
+        Returns the params (samples and garbage mutations) that are written to the .params.json
+        """
+
+        sample_names = self.in_df[samples_col].astype("object").unique()
+
+        if sort_samples:
+            sample_names=sorted(sample_names)
+
+        params = {
+          SAMPLES: sample_names,
+#          CLUSTERS: [],
+          GARBAGE: self.garbage_mutations()
+        }
+
+        # when appending to a previous .ssm, keep everything in its params (e.g. clusters) and extend its samples,
+        # the garbage mutations are those of the merged .ssm (the out_df), since the new samples can change them
+        if self.previous_params is not None:
+            params = dict(self.previous_params, **{SAMPLES: self.previous_params[SAMPLES] + self.new_samples, GARBAGE: params[GARBAGE]})
+
+        return params
+
+
+    def append_to_previous(self, previous_ssm, samples_col=SAMPLE_NAMES, sort_samples=False):
+        """
+        Appends the values of the samples in the in-file (that are not already in the previous .ssm) to the
+        var_reads/total_reads/var_read_prob vectors of a previously written .ssm, so that existing ids are kept.
+
+        Loci that are not in the in-file are given var_reads = 0, total_reads = 1 for the new samples,
+        and new loci are given the same values for every previous sample. The out_df is replaced by the merged .ssm,
+        so the garbage mutations written to the .params.json are detected over every sample (see out_params).
+        """
+
+        import json, re
+
+        previous_df = read_ssm(previous_ssm)
+
+        with open(params_file_for(previous_ssm)) as params_json:
+            self.previous_params = json.load(params_json)
+
+        previous_samples = self.previous_params[SAMPLES]
+
+        # values of the new samples for every processed row
+        values_df = self.processed_df.copy()
+        values_df[samples_col] = self.in_df.loc[values_df.index, samples_col]
+        values_df = values_df[~values_df[samples_col].isin(previous_samples)]
+
+        self.new_samples = list(values_df[samples_col].unique())
+
+        if sort_samples:
+            self.new_samples = sorted(self.new_samples)
+
+        # (locus x new sample) tables of each value, with the previous loci followed by any new loci
+        previous_names = set(previous_df[COL_NAME])
+        new_value_names = set(values_df[COL_NAME])
+
+        names = list(previous_df[COL_NAME]) + [name for name in self.out_df[COL_NAME] if name in new_value_names and name not in previous_names]
+
+        tables = {
+            column: values_df.groupby([COL_NAME, samples_col])[column].first().unstack().reindex(index=names, columns=self.new_samples)
+            for column in [COL_VAR_READS, COL_TOTAL_READS, COL_VAR_READ_PROB]
+        }
+
+        n_previous = len(previous_df)
+
+        # a previous locus keeps its last var_read_prob for new samples it's missing from, a new locus uses its first value
+        previous_probs = pd.Series(list(previous_df[COL_VAR_READ_PROB].apply(lambda row: float(row.split(",")[-1]))) + [None] * (len(names) - n_previous),
+                                   index=names, dtype="float64")
+
+        var_read_prob = tables[COL_VAR_READ_PROB].apply(lambda column: column.fillna(previous_probs))
+        var_read_prob = var_read_prob.fillna(method="bfill", axis=1).fillna(method="ffill", axis=1)
+
+        new_values = {
+            COL_VAR_READS: tables[COL_VAR_READS].fillna(0).astype(int),
+            COL_TOTAL_READS: tables[COL_TOTAL_READS].fillna(1).astype(int),
+            COL_VAR_READ_PROB: var_read_prob
+        }
+
+        # history given to new loci for every previous sample
+        history = {
+            COL_VAR_READS: ["0"] * len(previous_samples),
+            COL_TOTAL_READS: ["1"] * len(previous_samples),
+        }
+
+        merged_df = pd.DataFrame({COL_NAME: names})
+
+        for column, table in new_values.items():
+
+            new_strings = format_vectors(table.values, PROB_FORMAT if column == COL_VAR_READ_PROB else INT_FORMAT)
+
+            previous_strings = list(previous_df[column])
+
+            if column in history:
+                new_loci_strings = [", ".join(history[column]) for _ in range(n_previous, len(names))]
+            else:
+                new_loci_strings = [", ".join([str(row[0])] * len(previous_samples)) for row in table.values[n_previous:]]
+
+            merged_df[column] = [
+                ", ".join([old, new]) if (old and new) else (old or new)
+                for old, new in zip(previous_strings + new_loci_strings, new_strings)
+            ]
+
+        # existing ids are kept, new loci are numbered after the largest existing id (or take their id from the registry)
+        if self.id_registry:
+            new_ids = list(self.out_df.set_index(COL_NAME).loc[names[n_previous:], COL_ID])
+
+        else:
+            id_numbers = [int(match.group(1)) for match in previous_df[COL_ID].astype(str).apply(lambda id: re.match(r"s(\d+)$", id)) if match]
+            next_id = max(id_numbers) + 1 if id_numbers else n_previous
+
+            new_ids = ["s" + str(number) for number in range(next_id, next_id + len(names) - n_previous)]
+
+        merged_df[COL_ID] = list(previous_df[COL_ID]) + new_ids
+
+        self.out_df = merged_df
+
+
+    def variant_ids(self, keys, names=None):
+        """
+        Returns an id for each <chromosome>_<position> key, either from the id registry or numbered by row (s0, s1, ...)
+        """
+        if self.id_registry:
+            return self.id_registry.ids_for_keys(keys, names)
+
+        return ["s" + str(number) for number in list(range(0, len(keys)))]
+
+
     def garbage_mutations(self):
         """
-        This may be replaced or implemented at the subclass level to detect garbage mutations to ignore.
+        This may be replaced or implemented at the subclass level to detect garbage mutations to ignore
+        (e.g. by returning detect_garbage_mutations()).
         """
         return []
 
 
+    def detect_garbage_mutations(self):
+        """
+        Returns the ids of the loci of the out_df that a Garbage_Detector (with the processor's garbage_thresholds) flags
+        """
+        if not isinstance(self.out_df, pd.DataFrame):
+            return []
+
+        return Garbage_Detector(self.garbage_thresholds).garbage_ids(self.out_df)
+
+
     def process(self):
         """
         Collects all processing functions (functions that match r'p\_.*'), calls all processing
@@ -0,0 +1,187 @@
+import unittest
+import os, sys
+import json
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ssm_processors'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from ssm_columns import *
+from interval_index import Interval_Index
+from copy_number import Copy_Number_Segments, pyclone_copy_numbers, SEG_CHR, SEG_START, SEG_END, SEG_CN, SEG_MAJOR_CN, SEG_MINOR_CN, SEG_SAMPLE
+from mpn_aml_columns_txt import CHR, START
+from mpn_aml_processor_txt import MPN_AML_Processor_Txt
+from ssm_store import ssm_to_store, STORE_MOD_METHODS
+from modify_ssm import load_ssm, save_ssm
+from run_modify_ssm import MOD_METHODS, modify_file
+from mpn_aml_processor import MPN_AML_Processor
+from ssm_io import params_file_for
+import mpn_aml_columns
+from cohort_fixtures import write_cohort
+
+
+class Copy_Number_Tests(unittest.TestCase):
+    """
+    Test cases for assigning segment copy numbers to variants (interval_index.py, copy_number.py).
+    use 'python3 test_copy_number.py' to run the test suite
+    """
+    def test_interval_lookup(self):
+
+        rng = np.random.default_rng(3)
+
+        # overlapping intervals, including long ones starting before shorter ones
+        chromosomes = rng.choice(["1", "2", "X"], 200)
+        starts = rng.integers(1, 10000, 200)
+        ends = starts + rng.integers(0, 3000, 200)
+
+        index = Interval_Index(chromosomes, starts, ends)
+
+        positions = rng.integers(1, 13000, 2000)
+        position_chromosomes = rng.choice(["chr1", "chr2", "chrX", "chr3"], 2000)
+
+        rows = index.lookup(position_chromosomes, positions)
+
+        for chromosome, position, row in zip(position_chromosomes, positions, rows):
+
+            containing = (chromosomes == chromosome[3:]) & (starts <= position) & (ends >= position)
+
+            if row < 0:
+                self.assertFalse(containing.any(), 'Interval containing %s:%d not found' % (chromosome, position))
+            else:
+                self.assertTrue(containing[row], 'Interval %d does not contain %s:%d' % (row, chromosome, position))
+
+        # segments of a sample only match its own variants, allele-specific copy numbers are derived from cn if missing
+        segments = Copy_Number_Segments(pd.DataFrame({
+            SEG_CHR: ["chr1", "chr1", "1"],
+            SEG_START: [100, 100, 301],
+            SEG_END: [200, 200, 400],
+            SEG_CN: [3, 1, 4],
+            SEG_SAMPLE: ["S0", "S1", "S0"]
+        }))
+
+        annotated = segments.annotate(["1", "1", "chr1", "1"], [150, 150, 350, 250], ["S0", "S1", "S0", "S0"])
+
+        self.assertEqual(list(annotated[SEG_CN].fillna(-1)), [3, 1, 4, -1], 'Incorrect segment copy numbers')
+        self.assertEqual(list(annotated[SEG_MAJOR_CN].fillna(-1)), [2, 1, 3, -1], 'Incorrect major copy numbers')
+        self.assertEqual(list(annotated[SEG_MINOR_CN].fillna(-1)), [1, 0, 1, -1], 'Incorrect minor copy numbers')
+
+        with self.assertRaises(ValueError):
+            Copy_Number_Segments(pd.DataFrame({SEG_CHR: ["1"], SEG_START: [1], SEG_END: [2]}))
+
+
+    def test_processor_var_read_prob(self):
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            files = write_cohort(tmp_dir, n_loci=20, n_samples=3, n_clusters=2, seed=5, write_xls=False)
+
+            txt_df = pd.read_csv(files["txt"], sep="\t")
+            autosomal = txt_df[~txt_df[CHR].str.match("chr[XY]", case=False)]
+
+            first, second = autosomal[CHR].iloc[0], autosomal[START].iloc[0]
+            last, last_start = autosomal[CHR].iloc[-1], autosomal[START].iloc[-1]
+
+            segments_file = os.path.join(tmp_dir, "segments.tsv")
+
+            pd.DataFrame({
+                SEG_CHR: [first, last],
+                SEG_START: [second, last_start - 10],
+                SEG_END: [second, last_start + 10],
+                SEG_CN: [3, 1]
+            }).to_csv(segments_file, sep="\t", index=False)
+
+            processor = MPN_AML_Processor_Txt(files["txt"], "", False, False, segments=segments_file)
+            default = MPN_AML_Processor_Txt(files["txt"], "", False, False)
+
+            out_df = processor.out_df.set_index(COL_NAME)
+            default_df = default.out_df.set_index(COL_NAME)
+
+            first_name, last_name = "%s_%s" % (first, second), "%s_%s" % (last, last_start)
+
+            self.assertEqual(set(out_df.loc[first_name, COL_VAR_READ_PROB].split(", ")), {"0.333"}, 'Incorrect var_read_prob with a copy number of 3')
+            self.assertEqual(set(out_df.loc[last_name, COL_VAR_READ_PROB].split(", ")), {"1.0"}, 'Incorrect var_read_prob with a copy number of 1')
+
+            # variants in no segment keep the var_read_prob of their own copy number
+            others = out_df.index.difference([first_name, last_name])
+            self.assertTrue(out_df.loc[others, COL_VAR_READ_PROB].equals(default_df.loc[others, COL_VAR_READ_PROB]), 'var_read_prob changed outside of the segments')
+
+
+    def test_pyclone_copy_numbers(self):
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            files = write_cohort(tmp_dir, n_loci=40, n_samples=4, n_clusters=2, seed=6, write_xls=False)
+
+            ssm_df = load_ssm(files["ssm"])
+
+            with open(files["params"]) as params_json:
+                samples = json.load(params_json)[SAMPLES]
+
+            chromosome, position = ssm_df[COL_NAME].iloc[0].rsplit("_", 1)
+
+            segments_file = os.path.join(tmp_dir, "segments.tsv")
+
+            pd.DataFrame({
+                SEG_CHR: [chromosome], SEG_START: [int(position)], SEG_END: [int(position)], SEG_CN: [5], SEG_MAJOR_CN: [4], SEG_MINOR_CN: [1]
+            }).to_csv(segments_file, sep="\t", index=False)
+
+            major, minor = pyclone_copy_numbers(ssm_df[COL_NAME].values, samples, np.full((len(ssm_df), len(samples)), 0.5), segments_file)
+
+            self.assertEqual((major[0].tolist(), minor[0].tolist()), ([4] * len(samples), [1] * len(samples)), 'Segment copy numbers not used')
+            self.assertTrue((major[1:] == 1).all() and (minor[1:] == 1).all(), 'Default copy numbers changed outside of the segments')
+
+            # the store version gives the same tsv
+            store = ssm_to_store(files["ssm"], os.path.join(tmp_dir, "cohort.ssmstore"), files["params"], chunk_size=7)
+
+            STORE_MOD_METHODS["PYCLONE_FMT"](store, os.path.join(tmp_dir, "pyclone.store.tsv"), files["params"], segments_file)
+            save_ssm(MOD_METHODS["PYCLONE_FMT"](ssm_df, files["params"], segments_file), os.path.join(tmp_dir, "pyclone.df.tsv"))
+
+            with open(os.path.join(tmp_dir, "pyclone.df.tsv")) as df_tsv, open(os.path.join(tmp_dir, "pyclone.store.tsv")) as store_tsv:
+                self.assertEqual(df_tsv.read(), store_tsv.read(), 'PYCLONE_FMT with segments on a store does not match the dataframe version')
+
+            pyclone_df = pd.read_csv(os.path.join(tmp_dir, "pyclone.df.tsv"), sep="\t")
+
+            self.assertEqual(list(pyclone_df.loc[pyclone_df["mutation_id"] == ssm_df[COL_NAME].iloc[0], "major_cn"]), [4] * len(samples), 'Segment copy numbers not in the tsv')
+
+
+    def test_pyclone_copy_numbers_by_gene_names(self):
+        # MPN_AML_Processor names loci <gene>_<position>, their segments are found through the id registry rather than ignored
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            aggregated_df = pd.DataFrame({
+                mpn_aml_columns.CHR: ["chr9", "chr9", "chr1", "chr1"],
+                mpn_aml_columns.POSITION: [5073770, 5073770, 1000, 1000],
+                mpn_aml_columns.GENE: ["JAK2", "JAK2", "A1", "A1"],
+                mpn_aml_columns.SAMPLE_NAMES: ["S0", "S1", "S0", "S1"],
+                mpn_aml_columns.ALT_DEPTH: [90, 85, 20, 25],
+                mpn_aml_columns.REF_DEPTH: [10, 15, 30, 25]
+            })
+
+            ssm_file, registry_file = os.path.join(tmp_dir, "patient.ssm"), os.path.join(tmp_dir, "patient.ids.json")
+            segments_file, pyclone_file = os.path.join(tmp_dir, "segments.tsv"), os.path.join(tmp_dir, "patient.pyclone.tsv")
+
+            MPN_AML_Processor(aggregated_df, ssm_file, id_registry=registry_file)
+
+            # 9p UPD
+            pd.DataFrame({
+                SEG_CHR: ["chr9"], SEG_START: [1], SEG_END: [39000000], SEG_CN: [2], SEG_MAJOR_CN: [2], SEG_MINOR_CN: [0]
+            }).to_csv(segments_file, sep="\t", index=False)
+
+            with self.assertRaises(ValueError):
+                MOD_METHODS["PYCLONE_FMT"](load_ssm(ssm_file), params_file_for(ssm_file), segments_file)
+
+            modify_file(ssm_file, pyclone_file, [{"mod_method": "PYCLONE_FMT", "args": [segments_file]}], params_file_for(ssm_file), id_registry=registry_file)
+
+            pyclone_df = pd.read_csv(pyclone_file, sep="\t").set_index(["mutation_id", "sample_id"])
+
+            self.assertEqual(list(pyclone_df.loc["JAK2_5073770", ["major_cn", "minor_cn"]].values.ravel()), [2, 0, 2, 0], 'Segment copy numbers not used for <gene>_<position> names')
+            self.assertEqual(list(pyclone_df.loc["A1_1000", ["major_cn", "minor_cn"]].values.ravel()), [1, 1, 1, 1], 'Default copy numbers changed outside of the segments')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import os, sys
+import json
+import operator
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ssm_processors'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from ssm_columns import *
+from mpn_aml_columns_txt import VAR_READS, TOTAL_READS
+from garbage_detector import Garbage_Detector, MIN_DEPTH, MIN_COVERED_SAMPLES, MAX_VAF_LLR, MAX_DISPERSION
+from ssm_io import format_vectors
+from mpn_aml_processor_txt import MPN_AML_Processor_Txt
+from mpn_aml_processor import MPN_AML_Processor
+from mpn_aml_columns import CHR, POSITION, GENE, SAMPLE_NAMES, ALT_DEPTH, REF_DEPTH
+from modify_ssm import organize_vars_by_vaf
+from cohort_fixtures import write_cohort
+
+
+class Garbage_Detector_Tests(unittest.TestCase):
+    """
+    Test cases for detecting garbage mutations (garbage_detector.py) and writing them to the params of a processor.
+    use 'python3 test_garbage_detector.py' to run the test suite
+    """
+    def setUp(self):
+
+        # loci: fine, low depth in every sample, VAF of 0.9 with a var_read_prob of 0.5, VAF of 0.1 in one sample and 0.5 in the others
+        self.var_reads = np.array([[20, 25, 22], [1, 2, 0], [90, 27, 18], [5, 25, 25]])
+        self.total_reads = np.array([[50, 50, 50], [3, 5, 2], [100, 30, 20], [50, 50, 50]])
+        self.var_read_prob = np.full((4, 3), 0.5)
+
+
+    def test_checks(self):
+
+        # the VAF check is off by default
+        self.assertEqual(list(Garbage_Detector().is_garbage(self.var_reads, self.total_reads, self.var_read_prob)), [False, True, False, False],
+                         'Incorrect garbage mutations')
+
+        detector = Garbage_Detector({MAX_VAF_LLR: 19.5})
+
+        self.assertEqual(list(detector.is_garbage(self.var_reads, self.total_reads, self.var_read_prob)), [False, True, True, False],
+                         'Incorrect garbage mutations with the VAF check')
+
+        # a var_read_prob of 1 allows any VAF
+        self.assertFalse(detector.is_garbage(self.var_reads[2:3], self.total_reads[2:3], np.ones((1, 3)))[0], 'VAF above a var_read_prob of 1')
+
+        # the dispersion check is off by default
+        dispersion = Garbage_Detector({MAX_DISPERSION: 5.0})
+
+        self.assertEqual(list(dispersion.is_garbage(self.var_reads, self.total_reads, self.var_read_prob)), [False, True, False, True],
+                         'Incorrect garbage mutations with the dispersion check')
+
+        # checks are turned off with None
+        off = Garbage_Detector({MIN_DEPTH: None, MAX_VAF_LLR: None})
+
+        self.assertFalse(off.is_garbage(self.var_reads, self.total_reads, self.var_read_prob).any(), 'Checks are not turned off')
+
+        ssm_df = pd.DataFrame({
+            COL_ID: ["s0", "s1", "s2", "s3"],
+            COL_NAME: ["a", "b", "c", "d"],
+            COL_VAR_READS: format_vectors(self.var_reads),
+            COL_TOTAL_READS: format_vectors(self.total_reads),
+            COL_VAR_READ_PROB: format_vectors(self.var_read_prob, "%r")
+        })
+
+        self.assertEqual(detector.garbage_ids(ssm_df), ["s1", "s2"], 'Incorrect garbage ids')
+
+
+    def test_high_vaf_variant(self):
+        # a homozygous/LOH variant (JAK2 V617F on 9p UPD) has a VAF near 1 with the var_read_prob of 0.5 of an autosome, and isn't garbage by default
+        aggregated_df = pd.DataFrame({
+            CHR: ["chr9", "chr9", "chr1", "chr1"],
+            POSITION: [5073770, 5073770, 1000, 1000],
+            GENE: ["JAK2", "JAK2", "A1", "A1"],
+            SAMPLE_NAMES: ["S0", "S1", "S0", "S1"],
+            ALT_DEPTH: [90, 85, 20, 25],
+            REF_DEPTH: [10, 15, 30, 25]
+        })
+
+        processor = MPN_AML_Processor(aggregated_df, "", False, False)
+
+        self.assertEqual(processor.out_df.set_index(COL_NAME).loc["JAK2_5073770", COL_VAR_READ_PROB], "0.5, 0.5")
+        self.assertEqual(processor.garbage_mutations(), [], 'High VAF variant is garbage')
+
+        # with the VAF check, it's only garbage until its var_read_prob is set to 1 (ORG_VARS_BY_VAF > 0.5 1.0)
+        processor = MPN_AML_Processor(aggregated_df, "", False, False, garbage_thresholds={MAX_VAF_LLR: 19.5})
+
+        self.assertEqual(processor.garbage_mutations(), list(processor.out_df.loc[processor.out_df[COL_NAME] == "JAK2_5073770", COL_ID]))
+
+        organized_df = organize_vars_by_vaf(processor.out_df, operator.gt, 0.5, "1.0")
+
+        self.assertEqual(Garbage_Detector({MAX_VAF_LLR: 19.5}).garbage_ids(organized_df), [], 'High VAF variant is garbage with a var_read_prob of 1')
+
+
+    def test_processor_params(self):
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            files = write_cohort(tmp_dir, n_loci=30, n_samples=4, n_clusters=3, seed=2, write_xls=False)
+
+            # give the first locus a depth of 2 in every sample
+            txt_df = pd.read_csv(files["txt"], sep="\t")
+            first_locus = txt_df.index[:4]
+
+            txt_df.loc[first_locus, TOTAL_READS] = 2
+            txt_df.loc[first_locus, VAR_READS] = 1
+            txt_df.to_csv(files["txt"], sep="\t", index=False)
+
+            processor = MPN_AML_Processor_Txt(files["txt"], os.path.join(tmp_dir, "out.ssm"))
+
+            with open(os.path.join(tmp_dir, "out.params.json")) as params_json:
+                garbage = json.load(params_json)[GARBAGE]
+
+            first_name = "%s_%s" % (txt_df["chr"].iloc[0], txt_df["start"].iloc[0])
+
+            self.assertIn(processor.out_df.set_index(COL_NAME).loc[first_name, COL_ID], garbage, 'Low depth locus is not garbage')
+            self.assertEqual(garbage, Garbage_Detector().garbage_ids(processor.out_df), 'params garbage does not match the detector')
+
+            # thresholds are passed through the processor
+            processor = MPN_AML_Processor_Txt(files["txt"], "", False, False, garbage_thresholds={MIN_COVERED_SAMPLES: 0})
+
+            self.assertNotIn(processor.out_df.set_index(COL_NAME).loc[first_name, COL_ID], processor.garbage_mutations(), 'Thresholds are not passed to the detector')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+import os, sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ssm_processors'))
+
+from input_validation import *
+from mpn_aml_columns_txt import CHR, START, VAR_READS, TOTAL_READS, COPY_NUMBER
+from mpn_aml_processor_txt import MPN_AML_Processor_Txt
+from cohort_fixtures import write_cohort
+
+
+class Input_Validation_Tests(unittest.TestCase):
+    """
+    Test cases for the header and integrity checks of the inputs (input_validation.py) and of the processors.
+    use 'python3 test_input_validation.py' to run the test suite
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.files = write_cohort(self.tmp_dir.name, n_loci=20, n_samples=3, n_clusters=2, seed=11, write_xls=False)
+        self.txt_df = pd.read_csv(self.files["txt"], sep="\t")
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def path(self, name):
+
+        return os.path.join(self.tmp_dir.name, name)
+
+
+    def test_read_header(self):
+
+        xlsx_file = self.path("table.xlsx")
+        self.txt_df.to_excel(xlsx_file, sheet_name="Sheet1", index=False)
+
+        for file_name in [self.files["txt"], xlsx_file]:
+            self.assertEqual(read_header(file_name), list(self.txt_df.columns), 'Incorrect header of %s' % file_name)
+
+        self.assertEqual(read_header(xlsx_file, "Sheet1", None), list(range(len(self.txt_df.columns))), 'Columns without a header are not numbered')
+
+        report = check_header(xlsx_file, [CHR, "missing"])
+
+        self.assertEqual([(violation["check"], violation["column"]) for violation in report.violations], [(CHECK_MISSING_COLUMN, "missing")], 'Incorrect missing columns')
+
+        with self.assertRaises(Input_Validation_Error):
+            report.raise_if_failed()
+
+
+    def test_integrity_checks(self):
+
+        schema = Input_Schema([CHR, START, VAR_READS, TOTAL_READS], chromosome=CHR, positions=[START], counts=[VAR_READS, TOTAL_READS],
+                              var_total=(VAR_READS, TOTAL_READS), nullable=[VAR_READS])
+
+        self.assertTrue(validate_df(self.txt_df, schema).ok, 'Violations in valid rows')
+
+        invalid_df = self.txt_df.copy()
+        invalid_df.loc[1, CHR] = "chrUn_gl000220"
+        invalid_df.loc[2, START] = np.nan
+        invalid_df.loc[3, VAR_READS] = -2
+        invalid_df.loc[[4, 5], VAR_READS] = invalid_df.loc[[4, 5], TOTAL_READS] + 1
+        invalid_df.loc[6, VAR_READS] = np.nan
+
+        report = validate_df(invalid_df, schema, "invalid")
+        violations = report.to_df().set_index("check")
+
+        self.assertEqual(set(violations.index), {CHECK_CHROMOSOME, CHECK_MISSING_VALUE, CHECK_COUNT, CHECK_VAR_ABOVE_TOTAL}, 'Incorrect checks failed')
+        self.assertEqual(violations.loc[CHECK_VAR_ABOVE_TOTAL, "rows"], [4, 5], 'Incorrect rows with more variant reads than total reads')
+        self.assertEqual(violations.loc[CHECK_MISSING_VALUE, "rows"], [2], 'Missing values of nullable columns are violations')
+        self.assertEqual(violations.loc[CHECK_CHROMOSOME, "n_rows"], 1, 'Incorrect number of unknown chromosomes')
+
+        # VAFs have to match the depths they're computed from
+        depths_df = pd.DataFrame({"VAF": [0.25, 0.5, 1.5], "alt": [1, 1, 1], "ref": [3, 3, 0]})
+
+        vaf_report = validate_df(depths_df, Input_Schema(["VAF", "alt", "ref"], counts=["alt", "ref"], vaf=("VAF", "alt", "ref")))
+
+        self.assertEqual(vaf_report.violations[0]["rows"], [1, 2], 'Incorrect rows with invalid VAFs')
+
+        # VAFs can be percentages, and other chromosome sets can be checked for
+        percent_df = depths_df.assign(VAF=[25.0, 25.0, 100.0])
+
+        self.assertTrue(validate_df(percent_df, Input_Schema(["VAF", "alt", "ref"], vaf=("VAF", "alt", "ref"))).ok, 'Percentage VAFs are violations')
+        self.assertFalse(validate_df(percent_df, Input_Schema(["VAF", "alt", "ref"], vaf=("VAF", "alt", "ref"), vaf_scale=VAF_FRACTION)).ok, 'VAF scale is ignored')
+
+        contigs_schema = Input_Schema([CHR], chromosome=CHR, chromosome_pattern=r"^(chr)?([0-9]+|X|Y|M|Un_.*)$")
+
+        self.assertEqual(validate_df(invalid_df, contigs_schema).to_df()["check"].tolist(), [], 'Chromosome pattern is ignored')
+
+
+    def test_processor_validation(self):
+
+        # a missing column fails before the rows are read
+        self.txt_df.drop(columns=[TOTAL_READS]).to_csv(self.path("missing.txt"), sep="\t", index=False)
+
+        with self.assertRaises(Input_Validation_Error) as error:
+            MPN_AML_Processor_Txt(self.path("missing.txt"), "", False, False)
+
+        self.assertEqual(error.exception.report.violations[0]["column"], TOTAL_READS, 'Incorrect missing column')
+
+        # invalid counts are only reported by default, and raise with VALIDATE_RAISE
+        invalid_df = self.txt_df.copy()
+        invalid_df.loc[0, VAR_READS] = invalid_df.loc[0, TOTAL_READS] + 5
+
+        with self.assertRaises(Input_Validation_Error):
+            MPN_AML_Processor_Txt(invalid_df, "", False, False, validation=VALIDATE_RAISE)
+
+        processor = MPN_AML_Processor_Txt(invalid_df, "", False, False)
+
+        self.assertEqual([violation["check"] for violation in processor.validation_report.violations], [CHECK_VAR_ABOVE_TOTAL], 'Violations are not reported')
+        self.assertEqual(len(processor.out_df), len(invalid_df.drop_duplicates([CHR, START])), 'Reported rows are not processed')
+
+        self.assertTrue(MPN_AML_Processor_Txt(invalid_df, "", False, False, validation=VALIDATE_OFF).validation_report.ok, 'Rows are checked with VALIDATE_OFF')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import unittest
+import os, sys
+import json
+import operator
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from ssm_columns import *
+from modify_ssm import load_ssm, save_ssm, remove_vars_by_vaf, organize_vars_by_vaf, scale_counts, keep_vars_by_name, separate_garbage, overwrite_ids, partition_ssm, partition_file, \
+                       remap_params
+from ssm_io import iter_ssm
+from run_modify_ssm import load_operations, run_operations, _method_args
+from cohort_fixtures import write_cohort
+
+sys.path.append(os.path.join(os.environ["UTILS_DIR"], '..'))
+
+from utils import api
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+class Modify_SSM_Tests(unittest.TestCase):
+    """
+    Test cases for the .ssm modification methods (modify_ssm.py / run_modify_ssm.py).
+    use 'python3 test_modify_ssm.py' to run the test suite
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.files = write_cohort(self.tmp_dir.name, n_loci=40, n_samples=5, n_clusters=3, seed=4, write_xls=False)
+
+        with open(self.files["names"]) as names_file:
+            self.names = names_file.read().splitlines()
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def test_chain_matches_sequential(self):
+        # applying a chain of operations in memory should give the same result as running each method one after the other
+        checkpoint = os.path.join(self.tmp_dir.name, "checkpoint.ssm")
+        chain_file = os.path.join(self.tmp_dir.name, "chain.json")
+
+        with open(chain_file, "w") as chain:
+            json.dump({"operations": [
+                {"mod_method": "SCALE_COUNTS", "args": [25]},
+                {"mod_method": "KEEP_VARS_BY_NAME", "names_fn": self.files["names"], "checkpoint": checkpoint},
+                {"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.6]},
+                {"mod_method": "ORG_VARS_BY_VAF", "args": [">", 0.3, 1.0]}
+            ]}, chain)
+
+        chained_df = run_operations(load_ssm(self.files["ssm"]), load_operations(chain_file))
+
+        expected_df = load_ssm(self.files["ssm"])
+        expected_df = keep_vars_by_name(scale_counts(expected_df, 25), self.names)
+        checkpoint_df = expected_df.copy()
+        expected_df = organize_vars_by_vaf(remove_vars_by_vaf(expected_df, operator.gt, 0.6), operator.gt, 0.3, "1.0")
+
+        self.assertTrue(chained_df.reset_index(drop=True).equals(expected_df.reset_index(drop=True)),
+                        'Chained operations do not match running each operation separately')
+
+        self.assertTrue(load_ssm(checkpoint).equals(checkpoint_df.reset_index(drop=True)),
+                        'Checkpoint does not match the intermediate result')
+
+
+    def write_yaml_chain(self):
+
+        chain_file = os.path.join(self.tmp_dir.name, "chain.yaml")
+
+        with open(chain_file, "w") as chain:
+            chain.write("operations:\n"
+                        "  - {mod_method: SCALE_COUNTS, args: [25]}\n"
+                        "  - {mod_method: RM_VARS_BY_VAF, args: ['>', 0.6]}\n")
+
+        return chain_file
+
+
+    @unittest.skipUnless(yaml, "PyYAML is not installed")
+    def test_yaml_chain(self):
+
+        self.assertEqual(load_operations(self.write_yaml_chain()),
+                         [{"mod_method": "SCALE_COUNTS", "args": [25]}, {"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.6]}],
+                         'Operations of a .yaml chain not read')
+
+
+    @unittest.skipIf(yaml, "PyYAML is installed")
+    def test_yaml_chain_without_pyyaml(self):
+        # PyYAML isn't a requirement, a .yaml chain says how to get it
+        with self.assertRaisesRegex(ImportError, "pip3 install pyyaml"):
+            load_operations(self.write_yaml_chain())
+
+
+    def test_params_file_of_chain(self):
+        # a params file given to a whole chain (-p) is only passed to the methods that read it
+        params_file = self.files["params"]
+
+        self.assertEqual(_method_args("SCALE_COUNTS", ["25"], params_file), [25])
+        self.assertEqual(_method_args("SCALE_COUNTS", ["cells.csv"], params_file), [params_file, "cells.csv"])
+        self.assertEqual(_method_args("RM_VARS_BY_VAF", [">", "0.5"], params_file), [operator.gt, 0.5])
+        self.assertEqual(_method_args("SEPARATE_GARBAGE", [], params_file), [params_file])
+        self.assertEqual(_method_args("PYCLONE_FMT", [], params_file), [params_file])
+
+        with self.assertRaises(argparse.ArgumentTypeError):
+            _method_args("KEEP_VARS_IN_REGIONS", [], params_file)
+
+
+    def test_partition(self):
+        # every cluster and the garbage mutations are written in one pass, with renumbered ids and their own params
+        out_file = os.path.join(self.tmp_dir.name, "partition.ssm.gz")
+
+        with open(self.files["params"]) as params_json:
+            params = json.load(params_json)
+
+        # some clustered loci are garbage, and one is in no partition
+        params[GARBAGE] = params[CLUSTERS][0][:3]
+        params[CLUSTERS][0] = params[CLUSTERS][0][4:]
+
+        with open(self.files["params"], "w") as params_json:
+            json.dump(params, params_json)
+
+        counts = partition_ssm(iter_ssm(self.files["ssm"], chunk_size=7), self.files["params"], out_file)
+
+        ssm_df = load_ssm(self.files["ssm"])
+        garbage_df = separate_garbage(ssm_df, self.files["params"])
+
+        self.assertTrue(len(garbage_df) > 0 and sorted(garbage_df[COL_ID]) == sorted(params[GARBAGE]), 'Incorrect garbage mutations')
+
+        for name, ids, is_cluster in [("cluster%d" % (i+1), ids, True) for i, ids in enumerate(params[CLUSTERS])] + [(GARBAGE, params[GARBAGE], False)]:
+
+            expected_df = overwrite_ids(ssm_df[ssm_df[COL_ID].isin(ids)].copy()).reset_index(drop=True)
+
+            self.assertTrue(load_ssm(partition_file(out_file, name)).equals(expected_df), 'Incorrect loci in %s' % name)
+            self.assertEqual(counts[name], len(ids), 'Incorrect number of loci in %s' % name)
+
+            with open(os.path.join(self.tmp_dir.name, "partition.%s.params.json" % name)) as params_json:
+                partition_params = json.load(params_json)
+
+            expected_ids = list(expected_df[COL_ID])
+
+            self.assertEqual(partition_params[CLUSTERS], [expected_ids] if is_cluster else [], 'Incorrect clusters in %s' % name)
+            self.assertEqual(partition_params[GARBAGE], [] if is_cluster else expected_ids, 'Incorrect garbage in %s' % name)
+            self.assertEqual(partition_params[SAMPLES], params[SAMPLES], 'Incorrect samples in %s' % name)
+
+
+    def test_remap_params(self):
+        # filtering/reordering renumbers the ids, the params written with the modified .ssm follow the loci they named
+        with open(self.files["params"]) as params_json:
+            params = json.load(params_json)
+
+        params[GARBAGE] = params[CLUSTERS][0][:2]
+
+        with open(self.files["params"], "w") as params_json:
+            json.dump(params, params_json)
+
+        ssm_df = load_ssm(self.files["ssm"])
+        out_file = os.path.join(self.tmp_dir.name, "modified.ssm")
+
+        modified_df = api.modify(self.files["ssm"], [{"mod_method": "KEEP_VARS_BY_NAME", "args": [], "names_fn": self.files["names"]},
+                                                     {"mod_method": "ORG_VARS_BY_VAF", "args": [">", 0.3, 1.0]}], out_file)
+
+        with open(os.path.join(self.tmp_dir.name, "modified.params.json")) as params_json:
+            modified_params = json.load(params_json)
+
+        names = ssm_df.set_index(COL_ID)[COL_NAME]
+        modified_names = modified_df.set_index(COL_ID)[COL_NAME]
+
+        kept = lambda ids: [names[id] for id in ids if names[id] in set(self.names)]
+
+        self.assertEqual([list(modified_names[cluster]) for cluster in modified_params[CLUSTERS]], [kept(cluster) for cluster in params[CLUSTERS] if kept(cluster)],
+                         'Remapped clusters do not name the same loci')
+        self.assertEqual(list(modified_names[modified_params[GARBAGE]]), kept(params[GARBAGE]), 'Remapped garbage does not name the same loci')
+        self.assertEqual(modified_params[SAMPLES], params[SAMPLES], 'Incorrect samples')
+
+        # clusters without any loci left are dropped
+        self.assertEqual(remap_params(params, ssm_df, ssm_df.iloc[:0])[CLUSTERS], [], 'Empty clusters are kept')
+
+
+if __name__ == '__main__':
+    unittest.main()
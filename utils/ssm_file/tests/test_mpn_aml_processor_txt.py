@@ -0,0 +1,189 @@
+import unittest
+import os, sys
+import json
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ssm_processors'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from mpn_aml_columns_txt import *
+from ssm_columns import *
+from mpn_aml_processor_txt import MPN_AML_Processor_Txt
+from garbage_detector import Garbage_Detector
+from cohort_fixtures import simulate_cohort, txt_df
+from variant_ids import Variant_Id_Registry
+from modify_ssm import keep_vars_by_name, overwrite_ids
+
+
+class MPN_AML_Processor_Txt_Update_Tests(unittest.TestCase):
+    """
+    Test cases for appending new samples to a previously written .ssm with MPN_AML_Processor_Txt(previous_ssm=...).
+    use 'python3 test_mpn_aml_processor_txt.py' to run the test suite
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.data_df = txt_df(simulate_cohort(n_loci=20, n_samples=6, n_clusters=3, seed=2))
+
+        samples = sorted(self.data_df[SAMPLEA].unique())
+        self.previous_samples, self.new_samples = samples[:4], samples[4:]
+
+        names = self.data_df[CHR] + "_" + self.data_df[START].astype(str)
+        self.new_names = sorted(names.unique())[:3]
+
+        # a previous locus that only the new samples cover with enough reads (garbage before the update only)
+        self.covered_name = sorted(names.unique())[-1]
+        self.data_df.loc[(names == self.covered_name) & self.data_df[SAMPLEA].isin(self.previous_samples), [VAR_READS, TOTAL_READS]] = [1, 5]
+
+        # the previous run is missing the new samples and a few loci
+        self.files = {
+            "full": self.data_df,
+            "previous": self.data_df[self.data_df[SAMPLEA].isin(self.previous_samples) & ~names.isin(self.new_names)],
+            "new": self.data_df[self.data_df[SAMPLEA].isin(self.new_samples)]
+        }
+
+        for name, df in self.files.items():
+            self.files[name] = os.path.join(self.tmp_dir.name, name + ".txt")
+            df.to_csv(self.files[name], sep="\t", index=False)
+
+        MPN_AML_Processor_Txt(self.files["full"], os.path.join(self.tmp_dir.name, "full.ssm"))
+        MPN_AML_Processor_Txt(self.files["previous"], os.path.join(self.tmp_dir.name, "previous.ssm"))
+        MPN_AML_Processor_Txt(self.files["new"], os.path.join(self.tmp_dir.name, "updated.ssm"), previous_ssm=os.path.join(self.tmp_dir.name, "previous.ssm"))
+
+        self.full_df = pd.read_csv(os.path.join(self.tmp_dir.name, "full.ssm"), sep="\t").set_index(COL_NAME)
+        self.previous_df = pd.read_csv(os.path.join(self.tmp_dir.name, "previous.ssm"), sep="\t").set_index(COL_NAME)
+        self.updated_df = pd.read_csv(os.path.join(self.tmp_dir.name, "updated.ssm"), sep="\t").set_index(COL_NAME)
+
+        with open(os.path.join(self.tmp_dir.name, "updated.params.json")) as params_json:
+            self.updated_params = json.load(params_json)
+
+        with open(os.path.join(self.tmp_dir.name, "full.params.json")) as params_json:
+            self.full_params = json.load(params_json)
+
+        with open(os.path.join(self.tmp_dir.name, "previous.params.json")) as params_json:
+            self.previous_params = json.load(params_json)
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def test_samples_appended(self):
+        self.assertEqual(self.updated_params[SAMPLES], self.previous_samples + self.new_samples,
+                         'New samples are not appended to the previous samples')
+
+
+    def test_ids_preserved(self):
+        self.assertTrue(self.updated_df.loc[self.previous_df.index, COL_ID].equals(self.previous_df[COL_ID]),
+                        'Ids of previous loci changed')
+
+        self.assertEqual(self.updated_df[COL_ID].nunique(), len(self.updated_df),
+                         'Ids are not unique')
+
+
+    def test_previous_loci_match_full(self):
+        # loci in the previous .ssm should have the same vectors as processing every sample at once
+        for column in [COL_VAR_READS, COL_TOTAL_READS, COL_VAR_READ_PROB]:
+            self.assertTrue(self.updated_df.loc[self.previous_df.index, column].equals(self.full_df.loc[self.previous_df.index, column]),
+                            'Vectors of previous loci do not match a full run (%s)' % column)
+
+
+    def test_new_loci_zero_filled(self):
+        n_previous = len(self.previous_samples)
+
+        for name in self.new_names:
+            var_reads = [int(count) for count in self.updated_df.loc[name, COL_VAR_READS].split(",")]
+            total_reads = [int(count) for count in self.updated_df.loc[name, COL_TOTAL_READS].split(",")]
+            full_var_reads = [int(count) for count in self.full_df.loc[name, COL_VAR_READS].split(",")]
+
+            self.assertEqual(var_reads[:n_previous], [0] * n_previous, 'History of new loci is not zero-filled')
+            self.assertEqual(total_reads[:n_previous], [1] * n_previous, 'History of new loci is not zero-filled')
+            self.assertEqual(var_reads[n_previous:], full_var_reads[n_previous:], 'New loci have incorrect values for new samples')
+
+
+    def test_garbage_recomputed(self):
+        # garbage mutations are detected over the merged .ssm, so previous loci are flagged as in a full run
+        covered_id = self.updated_df.loc[self.covered_name, COL_ID]
+
+        self.assertIn(covered_id, self.previous_params[GARBAGE])
+        self.assertNotIn(covered_id, self.updated_params[GARBAGE], 'Garbage mutations are not recomputed with the new samples')
+
+        garbage_names = set(self.updated_df.index[self.updated_df[COL_ID].isin(self.updated_params[GARBAGE])])
+        full_garbage_names = set(self.full_df.index[self.full_df[COL_ID].isin(self.full_params[GARBAGE])])
+
+        self.assertEqual(garbage_names & set(self.previous_df.index), full_garbage_names & set(self.previous_df.index),
+                         'Garbage mutations of previous loci do not match a full run')
+
+        self.assertEqual(set(self.updated_params[GARBAGE]), set(Garbage_Detector().garbage_ids(self.updated_df)),
+                         'Garbage mutations are not those of the merged .ssm')
+
+
+class MPN_AML_Processor_Txt_Id_Registry_Tests(unittest.TestCase):
+    """
+    Test cases for stable variant ids (MPN_AML_Processor_Txt(id_registry=...)) across reruns on filtered input.
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.registry_file = os.path.join(self.tmp_dir.name, "patient.ids.json")
+
+        data_df = txt_df(simulate_cohort(n_loci=20, n_samples=3, n_clusters=2, seed=3))
+        names = data_df[CHR] + "_" + data_df[START].astype(str)
+
+        # the rerun drops every third locus
+        self.dropped_names = sorted(names.unique())[::3]
+
+        self.full_file = os.path.join(self.tmp_dir.name, "full.txt")
+        self.filtered_file = os.path.join(self.tmp_dir.name, "filtered.txt")
+
+        data_df.to_csv(self.full_file, sep="\t", index=False)
+        data_df[~names.isin(self.dropped_names)].to_csv(self.filtered_file, sep="\t", index=False)
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def test_ids_stable_across_reruns(self):
+
+        full_df = MPN_AML_Processor_Txt(self.full_file, "", False, False, id_registry=self.registry_file).out_df
+        filtered_df = MPN_AML_Processor_Txt(self.filtered_file, "", False, False, id_registry=self.registry_file).out_df
+
+        self.assertTrue(all(filtered_df[COL_ID].str.match(r's\d+') == True),
+                        'Registry ids have incorrect id convention')
+
+        self.assertTrue(filtered_df.set_index(COL_NAME)[COL_ID].equals(full_df.set_index(COL_NAME).loc[filtered_df[COL_NAME], COL_ID]),
+                        'Ids changed after rerunning on filtered input')
+
+        # a filter in modify_ssm keeps registered ids too
+        kept_df = keep_vars_by_name(full_df.copy(), full_df[COL_NAME].values[1::2])
+        kept_df = overwrite_ids(kept_df, Variant_Id_Registry(self.registry_file))
+
+        self.assertTrue(kept_df.set_index(COL_NAME)[COL_ID].equals(full_df.set_index(COL_NAME).loc[kept_df[COL_NAME], COL_ID]),
+                        'Ids changed after filtering with a registry')
+
+
+    def test_registered_ids_are_unique(self):
+        # an .ssm whose ids were renumbered (e.g. filtered without the registry) reuses ids the registry gave to other loci
+        registry = Variant_Id_Registry(self.registry_file)
+
+        registry.register(pd.DataFrame({COL_ID: ["s0", "s1"], COL_NAME: ["chr1_10", "chr1_20"]}))
+        registry.register(pd.DataFrame({COL_ID: ["s0", "s2"], COL_NAME: ["chr1_30", "chr1_20"]}))
+
+        ids = registry.ids_for_names(["chr1_10", "chr1_20", "chr1_30", "chr1_40"])
+
+        self.assertEqual(ids[:2], ["s0", "s1"], 'Registered ids changed')
+        self.assertEqual(len(set(ids)), len(ids), 'Different loci were given the same id')
+
+
+if __name__ == '__main__':
+    unittest.main()
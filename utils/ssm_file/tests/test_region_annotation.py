@@ -0,0 +1,155 @@
+import unittest
+import os, sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'ssm_processors'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from ssm_columns import *
+from region_annotation import Region_Annotator, ANN_GENE, ANN_REGION
+from mpn_aml_columns_txt import CHR, START, GENE, REGION
+from mpn_aml_processor_txt import MPN_AML_Processor_Txt
+from ssm_store import SSM_Store, ssm_to_store, STORE_MOD_METHODS
+from modify_ssm import load_ssm
+from run_modify_ssm import MOD_METHODS, stream_operations, modify_file
+from mpn_aml_processor import MPN_AML_Processor
+import mpn_aml_columns
+from cohort_fixtures import write_cohort
+
+
+GTF = """#!genome-build test
+chr1\ttest\tgene\t100\t500\t.\t+\t.\tgene_id "G1"; gene_name "GENE1";
+chr1\ttest\ttranscript\t100\t500\t.\t+\t.\tgene_id "G1"; gene_name "GENE1";
+chr1\ttest\texon\t100\t200\t.\t+\t.\tgene_id "G1"; gene_name "GENE1";
+chr1\ttest\texon\t400\t500\t.\t+\t.\tgene_id "G1"; gene_name "GENE1";
+chr2\ttest\tgene\t1000\t2000\t.\t-\t.\tgene_id "G2";
+"""
+
+
+class Region_Annotation_Tests(unittest.TestCase):
+    """
+    Test cases for annotating loci with the gene/region of a BED/GTF file and filtering them to its regions (region_annotation.py).
+    use 'python3 test_region_annotation.py' to run the test suite
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def path(self, name):
+
+        return os.path.join(self.tmp_dir.name, name)
+
+
+    def test_bed_and_gtf(self):
+
+        with open(self.path("panel.bed"), "w") as bed:
+            bed.write("track name=panel\nchr1\t99\t200\tGENE1\n2\t999\t1000\tGENE2\n")
+
+        annotator = Region_Annotator(self.path("panel.bed"))
+
+        # BED regions are 0-based and half-open, chromosomes match with or without a chr prefix
+        self.assertEqual(list(annotator.in_regions(["1", "chr1", "chr1", "chr2", "chrX"], [99, 100, 200, 1000, 150])), [False, True, True, True, False],
+                         'Incorrect loci in the BED regions')
+        self.assertEqual(list(annotator.annotate(["chr2"], [1000])[ANN_GENE]), ["GENE2"], 'Incorrect BED gene')
+
+        with open(self.path("genes.gtf"), "w") as gtf:
+            gtf.write(GTF)
+
+        annotations = Region_Annotator(self.path("genes.gtf")).annotate(["chr1", "chr1", "chr1", "chr2", "chr1"], [150, 300, 450, 1500, 600])
+
+        self.assertEqual(list(annotations[ANN_GENE].fillna("")), ["GENE1", "GENE1", "GENE1", "G2", ""], 'Incorrect GTF genes')
+        self.assertEqual(list(annotations[ANN_REGION].fillna("")), ["exonic", "intronic", "exonic", "intronic", ""], 'Incorrect GTF regions')
+
+
+    def test_processor_regions(self):
+
+        files = write_cohort(self.tmp_dir.name, n_loci=30, n_samples=3, n_clusters=2, seed=4, write_xls=False)
+
+        txt_df = pd.read_csv(files["txt"], sep="\t")
+
+        loci = txt_df.drop_duplicates([CHR, START])
+        panel = loci.iloc[::3]
+
+        pd.DataFrame({0: panel[CHR], 1: panel[START] - 1, 2: panel[START], 3: "PANEL"}).to_csv(self.path("panel.bed"), sep="\t", header=False, index=False)
+
+        # the first locus has no gene or region
+        first_locus = (txt_df[CHR] == panel[CHR].iloc[0]) & (txt_df[START] == panel[START].iloc[0])
+        txt_df.loc[first_locus, [GENE, REGION]] = np.nan
+
+        processor = MPN_AML_Processor_Txt(txt_df, "", False, False, regions=self.path("panel.bed"))
+
+        self.assertEqual(set(processor.in_df.loc[(processor.in_df[CHR] == panel[CHR].iloc[0]) & (processor.in_df[START] == panel[START].iloc[0]), GENE]), {"PANEL"},
+                         'Missing gene not filled in from the regions')
+        self.assertEqual(len(processor.out_df), len(loci), 'Variants dropped without panel_only')
+
+        panel_processor = MPN_AML_Processor_Txt(txt_df, "", False, False, regions=self.path("panel.bed"), panel_only=True)
+
+        self.assertEqual(set(panel_processor.out_df[COL_NAME]), set(panel[CHR] + "_" + panel[START].astype(str)), 'Variants outside of the panel are kept')
+
+
+    def test_keep_vars_in_regions(self):
+
+        files = write_cohort(self.tmp_dir.name, n_loci=40, n_samples=3, n_clusters=2, seed=8, write_xls=False)
+
+        ssm_df = load_ssm(files["ssm"])
+
+        loci = ssm_df[COL_NAME].str.rsplit("_", n=1, expand=True)
+        panel = loci.iloc[1::4]
+
+        pd.DataFrame({0: panel[0], 1: panel[1].astype(int) - 1, 2: panel[1].astype(int)}).to_csv(self.path("panel.bed"), sep="\t", header=False, index=False)
+
+        kept_df = MOD_METHODS["KEEP_VARS_IN_REGIONS"](ssm_df, self.path("panel.bed"))
+
+        self.assertEqual(list(kept_df[COL_NAME]), list(ssm_df[COL_NAME].iloc[1::4]), 'Incorrect loci kept')
+        self.assertEqual(list(kept_df[COL_ID]), ["s%d" % idx for idx in range(len(kept_df))], 'Ids are not renumbered')
+
+        # streamed and store versions keep the same loci
+        stream_operations(files["ssm"], [{"mod_method": "KEEP_VARS_IN_REGIONS", "args": [self.path("panel.bed")]}], self.path("streamed.ssm"), chunk_size=7)
+
+        store = ssm_to_store(files["ssm"], self.path("cohort.ssmstore"), files["params"], chunk_size=7)
+        kept_store = STORE_MOD_METHODS["KEEP_VARS_IN_REGIONS"](store, self.path("kept.ssmstore"), self.path("panel.bed"))
+
+        self.assertTrue(load_ssm(self.path("streamed.ssm")).equals(kept_df.reset_index(drop=True)), 'Streamed KEEP_VARS_IN_REGIONS does not match the dataframe version')
+        self.assertEqual(list(SSM_Store(self.path("kept.ssmstore")).names), list(kept_df[COL_NAME]), 'KEEP_VARS_IN_REGIONS on a store does not match the dataframe version')
+
+
+    def test_keep_vars_in_regions_by_gene_names(self):
+        # MPN_AML_Processor names loci <gene>_<position>, they're looked up in the id registry rather than dropped
+        aggregated_df = pd.DataFrame({
+            mpn_aml_columns.CHR: ["chr9", "chr9", "chr1", "chr1"],
+            mpn_aml_columns.POSITION: [5073770, 5073770, 1000, 1000],
+            mpn_aml_columns.GENE: ["JAK2", "JAK2", "A1", "A1"],
+            mpn_aml_columns.SAMPLE_NAMES: ["S0", "S1", "S0", "S1"],
+            mpn_aml_columns.ALT_DEPTH: [40, 35, 20, 25],
+            mpn_aml_columns.REF_DEPTH: [60, 65, 30, 25]
+        })
+
+        registry_file = self.path("patient.ids.json")
+
+        MPN_AML_Processor(aggregated_df, self.path("patient.ssm"), id_registry=registry_file)
+
+        with open(self.path("panel.bed"), "w") as bed_file:
+            bed_file.write("chr9\t5073700\t5073800\tJAK2\n")
+
+        with self.assertRaises(ValueError):
+            MOD_METHODS["KEEP_VARS_IN_REGIONS"](load_ssm(self.path("patient.ssm")), self.path("panel.bed"))
+
+        modify_file(self.path("patient.ssm"), self.path("kept.ssm"), [{"mod_method": "KEEP_VARS_IN_REGIONS", "args": [self.path("panel.bed")]}],
+                    id_registry=registry_file)
+
+        self.assertEqual(list(load_ssm(self.path("kept.ssm"))[COL_NAME]), ["JAK2_5073770"], 'Incorrect loci kept for <gene>_<position> names')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+import os, sys
+import operator
+import tempfile
+import gzip
+
+import numpy as np
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from ssm_columns import *
+from ssm_io import SSM_Writer, iter_ssm, read_ssm_rows, format_vectors, params_file_for, INT_FORMAT, PROB_FORMAT
+from modify_ssm import load_ssm, save_ssm
+from run_modify_ssm import MOD_METHODS, is_streamable, run_operations, stream_operations
+from variant_ids import Variant_Id_Registry
+from cohort_fixtures import write_cohort
+
+
+class SSM_IO_Tests(unittest.TestCase):
+    """
+    Test cases for streaming .ssm files (ssm_io.py, run_modify_ssm.stream_operations).
+    use 'python3 test_ssm_io.py' to run the test suite
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.files = write_cohort(self.tmp_dir.name, n_loci=60, n_samples=5, n_clusters=3, seed=11, write_xls=False)
+
+        with open(self.files["names"]) as names_file:
+            self.names = names_file.read().splitlines()
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def path(self, name):
+
+        return os.path.join(self.tmp_dir.name, name)
+
+
+    def read(self, file_name):
+
+        with open(file_name) as in_file:
+            return in_file.read()
+
+
+    def test_reader_and_writer(self):
+
+        chunks = list(iter_ssm(self.files["ssm"], chunk_size=7))
+
+        self.assertEqual([len(chunk) for chunk in chunks], [7] * 8 + [4], 'Incorrect chunk sizes')
+        self.assertTrue(all(list(chunk.index) == list(range(len(chunk))) for chunk in chunks), 'Chunks are not indexed from 0')
+
+        # writing the chunks back (without renumbering) gives the same .ssm
+        with SSM_Writer(self.path("copy.ssm")) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+
+        self.assertEqual(self.read(self.files["ssm"]), self.read(self.path("copy.ssm")), '.ssm changed after streaming it')
+
+        # renumbering continues across chunks
+        with SSM_Writer(self.path("renumbered.ssm"), renumber=True) as writer:
+            for chunk in chunks:
+                writer.write(chunk[1:])
+
+        self.assertEqual(list(load_ssm(self.path("renumbered.ssm"))[COL_ID]), ["s%d" % number for number in range(60 - len(chunks))],
+                         'Ids are not renumbered across chunks')
+
+        rows = read_ssm_rows(self.files["ssm"], COL_NAME, self.names[:5], columns=[COL_ID, COL_NAME], chunk_size=7)
+
+        self.assertEqual(sorted(rows[COL_NAME]), sorted(self.names[:5]), 'Incorrect rows read')
+
+
+    def test_stream_matches_dataframe(self):
+        # every chain of row-local operations gives the same .ssm (and checkpoints) streamed as in a dataframe
+        chains = [
+            [{"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5]}],
+            [{"mod_method": "SCALE_COUNTS", "args": [25]}],
+            [{"mod_method": "KEEP_VARS_BY_NAME", "args": [], "names_fn": self.files["names"]}],
+            [{"mod_method": "SCALE_COUNTS", "args": [25], "checkpoint": self.path("scaled.ssm")},
+             {"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5], "checkpoint": self.path("removed.ssm")},
+             {"mod_method": "KEEP_VARS_BY_NAME", "args": [], "names_fn": self.files["names"]}],
+            # nothing left to write
+            [{"mod_method": "RM_VARS_BY_VAF", "args": [">=", 0.0]}]
+        ]
+
+        for chain_num, chain in enumerate(chains):
+
+            self.assertTrue(is_streamable(chain))
+
+            save_ssm(run_operations(load_ssm(self.files["ssm"]), chain), self.path("df.ssm"))
+            checkpoints = [self.read(operation["checkpoint"]) for operation in chain if operation.get("checkpoint")]
+
+            stream_operations(self.files["ssm"], chain, self.path("stream.ssm"), chunk_size=7)
+
+            self.assertEqual(self.read(self.path("df.ssm")), self.read(self.path("stream.ssm")), 'Streamed chain %d does not match the dataframe version' % chain_num)
+            self.assertEqual(checkpoints, [self.read(operation["checkpoint"]) for operation in chain if operation.get("checkpoint")],
+                             'Streamed checkpoints of chain %d do not match the dataframe version' % chain_num)
+
+        self.assertFalse(is_streamable([{"mod_method": "ORG_VARS_BY_VAF", "args": [">", 0.2, "1.0"]}]))
+
+
+    def test_compressed_ssm(self):
+
+        dataframe = load_ssm(self.files["ssm"])
+
+        save_ssm(dataframe, self.path("copy.ssm"))
+        save_ssm(dataframe, self.path("copy.ssm.gz"))
+
+        self.assertEqual(self.read(self.files["ssm"]), self.read(self.path("copy.ssm")), '.ssm changed after saving it')
+
+        with gzip.open(self.path("copy.ssm.gz"), "rt") as ssm_gz:
+            self.assertEqual(self.read(self.files["ssm"]), ssm_gz.read(), '.ssm.gz does not decompress to the .ssm')
+
+        self.assertTrue(load_ssm(self.path("copy.ssm.gz")).equals(dataframe), '.ssm.gz is not read back')
+        self.assertEqual(sum(len(chunk) for chunk in iter_ssm(self.path("copy.ssm.gz"), chunk_size=7)), len(dataframe), '.ssm.gz is not streamed')
+
+        self.assertEqual(params_file_for("example.ssm.gz"), "example.params.json", 'Incorrect .params.json of an .ssm.gz')
+
+        # vectors are formatted as they were with ", ".join(map(str, ...))
+        reads = np.array([[0, 12, 3], [450, 0, 7]])
+        probs = np.array([[0.5, 1.0, 0.5], [1.0, 1.0, 0.25]])
+
+        self.assertEqual(format_vectors(reads, INT_FORMAT), ["0, 12, 3", "450, 0, 7"], 'Incorrect read count vectors')
+        self.assertEqual(format_vectors(probs, PROB_FORMAT), ["0.5, 1.0, 0.5", "1.0, 1.0, 0.25"], 'Incorrect probability vectors')
+
+
+    def test_stream_with_id_registry(self):
+
+        chain = [{"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5]}]
+
+        df_registry = Variant_Id_Registry()
+        dataframe = load_ssm(self.files["ssm"])
+        df_registry.register(dataframe)
+        save_ssm(run_operations(dataframe, chain, df_registry), self.path("df.ssm"))
+
+        stream_operations(self.files["ssm"], chain, self.path("stream.ssm"), Variant_Id_Registry(), chunk_size=7)
+
+        self.assertEqual(self.read(self.path("df.ssm")), self.read(self.path("stream.ssm")), 'Streamed ids do not match the registry ids')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import os, sys
+import operator
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from ssm_columns import *
+from ssm_store import SSM_Store, STORE_MOD_METHODS, ssm_to_store, store_to_ssm
+from modify_ssm import load_ssm, save_ssm
+from run_modify_ssm import MOD_METHODS, run_store_operations
+from split_data import read_fn, read_params, split_data
+from cohort_fixtures import write_cohort
+
+
+class SSM_Store_Tests(unittest.TestCase):
+    """
+    Test cases for the memory-mapped read-count store (ssm_store.py).
+    use 'python3 test_ssm_store.py' to run the test suite
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.files = write_cohort(self.tmp_dir.name, n_loci=60, n_samples=5, n_clusters=3, seed=7, write_xls=False)
+
+        with open(self.files["names"]) as names_file:
+            self.names = names_file.read().splitlines()
+
+        # small chunks, so every operation works over several chunks
+        self.store = ssm_to_store(self.files["ssm"], self.path("cohort.ssmstore"), self.files["params"], chunk_size=7)
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def path(self, name):
+
+        return os.path.join(self.tmp_dir.name, name)
+
+
+    def test_lossless_round_trip(self):
+
+        store_to_ssm(SSM_Store(self.path("cohort.ssmstore")), self.path("roundtrip.ssm"), chunk_size=7)
+
+        with open(self.files["ssm"]) as ssm, open(self.path("roundtrip.ssm")) as roundtrip:
+            self.assertEqual(ssm.read(), roundtrip.read(), '.ssm changed after converting to a store and back')
+
+        self.assertIsInstance(self.store.var_reads, np.memmap, 'Store arrays are not memory-mapped')
+
+
+    def test_operations_match_dataframe(self):
+        # every store operation should give the same .ssm as the dataframe version of the method
+        method_args = {
+            "RM_VARS_BY_VAF": [operator.gt, 0.5],
+            "ORG_VARS_BY_VAF": [operator.gt, 0.3, "1.0"],
+            "SCALE_COUNTS": [25],
+            "KEEP_VARS_BY_NAME": [self.names]
+        }
+
+        for mod_method, args in method_args.items():
+
+            out_store = STORE_MOD_METHODS[mod_method](self.store, self.path(mod_method + ".ssmstore"), *args)
+            store_to_ssm(out_store, self.path(mod_method + ".store.ssm"))
+
+            save_ssm(MOD_METHODS[mod_method](load_ssm(self.files["ssm"]), *args), self.path(mod_method + ".df.ssm"))
+
+            with open(self.path(mod_method + ".df.ssm")) as df_ssm, open(self.path(mod_method + ".store.ssm")) as store_ssm:
+                self.assertEqual(df_ssm.read(), store_ssm.read(), '%s on a store does not match the dataframe version' % mod_method)
+
+        # garbage mutations keep their ids
+        clusters, garbage = read_params(self.files["params"])
+        garbage_store = STORE_MOD_METHODS["SEPARATE_GARBAGE"](self.store, self.path("garbage.ssmstore"), self.files["params"])
+
+        self.assertTrue(len(garbage) > 0 and sorted(garbage_store.ids) == sorted(garbage), 'Incorrect garbage mutations')
+
+        # PyClone-VI tsv
+        STORE_MOD_METHODS["PYCLONE_FMT"](self.store, self.path("pyclone.store.tsv"), self.files["params"])
+        save_ssm(MOD_METHODS["PYCLONE_FMT"](load_ssm(self.files["ssm"]), self.files["params"]), self.path("pyclone.df.tsv"))
+
+        with open(self.path("pyclone.df.tsv")) as df_tsv, open(self.path("pyclone.store.tsv")) as store_tsv:
+            self.assertEqual(df_tsv.read(), store_tsv.read(), 'PYCLONE_FMT on a store does not match the dataframe version')
+
+
+    def test_chain_and_split(self):
+
+        run_store_operations(self.store, [{"mod_method": "SCALE_COUNTS", "args": [25]}, {"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5]}],
+                             self.path("chained.ssmstore"))
+
+        expected_df = MOD_METHODS["RM_VARS_BY_VAF"](MOD_METHODS["SCALE_COUNTS"](load_ssm(self.files["ssm"]), 25), operator.gt, 0.5)
+
+        self.assertTrue(SSM_Store(self.path("chained.ssmstore")).to_ssm_df().equals(expected_df.reset_index(drop=True).astype(str)),
+                        'Chained operations on a store do not match the dataframe versions')
+
+        # split_data only needs the index of a store
+        clusters, garbage = read_params(self.files["params"])
+
+        for name, ssm in [("ssm", self.files["ssm"]), ("store", self.path("cohort.ssmstore"))]:
+            os.makedirs(self.path("split_" + name))
+            split_data(read_fn(ssm), clusters, garbage, read_fn(self.files["txt"]), self.path("split_" + name))
+
+        for file_name in os.listdir(self.path("split_ssm")):
+            with open(os.path.join(self.path("split_ssm"), file_name)) as ssm_split, open(os.path.join(self.path("split_store"), file_name)) as store_split:
+                self.assertEqual(ssm_split.read(), store_split.read(), 'split_data on a store does not match the .ssm (%s)' % file_name)
+
+
+if __name__ == '__main__':
+    unittest.main()
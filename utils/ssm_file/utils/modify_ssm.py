@@ -5,13 +5,15 @@ import sys, os, math
 sys.path.append(os.environ["UTILS_DIR"] + "/common")
 
 from ssm_columns import *
+from ssm_io import GZ_EXT, SSM_Writer, params_file_for, read_ssm, write_ssm
+from variant_ids import Variant_Id_Registry
 
 
 def load_ssm(in_file):
     """
-    Return an ssm files dataframe (assumes tab delimited)
+    Return an ssm files dataframe (assumes tab delimited, .ssm.gz files are decompressed)
     """
-    return pd.read_csv(in_file, sep="\t")
+    return read_ssm(in_file)
 
 
 def load_csv(csv_file):
@@ -23,16 +25,23 @@ def load_csv(csv_file):
 
 def save_ssm(dataframe, out_file):
     """
-    Given a dataframe and out_file, saves a tab delimited dataframe
+    Given a dataframe and out_file, saves a tab delimited dataframe (gzip compressed if out_file ends in .gz)
     """
-    dataframe.to_csv(out_file, sep="\t", index=False)
+    write_ssm(dataframe, out_file)
 
 
-def overwrite_ids(dataframe):
+def overwrite_ids(dataframe, id_registry=None):
     """
-    Overwrite id column after some change has been made which modifies the original order of the dataframe
+    Overwrite id column after some change has been made which modifies the original order of the dataframe.
+    If an id registry (Variant_Id_Registry) is passed, each variant is given its registered id instead,
+    so filtering and reordering do not change the ids of the remaining variants.
     """
 
+    if id_registry:
+        dataframe[COL_ID] = id_registry.ids_for_names(dataframe[COL_NAME])
+
+        return dataframe
+
     # overwrite id column such that matched columns are at the end
     dataframe[COL_ID] = ["s" + str(number) for number in list(range(0, len(dataframe)))]
 
@@ -90,29 +99,36 @@ def organize_vars_by_vaf(dataframe, op, vaf, var_read_prob=None):
     return dataframe
 
 
-def scale_counts(dataframe, *cell_counts):
+def estimate_coverage(n_samples, *cell_counts):
     """
-    Scales var_reads and total_reads by a max_total_reads on a per variant/sample basis,
-    such that all((total_reads <= max_total_reads) and (var_reads <= max_total_reads))
+    Returns the maximum read count of each sample (twice its estimated cell count), from either a general
+    cell count estimate or a per sample cell count estimate ([.*\.params\.json, .*\.csv])
     """
 
     import re, json
 
-    # handle whether or not we've passed in a general cell count estimate or a per sample cell count estimate
-    estimated_coverage = None
-
     if len(cell_counts) == 2:
 
         if re.search(".*\.params\.json", cell_counts[0]) and re.search(".*\.csv", cell_counts[1]): # if we're reading from a file
 
             sample_order = json.load(open(cell_counts[0]))["samples"]
             cell_counts_df = load_csv(cell_counts[1])
-            estimated_coverage = np.array([cell_counts_df.loc[cell_counts_df["sample"] == sample, "cells"].item() for sample in sample_order]).astype('int64') * 2
+            return np.array([cell_counts_df.loc[cell_counts_df["sample"] == sample, "cells"].item() for sample in sample_order]).astype('int64') * 2
 
         else:
              raise TypeError("Incorrect parameters passed through arguments - expected [.*\.params\.json, .*\.csv]")
-    else:
-        estimated_coverage = np.array(cell_counts*len(dataframe.iloc[0][COL_TOTAL_READS].split(","))).astype('int64') * 2
+
+    return np.array(cell_counts*n_samples).astype('int64') * 2
+
+
+def scale_counts(dataframe, *cell_counts):
+    """
+    Scales var_reads and total_reads by a max_total_reads on a per variant/sample basis,
+    such that all((total_reads <= max_total_reads) and (var_reads <= max_total_reads))
+    """
+
+    # handle whether or not we've passed in a general cell count estimate or a per sample cell count estimate
+    estimated_coverage = estimate_coverage(len(dataframe.iloc[0][COL_TOTAL_READS].split(",")), *cell_counts)
 
     # iterate through all rows and scale var_reads and total_reads using estimated_coverage vector
     for row_idx in range(0, len(dataframe)):
@@ -149,51 +165,189 @@ def keep_vars_by_name(dataframe, names):
     return overwrite_ids(dataframe[dataframe[COL_NAME].isin(names)])
 
 
+def keep_vars_in_regions(dataframe, regions, loci=None):
+    """
+    Returns a dataframe that has only the loci in the regions of a BED/GTF file (or Region_Annotator, see region_annotation.py),
+    for loci named <chromosome>_<position>, other names are looked up in loci (name -> <chromosome>_<position>, e.g. the names of a
+    Variant_Id_Registry, see Region_Annotator.in_regions_by_name)
+    """
+    from region_annotation import Region_Annotator
+
+    if not isinstance(regions, Region_Annotator):
+        regions = Region_Annotator(regions)
+
+    return overwrite_ids(dataframe[regions.in_regions_by_name(dataframe[COL_NAME].values, loci)])
+
+
 
 def separate_garbage(dataframe, *params_file):
     """
-    Returns a dataframe with only the garbage mutations per the given params file
+    Returns a dataframe with only the garbage mutations per the given params file (keeping their ids)
     """
+    import re, json
+
     if re.search(".*\.params\.json", params_file[0]): # if we're reading from a file
 
-        garbage = json.load(open(params_file[0]))["garbage"]
+        garbage = json.load(open(params_file[0]))[GARBAGE]
 
-        return dataframe.loc[dataframe[COL_ID] == garbage].copy()
+        return dataframe.loc[dataframe[COL_ID].isin(set(garbage))].copy()
 
     else:
 
-        return pd.Dataframe()
+        return pd.DataFrame(columns=dataframe.columns)
 
 
+def load_index(in_file):
+    """
+    Returns a dataframe of only the ids and names of an .ssm (or read-count store)
+    """
+    from ssm_store import SSM_Store, is_store
 
-def pyclone_vi_fmt(dataframe, params):
+    if is_store(in_file):
+        return SSM_Store(in_file).index_df()
+
+    return pd.read_csv(in_file, sep="\t", usecols=[COL_ID, COL_NAME])
+
+
+def remap_params(params, in_df, out_df):
     """
-    Processes ssm dataframe into a tsv that can be used by PyClone-VI
+    Returns the params of in_df (a dictionary) for out_df, the result of modifying in_df: operations that filter or reorder the loci
+    renumber their ids, so the ids of the clusters and garbage mutations are mapped (by name) to the ids their loci have in out_df.
+    Loci that aren't in out_df anymore are dropped, and so are the clusters left without any loci.
     """
+    names = dict(zip(in_df[COL_ID], in_df[COL_NAME]))
+    ids = dict(zip(out_df[COL_NAME], out_df[COL_ID]))
+
+    remap = lambda old_ids: [ids[names[id]] for id in old_ids if names.get(id) in ids]
+
+    params = dict(params)
 
+    if CLUSTERS in params:
+        params[CLUSTERS] = [cluster for cluster in map(remap, params[CLUSTERS]) if cluster]
+
+    if GARBAGE in params:
+        params[GARBAGE] = remap(params[GARBAGE])
+
+    return params
+
+
+def save_remapped_params(params_file, in_df, out_file):
+    """
+    Writes the params of params_file, remapped to the ids of the (modified) .ssm out_file (see remap_params), next to out_file.
+    in_df holds the ids and names of the .ssm params_file belongs to (see load_index).
+    """
     import json
 
-    samples = json.load(open(params))["samples"]
+    with open(params_file) as params_json:
+        params = json.load(params_json)
 
-    pyclone_vi_columns = ["mutation_id", "sample_id", "ref_counts", "alt_counts", "major_cn", "minor_cn", "normal_cn"]
+    params = remap_params(params, in_df, load_index(out_file))
 
-    pyclone_df = pd.DataFrame(columns=pyclone_vi_columns)
+    with open(params_file_for(out_file), "w") as params_json:
+        json.dump(params, params_json)
 
-    for row_idx in range(0, len(dataframe)):
+    return params
 
-        row = dataframe.iloc[row_idx]
 
-        var_reads_scaled, total_reads_scaled = [], []
+def partition_file(out_file, name):
+    """
+    Returns the file of a partition named name, e.g. example.cluster1.ssm for example.ssm (and example.cluster1.ssm.gz for example.ssm.gz)
+    """
+    out_file, gz_ext = (out_file[:-len(GZ_EXT)], GZ_EXT) if out_file.endswith(GZ_EXT) else (out_file, "")
+
+    root, ext = os.path.splitext(out_file)
+
+    return root + "." + name + ext + gz_ext
+
+
+def partitions(params):
+    """
+    Returns the (name, ids) of each partition of a params dictionary: one per cluster (cluster<N>), then the garbage mutations (garbage)
+    """
+    return [("cluster%d" % (i+1), ids) for i, ids in enumerate(params[CLUSTERS])] + [(GARBAGE, params[GARBAGE])]
+
+
+def partition_ssm(chunks, params_file, out_file, id_registry=None):
+    """
+    Writes every partition of the params file (see partitions) to its own .ssm and .params.json (see partition_file)
+    in one pass over chunks, the loci of an .ssm as dataframes (e.g. from ssm_io.iter_ssm). Each locus is looked up
+    in a hash map of ids to partitions, loci in no partition are left out.
+
+    Ids are renumbered within each partition (or given their registered id if an id registry is passed), and the params
+    of a partition keep the rest of the params, with all its ids in one cluster (or in garbage for the garbage mutations).
+    Returns the number of loci written to each partition.
+    """
+    import json
+    from contextlib import ExitStack
+
+    with open(params_file) as params_json:
+        params = json.load(params_json)
+
+    named_ids = partitions(params)
+
+    partition_of = {id: number for number, (name, ids) in enumerate(named_ids) for id in ids}
+
+    written_ids = [[] for _ in named_ids]
+
+    with ExitStack() as stack:
+
+        writers = [stack.enter_context(SSM_Writer(partition_file(out_file, name), True, id_registry)) for name, _ in named_ids]
+
+        for chunk in chunks:
+
+            if id_registry:
+                id_registry.register(chunk)
+
+            # sorting the partition numbers (stable, -1 for no partition) gives the rows of every partition in .ssm order
+            numbers = chunk[COL_ID].map(partition_of).fillna(-1).values.astype(np.int64)
+
+            order = np.argsort(numbers, kind="stable")
+            bounds = np.searchsorted(numbers[order], np.arange(len(named_ids) + 1))
+
+            for number, writer in enumerate(writers):
+                written_ids[number].extend(writer.write(chunk.iloc[order[bounds[number]:bounds[number + 1]]])[COL_ID])
+
+    for (name, _), ids in zip(named_ids, written_ids):
+
+        partition_params = dict(params, **{CLUSTERS: [ids] if name != GARBAGE and ids else [], GARBAGE: ids if name == GARBAGE else []})
+
+        with open(params_file_for(partition_file(out_file, name)), "w") as params_json:
+            json.dump(partition_params, params_json)
+
+    return {name: len(ids) for (name, _), ids in zip(named_ids, written_ids)}
+
+
+
+def pyclone_vi_fmt(dataframe, params, segments=None, loci=None):
+    """
+    Processes ssm dataframe into a tsv that can be used by PyClone-VI,
+    major_cn/minor_cn are those of the copy-number segments (see copy_number.py) of the loci, if given
+    (loci that aren't named <chromosome>_<position> are looked up in loci, see copy_number.pyclone_copy_numbers)
+    """
+
+    import json
+    from ssm_io import parse_vectors
+    from copy_number import pyclone_copy_numbers
+
+    samples = json.load(open(params))["samples"]
+
+    n_loci, n_samples = len(dataframe), len(samples)
+
+    # loci with fewer values than samples have none for the rest (padded to keep the matrices rectangular)
+    def matrix(column, dtype):
+        values = parse_vectors(dataframe[column], dtype, 0) if n_loci else np.zeros((0, n_samples), dtype=dtype)
+        return np.pad(values, ((0, 0), (0, max(0, n_samples - values.shape[1]))))[:, :n_samples]
+
+    var_read_prob = matrix(COL_VAR_READ_PROB, "float64")
+
+    major_cn, minor_cn = pyclone_copy_numbers(dataframe[COL_NAME].values, samples, var_read_prob, segments, loci)
 
-        # iterate through all var_read, ref_reads, var_read_prob per row
-        for var_reads, ref_reads, var_read_prob, sample in zip([int(cnt) for cnt in row[COL_VAR_READS].split(",")],
-                                                               [int(cnt) for cnt in row[COL_TOTAL_READS].split(",")],
-                                                               [float(prob) for prob in row[COL_VAR_READ_PROB].split(",")],
-                                                               samples):
-            major_cn = 2 if var_read_prob > 0.5 else 1
-            minor_cn = 2 - major_cn
-            normal_cn = 2
-            pyclone_values = [row[COL_NAME], sample, ref_reads, var_reads, major_cn, minor_cn, normal_cn]
-            pyclone_df = pyclone_df.append(dict(zip(pyclone_vi_columns, pyclone_values)), ignore_index=True)
-
-    return pyclone_df
+    return pd.DataFrame({
+        "mutation_id": np.repeat(dataframe[COL_NAME].values, n_samples),
+        "sample_id": np.tile(samples, n_loci),
+        "ref_counts": matrix(COL_TOTAL_READS, "int64").ravel(),
+        "alt_counts": matrix(COL_VAR_READS, "int64").ravel(),
+        "major_cn": major_cn.ravel(),
+        "minor_cn": minor_cn.ravel(),
+        "normal_cn": 2
+    })
@@ -1,10 +1,22 @@
+import os
 import operator
 import argparse
 
-from modify_ssm import load_ssm, load_csv, save_ssm, remove_vars_by_vaf, organize_vars_by_vaf, scale_counts, separate_garbage, keep_vars_by_name, pyclone_vi_fmt
+from modify_ssm import load_ssm, load_csv, save_ssm, overwrite_ids, remove_vars_by_vaf, organize_vars_by_vaf, scale_counts, separate_garbage, keep_vars_by_name, keep_vars_in_regions, pyclone_vi_fmt, partition_ssm, \
+                       load_index, save_remapped_params
+from variant_ids import Variant_Id_Registry
+from ssm_store import SSM_Store, STORE_EXT, STORE_MOD_METHODS, is_store, store_to_ssm
+from ssm_io import CHUNK_SIZE, GZ_EXT, SSM_Writer, iter_ssm, params_file_for
+from ssm_columns import *
+from table_io import read_spec
 
 # to run an example, use the following command:
 #   python3 $UTILS_DIR/ssm_file/utils/run_modify_ssm.py -i example.output.ssm -o example.modified.ssm -d $DATA_DIR/example/results/ -a \> 0.5 -m RM_VARS_BY_VAF
+# the in-file can also be a read-count store (see ssm_store.py), in which case the out-file can be a store or an .ssm
+# chains of only row-local operations (STREAMING_MOD_METHODS) are streamed through the .ssm in chunks of --chunk-size loci
+# the .params.json of the in-file (or --params-file) is written next to the out-file, with its cluster/garbage ids remapped to the modified .ssm
+# -m PARTITION writes every cluster and the garbage mutations of the params file to their own .ssm/.params.json in one pass, e.g.
+#   python3 $UTILS_DIR/ssm_file/utils/run_modify_ssm.py -i example.output.ssm -o example.partition.ssm -p $DATA_DIR/example/results/example.output.params.json -d $DATA_DIR/example/results/ -m PARTITION
 
 
 MOD_METHODS = {
@@ -13,9 +25,21 @@ MOD_METHODS = {
     "SCALE_COUNTS": scale_counts,
     "SEPARATE_GARBAGE": separate_garbage,
     "KEEP_VARS_BY_NAME": keep_vars_by_name,
+    "KEEP_VARS_IN_REGIONS": keep_vars_in_regions,
     "PYCLONE_FMT": pyclone_vi_fmt
 }
 
+# operations that only look at one locus at a time (and whether they renumber the ids), which can be applied to an .ssm chunk by chunk
+STREAMING_MOD_METHODS = {
+    "RM_VARS_BY_VAF": True,
+    "SCALE_COUNTS": False,
+    "KEEP_VARS_BY_NAME": True,
+    "KEEP_VARS_IN_REGIONS": True
+}
+
+# writes several .ssm files rather than modifying one, so it can't be part of a chain
+PARTITION = "PARTITION"
+
 OPERATORS = {
     "==": operator.eq,
     "<" : operator.lt,
@@ -42,19 +66,325 @@ def _parse_args():
     parser.add_argument('-p', '--params-file', help='Name of params file to reference.', default=None)
     parser.add_argument('-d', '--directory', help='Directory to read/write files from.')
     parser.add_argument('-a', '--args', nargs='+', help='Additional arguments to pass to modification method.')
-    parser.add_argument('-m', '--mod-method', help='Modification method to be applied to ssm file.', choices=tuple(MOD_METHODS.keys()), required=True)
+    parser.add_argument('-m', '--mod-method', help='Modification method to be applied to ssm file.', choices=tuple(MOD_METHODS.keys()) + (PARTITION,))
     parser.add_argument('-n', '--names-fn', help='File containing names to keep')
+    parser.add_argument('-r', '--id-registry', help='Id registry (.ids.json) to keep variant ids stable with (created if it does not exist).')
+    parser.add_argument('-e', '--op', action='append', dest='ops', help='Operation "<MOD_METHOD> [args ...]" to apply, in order (can be repeated instead of -m/-a).')
+    parser.add_argument('-c', '--chain-file', help='.json/.yaml file with an ordered list of operations to apply.')
+    parser.add_argument('-k', '--checkpoints', action='store_true', help='Write the result of every operation in a chain (<out-file>.<step>.<MOD_METHOD>.ssm).')
+    parser.add_argument('-s', '--chunk-size', type=int, default=CHUNK_SIZE, help='Number of loci to stream at a time when every operation is row-local.')
 
 
     args = parser.parse_args()
 
+    if sum([bool(args.mod_method), bool(args.ops), bool(args.chain_file)]) != 1:
+        parser.error('exactly one of --mod-method, --op or --chain-file is required')
+
+    if args.mod_method == PARTITION and args.params_file in [None, "None"]:
+        parser.error('PARTITION needs the params file (--params-file) of the clusters and garbage mutations')
+
+    return args
+
+
+def _method_args(mod_method, args=[], params_file=None, names_fn=None):
+    """
+    Translates the (string) arguments of a modification method into the arguments it is called with.
+    The params file is only passed to the methods that read it, so one params file can be given to a whole chain.
+    """
+
+    args = list(args)
+
+    # keep names
+    if names_fn and mod_method == "KEEP_VARS_BY_NAME":
+        args = [open(names_fn).read().splitlines()]
+    # keep the loci in the regions of a BED/GTF file (indexed once, rather than for every chunk), names that aren't
+    # <chromosome>_<position> (e.g. <gene>_<position>) are looked up in the id registry given after it
+    elif mod_method == "KEEP_VARS_IN_REGIONS":
+        if len(args) == 0:
+            raise argparse.ArgumentTypeError('KEEP_VARS_IN_REGIONS needs the BED/GTF file of the regions to keep (--args <regions file> [<id registry>])')
+
+        from region_annotation import Region_Annotator
+        args = [Region_Annotator(args[0])] + [Variant_Id_Registry(registry).names for registry in args[1:2]]
+    # for separate garbage
+    elif mod_method == "SEPARATE_GARBAGE":
+        args = args[:1] or [params_file]
+    # PyClone-VI can be given a copy-number segments file as well (and the id registry to find the loci of other names than
+    # <chromosome>_<position> in the segments with)
+    elif mod_method == "PYCLONE_FMT":
+        args = [params_file] + args if params_file else args
+        args = args[:2] + [Variant_Id_Registry(registry).names for registry in args[2:3]]
+
+    # for scale counts, either a cell count estimate for every sample or a .csv of the cell counts per sample (in the order of the params file)
+    elif mod_method == "SCALE_COUNTS":
+        if len(args) == 1 and str(args[0]).endswith(".csv"):
+            args = [params_file, args[0]]
+        elif len(args) == 1:
+            args = [int(args[0])]
+
+    # for rm vaf
+    elif len(args) == 2:
+        args = [OPERATORS[args[0]], float(args[1])]
+
+    # for organize vaf
+    elif len(args) == 3:
+        args = [OPERATORS[args[0]], float(args[1]), str(args[2])]
+
     return args
 
 
+def load_operations(chain_file):
+    """
+    Reads an ordered list of operations from a .json or .yaml file, e.g.
+
+        [{"mod_method": "SCALE_COUNTS", "args": [25]},
+         {"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5], "checkpoint": "example.rmvaf.ssm"},
+         {"mod_method": "ORG_VARS_BY_VAF", "args": [">", 0.2, 1.0]}]
+
+    Each operation can also have its own "params_file" and "names_fn" (see the command line arguments).
+    """
+
+    operations = read_spec(chain_file)
+
+    # a spec can either be the list of operations or {"operations": [...]}
+    if isinstance(operations, dict):
+        operations = operations["operations"]
+
+    for operation in operations:
+        if operation.get("mod_method") not in MOD_METHODS:
+            raise argparse.ArgumentTypeError('unknown modification method %s in %s' % (operation.get("mod_method"), chain_file))
+
+    return operations
+
+
+def run_operations(dataframe, operations, id_registry=None):
+    """
+    Applies each operation to the dataframe in order, writing the intermediate result of any operation with a "checkpoint" file
+    """
+
+    for operation in operations:
+
+        dataframe = MOD_METHODS[operation["mod_method"]](
+            dataframe,
+            *_method_args(operation["mod_method"], operation.get("args", []), operation.get("params_file"), operation.get("names_fn"))
+        )
+
+        if id_registry and COL_ID in dataframe.columns:
+            dataframe = overwrite_ids(dataframe, id_registry)
+
+        if operation.get("checkpoint"):
+            save_ssm(dataframe, operation["checkpoint"])
+
+    return dataframe
+
+
+def is_streamable(operations):
+    """
+    Returns whether every operation can be applied to an .ssm chunk by chunk (see stream_operations)
+    """
+    return all(operation["mod_method"] in STREAMING_MOD_METHODS for operation in operations)
+
+
+def stream_operations(in_file, operations, out_file, id_registry=None, chunk_size=CHUNK_SIZE):
+    """
+    Applies row-local operations (STREAMING_MOD_METHODS) to an .ssm one chunk of loci at a time, so only chunk_size loci
+    are in memory whatever the size of the .ssm. Ids are renumbered by the writers as the chunks are written,
+    which gives the same out-file (and checkpoints) as run_operations.
+    """
+    from contextlib import ExitStack
+
+    methods = [
+        (operation["mod_method"], _method_args(operation["mod_method"], operation.get("args", []), operation.get("params_file"), operation.get("names_fn")))
+        for operation in operations
+    ]
+
+    with ExitStack() as stack:
+
+        # ids only need renumbering once a filtering operation has been applied
+        writers, renumber = {}, False
+
+        for step, operation in enumerate(operations):
+
+            renumber = renumber or STREAMING_MOD_METHODS[operation["mod_method"]]
+
+            if operation.get("checkpoint"):
+                writers[step] = stack.enter_context(SSM_Writer(operation["checkpoint"], renumber, id_registry))
+
+        out_writer = stack.enter_context(SSM_Writer(out_file, renumber, id_registry))
+
+        for chunk in iter_ssm(in_file, chunk_size):
+
+            # variants that are not in the registry yet keep the id they have in the in-file
+            if id_registry:
+                id_registry.register(chunk)
+
+            for step, (mod_method, args) in enumerate(methods):
+
+                # the methods need at least one locus (e.g. to count samples)
+                if len(chunk) > 0:
+                    chunk = MOD_METHODS[mod_method](chunk.reset_index(drop=True), *args)
+
+                if step in writers:
+                    writers[step].write(chunk)
+
+            out_writer.write(chunk)
+
+    return out_writer.n_written
+
+
+def run_store_operations(store, operations, out_file, id_registry=None):
+    """
+    Applies each operation to a read-count store (see ssm_store.py) in order, only loading the loci being worked on.
+    Every operation writes a new (temporary) store, the last one is written to out_file, which can either be a store or an .ssm
+    (or the PyClone-VI tsv if the last operation is PYCLONE_FMT).
+    """
+    import os, shutil, tempfile
+
+    # temporary stores are kept next to the out-file, since they're as large as the data
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(out_file)))
+
+    try:
+        for step, operation in enumerate(operations):
+
+            if operation["mod_method"] == "PYCLONE_FMT":
+
+                if step != len(operations) - 1:
+                    raise argparse.ArgumentTypeError('PYCLONE_FMT has to be the last operation applied to a store')
+
+                return STORE_MOD_METHODS["PYCLONE_FMT"](store, out_file, *_method_args("PYCLONE_FMT", operation.get("args", []), operation.get("params_file")))
+
+            store = STORE_MOD_METHODS[operation["mod_method"]](
+                store,
+                os.path.join(tmp_dir, "%d.%s%s" % (step, operation["mod_method"], STORE_EXT)),
+                *_method_args(operation["mod_method"], operation.get("args", []), operation.get("params_file"), operation.get("names_fn"))
+            )
+
+            if id_registry:
+                store.ids = id_registry.ids_for_names(store.names)
+                store.save_index()
+
+            if operation.get("checkpoint"):
+                if is_store(operation["checkpoint"]):
+                    shutil.rmtree(operation["checkpoint"], ignore_errors=True)
+                    shutil.copytree(store.path, operation["checkpoint"])
+                else:
+                    store_to_ssm(store, operation["checkpoint"])
+
+        if is_store(out_file):
+            shutil.rmtree(out_file, ignore_errors=True)
+            shutil.move(store.path, out_file)
+            store = SSM_Store(out_file)
+        else:
+            store_to_ssm(store, out_file)
+
+        return store
+
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def modify_file(in_file, out_file, operations, params_file=None, names_fn=None, id_registry=None, chunk_size=CHUNK_SIZE):
+    """
+    Applies operations to in_file (an .ssm or a read-count store) and writes out_file, picking how to run them: on the store,
+    streamed through the .ssm (see is_streamable) or on the loaded dataframe. A single PARTITION operation writes the partitions
+    of the params file instead (see partition_ssm). params_file and names_fn are the default of every operation, and
+    id_registry is the .ids.json to keep the ids stable with.
+
+    The params of the in-file (params_file, or the .params.json of the in-file) are written next to the out-file, with their
+    cluster/garbage ids remapped to the modified .ssm (see remap_params).
+    Returns the number of loci written (the number per partition for PARTITION).
+    """
+
+    operations = [dict({"params_file": params_file, "names_fn": names_fn}, **operation) for operation in operations]
+
+    # names of KEEP_VARS_IN_REGIONS (and PYCLONE_FMT with segments) are looked up in the id registry of the run if none is given (see _method_args)
+    if id_registry:
+        for operation in operations:
+
+            n_args = {"KEEP_VARS_IN_REGIONS": 1, "PYCLONE_FMT": 1 if operation["params_file"] else 2}.get(operation["mod_method"])
+
+            if n_args and len(operation.get("args", [])) == n_args:
+                operation["args"] = list(operation["args"]) + [id_registry]
+
+    for operation in operations:
+        if operation["mod_method"] not in MOD_METHODS and operation["mod_method"] != PARTITION:
+            raise argparse.ArgumentTypeError('unknown modification method %s' % operation["mod_method"])
+
+    id_registry = Variant_Id_Registry(id_registry) if id_registry else None
+
+    # the partitions are written next to the out-file (<out-file>.cluster<N>.ssm, <out-file>.garbage.ssm)
+    if any(operation["mod_method"] == PARTITION for operation in operations):
+
+        if len(operations) > 1:
+            raise argparse.ArgumentTypeError('PARTITION writes several .ssm files, so it can\'t be part of a chain')
+
+        if not operations[0]["params_file"]:
+            raise argparse.ArgumentTypeError('PARTITION needs the params file of the clusters and garbage mutations')
+
+        if is_store(in_file):
+            store = SSM_Store(in_file)
+            chunks = (store.to_ssm_df(start, stop) for start, stop in store.chunks(chunk_size))
+        else:
+            chunks = iter_ssm(in_file, chunk_size)
+
+        n_written = partition_ssm(chunks, operations[0]["params_file"], out_file, id_registry)
+
+        if id_registry:
+            id_registry.save()
+
+        return n_written
+
+    # the params of the in-file are remapped to the ids of the out-file (filtering/reordering renumbers them), see remap_params
+    params_file = params_file or params_file_for(in_file)
+    remap = os.path.isfile(params_file) and not is_store(out_file) and operations[-1]["mod_method"] != "PYCLONE_FMT"
+
+    in_index = load_index(in_file) if remap else None
+
+    # read-count stores are modified without loading them into a dataframe
+    if is_store(in_file):
+
+        store = SSM_Store(in_file)
+
+        if id_registry:
+            id_registry.register(store.index_df())
+
+        store = run_store_operations(store, operations, out_file, id_registry)
+
+        n_written = len(store) if isinstance(store, SSM_Store) else None
+
+    # row-local operations are streamed, so the .ssm is never fully loaded
+    elif is_streamable(operations):
+
+        n_written = stream_operations(in_file, operations, out_file, id_registry, chunk_size)
+
+    else:
+        dataframe = load_ssm(in_file)
+
+        # variants that are not in the registry yet keep the id they have in the in-file
+        if id_registry:
+            id_registry.register(dataframe)
+
+        # apply methods, the file is only read and written once
+        dataframe = run_operations(dataframe, operations, id_registry)
+
+        save_ssm(dataframe, out_file)
+
+        n_written = len(dataframe)
+
+    if id_registry:
+        id_registry.save()
+
+    if remap:
+        save_remapped_params(params_file, in_index, out_file)
+
+    return n_written
+
+
 def main():
     """
     Performs checks on command line arguments, then attempts to process all files.
     """
+    import shlex
+
     args = _parse_args()
 
 
@@ -65,42 +395,33 @@ def main():
     if args.args == None:
         args.args = []
 
-    # append directory to in_file/out_file if the argument was passed
-    if args.directory:
-        args.in_file = args.directory + args.in_file
-        args.out_file = args.directory + args.out_file
-
-    # extract args passed
+    # collect the operations to apply (a single method is a chain of one operation)
+    if args.chain_file:
+        operations = load_operations(args.chain_file)
 
-    # keep names
-    if args.names_fn and args.mod_method == "KEEP_VARS_BY_NAME":
-        args.args = [open(args.names_fn).read().splitlines()]
-    # for separate garbage
-    elif (len(args.args) == 0 and args.params_file) or (args.params_file and args.mod_method == "PYCLONE_FMT"):
-        args.args = [args.params_file]
+    elif args.ops:
+        operations = [{"mod_method": op[0], "args": op[1:]} for op in map(shlex.split, args.ops)]
 
-    # for scale counts
-    elif len(args.args) == 1:
-        if args.params_file:
-            args.args = [args.params_file, args.args[0]]
-        else:
-            args.args = [int(args.args[0])]
+    else:
+        operations = [{"mod_method": args.mod_method, "args": args.args}]
 
-    # for rm vaf
-    elif len(args.args) == 2:
-        args.args = [OPERATORS[args.args[0]], float(args.args[1])]
+    for step, operation in enumerate(operations):
 
-    # for organize vaf
-    elif len(args.args) == 3:
-        args.args = [OPERATORS[args.args[0]], float(args.args[1]), args.args[2]]
+        if args.checkpoints and step < len(operations) - 1 and not operation.get("checkpoint"):
+            # checkpoints of an .ssm.gz are compressed as well
+            out_file, gz_ext = (args.out_file[:-len(GZ_EXT)], GZ_EXT) if args.out_file.endswith(GZ_EXT) else (args.out_file, "")
+            operation["checkpoint"] = out_file.replace(".ssm", "") + ".%d.%s.ssm" % (step + 1, operation["mod_method"]) + gz_ext
 
-    # apply method
-    save_ssm(
+    # append directory to in_file/out_file (and checkpoints) if the argument was passed
+    if args.directory:
+        args.in_file = args.directory + args.in_file
+        args.out_file = args.directory + args.out_file
 
-        MOD_METHODS[args.mod_method](load_ssm(args.in_file), *args.args),
-        args.out_file
+        for operation in operations:
+            if operation.get("checkpoint"):
+                operation["checkpoint"] = args.directory + operation["checkpoint"]
 
-    )
+    modify_file(args.in_file, args.out_file, operations, args.params_file, args.names_fn, args.id_registry, args.chunk_size)
 
 
 if __name__ == '__main__':
@@ -4,9 +4,14 @@ import argparse
 import json
 
 sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/ssm_file/utils")
+sys.path.append(os.environ["UTILS_DIR"] + "/db_file")
 
 from ssm_columns import *
 from mpn_aml_columns_txt import *
+from ssm_store import SSM_Store, is_store
+from ssm_io import GZ_EXT
+from variant_db import Variant_DB, KIND_TXT, LOCUS
 
 
 def read_params(params_fn):
@@ -30,9 +35,15 @@ def read_fn(fn):
     
     df = pd.DataFrame()
 
-    if fn:
+    # only the ids and names of a read-count store are needed to split the data
+    if fn and is_store(fn):
+
+        df = SSM_Store(fn).index_df()
+
+    elif fn:
         
-        file_ext = fn.split(".")[-1]
+        # (the extension of a compressed file is the one before .gz)
+        file_ext = fn[:-len(GZ_EXT)].split(".")[-1] if fn.endswith(GZ_EXT) else fn.split(".")[-1]
             
         if file_ext == "txt" or file_ext == "ssm":
             df = pd.read_csv(fn, sep="\t", header=0)
@@ -40,6 +51,57 @@ def read_fn(fn):
     return df
     
 
+def split_data(ssm_df, clusters, garbage, data_df, out_dir):
+    """
+    Writes the rows of the original data file belonging to each cluster (cluster<N>.txt)
+    and to the garbage mutations (garbage.txt) into out_dir
+    """
+
+    # extract clusters data
+    for i, c in enumerate(clusters):
+
+        df = pd.DataFrame()
+
+        for id in c:
+            chr, pos = ssm_df.loc[ssm_df[COL_ID] == id][COL_NAME].values[0].split("_")
+            # print(data_df.loc[(data_df[CHR] == chr) & (data_df[START] == pos)])
+            df = df.append(data_df.loc[(data_df[CHR] == chr) & (data_df[START] == int(pos))])
+
+        df.to_csv(out_dir + "/" + "cluster%d.txt" % (i+1), sep="\t", index=False)
+
+
+    # extract garbage data
+    df = pd.DataFrame()
+
+    for id in garbage:
+        chr, pos = ssm_df.loc[ssm_df[COL_ID] == id][COL_NAME].values[0].split("_")
+        # print(data_df.loc[(data_df[CHR] == chr) & (data_df[START] == pos)])
+        df = df.append(data_df.loc[(data_df[CHR] == chr) & (data_df[START] == int(pos))])
+
+    df.to_csv(out_dir + "/" + "garbage.txt", sep="\t", index=False)
+
+
+def split_data_from_store(db, patient, out_dir):
+    """
+    Writes the same files as split_data for a patient of a variant database (see variant_db.py),
+    only fetching the .ssm names and .txt rows of the clustered and garbage mutations
+    """
+    params = db.params(patient)
+    clusters, garbage = params[CLUSTERS], params[GARBAGE]
+
+    names = db.ssm_rows(patient, ids=[id for ids in clusters + [garbage] for id in ids]).set_index(COL_ID)[COL_NAME]
+
+    out_files = [("cluster%d.txt" % (i+1), c) for i, c in enumerate(clusters)] + [("garbage.txt", garbage)]
+
+    for out_file, ids in out_files:
+
+        loci = [names[id].split("_") for id in ids]
+
+        df = db.data_rows(patient, KIND_TXT, loci, LOCUS) if loci else pd.DataFrame()
+
+        df.to_csv(out_dir + "/" + out_file, sep="\t", index=False)
+
+
 def main():
     parser = argparse.ArgumentParser(
 
@@ -48,13 +110,29 @@ def main():
 
     )
 
-    parser.add_argument('-s', '--ssm-files', nargs='+', help='List of ssm files', required=True)
-    parser.add_argument('-p', '--param-files', nargs='+', help='List of params.json files', required=True)
-    parser.add_argument('-f', '--data-files', nargs='+', help='List of data files', required=True)
+    parser.add_argument('-s', '--ssm-files', nargs='+', help='List of ssm files', default=[])
+    parser.add_argument('-p', '--param-files', nargs='+', help='List of params.json files', default=[])
+    parser.add_argument('-f', '--data-files', nargs='+', help='List of data files', default=[])
     parser.add_argument('-d', '--directories', nargs='+', help='Directory to read/write files from.')
+    parser.add_argument('-b', '--store', help='Variant database (see variant_db.py) to read the .ssm, params and .txt data of --patients from, in place of files')
+    parser.add_argument('-P', '--patients', nargs='+', help='Patients of the variant database to split (each into a directory named after it)', default=[])
 
 
     args = parser.parse_args()
+
+    if args.store:
+
+        with Variant_DB(args.store) as db:
+
+            for patient in args.patients:
+
+                os.mkdir(patient)
+
+                split_data_from_store(db, patient, patient)
+
+        return
+
+    assert args.ssm_files, "Pass either ssm, params and data files or a variant database (--store)"
     assert (len(args.ssm_files) == len(args.param_files)) and (len(args.ssm_files) == len(args.data_files)), "Number of ssm, params, and data files must match"
     assert len(args.ssm_files) == len(args.directories) or len(args.directories) == 1, "Number of directories must match number of other input files, or be a single directory"
            
@@ -75,29 +153,7 @@ def main():
         dir = data_fn.split(".")[0]
         os.mkdir(dir)
 
-        # extract clusters data
-        for i, c in enumerate(clusters):
-                    
-            df = pd.DataFrame()
-
-            for id in c:
-                chr, pos = ssm_df.loc[ssm_df[COL_ID] == id][COL_NAME].values[0].split("_")
-                # print(data_df.loc[(data_df[CHR] == chr) & (data_df[START] == pos)])
-                df = df.append(data_df.loc[(data_df[CHR] == chr) & (data_df[START] == int(pos))])
-            
-            df.to_csv(dir + "/" + "cluster%d.txt" % (i+1), sep="\t", index=False)
-                
-        
-        # extract garbage data
-        df = pd.DataFrame()
-
-        for id in garbage:
-            chr, pos = ssm_df.loc[ssm_df[COL_ID] == id][COL_NAME].values[0].split("_")
-            # print(data_df.loc[(data_df[CHR] == chr) & (data_df[START] == pos)])
-            df = df.append(data_df.loc[(data_df[CHR] == chr) & (data_df[START] == int(pos))])
-        
-        df.to_csv(dir + "/" + "garbage.txt", sep="\t", index=False)   
-
+        split_data(ssm_df, clusters, garbage, data_df, dir)
 
 
 
@@ -0,0 +1,383 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/ssm_file/utils")
+
+from ssm_columns import *
+from modify_ssm import estimate_coverage
+from ssm_io import SSM_Writer, format_vectors, parse_vectors, INT_FORMAT, PROB_FORMAT
+
+# to convert an .ssm into a read-count store (and back), use the following commands:
+#   python3 $UTILS_DIR/ssm_file/utils/ssm_store.py -i example.output.ssm -o example.output.ssmstore -p example.output.params.json -d $DATA_DIR/example/results/
+#   python3 $UTILS_DIR/ssm_file/utils/ssm_store.py -i example.output.ssmstore -o example.roundtrip.ssm -d $DATA_DIR/example/results/
+#
+# a store is a directory holding one (loci x samples) .npy array per read-count column, which are memory-mapped when opened,
+# and an index.json with the ids, names and (if known) samples of the .ssm, so only the rows being worked on are ever in memory
+
+
+STORE_EXT = ".ssmstore"
+STORE_INDEX = "index.json"
+
+# .npy file and dtype of each read-count column
+STORE_ARRAYS = {
+    COL_VAR_READS: np.int64,
+    COL_TOTAL_READS: np.int64,
+    COL_VAR_READ_PROB: np.float64
+}
+
+# number of loci read/written at a time
+CHUNK_SIZE = 10000
+
+
+def is_store(path):
+    """
+    Whether path is (or names) a read-count store rather than an .ssm file
+    """
+    return str(path).rstrip("/").endswith(STORE_EXT) or os.path.isfile(os.path.join(str(path), STORE_INDEX))
+
+
+class SSM_Store:
+    """
+    Read-count store of an .ssm (see the top of this file), the var_reads, total_reads and var_read_prob
+    arrays are memory-mapped, so opening a store only reads its index.
+    """
+
+    def __init__(self, path, mode="r"):
+
+        self.path = path
+
+        with open(os.path.join(path, STORE_INDEX)) as index_json:
+            index = json.load(index_json)
+
+        self.ids = index[COL_ID]
+        self.names = index[COL_NAME]
+        self.samples = index[SAMPLES]
+        self.n_samples = index["n_samples"]
+
+        self.arrays = {column: np.load(os.path.join(path, column + ".npy"), mmap_mode=mode) for column in STORE_ARRAYS}
+
+
+    @classmethod
+    def create(cls, path, ids, names, n_samples, samples=None):
+        """
+        Creates an empty store for len(ids) loci, returns it opened for writing
+        """
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+        os.makedirs(path)
+
+        for column, dtype in STORE_ARRAYS.items():
+            np.lib.format.open_memmap(os.path.join(path, column + ".npy"), mode="w+", dtype=dtype, shape=(len(ids), n_samples)).flush()
+
+        with open(os.path.join(path, STORE_INDEX), "w") as index_json:
+            json.dump({COL_ID: list(ids), COL_NAME: list(names), SAMPLES: samples, "n_samples": n_samples}, index_json)
+
+        return cls(path, mode="r+")
+
+
+    def __len__(self):
+
+        return len(self.ids)
+
+
+    @property
+    def var_reads(self):
+        return self.arrays[COL_VAR_READS]
+
+
+    @property
+    def total_reads(self):
+        return self.arrays[COL_TOTAL_READS]
+
+
+    @property
+    def var_read_prob(self):
+        return self.arrays[COL_VAR_READ_PROB]
+
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        """
+        Yields (start, stop) row ranges of at most chunk_size loci
+        """
+        for start in range(0, len(self), chunk_size):
+            yield start, min(start + chunk_size, len(self))
+
+
+    def save_index(self):
+
+        with open(os.path.join(self.path, STORE_INDEX), "w") as index_json:
+            json.dump({COL_ID: list(self.ids), COL_NAME: list(self.names), SAMPLES: self.samples, "n_samples": self.n_samples}, index_json)
+
+
+    def flush(self):
+
+        for array in self.arrays.values():
+            if isinstance(array, np.memmap):
+                array.flush()
+
+
+    def index_df(self):
+        """
+        Returns a dataframe of the ids and names of the store (enough for e.g. split_data)
+        """
+        return pd.DataFrame({COL_ID: self.ids, COL_NAME: self.names})
+
+
+    def to_ssm_df(self, start=0, stop=None):
+        """
+        Returns the .ssm dataframe of a range of loci (every locus by default)
+        """
+        stop = len(self) if stop is None else stop
+
+        dataframe = pd.DataFrame({COL_ID: self.ids[start:stop], COL_NAME: self.names[start:stop]})
+
+        for column in STORE_ARRAYS:
+            dataframe[column] = format_vectors(self.arrays[column][start:stop], PROB_FORMAT if column == COL_VAR_READ_PROB else INT_FORMAT)
+
+        return dataframe
+
+
+    def take(self, rows, path, ids=None, chunk_size=CHUNK_SIZE):
+        """
+        Writes the given rows (in order) to a new store at path, the ids of the new store are renumbered (s0, s1, ...) unless passed
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+
+        ids = ["s" + str(number) for number in range(0, len(rows))] if ids is None else ids
+
+        out_store = SSM_Store.create(path, ids, [self.names[row] for row in rows], self.n_samples, self.samples)
+
+        for start in range(0, len(rows), chunk_size):
+            for column in STORE_ARRAYS:
+                out_store.arrays[column][start:start + chunk_size] = self.arrays[column][rows[start:start + chunk_size]]
+
+        out_store.flush()
+
+        return out_store
+
+
+def ssm_to_store(ssm_file, path, params_file=None, chunk_size=CHUNK_SIZE):
+    """
+    Converts an .ssm into a store at path, reading chunk_size loci at a time.
+    The samples of the params file (if passed) are recorded in the store.
+    """
+    # ids and names are read first (they make up the index), then the read counts are filled in chunk by chunk
+    index_df = pd.read_csv(ssm_file, sep="\t", usecols=[COL_ID, COL_NAME, COL_VAR_READS], dtype=str)
+
+    n_samples = len(index_df[COL_VAR_READS].iloc[0].split(",")) if len(index_df) else 0
+
+    samples = None
+
+    if params_file:
+        with open(params_file) as params_json:
+            samples = json.load(params_json)[SAMPLES]
+
+    store = SSM_Store.create(path, index_df[COL_ID], index_df[COL_NAME], n_samples, samples)
+
+    del index_df
+
+    start = 0
+
+    for chunk in pd.read_csv(ssm_file, sep="\t", usecols=list(STORE_ARRAYS), dtype=str, chunksize=chunk_size):
+
+        for column, dtype in STORE_ARRAYS.items():
+            store.arrays[column][start:start + len(chunk)] = parse_vectors(chunk[column], dtype)
+
+        start += len(chunk)
+
+    store.flush()
+
+    return store
+
+
+def store_to_ssm(store, ssm_file, chunk_size=CHUNK_SIZE):
+    """
+    Writes a store (or the path of one) to an .ssm, chunk_size loci at a time
+    """
+    store = store if isinstance(store, SSM_Store) else SSM_Store(store)
+
+    with SSM_Writer(ssm_file) as writer:
+
+        # the header is written even if the store is empty
+        if len(store) == 0:
+            writer.write(store.to_ssm_df())
+
+        for start, stop in store.chunks(chunk_size):
+            writer.write(store.to_ssm_df(start, stop))
+
+
+def _matching_rows(store, op, vaf, chunk_size=CHUNK_SIZE):
+    """
+    Returns a boolean array of the loci with any sample whose VAF meets op(VAF, vaf)
+    """
+    matches = np.zeros(len(store), dtype=bool)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for start, stop in store.chunks(chunk_size):
+            matches[start:stop] = op(store.var_reads[start:stop] / store.total_reads[start:stop], vaf).any(axis=1)
+
+    return matches
+
+
+def store_remove_vars_by_vaf(store, path, op, vaf):
+    """
+    Store version of modify_ssm.remove_vars_by_vaf
+    """
+    return store.take(np.flatnonzero(~_matching_rows(store, op, vaf)), path)
+
+
+def store_organize_vars_by_vaf(store, path, op, vaf, var_read_prob=None):
+    """
+    Store version of modify_ssm.organize_vars_by_vaf
+    """
+    matches = _matching_rows(store, op, vaf)
+
+    out_store = store.take(np.concatenate([np.flatnonzero(~matches), np.flatnonzero(matches)]), path)
+
+    # overwrite var_read_prob for matched rows (which are now at the end) if it's passed in
+    if var_read_prob:
+        out_store.var_read_prob[len(store) - matches.sum():] = float(var_read_prob)
+        out_store.flush()
+
+    return out_store
+
+
+def store_scale_counts(store, path, *cell_counts):
+    """
+    Store version of modify_ssm.scale_counts
+    """
+    estimated_coverage = estimate_coverage(store.n_samples, *cell_counts)
+
+    out_store = store.take(np.arange(0, len(store)), path, ids=store.ids)
+
+    for start, stop in out_store.chunks():
+
+        var_reads, total_reads = out_store.var_reads[start:stop], out_store.total_reads[start:stop]
+
+        # same arithmetic as scale_counts, so values are rounded in the same way
+        factor = np.where(total_reads > estimated_coverage, total_reads / estimated_coverage, 1)
+
+        out_store.var_reads[start:stop] = np.round(var_reads / factor)
+        out_store.total_reads[start:stop] = np.round(total_reads / factor)
+
+    out_store.flush()
+
+    return out_store
+
+
+def store_keep_vars_by_name(store, path, names):
+    """
+    Store version of modify_ssm.keep_vars_by_name
+    """
+    return store.take(np.flatnonzero(pd.Series(store.names).isin(names).values), path)
+
+
+def store_keep_vars_in_regions(store, path, regions, loci=None):
+    """
+    Store version of modify_ssm.keep_vars_in_regions
+    """
+    from region_annotation import Region_Annotator
+
+    if not isinstance(regions, Region_Annotator):
+        regions = Region_Annotator(regions)
+
+    return store.take(np.flatnonzero(regions.in_regions_by_name(store.names, loci)), path)
+
+
+def store_separate_garbage(store, path, params_file):
+    """
+    Store version of modify_ssm.separate_garbage (keeps the ids of the garbage mutations)
+    """
+    with open(params_file) as params_json:
+        garbage = json.load(params_json)[GARBAGE]
+
+    rows = np.flatnonzero(pd.Series(store.ids).isin(garbage).values)
+
+    return store.take(rows, path, ids=[store.ids[row] for row in rows])
+
+
+def store_pyclone_vi_fmt(store, path, params, segments=None, loci=None):
+    """
+    Store version of modify_ssm.pyclone_vi_fmt, writes the PyClone-VI tsv to path chunk by chunk
+    """
+    from copy_number import Copy_Number_Segments, pyclone_copy_numbers
+
+    with open(params) as params_json:
+        samples = json.load(params_json)[SAMPLES]
+
+    # the segments are indexed once for every chunk
+    if segments is not None:
+        segments = Copy_Number_Segments(segments)
+
+    pyclone_vi_columns = ["mutation_id", "sample_id", "ref_counts", "alt_counts", "major_cn", "minor_cn", "normal_cn"]
+
+    with open(path, "w") as tsv:
+
+        tsv.write("\t".join(pyclone_vi_columns) + "\n")
+
+        for start, stop in store.chunks():
+
+            n_loci = stop - start
+
+            major_cn, minor_cn = pyclone_copy_numbers(store.names[start:stop], samples, store.var_read_prob[start:stop], segments, loci)
+
+            pd.DataFrame({
+                "mutation_id": np.repeat(store.names[start:stop], store.n_samples),
+                "sample_id": np.tile(samples, n_loci),
+                "ref_counts": store.total_reads[start:stop].ravel(),
+                "alt_counts": store.var_reads[start:stop].ravel(),
+                "major_cn": major_cn.ravel(),
+                "minor_cn": minor_cn.ravel(),
+                "normal_cn": 2
+            }).to_csv(tsv, sep="\t", index=False, header=False)
+
+    return path
+
+
+# store versions of run_modify_ssm.MOD_METHODS, called as (store, out path, *arguments of the method)
+STORE_MOD_METHODS = {
+    "RM_VARS_BY_VAF": store_remove_vars_by_vaf,
+    "ORG_VARS_BY_VAF": store_organize_vars_by_vaf,
+    "SCALE_COUNTS": store_scale_counts,
+    "SEPARATE_GARBAGE": store_separate_garbage,
+    "KEEP_VARS_BY_NAME": store_keep_vars_by_name,
+    "KEEP_VARS_IN_REGIONS": store_keep_vars_in_regions,
+    "PYCLONE_FMT": store_pyclone_vi_fmt
+}
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+
+        description='Convert an .ssm into a memory-mapped read-count store (%s), or a store back into an .ssm.' % STORE_EXT,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+
+    )
+
+    parser.add_argument('-i', '--in-file', help='.ssm file or store to convert', required=True)
+    parser.add_argument('-o', '--out-file', help='Store or .ssm file to write', required=True)
+    parser.add_argument('-p', '--params-file', help='params.json whose samples are recorded in the store')
+    parser.add_argument('-d', '--directory', default="", help='Directory to read/write files from')
+    parser.add_argument('-c', '--chunk-size', type=int, default=CHUNK_SIZE, help='Number of loci to read/write at a time')
+
+    args = parser.parse_args()
+
+    in_file, out_file = args.directory + args.in_file, args.directory + args.out_file
+
+    if is_store(in_file):
+        store_to_ssm(in_file, out_file, args.chunk_size)
+    else:
+        ssm_to_store(in_file, out_file, args.directory + args.params_file if args.params_file else None, args.chunk_size)
+
+
+if __name__ == '__main__':
+  main()
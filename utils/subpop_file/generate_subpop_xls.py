@@ -4,28 +4,35 @@ import sys, os
 import pandas as pd
 
 sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/db_file")
 
 from ssm_columns import *
 from mpn_aml_columns import *
+from table_io import read_table, write_tables, with_format_extension, TABLE_FORMATS
+from ssm_io import read_ssm, read_ssm_rows
+from variant_db import Variant_DB, KIND_AGGREGATED, KEY_GENE, KEY_POSITION
 
 
 def load_ssm(ssm_fn):
     """
-    Return an ssm files dataframe (assumes tab delimited)
+    Return an ssm files dataframe (assumes tab delimited, .ssm.gz files are decompressed)
     """
-    return pd.read_csv(ssm_fn, sep="\t")
+    return read_ssm(ssm_fn)
 
 
 def load_xls(xls_fn):
     """
-    Return an xls file dataframe (assumes only one sheet)
+    Return an xls (or parquet/feather) file dataframe (assumes only one sheet)
     """
-    return pd.read_excel(xls_fn)
+    return read_table(xls_fn)
 
 
-def create_subpop_file(ssm_fn, params_fn, xls_fn, xls_out):
+def create_subpop_file(ssm_fn, params_fn, xls_fn, xls_out, fmt=None):
+    """
+    Writes the rows of xls_fn belonging to each cluster into its own sheet (Pop<N>) of xls_out,
+    or into one <xls_out without extension>.Pop<N>.<extension> file per cluster for parquet/feather
+    """
 
-    ssm_df = load_ssm(ssm_fn)
     xls_df = load_xls(xls_fn)
 
     clusters = None
@@ -36,6 +43,9 @@ def create_subpop_file(ssm_fn, params_fn, xls_fn, xls_out):
         params_data = json.load(params_json)
         clusters = params_data["clusters"]
 
+    # only the ids/names of clustered variants are needed, so the .ssm is streamed rather than loaded
+    ssm_df = read_ssm_rows(ssm_fn, COL_ID, [id for pop in clusters for id in pop], columns=[COL_ID, COL_NAME])
+
     # iterate through populations in clusters
     for pop in clusters:
 
@@ -58,11 +68,30 @@ def create_subpop_file(ssm_fn, params_fn, xls_fn, xls_out):
 
         pop_df_list.append(pop_df)
 
-    with pd.ExcelWriter(xls_out) as writer:
-        pop_num = 1
-        for pop_df in pop_df_list:
-            pop_df.to_excel(writer, sheet_name="Pop"+str(pop_num))
-            pop_num += 1
+    write_tables({"Pop" + str(pop_num): pop_df for pop_num, pop_df in enumerate(pop_df_list, start=1)}, xls_out, fmt)
+
+
+def create_subpop_file_from_store(db, patient, xls_out, fmt=None):
+    """
+    Writes the same subpopulations as create_subpop_file for a patient of a variant database (see variant_db.py),
+    only fetching the .ssm names and aggregated rows of the clustered variants
+    """
+    clusters = db.params(patient)["clusters"]
+
+    names = db.ssm_rows(patient, ids=[id for pop in clusters for id in pop]).set_index(COL_ID)[COL_NAME]
+
+    pop_df_list = []
+
+    for pop in clusters:
+
+        pop_ids = set(pop)
+
+        # rows of each <gene>_<position> of the population (in .ssm order, as create_subpop_file finds them)
+        gene_positions = [name.split("_") for id, name in names.items() if id in pop_ids]
+
+        pop_df_list.append(db.data_rows(patient, KIND_AGGREGATED, gene_positions, (KEY_GENE, KEY_POSITION)) if gene_positions else pd.DataFrame())
+
+    write_tables({"Pop" + str(pop_num): pop_df for pop_num, pop_df in enumerate(pop_df_list, start=1)}, xls_out, fmt)
 
 
 
@@ -81,10 +110,20 @@ def main():
     parser.add_argument('-p', '--params-fn', help='params files to obtain populations from')
     parser.add_argument('-x', '--xls-fn', help='excel file to pull rows from')
     parser.add_argument('-o', '--out-fn', help='excel file to write out subpopulations to')
+    parser.add_argument('-F', '--output-format', default=None, help='Format to write subpopulations in (default: from the extension of the out-file)', choices=TABLE_FORMATS)
+    parser.add_argument('-b', '--store', help='Variant database (see variant_db.py) to read the .ssm, params and aggregated rows of --patient from, in place of files')
+    parser.add_argument('-P', '--patient', help='Patient of the variant database')
 
     args = parser.parse_args()
 
-    create_subpop_file(args.ssm_fn, args.params_fn, args.xls_fn, args.out_fn)
+    if args.store:
+
+        with Variant_DB(args.store) as db:
+            create_subpop_file_from_store(db, args.patient, with_format_extension(args.out_fn, args.output_format), args.output_format)
+
+        return
+
+    create_subpop_file(args.ssm_fn, args.params_fn, args.xls_fn, with_format_extension(args.out_fn, args.output_format), args.output_format)
 
 if __name__ == '__main__':
   main()
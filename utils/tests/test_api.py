@@ -0,0 +1,72 @@
+import unittest
+import os, sys
+import tempfile
+
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from ssm_columns import *
+from utils import api, cli
+
+
+class API_Tests(unittest.TestCase):
+    """
+    Test cases for the python api (api.py) and the single command line entry point (cli.py).
+    use 'python3 test_api.py' to run the test suite
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.example_dir = os.environ["DATA_DIR"] + "/example/"
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def test_in_memory_matches_files(self):
+        # aggregating and processing dataframes in memory should give the same .ssm as going through the aggregated xlsx
+        primary_df = pd.read_excel(self.example_dir + "example.primary.xlsx", "Sheet1")
+        populations = pd.read_excel(self.example_dir + "example.populations.xlsx", "Sheet1", header=None)[0].tolist()
+
+        aggregated_df = api.aggregate(primary_df, self.example_dir + "example.calls.xlsx", populations)
+
+        ssm_df, params = api.process(aggregated_df, processor="MPN_AML_Processor")
+
+        out_file = os.path.join(self.tmp_dir.name, "example.ssm")
+        api.process(api.aggregate(self.example_dir + "example.primary.xlsx", self.example_dir + "example.calls.xlsx",
+                                  self.example_dir + "example.populations.xlsx", os.path.join(self.tmp_dir.name, "example.aggregated.xlsx")),
+                    out_file, processor="MPN_AML_Processor")
+
+        self.assertTrue(ssm_df.equals(pd.read_csv(out_file, sep="\t")), 'In-memory .ssm does not match the written .ssm')
+        self.assertEqual(params[SAMPLES], populations, 'Incorrect samples in params')
+
+        modified_df = api.modify(ssm_df, [{"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.2]}])
+        self.assertTrue(len(modified_df) < len(ssm_df), 'Operations were not applied')
+
+
+    def test_cli_subcommand(self):
+
+        in_file = os.path.join(self.tmp_dir.name, "in.ssm")
+        out_file = os.path.join(self.tmp_dir.name, "out.ssm")
+
+        api.process(api.aggregate(self.example_dir + "example.primary.xlsx", self.example_dir + "example.calls.xlsx", self.example_dir + "example.populations.xlsx"),
+                    in_file, processor="MPN_AML_Processor")
+
+        argv = sys.argv
+
+        try:
+            cli.main(["modify", "-i", in_file, "-o", out_file, "-m", "RM_VARS_BY_VAF", "-a", ">", "0.2"])
+        finally:
+            sys.argv = argv
+
+        self.assertTrue(pd.read_csv(out_file, sep="\t").equals(api.modify(in_file, [{"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.2]}]).reset_index(drop=True)),
+                        'modify subcommand does not match the api')
+
+
+if __name__ == '__main__':
+    unittest.main()
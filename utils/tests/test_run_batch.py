@@ -0,0 +1,173 @@
+import unittest
+import os, sys
+import json
+import tempfile
+
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ssm_columns import *
+from mpn_aml_columns_txt import CHR, START
+from garbage_detector import MIN_DEPTH
+from run_batch import run_batch, load_batch, RAN, UP_TO_DATE, STALE, FAILED, BLOCKED, MANIFEST_EXT, STAGE_CODE, \
+                      STAGE_AGGREGATE, STAGE_PROCESS, STAGE_MODIFY, STAGE_SPLIT
+from run_pipeline import run_pipeline
+from cohort_fixtures import write_cohort
+from modify_ssm import load_ssm
+
+
+class Run_Batch_Tests(unittest.TestCase):
+    """
+    Test cases for running a batch of patients with dependency tracking (run_batch.py).
+    use 'python3 test_run_batch.py' to run the test suite
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.in_dir = os.path.join(self.tmp_dir.name, "in")
+        self.out_dir = os.path.join(self.tmp_dir.name, "out")
+
+        self.operations = [{"mod_method": "SCALE_COUNTS", "args": [25]}, {"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5]}]
+
+        self.patients = {}
+
+        for seed, patient in enumerate(["p1", "p2"]):
+
+            files = write_cohort(self.in_dir, prefix=patient, n_loci=20, n_samples=3, n_clusters=2, seed=seed)
+
+            self.patients[patient] = {
+                "primary": [os.path.basename(files["primary"]), "Sheet1"],
+                "calls": [os.path.basename(files["calls"]), "Sheet1"],
+                "populations": [os.path.basename(files["populations"]), "Sheet1", None],
+                "data": os.path.basename(files["txt"]),
+                "operations": self.operations
+            }
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def run_batch(self, patients=None, **kwargs):
+
+        return run_batch(patients or self.patients, self.in_dir, self.out_dir, **dict({"workers": 1}, **kwargs))
+
+
+    def test_skips_up_to_date_stages(self):
+
+        outcomes = self.run_batch(workers=2)
+
+        self.assertEqual(outcomes, {patient: {"aggregate": RAN, "process": RAN, "modify": RAN, "split": RAN} for patient in self.patients}, 'Not every stage ran')
+
+        # the batch gives the same .ssm as the in-memory pipeline
+        xls = lambda name: [os.path.join(self.in_dir, self.patients["p1"][name][0])] + self.patients["p1"][name][1:]
+        expected_df, _ = run_pipeline(xls("primary"), xls("calls"), xls("populations"), "", self.operations)
+
+        self.assertTrue(load_ssm(os.path.join(self.out_dir, "p1", "p1.modified.ssm")).equals(expected_df.reset_index(drop=True)), 'Batch .ssm does not match the pipeline')
+        self.assertTrue(os.path.exists(os.path.join(self.out_dir, "p1", "split", "garbage.txt")), 'Data was not split')
+
+        self.assertEqual(set(self.run_batch()["p1"].values()), {UP_TO_DATE}, 'Up to date stages ran again')
+
+        # rewriting an input with the same content (a newer modification time) doesn't make anything stale
+        calls_file = os.path.join(self.in_dir, self.patients["p1"]["calls"][0])
+
+        with open(calls_file, "rb") as calls_xlsx:
+            content = calls_xlsx.read()
+        with open(calls_file, "wb") as calls_xlsx:
+            calls_xlsx.write(content)
+
+        self.assertEqual(set(self.run_batch()["p1"].values()), {UP_TO_DATE}, 'Unchanged content made a stage stale')
+
+        # changed content does, for the stages reading it
+        with open(os.path.join(self.in_dir, self.patients["p1"]["data"]), "a") as data_txt:
+            data_txt.write("\n")
+
+        self.assertEqual(self.run_batch(dry_run=True)["p1"], {"aggregate": UP_TO_DATE, "process": UP_TO_DATE, "modify": UP_TO_DATE, "split": STALE}, 'Changed input is not stale')
+
+        # only the stages after a changed parameter run again
+        self.patients["p2"]["operations"] = self.operations[:1]
+
+        self.assertEqual(self.run_batch(dry_run=True)["p2"], {"aggregate": UP_TO_DATE, "process": UP_TO_DATE, "modify": STALE, "split": STALE}, 'Incorrect stale stages')
+        self.assertEqual(self.run_batch()["p2"], {"aggregate": UP_TO_DATE, "process": UP_TO_DATE, "modify": RAN, "split": RAN}, 'Incorrect stages ran')
+
+        # a changed output is stale as well
+        os.remove(os.path.join(self.out_dir, "p1", "p1.ssm"))
+
+        self.assertEqual(self.run_batch()["p1"], {"aggregate": UP_TO_DATE, "process": RAN, "modify": UP_TO_DATE, "split": UP_TO_DATE}, 'Removed output was not rebuilt')
+
+
+    def test_resumes_from_failed_stage(self):
+
+        patients = {"p1": dict(self.patients["p1"], operations=[{"mod_method": "RM_VARS_BY_VAF", "args": ["?", 0.5]}])}
+
+        self.assertEqual(self.run_batch(patients)["p1"], {"aggregate": RAN, "process": RAN, "modify": FAILED, "split": BLOCKED}, 'Failed stage does not stop the patient')
+
+        with open(os.path.join(self.out_dir, "p1", "p1" + MANIFEST_EXT)) as manifest_json:
+            manifest = json.load(manifest_json)
+
+        self.assertEqual(manifest["stages"]["modify"]["status"], "failed", 'Failed stage is not recorded')
+        self.assertIn("KeyError", manifest["stages"]["modify"]["error"], 'Error of the failed stage is not recorded')
+
+        self.assertEqual(self.run_batch()["p1"], {"aggregate": UP_TO_DATE, "process": UP_TO_DATE, "modify": RAN, "split": RAN}, 'Batch does not resume from the failed stage')
+
+        batch_file = os.path.join(self.tmp_dir.name, "batch.json")
+
+        with open(batch_file, "w") as batch_json:
+            json.dump({"defaults": {"operations": [{"mod_method": "UNKNOWN"}]}, "patients": {"p1": {}}}, batch_json)
+
+        with self.assertRaises(Exception):
+            load_batch(batch_file)
+
+
+    def test_split_follows_modified_ids(self):
+        # with every variant garbage, the garbage split off has to be every locus left in the modified .ssm
+        patients = {"p1": {"in_file": self.patients["p1"]["data"], "data": self.patients["p1"]["data"], "processor": "MPN_AML_Processor_Txt",
+                           "garbage_thresholds": {MIN_DEPTH: 10**9}, "operations": [{"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.3]}]}}
+
+        self.assertEqual(set(self.run_batch(patients)["p1"].values()), {RAN}, 'Not every stage ran')
+
+        processed_df = load_ssm(os.path.join(self.out_dir, "p1", "p1.ssm"))
+        modified_df = load_ssm(os.path.join(self.out_dir, "p1", "p1.modified.ssm"))
+        garbage_df = pd.read_csv(os.path.join(self.out_dir, "p1", "split", "garbage.txt"), sep="\t")
+
+        self.assertTrue(0 < len(modified_df) < len(processed_df), 'No variants were filtered')
+        self.assertEqual(set(garbage_df[CHR] + "_" + garbage_df[START].astype(str)), set(modified_df[COL_NAME]), 'Split garbage does not match the modified .ssm')
+
+
+    def test_stage_code_covers_imports(self):
+        # a change to any module a stage runs has to make the stage stale, so every module its entry points import is part of its code
+        import modulefinder
+
+        utils_dir = os.path.normpath(os.environ["UTILS_DIR"])
+        module_dirs = [root for root, _, files in os.walk(utils_dir) if "tests" not in root.split(os.sep) and any(name.endswith(".py") for name in files)]
+
+        entry_points = {
+            STAGE_AGGREGATE: ["xls_file/run_aggregator.py"],
+            STAGE_PROCESS: ["ssm_file/run_processor.py"],
+            STAGE_MODIFY: ["ssm_file/utils/run_modify_ssm.py"],
+            STAGE_SPLIT: ["ssm_file/utils/split_data.py", "ssm_file/utils/modify_ssm.py"]
+        }
+
+        for stage, scripts in entry_points.items():
+
+            stage_code = [os.path.join(utils_dir, path) for path in STAGE_CODE[stage]]
+
+            for script in scripts:
+
+                # only the modules of this repository are found
+                finder = modulefinder.ModuleFinder(path=module_dirs)
+                finder.run_script(os.path.join(utils_dir, script))
+
+                for module in finder.modules.values():
+                    if module.__file__ and module.__file__.startswith(utils_dir + os.sep):
+                        self.assertTrue(any(module.__file__ == path or module.__file__.startswith(path + os.sep) for path in stage_code),
+                                        '%s imports %s, which is not in the code of the %s stage' % (script, os.path.relpath(module.__file__, utils_dir), stage))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import os, sys
+import json
+import tempfile
+
+import pandas as pd
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
+sys.path.append(os.environ["UTILS_DIR"] + "/ssm_file/utils")
+sys.path.append(os.environ["UTILS_DIR"] + "/ssm_file/ssm_processors")
+sys.path.append(os.environ["UTILS_DIR"] + "/xls_file/xls_aggregators")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ssm_columns import *
+from garbage_detector import MIN_DEPTH
+from run_pipeline import run_pipeline
+from cohort_fixtures import write_cohort
+from mpn_aml_aggregator import MPN_AML_Aggregator
+from mpn_aml_processor import MPN_AML_Processor
+from modify_ssm import load_ssm, remap_params
+from run_modify_ssm import run_operations
+
+
+class Run_Pipeline_Tests(unittest.TestCase):
+    """
+    Test cases for running aggregate -> process -> modify in memory (run_pipeline.py).
+    use 'python3 test_run_pipeline.py' to run the test suite
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.files = write_cohort(self.tmp_dir.name, n_loci=30, n_samples=4, n_clusters=2, seed=6)
+
+        self.operations = [{"mod_method": "SCALE_COUNTS", "args": [25]}, {"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.5]}]
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def path(self, name):
+
+        return os.path.join(self.tmp_dir.name, name)
+
+
+    def test_matches_file_handoff(self):
+        # passing dataframes between the steps should give the same result as handing off through the aggregated xlsx
+        xls = lambda name: [self.files[name], "Sheet1"]
+
+        ssm_df, params = run_pipeline(xls("primary"), xls("calls"), xls("populations") + [None], self.path("pipeline.ssm"), self.operations,
+                                      processed_ssm=self.path("pipeline.processed.ssm"))
+
+        MPN_AML_Aggregator(xls("primary"), xls("calls"), xls("populations") + [None], [self.path("aggregated.xlsx"), "Sheet1"])
+        MPN_AML_Processor(self.path("aggregated.xlsx"), self.path("processed.ssm"))
+
+        expected_df = run_operations(load_ssm(self.path("processed.ssm")), self.operations)
+
+        self.assertTrue(load_ssm(self.path("pipeline.processed.ssm")).equals(load_ssm(self.path("processed.ssm"))),
+                        'Processed .ssm does not match the xlsx handoff')
+
+        self.assertTrue(load_ssm(self.path("pipeline.ssm")).equals(expected_df.reset_index(drop=True)),
+                        'Modified .ssm does not match the xlsx handoff')
+
+        # the ids of the params follow the modified .ssm
+        with open(self.path("pipeline.params.json")) as params_json, open(self.path("processed.params.json")) as expected_json:
+            self.assertEqual(json.load(params_json), remap_params(json.load(expected_json), load_ssm(self.path("processed.ssm")), expected_df), 'Incorrect params')
+
+
+    def test_no_intermediate_files(self):
+
+        run_pipeline([self.files["primary"], "Sheet1"], [self.files["calls"], "Sheet1"], [self.files["populations"], "Sheet1", None],
+                     self.path("only.ssm"), self.operations)
+
+        written = set(os.listdir(self.tmp_dir.name)) - set(os.path.basename(path) for path in self.files.values())
+
+        self.assertEqual(written, {"only.ssm", "only.params.json"}, 'Intermediate files were written')
+
+
+    def test_params_match_modified_ssm(self):
+        # with every variant garbage, the garbage of the written params has to be exactly the ids of the filtered .ssm
+        ssm_df, params = run_pipeline([self.files["primary"], "Sheet1"], [self.files["calls"], "Sheet1"], [self.files["populations"], "Sheet1", None],
+                                      self.path("filtered.ssm"), [{"mod_method": "RM_VARS_BY_VAF", "args": [">", 0.3]}],
+                                      garbage_thresholds={MIN_DEPTH: 10**9}, processed_ssm=self.path("filtered.processed.ssm"))
+
+        filtered_df = load_ssm(self.path("filtered.ssm"))
+
+        with open(self.path("filtered.params.json")) as params_json:
+            written_params = json.load(params_json)
+
+        self.assertTrue(0 < len(filtered_df) < len(load_ssm(self.path("filtered.processed.ssm"))), 'No variants were filtered')
+        self.assertEqual(written_params, params, 'Written params do not match the returned params')
+        self.assertEqual(written_params[GARBAGE], list(filtered_df[COL_ID]), 'Garbage ids do not match the filtered .ssm')
+
+
+if __name__ == '__main__':
+    unittest.main()
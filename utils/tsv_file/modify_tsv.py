@@ -5,13 +5,14 @@ import sys, os, math
 sys.path.append(os.environ["UTILS_DIR"] + "/common")
 
 from ssm_columns import *
+from ssm_io import read_ssm, read_ssm_rows, write_ssm
 
 
 def load_ssm(in_file):
     """
-    Return an ssm files dataframe (assumes tab delimited)
+    Return an ssm files dataframe (assumes tab delimited, .ssm.gz files are decompressed)
     """
-    return pd.read_csv(in_file, sep="\t")
+    return read_ssm(in_file)
 
 
 def load_csv(csv_file):
@@ -23,21 +24,15 @@ def load_csv(csv_file):
 
 def save_ssm(dataframe, out_file):
     """
-    Given a dataframe and out_file, saves a tab delimited dataframe
+    Given a dataframe and out_file, saves a tab delimited dataframe (gzip compressed if out_file ends in .gz)
     """
-    dataframe.to_csv(out_file, sep="\t", index=False)
+    write_ssm(dataframe, out_file)
 
 
-def match_tsv_to_ssm(tsv_fn, ssm_fn, params_fn):
+def tsv_clusters(tsv_df, ssm_df):
     """
-    Matches tsv data to ssm data to update clusters in params file
+    Returns the clusters of a PyClone-VI tsv as lists of the ids its mutations have in ssm_df
     """
-    import json, re
-
-    tsv_df = load_ssm(tsv_fn)
-    ssm_df = load_ssm(ssm_fn)
-    params_data = None
-
     clusters = []
 
     # read through cluster ids in tsv
@@ -55,6 +50,23 @@ def match_tsv_to_ssm(tsv_fn, ssm_fn, params_fn):
 
         clusters.append(cl)
 
+    return clusters
+
+
+def match_tsv_to_ssm(tsv_fn, ssm_fn, params_fn):
+    """
+    Matches tsv data to ssm data to update clusters in params file
+    """
+    import json, re
+
+    tsv_df = load_ssm(tsv_fn)
+
+    # only the ids/names of the mutations in the tsv are needed, so the .ssm is streamed rather than loaded
+    ssm_df = read_ssm_rows(ssm_fn, COL_NAME, tsv_df["mutation_id"].unique(), columns=[COL_ID, COL_NAME])
+    params_data = None
+
+    clusters = tsv_clusters(tsv_df, ssm_df)
+
 
     with open(params_fn, "r") as params_json:
         params_data = json.load(params_json)
@@ -65,3 +77,26 @@ def match_tsv_to_ssm(tsv_fn, ssm_fn, params_fn):
     with open(params_fn, "w") as params_json:
         json_out = json.dumps(params_data)
         params_json.write(json_out)
+
+
+def match_tsv_to_store(tsv_fn, db, patient, params_fn=None):
+    """
+    Matches tsv data to the .ssm of a patient of a variant database (see variant_db.py) to update the clusters in its params
+    (and in params_fn, if passed)
+    """
+    import json
+
+    tsv_df = load_ssm(tsv_fn)
+
+    clusters = tsv_clusters(tsv_df, db.ssm_rows(patient, names=tsv_df["mutation_id"].unique()))
+
+    params_data = db.params(patient)
+
+    if params_data:
+        params_data["clusters"] = clusters
+
+        db.ingest_params(patient, params_data)
+
+    if params_fn:
+        with open(params_fn, "w") as params_json:
+            params_json.write(json.dumps(params_data))
@@ -1,10 +1,16 @@
 import operator
 import argparse
+import sys, os
 
-from modify_tsv import load_ssm, load_csv, save_ssm, match_tsv_to_ssm
+sys.path.append(os.environ["UTILS_DIR"] + "/db_file")
+
+from modify_tsv import load_ssm, load_csv, save_ssm, match_tsv_to_ssm, match_tsv_to_store
+from variant_db import Variant_DB
 
 # to run an example, use the following command:
 #  python3 $UTILS_DIR/ssm_file/utils/tsv_file/tsv_to_ssm.py -s example.ssm -t example.tsv -p example.params.json -m MATCH_TSV_TO_SSM
+# or, to match the tsv to the .ssm of a patient of a variant database (see variant_db.py) and update its params there:
+#  python3 $UTILS_DIR/ssm_file/utils/tsv_file/tsv_to_ssm.py -b cohort.db -P example -t example.tsv -m MATCH_TSV_TO_SSM
 
 
 MOD_METHODS = {
@@ -23,10 +29,12 @@ def _parse_args():
 
     )
 
-    parser.add_argument('-s', '--ssm-file', help='Name of ssm file to modify.', required=True)
+    parser.add_argument('-s', '--ssm-file', help='Name of ssm file to modify.')
     parser.add_argument('-t', '--tsv-file', help='Name of tsv file to modify.', required=True)
     parser.add_argument('-p', '--params-file', help='Name of params file to modify.', default=None)
     parser.add_argument('-d', '--directory', help='Directory to read/write files from.')
+    parser.add_argument('-b', '--store', help='Variant database (see variant_db.py) to read the .ssm and params of --patient from, in place of files')
+    parser.add_argument('-P', '--patient', help='Patient of the variant database')
     parser.add_argument('-m', '--mod-method', help='Modification method to be applied to ssm file.', choices=tuple(MOD_METHODS.keys()), required=True)
 
 
@@ -46,10 +54,19 @@ def main():
     if args.params_file == "None":
         args.params_file = None
 
-    # append directory to in_file/out_file if the argument was passed
+    # append directory to ssm/tsv/params files if the argument was passed
     if args.directory:
-        args.in_file = args.directory + args.in_file
-        args.out_file = args.directory + args.out_file
+        args.ssm_file = args.directory + args.ssm_file if args.ssm_file else None
+        args.tsv_file = args.directory + args.tsv_file
+        args.params_file = args.directory + args.params_file if args.params_file else None
+
+    # the params of the patient are updated in the variant database (and written to the params file, if passed)
+    if args.store:
+
+        with Variant_DB(args.store) as db:
+            match_tsv_to_store(args.tsv_file, db, args.patient, args.params_file)
+
+        return
 
     if not args.params_file or not args.ssm_file or not args.tsv_file:
         raise FileNotFoundError("Did not pass in params, ssm or tsv file")
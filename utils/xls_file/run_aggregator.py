@@ -3,8 +3,11 @@ import os
 import sys
 
 sys.path.append(os.environ["UTILS_DIR"] + "/xls_file/xls_aggregators")
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
 
 from mpn_aml_aggregator import MPN_AML_Aggregator, IMPUTE_AVG, IMPUTE_ZERO
+from table_io import TABLE_FORMATS, with_format_extension
+from input_validation import DEFAULT_VALIDATION, VALIDATION_MODES
 
 
 # NEED to add any aggregator you might want to use
@@ -52,12 +55,23 @@ def _parse_args(aggregator_choices=[]):
     parser.add_argument('-i', '--input-directory', help='Directory to read primary/call files from')
     parser.add_argument('-j', '--output-directory', help='Directory to write aggregated file to')
     parser.add_argument('-t', '--impute-technique', default=IMPUTE_ZERO, help='Technique to use for imputing missing values', choices=(IMPUTE_AVG, IMPUTE_ZERO))
+    parser.add_argument('-r', '--previous-file', nargs='+', default=[], help='Previously aggregated file to update with new populations/loci <file_name> <sheet_name>')
+    parser.add_argument('-F', '--output-format', default=None, help='Format to write the aggregated file in (default: from the extension of the output file)', choices=TABLE_FORMATS)
+    parser.add_argument('-l', '--low-memory', action='store_true', help='Aggregate with categorical/32-bit columns to use less memory (VAF is kept as float32)')
+    parser.add_argument('-g', '--regions-file', default="", help='BED/GTF file of the gene/regions that missing genes are filled in from (see region_annotation.py)')
+    parser.add_argument('--panel-only', action='store_true', help='Drop the primary loci outside of the regions of --regions-file')
+    parser.add_argument('--validation', default=DEFAULT_VALIDATION, choices=VALIDATION_MODES, help='Whether rows failing the integrity checks of the inputs (see input_validation.py) raise an error, are only reported, or are not checked')
+    parser.add_argument('--cache-dir', default="", help='Directory to keep parsed copies of the input xlsx files in, so unchanged inputs (and a previous file written with it) are not parsed again in an update (needs pyarrow)')
+    parser.add_argument('--read-workers', type=int, default=None, help='Number of processes parsing the input xlsx files concurrently (default: one per file, up to the number of CPUs, 1 reads them one after another)')
+    parser.add_argument('--report-memory', action='store_true', help='Print the peak memory (resident set size) used')
     args = parser.parse_args()
 
     return args
 
 
-def run_aggregators(aggregator, primary_file, call_file, population_file, output_file, metrics_file, input_directory, output_directory, impute_technique):
+def run_aggregators(aggregator, primary_file, call_file, population_file, output_file, metrics_file, input_directory, output_directory, impute_technique, previous_file=[], output_format=None,
+                    low_memory=False, read_workers=None, regions="", panel_only=False,
+                    validation=DEFAULT_VALIDATION, cache_dir=""):
     """
     Runs all aggregators dependent on what arguments are passed via the command line
     """
@@ -83,10 +97,16 @@ def run_aggregators(aggregator, primary_file, call_file, population_file, output
         population_file[0] = input_directory + population_file[0]
 
 
+    # the extension of the output file follows the output format
+    output_file[0] = with_format_extension(output_file[0], output_format)
+
     # concatenate output directory with file names if necessary
     if output_directory != None:
         output_file[0] = output_directory + output_file[0]
-        metrics_file = output_directory + metrics_file
+        metrics_file = output_directory + metrics_file if metrics_file else ""
+
+        if previous_file:
+            previous_file[0] = output_directory + previous_file[0]
 
 
 
@@ -102,7 +122,21 @@ def run_aggregators(aggregator, primary_file, call_file, population_file, output
 
     # if we only have one aggregator, use it for all of our files
     if aggregator != None:
-        aggregator(primary_file, call_file, population_file, output_file, metrics_file, impute_technique)
+        aggregator(primary_file, call_file, population_file, output_file, metrics_file, impute_technique=impute_technique, previous_xls=previous_file, output_format=output_format,
+                   low_memory=low_memory, read_workers=read_workers, regions=regions, panel_only=panel_only,
+                   validation=validation, cache_dir=cache_dir)
+
+
+def peak_memory_mb():
+    """
+    Returns the peak resident set size of this process (or of the largest process it started, e.g. to parse an xlsx) in MB
+    """
+    import resource
+
+    max_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return max_rss / (2**20 if sys.platform == "darwin" else 2**10)
 
 
 
@@ -120,7 +154,18 @@ def main():
                     args.metrics_file,
                     args.input_directory,
                     args.output_directory,
-                    args.impute_technique)
+                    args.impute_technique,
+                    args.previous_file,
+                    args.output_format,
+                    args.low_memory,
+                    args.read_workers,
+                    args.regions_file,
+                    args.panel_only,
+                    args.validation,
+                    args.cache_dir)
+
+    if args.report_memory:
+        print("peak memory: %.1f MB" % peak_memory_mb())
 
 
 if __name__ == '__main__':
@@ -1,16 +1,33 @@
 import unittest
 import os, sys
 import argparse
+import tempfile
+from unittest import mock
 
 import numpy as np
 import pandas as pd
 
 
 sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/tests")
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'xls_aggregators'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'xls_aggregators', 'utils'))
+sys.path.append(os.environ["UTILS_DIR"] + "/ssm_file/ssm_processors")
+sys.path.append(os.environ["UTILS_DIR"] + "/pop_file")
 
 from mpn_aml_columns import *
-from mpn_aml_aggregator import MPN_AML_Aggregator
+from mpn_aml_aggregator import MPN_AML_Aggregator, IMPUTE_AVG, IMPUTE_ZERO
+from mpn_aml_processor import MPN_AML_Processor
+from aggregation_index import Locus_Sample_Index
+from table_io import read_table
+from modify_pop import load_excel, save_excel
+from cohort_fixtures import simulate_cohort, primary_calls_dfs
+from input_validation import Input_Validation_Error, VALIDATE_RAISE, CHECK_COUNT, CHECK_VAF
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 
 class MPN_AML_Processor_Tests(unittest.TestCase):
@@ -65,6 +82,26 @@ class MPN_AML_Processor_Tests(unittest.TestCase):
         self.n_unique_chr_pos = len(self.test_aggregator.unique_chr_pos) * len(self.test_aggregator.populations)
 
 
+    def test_concurrent_reads(self):
+        # parsing the inputs in a process pool gives the same aggregation as reading them one after another
+        concurrent_aggregator = MPN_AML_Aggregator(primary_xls = self.primary_xls,
+                                                   calls_xls = self.calls_xls,
+                                                   populations_xls = self.populations_xls,
+                                                   aggregated_xls = [],
+                                                   write_xls_file = False,
+                                                   read_workers = 3)
+
+        sequential_aggregator = MPN_AML_Aggregator(primary_xls = self.primary_xls,
+                                                   calls_xls = self.calls_xls,
+                                                   populations_xls = self.populations_xls,
+                                                   aggregated_xls = [],
+                                                   write_xls_file = False,
+                                                   read_workers = 1)
+
+        self.assertTrue(concurrent_aggregator.aggregated_df.equals(sequential_aggregator.aggregated_df), 'Concurrent reads do not match sequential reads')
+        self.assertTrue(concurrent_aggregator.calls_df.equals(sequential_aggregator.calls_df), 'Concurrently read calls do not match sequential reads')
+
+
     def test_df_sizes(self):
         self.assertTrue(len(self.aggregated_df) == self.n_unique_chr_pos,
                         "Size of aggregated_df is not equal to the number of unique chr_pos * number of populations")
@@ -106,5 +143,416 @@ class MPN_AML_Processor_Tests(unittest.TestCase):
                         "Data does not match between primary_df and aggregated_df")
 
 
+class MPN_AML_Incremental_Aggregator_Tests(unittest.TestCase):
+    """
+    Test cases for updating a previously aggregated xlsx with new populations and loci (MPN_AML_Aggregator(previous_xls=...)),
+    which should give the same result as aggregating everything from scratch.
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        cohort = simulate_cohort(n_loci=30, n_samples=6, n_clusters=3, seed=1)
+        primary_df, calls_df = primary_calls_dfs(cohort, seed=1)
+
+        samples = cohort["samples"]
+        new_sample = samples[-1]
+        new_chr_pos = set((primary_df[CHR] + "_" + primary_df[POSITION].apply(str)).unique()[:3])
+
+        # the earlier run is missing the last sample, and a few loci
+        earlier_primary_df = primary_df[(primary_df[SAMPLE_NAMES] != new_sample)
+                                        & ~(primary_df[CHR] + "_" + primary_df[POSITION].apply(str)).isin(new_chr_pos)]
+        earlier_calls_df = calls_df[calls_df[SAMPLE_NAMES] != new_sample]
+
+        # the entries of the first sample were corrected since the earlier run (one primary entry is gone and one's depths changed)
+        changed_primary_df = earlier_primary_df.copy()
+        first_sample = changed_primary_df.index[changed_primary_df[SAMPLE_NAMES] == samples[0]]
+        changed_primary_df.loc[first_sample[0], ALT_DEPTH] += 7
+        changed_primary_df = changed_primary_df.drop(index=first_sample[1])
+
+        changed_calls_df = earlier_calls_df.copy()
+        changed_calls_df.loc[changed_calls_df.index[changed_calls_df[SAMPLE_NAMES] == samples[0]][0], REF_DEPTH] += 5
+
+        self.files = {}
+
+        for name, df, header in [("primary", primary_df, True), ("calls", calls_df, True),
+                                 ("earlier_primary", earlier_primary_df, True), ("earlier_calls", earlier_calls_df, True),
+                                 ("changed_primary", changed_primary_df, True), ("changed_calls", changed_calls_df, True),
+                                 ("populations", pd.DataFrame(samples), False), ("earlier_populations", pd.DataFrame(samples[:-1]), False)]:
+
+            self.files[name] = os.path.join(self.tmp_dir.name, name + ".xlsx")
+            df.to_excel(self.files[name], sheet_name="Sheet1", header=header, index=False)
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def aggregate(self, impute_technique, earlier=False, previous_xls=[], changed=False, cache_dir=""):
+
+        prefix = "earlier_" if earlier else ""
+        inputs_prefix = "changed_" if changed else prefix
+
+        return MPN_AML_Aggregator(primary_xls = [self.files[inputs_prefix + "primary"], "Sheet1"],
+                                  calls_xls = [self.files[inputs_prefix + "calls"], "Sheet1"],
+                                  populations_xls = [self.files[prefix + "populations"], "Sheet1", None],
+                                  aggregated_xls = [os.path.join(self.tmp_dir.name, prefix + "aggregated.xlsx"), "Sheet1"],
+                                  impute_technique = impute_technique,
+                                  previous_xls = previous_xls,
+                                  cache_dir = cache_dir).aggregated_df
+
+
+    def assert_incremental_matches_full(self, impute_technique):
+
+        full_df = self.aggregate(impute_technique)
+
+        self.aggregate(impute_technique, earlier=True)
+        incremental_df = self.aggregate(impute_technique, previous_xls=[os.path.join(self.tmp_dir.name, "earlier_aggregated.xlsx"), "Sheet1"])
+
+        columns = [CHR, POSITION, REF_DEPTH, ALT_DEPTH, SAMPLE_NAMES, GENE, CHR_POS]
+
+        self.assertTrue(full_df[columns].reset_index(drop=True).equals(incremental_df[columns].reset_index(drop=True)),
+                        "Incrementally aggregated dataframe does not match a full aggregation")
+
+        self.assertTrue(np.allclose(full_df[VAF].values, incremental_df[VAF].values),
+                        "Incrementally aggregated VAFs do not match a full aggregation")
+
+
+    def test_incremental_impute_zero(self):
+        self.assert_incremental_matches_full(IMPUTE_ZERO)
+
+
+    def test_incremental_impute_avg(self):
+        self.assert_incremental_matches_full(IMPUTE_AVG)
+
+
+    def test_incremental_changed_population(self):
+        # an existing population whose entries changed since the previous run is aggregated again (and the averages it's part of updated)
+        full_df = self.aggregate(IMPUTE_AVG)
+
+        self.aggregate(IMPUTE_AVG, earlier=True, changed=True)
+        incremental_df = self.aggregate(IMPUTE_AVG, previous_xls=[os.path.join(self.tmp_dir.name, "earlier_aggregated.xlsx"), "Sheet1"])
+
+        columns = [CHR, POSITION, REF_DEPTH, ALT_DEPTH, SAMPLE_NAMES, GENE, CHR_POS, SOURCE]
+
+        self.assertTrue(full_df[columns].reset_index(drop=True).equals(incremental_df[columns].reset_index(drop=True)),
+                        "Incrementally aggregated dataframe does not match a full aggregation after a population changed")
+
+
+    @unittest.skipUnless(pyarrow, "pyarrow is not installed")
+    def test_incremental_cached(self):
+        # with a cache dir, the changed populations are told apart by their digests, and unchanged xlsx files aren't parsed again
+        cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        aggregated_xlsx = os.path.join(self.tmp_dir.name, "aggregated.xlsx")
+
+        full_df = self.aggregate(IMPUTE_AVG)
+
+        self.aggregate(IMPUTE_AVG, earlier=True, changed=True, cache_dir=cache_dir)
+
+        with mock.patch.object(MPN_AML_Aggregator, "changed_populations", side_effect=AssertionError("Previous entries compared to the inputs")):
+            incremental_df = self.aggregate(IMPUTE_AVG, previous_xls=[os.path.join(self.tmp_dir.name, "earlier_aggregated.xlsx"), "Sheet1"], cache_dir=cache_dir)
+
+        columns = [CHR, POSITION, REF_DEPTH, ALT_DEPTH, SAMPLE_NAMES, GENE, CHR_POS, SOURCE]
+
+        self.assertTrue(full_df[columns].reset_index(drop=True).equals(incremental_df[columns].reset_index(drop=True)),
+                        "Incrementally aggregated dataframe does not match a full aggregation after a population changed")
+
+        # updating the aggregated xlsx again from the same inputs only reads cached files
+        with mock.patch("mpn_aml_aggregator.read_table", side_effect=AssertionError("Cached xlsx parsed again")):
+            updated_df = self.aggregate(IMPUTE_AVG, previous_xls=[aggregated_xlsx, "Sheet1"], cache_dir=cache_dir)
+
+        self.assertTrue(full_df[columns].reset_index(drop=True).equals(updated_df[columns].reset_index(drop=True)),
+                        "Aggregated dataframe changed when updated from cached inputs")
+
+        self.assertTrue(read_table(aggregated_xlsx, "Sheet1")[columns].equals(full_df[columns].reset_index(drop=True)),
+                        "Aggregated xlsx does not match the aggregated dataframe")
+
+
+    def test_incremental_without_sources(self):
+        # aggregated files written before sources were recorded get them from the inputs
+
+        full_df = self.aggregate(IMPUTE_AVG)
+
+        earlier_xlsx = os.path.join(self.tmp_dir.name, "earlier_aggregated.xlsx")
+
+        self.aggregate(IMPUTE_AVG, earlier=True).drop(columns=[SOURCE]).to_excel(earlier_xlsx, sheet_name="Sheet1", index=False)
+
+        incremental_df = self.aggregate(IMPUTE_AVG, previous_xls=[earlier_xlsx, "Sheet1"])
+
+        columns = [CHR, POSITION, REF_DEPTH, ALT_DEPTH, SAMPLE_NAMES, GENE, CHR_POS, SOURCE]
+
+        self.assertTrue(full_df[columns].reset_index(drop=True).equals(incremental_df[columns].reset_index(drop=True)),
+                        "Incrementally aggregated dataframe does not match a full aggregation")
+
+
+class MPN_AML_Aggregation_Index_Tests(unittest.TestCase):
+    """
+    Test cases for matching primary/calls entries to aggregated rows (Locus_Sample_Index), which replaces merging them.
+    """
+    def setUp(self):
+
+        cohort = simulate_cohort(n_loci=20, n_samples=4, n_clusters=2, seed=3)
+
+        self.primary_df, self.calls_df = primary_calls_dfs(cohort, seed=3)
+        self.populations_df = pd.DataFrame(cohort["samples"])
+
+
+    def test_rows_and_gather(self):
+
+        aggregated_df = pd.DataFrame({CHR_POS: ["chr1_10", "chr1_10", "chr2_5", "chr2_5"], SAMPLE_NAMES: ["A", "B", "A", "B"]})
+        entries_df = pd.DataFrame({CHR_POS: ["chr2_5", "chr3_1", "chr1_10"], SAMPLE_NAMES: ["B", "A", "C"], ALT_DEPTH: [7, 8, 9]})
+
+        index = Locus_Sample_Index(aggregated_df)
+        rows = index.rows(entries_df)
+
+        self.assertEqual(list(rows), [3, -1, -1], 'Incorrect aggregated rows')
+        self.assertFalse(index.has_duplicates(rows))
+
+        gathered = index.gather(entries_df[ALT_DEPTH], rows)
+
+        self.assertTrue(np.isnan(gathered[:3]).all() and gathered[3] == 7, 'Incorrect gathered values')
+        self.assertEqual(list(index.gather(entries_df[ALT_DEPTH], rows, 0)), [0, 0, 0, 7], 'Incorrect filled values')
+
+
+    def test_duplicated_entries(self):
+        # an entry in the primary dataframe twice gets two aggregated rows, as it did with merges
+
+        primary_df = pd.concat([self.primary_df, self.primary_df.iloc[[0]]])
+
+        aggregated_df = MPN_AML_Aggregator([self.primary_df], [self.calls_df], [self.populations_df, 0, None], write_xls_file=False).aggregated_df
+        duplicated_df = MPN_AML_Aggregator([primary_df], [self.calls_df], [self.populations_df, 0, None], write_xls_file=False).aggregated_df
+
+        self.assertEqual(len(duplicated_df), len(aggregated_df) + 1, 'Duplicated entry is not aggregated twice')
+        self.assertTrue(duplicated_df[SOURCE].value_counts().equals(pd.concat([aggregated_df[SOURCE], pd.Series([SOURCE_PRIMARY])]).value_counts()),
+                        'Incorrect sources of duplicated entries')
+
+
+    def test_sources(self):
+
+        aggregated_df = MPN_AML_Aggregator([self.primary_df], [self.calls_df], [self.populations_df, 0, None], write_xls_file=False).aggregated_df
+
+        cells = lambda df: set(zip(df[CHR] + "_" + df[POSITION].apply(str), df[SAMPLE_NAMES]))
+
+        primary_cells = cells(self.primary_df)
+        calls_cells = cells(self.calls_df.rename(columns={SEQNAMES: CHR, START: POSITION})) - primary_cells
+
+        for source, source_cells in [(SOURCE_PRIMARY, primary_cells), (SOURCE_CALLS, calls_cells)]:
+            self.assertEqual(cells(aggregated_df[aggregated_df[SOURCE] == source]), source_cells, 'Incorrect %s cells' % source)
+
+        imputed_df = aggregated_df[aggregated_df[SOURCE] == SOURCE_IMPUTED]
+
+        self.assertEqual(len(imputed_df), len(aggregated_df) - len(primary_cells) - len(calls_cells), 'Incorrect number of imputed cells')
+        self.assertTrue((imputed_df[ALT_DEPTH] == 0).all() and (imputed_df[REF_DEPTH] == 1).all(), 'Incorrect imputed values')
+
+
+    def test_unused_calls_entries(self):
+        # calls entries of other samples or loci, and columns that aren't aggregated, are dropped while reading
+
+        aggregated_df = MPN_AML_Aggregator([self.primary_df], [self.calls_df], [self.populations_df, 0, None], write_xls_file=False).aggregated_df
+
+        other_df = self.calls_df.assign(**{SAMPLE_NAMES: "other_" + self.calls_df[SAMPLE_NAMES]})
+        other_loci_df = self.calls_df.assign(**{START: self.calls_df[START] + 1})
+
+        calls_df = pd.concat([self.calls_df, other_df, other_loci_df]).assign(annotation="unused")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            calls_xlsx = os.path.join(tmp_dir, "calls.xlsx")
+            calls_df.to_excel(calls_xlsx, sheet_name="Sheet1", index=False)
+
+            aggregator = MPN_AML_Aggregator([self.primary_df], [calls_xlsx, "Sheet1"], [self.populations_df, 0, None], write_xls_file=False)
+
+        self.assertTrue(aggregator.aggregated_df.equals(aggregated_df), 'Unused calls entries change the aggregation')
+        self.assertTrue(aggregator.calls_df[SAMPLE_NAMES].isin(self.populations_df[0]).all(), 'Calls entries of other samples are kept')
+        self.assertEqual(len(aggregator.calls_df), (aggregator.index.rows(aggregator.calls_df) >= 0).sum(), 'Calls entries of other loci are kept')
+        self.assertEqual(aggregator.n_calls_rows, len(calls_df), 'Incorrect number of calls rows read')
+
+
+    def test_regions(self):
+        # loci without a gene in any sample get the gene of their region, and loci outside of the regions are dropped with panel_only
+
+        loci = self.primary_df.drop_duplicates([CHR, POSITION])
+        panel = loci.iloc[::2]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            # BED regions are 0-based and half-open
+            bed_file = os.path.join(tmp_dir, "panel.bed")
+            pd.DataFrame({0: panel[CHR], 1: panel[POSITION] - 1, 2: panel[POSITION], 3: "BED_" + panel[GENE]}).to_csv(bed_file, sep="\t", header=False, index=False)
+
+            first_locus = (self.primary_df[CHR] == panel[CHR].iloc[0]) & (self.primary_df[POSITION] == panel[POSITION].iloc[0])
+            primary_df = self.primary_df.assign(**{GENE: self.primary_df[GENE].where(~first_locus)})
+
+            aggregated_df = MPN_AML_Aggregator([primary_df], [self.calls_df], [self.populations_df, 0, None], write_xls_file=False, regions=bed_file).aggregated_df
+            panel_df = MPN_AML_Aggregator([primary_df], [self.calls_df], [self.populations_df, 0, None], write_xls_file=False, regions=bed_file, panel_only=True).aggregated_df
+
+        chr_pos = panel[CHR] + "_" + panel[POSITION].astype(str)
+
+        self.assertEqual(set(aggregated_df.loc[aggregated_df[CHR_POS] == chr_pos.iloc[0], GENE]), {"BED_" + panel[GENE].iloc[0]}, 'Missing gene not filled in from the regions')
+        self.assertFalse(aggregated_df.loc[aggregated_df[CHR_POS] != chr_pos.iloc[0], GENE].str.startswith("BED_").any(), 'Genes of the primary entries are replaced')
+
+        self.assertEqual(set(panel_df[CHR_POS]), set(chr_pos), 'Loci outside of the panel are aggregated')
+        self.assertEqual(len(panel_df), len(chr_pos) * len(self.populations_df), 'Incorrect number of aggregated rows with panel_only')
+
+
+    def test_validation(self):
+        # a missing column fails on the header of the file, invalid entries fail (or are reported) once read
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+
+            calls_xlsx = os.path.join(tmp_dir, "calls.xlsx")
+            self.calls_df.drop(columns=[REF_DEPTH]).to_excel(calls_xlsx, sheet_name="Sheet1", index=False)
+
+            with self.assertRaises(Input_Validation_Error) as error:
+                MPN_AML_Aggregator([self.primary_df], [calls_xlsx, "Sheet1"], [self.populations_df, 0, None], write_xls_file=False)
+
+        self.assertEqual([violation["column"] for violation in error.exception.report.violations], [REF_DEPTH], 'Incorrect missing column')
+
+        primary_df = self.primary_df.copy()
+        primary_df.loc[primary_df.index[0], ALT_DEPTH] = -1
+
+        with self.assertRaises(Input_Validation_Error):
+            MPN_AML_Aggregator([primary_df], [self.calls_df], [self.populations_df, 0, None], write_xls_file=False, validation=VALIDATE_RAISE)
+
+        # only reported by default
+        aggregator = MPN_AML_Aggregator([primary_df], [self.calls_df], [self.populations_df, 0, None], write_xls_file=False)
+
+        self.assertEqual({violation["check"] for violation in aggregator.validation_report.violations}, {CHECK_COUNT, CHECK_VAF}, 'Invalid depth is not reported')
+        self.assertEqual(aggregator.validation_report.violations[0]["source"], "primary", 'Incorrect source of the violations')
+
+
+class MPN_AML_Low_Memory_Aggregator_Tests(unittest.TestCase):
+    """
+    Test cases for aggregating with categorical/32-bit columns (MPN_AML_Aggregator(low_memory=True)),
+    which should give the same data as a regular aggregation (VAF to float32 precision).
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        cohort = simulate_cohort(n_loci=40, n_samples=6, n_clusters=3, seed=2)
+
+        self.primary_df, self.calls_df = primary_calls_dfs(cohort, seed=2)
+        self.populations_df = pd.DataFrame(cohort["samples"])
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def aggregate(self, impute_technique, low_memory, previous_xls=[], populations_df=None):
+
+        populations_df = self.populations_df if populations_df is None else populations_df
+
+        return MPN_AML_Aggregator(primary_xls = [self.primary_df],
+                                  calls_xls = [self.calls_df],
+                                  populations_xls = [populations_df, 0, None],
+                                  write_xls_file = False,
+                                  impute_technique = impute_technique,
+                                  previous_xls = previous_xls,
+                                  low_memory = low_memory)
+
+
+    def assert_matches(self, full_df, lean_df):
+
+        self.assertEqual([str(lean_df[column].dtype) for column in [CHR, CHR_POS, GENE, SAMPLE_NAMES, SOURCE, REF_DEPTH, ALT_DEPTH, VAF]],
+                         ["category"] * 5 + ["int32", "int32", "float32"], 'Incorrect low memory dtypes')
+
+        columns = [CHR, POSITION, REF_DEPTH, ALT_DEPTH, SAMPLE_NAMES, GENE, CHR_POS, SOURCE]
+
+        self.assertTrue(full_df[columns].reset_index(drop=True).equals(lean_df[columns].astype(full_df[columns].dtypes.to_dict()).reset_index(drop=True)),
+                        'Low memory aggregation does not match a regular aggregation')
+
+        self.assertTrue(np.allclose(full_df[VAF].values, lean_df[VAF].values), 'Low memory VAFs do not match a regular aggregation')
+
+
+    def test_low_memory_matches_full(self):
+
+        for impute_technique in [IMPUTE_ZERO, IMPUTE_AVG]:
+
+            full_df = self.aggregate(impute_technique, False).aggregated_df
+            lean_aggregator = self.aggregate(impute_technique, True)
+
+            self.assert_matches(full_df, lean_aggregator.aggregated_df)
+
+            self.assertLess(lean_aggregator.aggregated_df.memory_usage(deep=True).sum(), full_df.memory_usage(deep=True).sum() / 2,
+                            'Low memory aggregation does not use less memory')
+
+            # inputs are released once aggregated
+            self.assertIsNone(lean_aggregator.primary_df)
+
+        # the processor gives the same .ssm for both
+        for name, aggregated_df in [("full", full_df), ("lean", lean_aggregator.aggregated_df)]:
+            MPN_AML_Processor(aggregated_df, os.path.join(self.tmp_dir.name, name + ".ssm"))
+
+        with open(os.path.join(self.tmp_dir.name, "full.ssm")) as full_ssm, open(os.path.join(self.tmp_dir.name, "lean.ssm")) as lean_ssm:
+            self.assertEqual(full_ssm.read(), lean_ssm.read(), '.ssm from a low memory aggregation does not match')
+
+
+    def test_low_memory_incremental(self):
+
+        previous_df = self.aggregate(IMPUTE_AVG, True, populations_df=self.populations_df[:-1]).aggregated_df
+
+        self.assert_matches(self.aggregate(IMPUTE_AVG, False).aggregated_df, self.aggregate(IMPUTE_AVG, True, previous_xls=[previous_df]).aggregated_df)
+
+
+@unittest.skipUnless(pyarrow, "pyarrow is not installed")
+class MPN_AML_Aggregator_Output_Format_Tests(unittest.TestCase):
+    """
+    Test cases for writing the aggregated data as parquet/feather (MPN_AML_Aggregator(output_format=...)).
+    """
+    def setUp(self):
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        self.example_xls = lambda name: [os.environ["DATA_DIR"] + "/example/example.%s.xlsx" % name, "Sheet1"]
+
+
+    def tearDown(self):
+
+        self.tmp_dir.cleanup()
+
+
+    def test_columnar_round_trip(self):
+
+        for out_name, output_format in [("aggregated.parquet", None), ("aggregated.feather", None), ("aggregated.out", "feather")]:
+
+            out_file = os.path.join(self.tmp_dir.name, out_name)
+
+            aggregated_df = MPN_AML_Aggregator(self.example_xls("primary"), self.example_xls("calls"), self.example_xls("populations") + [None],
+                                               [out_file, "Sheet1"], output_format=output_format).aggregated_df
+
+            read_df = read_table(out_file, fmt=output_format)
+
+            self.assertTrue(read_df.equals(aggregated_df.reset_index(drop=True)),
+                            'Aggregated data changed when written to %s' % out_name)
+
+            self.assertEqual(list(read_df.dtypes), list(aggregated_df.dtypes), 'dtypes changed when written to %s' % out_name)
+
+        # the processor reads the columnar output as it does the xlsx
+        MPN_AML_Aggregator(self.example_xls("primary"), self.example_xls("calls"), self.example_xls("populations") + [None],
+                           [os.path.join(self.tmp_dir.name, "aggregated.xlsx"), "Sheet1"])
+
+        for name in ["aggregated.xlsx", "aggregated.feather"]:
+            MPN_AML_Processor(os.path.join(self.tmp_dir.name, name), os.path.join(self.tmp_dir.name, name + ".ssm"))
+
+        with open(os.path.join(self.tmp_dir.name, "aggregated.xlsx.ssm")) as xlsx_ssm, open(os.path.join(self.tmp_dir.name, "aggregated.feather.ssm")) as feather_ssm:
+            self.assertEqual(xlsx_ssm.read(), feather_ssm.read(), '.ssm from feather does not match .ssm from xlsx')
+
+
+    def test_headerless_populations(self):
+
+        populations_df = pd.DataFrame(["Pt0_blast", "Pt0_NK"])
+
+        for name in ["populations.xlsx", "populations.parquet", "populations.feather"]:
+
+            save_excel(populations_df, os.path.join(self.tmp_dir.name, name), "Sheet1", header=None)
+
+            self.assertTrue(load_excel(os.path.join(self.tmp_dir.name, name), "Sheet1", header=None).equals(populations_df),
+                            'Populations changed when written to %s' % name)
+
+
 if __name__ == '__main__':
     unittest.main()
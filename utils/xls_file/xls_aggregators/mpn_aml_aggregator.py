@@ -1,18 +1,42 @@
+import numpy as np
 import pandas as pd
 import sys, os
 
 
 sys.path.append(os.environ["UTILS_DIR"] + "/pdf_templates")
 sys.path.append(os.environ["UTILS_DIR"] + "/common")
+sys.path.append(os.environ["UTILS_DIR"] + "/xls_file/xls_aggregators/utils")
 
 from mpn_aml_columns import *
-from utils.verify_aggregation import verify_aggregation
+from table_io import FORMAT_XLSX, read_table, table_format, write_table
+from verify_aggregation import verify_aggregation
+from aggregation_index import Locus_Sample_Index
+from region_annotation import Region_Annotator, ANN_GENE
+from input_validation import Input_Schema, Validation_Report, check_header, validate_df, handle_report, DEFAULT_VALIDATION, VALIDATE_OFF
+from input_cache import Input_Cache, population_digests
 
 # impute techniques
 IMPUTE_AVG = "AVG"
 IMPUTE_ZERO = "ZERO"
 
 
+def is_xlsx(file_name):
+    """
+    Returns whether file_name is an excel file (dataframes can be passed in place of file names)
+    """
+    return not isinstance(file_name, pd.DataFrame) and table_format(file_name) == FORMAT_XLSX
+
+
+def available_cpus():
+    """
+    Returns the number of CPUs this process can run on
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
 class MPN_AML_Aggregator:
     """
     A one-off class for aggregating data for the mpn-aml-pairtree analysis
@@ -24,28 +48,79 @@ class MPN_AML_Aggregator:
                  aggregated_xls = [],
                  metrics_file = "",
                  write_xls_file = True,
-                 impute_technique=IMPUTE_ZERO):
+                 impute_technique=IMPUTE_ZERO,
+                 previous_xls = [],
+                 output_format = None,
+                 low_memory = False,
+                 read_workers = None,
+                 regions = "",
+                 panel_only = False,
+                 validation = DEFAULT_VALIDATION,
+                 cache_dir = ""):
 
         """
-        Aims to load in xlsx files, and then kick off preprocessing, processing, and simple verification checks
+        Aims to load in xlsx files, and then kick off preprocessing, processing, and simple verification checks.
+
+        If previous_xls (a previously written aggregated xlsx) is passed, only the <chromosome><position> x sample
+        entries that are missing from it (new populations or new primary loci) or that changed since are aggregated and merged into it
+        (see process_incremental).
+
+        If cache_dir is passed, parsed copies of the xlsx files read are kept in it (see input_cache.py), so an xlsx that hasn't changed
+        since an earlier run with the same cache_dir isn't parsed again, along with the population digests of the inputs each
+        aggregated file was made from. Needs pyarrow.
+
+        Besides the aggregated values, every row of the aggregated file has a "source" column (SOURCE): "primary" if it's a primary entry,
+        "calls" if its refDepth is from a calls entry only, and "imputed" otherwise. The metrics pdf is derived from it, and an incremental
+        update reads it back to tell which previous refDepths were imputed (previous files without it get it from the inputs).
+
+        Any of the files can also be parquet/feather files (see table_io.py), the aggregated data is written in
+        output_format if passed, otherwise in the format matching the extension of its file name.
+
+        With low_memory, chromosome/<chromosome><position>/gene/sample columns are categoricals, depths are int32 and VAF
+        is float32 (see optimize_dtypes), and the input dataframes are released once the aggregated dataframe is verified.
+
+        The xlsx files are parsed concurrently by read_workers processes (parsing is CPU-bound, by default one per xlsx, up to
+        the number of available CPUs), and the primary and populations dataframes are preprocessed while the calls xlsx
+        (usually the largest) is still being parsed. With a single worker, they're read one after another.
+
+        If regions (a BED/GTF file or dataframe, see region_annotation.py) is passed, <chromosome><position> pairs without a gene
+        in any sample get the gene of the region they're in, and with panel_only the primary loci outside of the regions are dropped
+        (before the calls are read into the aggregated dataframe, so they never make it downstream).
+
+        The headers of the input files are checked before any of them is parsed, so a missing column fails right away
+        (an Input_Validation_Error). Once read, the primary and calls entries go through the integrity checks of
+        input_validation.py (chromosomes, positions, depths and VAF), with their violations in validation_report. By default
+        (VALIDATE_REPORT) they're printed, with VALIDATE_RAISE an Input_Validation_Error is raised for them.
         """
 
-        self.primary_df = self.read_xls_sheet(*primary_xls)
-        self.calls_df = self.read_xls_sheet(*calls_xls)
-        self.populations = self.read_xls_sheet(*populations_xls)[0] # we only want the first column
         self.aggregated_df = pd.DataFrame()
+        self.index = None
         self.aggregated_xls = aggregated_xls
         self.metrics_file = metrics_file
+        self.output_format = output_format
         self.impute_technique = impute_technique
+        self.low_memory = low_memory
+        self.regions = Region_Annotator(regions) if isinstance(regions, pd.DataFrame) or regions else None
+        self.panel_only = panel_only
+        self.validation = validation
+        self.validation_report = Validation_Report()
+        self.cache = Input_Cache(cache_dir) if cache_dir else None
+        self.digests = {}
 
         # initialize constants before preprocessing dataframes (or doing anything else for that matter)
         self.init_constants()
 
-        # preprocess dataframes
-        self.preprocess_dfs()
+        # read and preprocess dataframes
+        self.read_dfs(primary_xls, calls_xls, populations_xls, previous_xls, read_workers)
+
+        if self.low_memory:
+            self.optimize_dtypes()
 
         # start processing
-        self.process()
+        if self.previous_df is not None:
+            self.process_incremental()
+        else:
+            self.process()
 
         # basic checks to verify aggregation
         verify_aggregation(self.metrics_file,
@@ -58,13 +133,22 @@ class MPN_AML_Aggregator:
                            primary_xls,
                            calls_xls,
                            populations_xls,
-                           aggregated_xls)
+                           aggregated_xls,
+                           self.index,
+                           self.n_calls_rows)
+
+        # the inputs are only needed to aggregate and verify
+        if self.low_memory:
+            self.primary_df = self.calls_df = self.previous_df = None
 
         # write aggregated and updated dataframe to xls file
         if write_xls_file:
 
             self.write_xls_sheet(self.aggregated_df, *self.aggregated_xls)
 
+            if self.cache is not None and not self.aggregated_df.empty:
+                self.cache_aggregated_file(*self.aggregated_xls)
+
 
     def init_constants(self):
         """
@@ -74,18 +158,144 @@ class MPN_AML_Aggregator:
         # other constants
         self.SCAN_FILE_EXT = ".RAW.VarScan.txt"
 
+        # list of columns that each dataframe should have (the only ones read from the calls and primary files)
+        self.calls_columns = [SEQNAMES, START, REF_DEPTH, ALT_DEPTH, SAMPLE_NAMES, VAF]
+        self.primary_columns = [CHR, POSITION, REF_DEPTH, ALT_DEPTH, SAMPLE_NAMES, VAF, GENE]
+        # SOURCE (primary/calls/imputed) is written as well, the metrics and incremental updates are derived from it
+        self.aggregated_columns = [CHR, POSITION, REF_DEPTH, ALT_DEPTH, SAMPLE_NAMES, VAF, GENE, CHR_POS, SOURCE]
+
+        # integrity checks of the primary and calls entries (see input_validation.py), genes can be missing
+        self.primary_schema = Input_Schema(self.primary_columns, chromosome=CHR, positions=[POSITION], counts=[REF_DEPTH, ALT_DEPTH],
+                                           vaf=(VAF, ALT_DEPTH, REF_DEPTH), nullable=[GENE])
+        self.calls_schema = Input_Schema(self.calls_columns, chromosome=SEQNAMES, positions=[START], counts=[REF_DEPTH, ALT_DEPTH],
+                                         vaf=(VAF, ALT_DEPTH, REF_DEPTH))
+
+        # dtypes the string columns of the calls and primary xlsx files are parsed as (the others are inferred)
+        self.calls_dtypes = {SEQNAMES: str, SAMPLE_NAMES: str}
+        self.primary_dtypes = {CHR: str, SAMPLE_NAMES: str, GENE: str}
+
+        # dtypes of the aggregated columns (see optimize_dtypes for the low memory ones)
+        self.dtypes = {
+            CHR          : "object",
+            POSITION     : "int64",
+            CHR_POS      : "object",
+            REF_DEPTH    : "int64",
+            ALT_DEPTH    : "int64",
+            SAMPLE_NAMES : "object",
+            GENE         : "object",
+            VAF          : "float64",
+            SOURCE       : "object"
+        }
+
+
+    def read_xls_sheet(self, file_name, sheet_name=0, header=0, columns=None, dtype=None):
+
+        # dataframes can be passed in place of file names (e.g. when called from the python api)
+        if isinstance(file_name, pd.DataFrame):
+            return (file_name if columns is None else file_name[columns]).copy()
+
+        return read_table(file_name, sheet_name, header=header, columns=columns, dtype=dtype)
 
 
-    def read_xls_sheet(self, file_name, sheet_name, header=0):
+    def submit_read(self, pool, file_name, sheet_name=0, header=0, columns=None, dtype=None):
+        """
+        Returns a future of the dataframe read_xls_sheet returns, xlsx files are parsed in pool (a process pool) if one is passed
+        (unless they're cached)
+        """
+
+        from concurrent.futures import Future
+
+        future = Future()
+
+        cached = self.cache.read(file_name, sheet_name, header, columns, dtype) if self.cache is not None and is_xlsx(file_name) else None
+
+        if cached is not None:
+            future.set_result(cached)
+
+        elif pool is not None and is_xlsx(file_name):
+            return pool.submit(read_table, file_name, sheet_name, header=header, columns=columns, dtype=dtype)
+
+        else:
+            future.set_result(self.read_xls_sheet(file_name, sheet_name, header, columns, dtype))
+
+        return future
+
+
+    def read_result(self, future, file_name, sheet_name=0, header=0, columns=None, dtype=None):
+        """
+        Returns the dataframe of a submit_read future, caching it if it was parsed from an xlsx
+        """
+
+        dataframe = future.result()
+
+        if self.cache is not None and is_xlsx(file_name):
+            self.cache.write(dataframe, file_name, sheet_name, header, columns, dtype)
 
-        return pd.read_excel(file_name, sheet_name, header=header)
+        return dataframe
+
+
+    def read_dfs(self, primary_xls, calls_xls, populations_xls, previous_xls=[], read_workers=None):
+        """
+        Reads the input dataframes, preprocessing each one as soon as it's read (see __init__)
+        """
+
+        from concurrent.futures import ProcessPoolExecutor
+        from contextlib import ExitStack
+
+        input_xls = [xls for xls in [calls_xls, primary_xls, populations_xls, previous_xls] if xls]
+
+        # fail before parsing anything if a column that's read is missing
+        self.check_headers(primary_xls, calls_xls)
+
+        n_xlsx = len([xls for xls in input_xls if is_xlsx(xls[0])])
+
+        read_workers = min(n_xlsx, available_cpus()) if read_workers is None else min(n_xlsx, read_workers)
+
+        with ExitStack() as stack:
+
+            # a pool is only worth starting if more than one xlsx can be parsed at a time
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=read_workers)) if read_workers > 1 else None
+
+            # the calls xlsx is submitted first, since it takes the longest to parse (only the columns that are aggregated are parsed)
+            calls = self.submit_read(pool, *calls_xls, columns=self.calls_columns, dtype=self.calls_dtypes)
+            primary = self.submit_read(pool, *primary_xls, columns=self.primary_columns, dtype=self.primary_dtypes)
+            populations = self.submit_read(pool, *populations_xls)
+            previous = self.submit_read(pool, *previous_xls) if previous_xls else None
+
+            self.primary_df = self.preprocess_primary_df(self.read_result(primary, *primary_xls, columns=self.primary_columns, dtype=self.primary_dtypes))
+            self.populations = self.read_result(populations, *populations_xls)[0] # we only want the first column
+            self.previous_df = self.read_result(previous, *previous_xls) if previous else None
+            self.previous_digests = self.cache.read_digests(previous_xls[0]) if previous and self.cache is not None and not isinstance(previous_xls[0], pd.DataFrame) else None
+            self.calls_df = self.preprocess_calls_df(self.read_result(calls, *calls_xls, columns=self.calls_columns, dtype=self.calls_dtypes))
+
+
+    def check_headers(self, primary_xls, calls_xls):
+        """
+        Raises an Input_Validation_Error if the primary or calls file is missing a column that's read from it (only their headers are read)
+        """
+        report = Validation_Report()
+
+        for xls, columns in [(primary_xls, self.primary_columns), (calls_xls, self.calls_columns)]:
+            report.extend(check_header(xls[0], columns, *xls[1:3]))
+
+        report.raise_if_failed()
+
+
+    def validate(self, dataframe, schema, source):
+        """
+        Runs the integrity checks of schema on a dataframe, adding its violations to validation_report (see __init__)
+        """
+        if self.validation == VALIDATE_OFF:
+            return
+
+        self.validation_report.extend(handle_report(validate_df(dataframe, schema, source), self.validation))
 
 
     def write_xls_sheet(self, dataframe, file_name, sheet_name):
 
         if not dataframe.empty:
 
-            dataframe.to_excel(file_name, sheet_name=sheet_name)
+            write_table(dataframe, file_name, sheet_name=sheet_name, fmt=self.output_format)
 
 
     def preprocess_dfs(self):
@@ -93,55 +303,152 @@ class MPN_AML_Aggregator:
         Preprocess the different dataframes (e.g. standardize column headers)
         """
 
-        # basic prepocessing to make sure dataframes have same column names, as well as similar formatting of columns
-        self.primary_df[SAMPLE_NAMES] = self.primary_df[SAMPLE_NAMES].str.replace(self.SCAN_FILE_EXT, "", regex=False)
-        self.calls_df[SAMPLE_NAMES] = self.calls_df[SAMPLE_NAMES].str.replace(self.SCAN_FILE_EXT, "", regex=False)
+        self.primary_df = self.preprocess_primary_df(self.primary_df)
+        self.calls_df = self.preprocess_calls_df(self.calls_df)
 
-        # list of columns that each dataframe should have
-        self.calls_columns = [SEQNAMES, START, REF_DEPTH, ALT_DEPTH, SAMPLE_NAMES, VAF]
-        self.primary_columns = [CHR, POSITION, REF_DEPTH, ALT_DEPTH, SAMPLE_NAMES, VAF, GENE]
-        self.aggregated_columns = [CHR, POSITION, REF_DEPTH, ALT_DEPTH, SAMPLE_NAMES, VAF, GENE, CHR_POS]
 
-        self.calls_df = self.calls_df[self.calls_columns]
-        self.primary_df = self.primary_df[self.primary_columns]
+    def preprocess_primary_df(self, primary_df):
+        """
+        Returns the primary dataframe with the primary columns, its <chromosome><position> pairs and sorted by chromosome
+        number and position, and records its unique <chromosome><position> pairs
+        """
 
-        # rename columns from calls dataframe
-        self.calls_df = self.calls_df.rename(columns={SEQNAMES: CHR, START: POSITION})
+        primary_df[SAMPLE_NAMES] = primary_df[SAMPLE_NAMES].str.replace(self.SCAN_FILE_EXT, "", regex=False)
+
+        primary_df = primary_df[self.primary_columns].copy()
+
+        self.validate(primary_df, self.primary_schema, "primary")
+
+        # loci outside of the panel are dropped before anything is aggregated for them
+        if self.panel_only and self.regions is not None:
+            primary_df = primary_df[self.regions.in_regions(primary_df[CHR], primary_df[POSITION])]
 
         # add <chromosome><position> column which will help us compile a proper aggregated dataframe
-        self.primary_df[CHR_POS] = self.primary_df[CHR] + "_" + self.primary_df[POSITION].apply(str)
-        self.calls_df[CHR_POS] = self.calls_df[CHR] + "_" + self.calls_df[POSITION].apply(str)
+        primary_df[CHR_POS] = primary_df[CHR] + "_" + primary_df[POSITION].apply(str)
 
         # sort the dataframe by chromosome number by creating CHR_NUM column which contains chromsome number, then drop that column after sorting
-        self.primary_df[CHR_NUM] = self.primary_df[CHR].str.extract("(\d+)", expand=False).astype(int, errors = "ignore").fillna(0).astype(int)
-        self.primary_df = self.primary_df.sort_values(by=[CHR_NUM, POSITION]).drop(columns=[CHR_NUM])
+        primary_df[CHR_NUM] = primary_df[CHR].str.extract("(\d+)", expand=False).astype(int, errors = "ignore").fillna(0).astype(int)
+        primary_df = primary_df.sort_values(by=[CHR_NUM, POSITION]).drop(columns=[CHR_NUM])
+
+        self.unique_chr_pos = primary_df[CHR_POS].unique() # obtain all unique chromosome + position pairs
 
-        self.calls_df[CHR_NUM] = self.calls_df[CHR].str.extract("(\d+)", expand=False).astype("int64", errors = "ignore").fillna(0).astype(int)
-        self.calls_df = self.calls_df.sort_values(by=[CHR_NUM, POSITION]).drop(columns=[CHR_NUM])
+        # the changed populations of an incremental update are told apart by their digests (see process_incremental)
+        if self.cache is not None:
+            for population, digest in population_digests(primary_df, self.primary_columns, primary_df[SAMPLE_NAMES]).items():
+                self.digests.setdefault(population, [None, None])[0] = digest
 
-        self.unique_chr_pos = self.primary_df[CHR_POS].unique() # obtain all unique chromosome + position pairs
+        return primary_df
 
 
-    def init_aggregated_df(self):
+    def preprocess_calls_df(self, calls_df):
+        """
+        Returns the calls dataframe with the calls columns (renamed to the primary column names), its <chromosome><position> pairs
+        and sorted by chromosome number and position.
+        Entries of samples that aren't populations or of <chromosome><position> pairs that aren't in the primary dataframe can't be
+        aggregated, so they're dropped before anything else is done to them (needs the populations and preprocessed primary dataframe).
+        """
+
+        # the number of rows read is still reported in the aggregation metrics
+        self.n_calls_rows = len(calls_df)
+
+        populations = list(self.populations.astype(str))
+
+        calls_df = calls_df.loc[calls_df[SAMPLE_NAMES].isin(populations + [pop + self.SCAN_FILE_EXT for pop in populations]), self.calls_columns]
+
+        # entries of loci outside of the primary dataframe are part of the digests, so new primary loci don't change them
+        if self.cache is not None:
+            for population, digest in population_digests(calls_df, self.calls_columns,
+                                                          calls_df[SAMPLE_NAMES].str.replace(self.SCAN_FILE_EXT, "", regex=False)).items():
+                self.digests.setdefault(population, [None, None])[1] = digest
+
+        # add <chromosome><position> column, which the entries are also filtered on
+        chr_pos = calls_df[SEQNAMES] + "_" + calls_df[START].apply(str)
+        in_primary = chr_pos.isin(self.unique_chr_pos).values
+
+        calls_df = calls_df[in_primary].assign(**{CHR_POS: chr_pos[in_primary]})
+
+        # only the entries that are aggregated are checked
+        self.validate(calls_df, self.calls_schema, "calls")
+
+        calls_df[SAMPLE_NAMES] = calls_df[SAMPLE_NAMES].str.replace(self.SCAN_FILE_EXT, "", regex=False)
+
+        # rename columns from calls dataframe
+        calls_df = calls_df.rename(columns={SEQNAMES: CHR, START: POSITION})
+
+        calls_df[CHR_NUM] = calls_df[CHR].str.extract("(\d+)", expand=False).astype("int64", errors = "ignore").fillna(0).astype(int)
+        calls_df = calls_df.sort_values(by=[CHR_NUM, POSITION]).drop(columns=[CHR_NUM])
+
+        return calls_df
+
+
+    def optimize_dtypes(self):
+        """
+        Shrinks the preprocessed dataframes: chromosome, <chromosome><position>, gene and sample columns become categoricals
+        (the columns merged on share their categories between dataframes, so merges keep them categorical), depths become int32
+        and VAF float32.
+        Depths with missing values (to be imputed) are kept as float32 until the aggregated dataframe is complete.
+        """
+
+        populations = self.populations.astype(str)
+
+        categories = {
+            CHR          : pd.concat([self.primary_df[CHR], self.calls_df[CHR]]),
+            CHR_POS      : pd.concat([self.primary_df[CHR_POS], self.calls_df[CHR_POS]]),
+            SAMPLE_NAMES : pd.concat([self.primary_df[SAMPLE_NAMES], self.calls_df[SAMPLE_NAMES], populations])
+        }
+
+        for column, values in categories.items():
+            self.dtypes[column] = pd.CategoricalDtype(values.unique())
+
+        # genes are never merged on, so their categories are whatever genes a dataframe has
+        self.dtypes.update({GENE: "category", REF_DEPTH: "int32", ALT_DEPTH: "int32", VAF: "float32",
+                            SOURCE: pd.CategoricalDtype([SOURCE_PRIMARY, SOURCE_CALLS, SOURCE_IMPUTED])})
+
+        self.primary_df = self.lean_df(self.primary_df)
+        self.calls_df = self.lean_df(self.calls_df)
+
+
+    def lean_df(self, dataframe):
+        """
+        Returns dataframe with its aggregated columns cast to self.dtypes (depths with missing values are cast to float32)
+        """
+
+        dtypes = {}
+
+        for column in dataframe.columns.intersection(list(self.dtypes)):
+
+            dtypes[column] = self.dtypes[column]
+
+            if column in [REF_DEPTH, ALT_DEPTH] and dataframe[column].isnull().any():
+                dtypes[column] = "float32"
+
+        return dataframe.astype(dtypes)
+
+
+    def init_aggregated_df(self, populations=None, unique_chr_pos=None):
         """
         Create an empty dataframe containing a unique <chromosome><position> found in the primary
-        dataframe for each sample (n_samples * len(self.unique_chr_pos))
+        dataframe for each sample (n_samples * len(self.unique_chr_pos)).
+        A subset of the populations and/or <chromosome><position> pairs can be passed to only create those entries.
         """
 
+        populations = self.populations if populations is None else populations
+        unique_chr_pos = self.unique_chr_pos if unique_chr_pos is None else unique_chr_pos
+
         self.aggregated_df = pd.DataFrame()
 
-        for pop in self.populations:
+        for pop in populations:
 
             self.aggregated_df = self.aggregated_df.append(pd.DataFrame({
 
-                CHR          : pd.Series([chr_pos.split("_")[0] for chr_pos in self.unique_chr_pos], dtype="object"),
-                POSITION     : pd.Series([chr_pos.split("_")[1] for chr_pos in self.unique_chr_pos], dtype="int64"),
-                CHR_POS      : pd.Series(self.unique_chr_pos, dtype="object"),
-                REF_DEPTH    : pd.Series([], dtype="int64"),
-                ALT_DEPTH    : pd.Series([], dtype="int64"),
-                SAMPLE_NAMES : pd.Series([pop]*len(self.unique_chr_pos), dtype="object"),
-                GENE         : pd.Series([], dtype="object"),
-                VAF          : pd.Series([], dtype="float64")
+                CHR          : pd.Series([chr_pos.split("_")[0] for chr_pos in unique_chr_pos], dtype=self.dtypes[CHR]),
+                POSITION     : pd.Series([chr_pos.split("_")[1] for chr_pos in unique_chr_pos], dtype=self.dtypes[POSITION]),
+                CHR_POS      : pd.Series(unique_chr_pos, dtype=self.dtypes[CHR_POS]),
+                REF_DEPTH    : pd.Series([], dtype=self.dtypes[REF_DEPTH]),
+                ALT_DEPTH    : pd.Series([], dtype=self.dtypes[ALT_DEPTH]),
+                SAMPLE_NAMES : pd.Series([pop]*len(unique_chr_pos), dtype=self.dtypes[SAMPLE_NAMES]),
+                GENE         : pd.Series([], dtype=self.dtypes[GENE]),
+                VAF          : pd.Series([], dtype=self.dtypes[VAF])
 
             }))
 
@@ -150,6 +457,22 @@ class MPN_AML_Aggregator:
         self.aggregated_df = self.aggregated_df.sort_values(by=[CHR_NUM, POSITION]).drop(columns=[CHR_NUM])
 
 
+    def average_total_reads(self, chr_pos):
+        """
+        Returns the average total reads across all samples in the primary dataframe (rounded down) of each <chromosome><position> pair
+        in chr_pos, in the same order (computed for all of them at once, rather than filtering the primary dataframe per pair)
+        """
+
+        # obtain every samples <chromosome><position> pair that does not have a NaN refDepth value
+        with_ref = self.primary_df[self.primary_df[REF_DEPTH].notnull()]
+
+        totals = with_ref.groupby(np.asarray(with_ref[CHR_POS], dtype="object"))[[REF_DEPTH, ALT_DEPTH]].agg(["sum", "count"])
+
+        averages = np.floor((totals[(REF_DEPTH, "sum")] + totals[(ALT_DEPTH, "sum")]) / totals[(REF_DEPTH, "count")])
+
+        return averages.reindex(np.asarray(chr_pos, dtype="object")).values
+
+
     def impute_missing_values(self):
         """
         Implements the impute technique for any calls missing from both the primary xls and calls xls
@@ -157,19 +480,10 @@ class MPN_AML_Aggregator:
 
         if self.impute_technique == IMPUTE_AVG:
 
-            import math
-
-            # impute ref depth values for
-            for chr_pos in self.unique_chr_pos:
+            # overwrite NaN refDepth values with the average total reads across all samples for their <chromosome><position> pair
+            missing = self.aggregated_df[REF_DEPTH].isnull().values
 
-                # obtain every samples <chromosome><position> pair that does not have a NaN refDepth value
-                chr_pos_df = self.primary_df.loc[(self.primary_df[CHR_POS] == chr_pos)
-                                               & self.primary_df[REF_DEPTH].notnull()]
-
-                # overwrite NaN values with the average total reads across all samples for a <chromosome><position> pair
-                self.aggregated_df.loc[(self.aggregated_df[CHR_POS] == chr_pos)
-                                       & self.aggregated_df[REF_DEPTH].isnull(), REF_DEPTH] = \
-                    math.floor((chr_pos_df[REF_DEPTH].sum() + chr_pos_df[ALT_DEPTH].sum()) / len(chr_pos_df))
+            self.aggregated_df.loc[missing, REF_DEPTH] = self.average_total_reads(self.aggregated_df.loc[missing, CHR_POS])
 
         elif self.impute_technique == IMPUTE_ZERO:
 
@@ -181,15 +495,38 @@ class MPN_AML_Aggregator:
         Initializes dataframe for aggegration, then merges all dataframes
         """
 
-        on_list = [CHR_POS, POSITION, CHR, SAMPLE_NAMES] # columns to use for join
-
         self.init_aggregated_df()
 
-        # join the primary dataframe with the aggregated dataframe
-        self.aggregated_df = self.aggregated_df.merge(self.primary_df, how="left", on=on_list, suffixes=("_x", ""))
+        self.merge_dfs()
 
-        # join the calls dataframe with the aggregated dataframe
-        self.aggregated_df = self.aggregated_df.merge(self.calls_df.drop(columns=[ALT_DEPTH, VAF]), how="left", on=on_list, suffixes=("_x", ""))
+
+    def merge_dfs(self, previous_genes=None):
+        """
+        Fills the initialized aggregated dataframe with the altDepth, VAF and gene of the matching primary entries and the
+        refDepth of the matching calls entries (matched through a Locus_Sample_Index, rather than merged), then fills in missing values.
+        previous_genes (<chromosome><position> -> gene) is used to fill genes of previously aggregated <chromosome><position> pairs.
+        """
+
+        self.aggregated_df = self.aggregated_df.reset_index(drop=True)
+
+        # the index is kept to verify the aggregation with
+        self.index = Locus_Sample_Index(self.aggregated_df)
+
+        primary_rows = self.index.rows(self.primary_df)
+        calls_rows = self.index.rows(self.calls_df)
+
+        # an entry in the primary or calls dataframe more than once gets one aggregated row per match, as a merge would do
+        if self.index.has_duplicates(primary_rows) or self.index.has_duplicates(calls_rows):
+            self.merge_duplicated_dfs()
+        else:
+            for column, values, rows in [(ALT_DEPTH, self.primary_df[ALT_DEPTH], primary_rows),
+                                         (VAF, self.primary_df[VAF], primary_rows),
+                                         (GENE, self.primary_df[GENE], primary_rows),
+                                         (REF_DEPTH, self.calls_df[REF_DEPTH], calls_rows)]:
+
+                self.aggregated_df[column] = self.index.gather(values, rows)
+
+            self.aggregated_df[SOURCE] = self.sources(len(self.aggregated_df), primary_rows, calls_rows)
 
         # fill all NaN values in altDepth column as 0
         # we're doing this here because we want to set variant reads to 0 for all <chromosome><position> pairs for a sample that weren't in the primary spreadsheet
@@ -198,8 +535,22 @@ class MPN_AML_Aggregator:
         # fill all NaN values in VAF column as 0
         self.aggregated_df[VAF] = self.aggregated_df[VAF].fillna(0)
 
-        # fill gene column with the most common gene that the matching <chromosome><position> pairs have
-        self.aggregated_df[GENE] =  self.aggregated_df.groupby(CHR_POS)[GENE].transform(lambda grp: grp.fillna(grp[grp.notnull()].mode()[0]))
+        # genes are filled in as objects (a categorical gene column is slow to fill per group, and may not have the previous genes as categories)
+        self.aggregated_df[GENE] = self.aggregated_df[GENE].astype("object")
+
+        # previously aggregated <chromosome><position> pairs keep the gene they were given
+        if previous_genes is not None:
+            self.aggregated_df[GENE] = self.aggregated_df[GENE].fillna(self.aggregated_df[CHR_POS].map(previous_genes).astype("object"))
+
+        # fill gene column with the most common gene that the matching <chromosome><position> pairs have (pairs without a gene in any sample keep none)
+        self.aggregated_df[GENE] = self.aggregated_df[GENE].fillna(pd.Series(self.most_common_genes(self.aggregated_df), index=self.aggregated_df.index))
+
+        # the rest get the gene of the region they're in
+        if self.regions is not None and self.aggregated_df[GENE].isnull().any():
+
+            missing = self.aggregated_df[GENE].isnull().values
+
+            self.aggregated_df.loc[missing, GENE] = self.regions.annotate(self.aggregated_df.loc[missing, CHR], self.aggregated_df.loc[missing, POSITION])[ANN_GENE].values
 
         # impute ref depth values for missing variants
         self.impute_missing_values()
@@ -208,6 +559,223 @@ class MPN_AML_Aggregator:
         self.aggregated_df = self.aggregated_df[self.aggregated_columns]
 
         # need to reset column type since joins will change the underlying type (and so we"ll fail our checks)
-        self.aggregated_df[POSITION] = self.aggregated_df[POSITION].astype("int64")
-        self.aggregated_df[REF_DEPTH] = self.aggregated_df[REF_DEPTH].astype("int64")
-        self.aggregated_df[ALT_DEPTH] = self.aggregated_df[ALT_DEPTH].astype("int64")
+        self.reset_column_types()
+
+
+    def most_common_genes(self, dataframe):
+        """
+        Returns the most common gene of the <chromosome><position> pair of each row of dataframe (the first one in sorted order
+        if several are, as Series.mode does), NaN for pairs without a gene in any row
+        """
+
+        genes = pd.DataFrame({CHR_POS: np.asarray(dataframe[CHR_POS], dtype="object"), GENE: dataframe[GENE].values}).dropna()
+
+        counts = genes.groupby([CHR_POS, GENE]).size().rename("count").reset_index() \
+                      .sort_values(by=["count", GENE], ascending=[False, True]) \
+                      .drop_duplicates(CHR_POS)
+
+        return pd.Series(counts[GENE].values, index=counts[CHR_POS].values, dtype="object").reindex(np.asarray(dataframe[CHR_POS], dtype="object")).values
+
+
+    def merge_duplicated_dfs(self):
+        """
+        Left joins the primary and calls dataframes into the aggregated dataframe, for inputs with duplicated entries
+        """
+
+        # the joined dataframe has more rows than the index
+        self.index = None
+
+        on_list = [CHR_POS, POSITION, CHR, SAMPLE_NAMES] # columns to use for join
+
+        # join the primary dataframe with the aggregated dataframe
+        self.aggregated_df = self.aggregated_df.merge(self.primary_df, how="left", on=on_list, suffixes=("_x", ""), indicator="in_primary")
+
+        # join the calls dataframe with the aggregated dataframe
+        self.aggregated_df = self.aggregated_df.merge(self.calls_df.drop(columns=[ALT_DEPTH, VAF]), how="left", on=on_list, suffixes=("_x", ""), indicator="in_calls")
+
+        self.aggregated_df[SOURCE] = np.where(self.aggregated_df["in_primary"] == "both", SOURCE_PRIMARY,
+                                              np.where(self.aggregated_df["in_calls"] == "both", SOURCE_CALLS, SOURCE_IMPUTED))
+
+
+    def sources(self, n_rows, primary_rows, calls_rows):
+        """
+        Returns the source of each of n_rows aggregated rows: SOURCE_PRIMARY for rows matched to a primary entry,
+        SOURCE_CALLS for rows only matched to a calls entry and SOURCE_IMPUTED for the others (see Locus_Sample_Index.rows)
+        """
+
+        sources = np.full(n_rows, SOURCE_IMPUTED, dtype="object")
+
+        sources[calls_rows[calls_rows >= 0]] = SOURCE_CALLS
+        sources[primary_rows[primary_rows >= 0]] = SOURCE_PRIMARY
+
+        return sources
+
+
+    def reset_column_types(self):
+
+        self.aggregated_df[POSITION] = self.aggregated_df[POSITION].astype(self.dtypes[POSITION])
+        self.aggregated_df[REF_DEPTH] = self.aggregated_df[REF_DEPTH].astype(self.dtypes[REF_DEPTH])
+        self.aggregated_df[ALT_DEPTH] = self.aggregated_df[ALT_DEPTH].astype(self.dtypes[ALT_DEPTH])
+
+        # merges (and concatenating with a previously aggregated dataframe) can turn categoricals back into objects
+        if self.low_memory:
+            self.aggregated_df = self.lean_df(self.aggregated_df)
+
+
+    def process_incremental(self):
+        """
+        Aggregates only the entries missing from the previously aggregated dataframe (every <chromosome><position> pair
+        for new populations, and new <chromosome><position> pairs for the existing populations), then merges them into
+        the previously aggregated dataframe in the same order a full run would produce.
+        Existing populations whose primary or calls entries changed since are aggregated again, like new ones. If the previous
+        file was written with the same cache_dir, they're the ones whose population digests changed, otherwise their previous entries
+        are compared to the inputs (see changed_populations).
+
+        Most of a run is spent parsing the xlsx inputs, so an update is only much faster than a full run if its inputs (and the
+        previous file, unless it's a parquet/feather file) are cached. For 5000 loci x 21 samples on one CPU, a full run takes 20s,
+        while adding a population whose entries are already in the cached inputs takes 1s. Writing the aggregated data as xlsx
+        adds about 24s to either, so the files that are updated are best written as parquet/feather.
+        """
+
+        # aggregated files written before sources were recorded get them from the inputs
+        if SOURCE not in self.previous_df.columns:
+
+            index = Locus_Sample_Index(self.previous_df)
+
+            self.previous_df[SOURCE] = self.sources(len(self.previous_df), index.rows(self.primary_df), index.rows(self.calls_df))
+
+        # entries of populations or <chromosome><position> pairs that are no longer in the inputs are dropped (as they would be in a full run)
+        previous_df = self.previous_df.loc[self.previous_df[SAMPLE_NAMES].isin(self.populations)
+                                           & self.previous_df[CHR_POS].isin(self.unique_chr_pos), self.aggregated_columns].copy()
+
+        if self.previous_digests is not None:
+            changed_populations = [pop for pop in pd.unique(previous_df[SAMPLE_NAMES]) if self.previous_digests.get(str(pop)) != self.digests.get(str(pop))]
+        else:
+            changed_populations = self.changed_populations(previous_df)
+
+        changed_df = previous_df[previous_df[SAMPLE_NAMES].isin(changed_populations)]
+        previous_df = previous_df.drop(index=changed_df.index)
+
+        previous_populations = set(previous_df[SAMPLE_NAMES])
+        previous_chr_pos = set(previous_df[CHR_POS])
+
+        new_populations = [pop for pop in self.populations if pop not in previous_populations]
+        old_populations = [pop for pop in self.populations if pop in previous_populations]
+        new_chr_pos = [chr_pos for chr_pos in self.unique_chr_pos if chr_pos not in previous_chr_pos]
+
+        new_dfs = []
+
+        if new_populations:
+            self.init_aggregated_df(new_populations, self.unique_chr_pos)
+            new_dfs.append(self.aggregated_df)
+
+        if old_populations and new_chr_pos:
+            self.init_aggregated_df(old_populations, new_chr_pos)
+            new_dfs.append(self.aggregated_df)
+
+        if new_dfs:
+
+            self.aggregated_df = pd.concat(new_dfs)
+
+            self.merge_dfs(previous_genes=previous_df.drop_duplicates(CHR_POS).set_index(CHR_POS)[GENE])
+
+            # averages used for imputation include the primary entries of the new (and changed) populations
+            if self.impute_technique == IMPUTE_AVG:
+                self.reimpute_previous_values(previous_df, new_populations, changed_df)
+
+            self.aggregated_df = pd.concat([previous_df, self.aggregated_df])
+
+        else:
+
+            self.aggregated_df = previous_df
+
+        # order by <chromosome><position>, then by population, as init_aggregated_df does for a full run
+        self.aggregated_df[CHR_NUM] = self.aggregated_df[CHR].str.extract("(\d+)", expand=False).astype(int, errors = "ignore").fillna(0).astype(int)
+        self.aggregated_df["pop_order"] = pd.Index(self.populations).get_indexer(self.aggregated_df[SAMPLE_NAMES])
+        self.aggregated_df["chr_pos_order"] = pd.Index(self.unique_chr_pos).get_indexer(self.aggregated_df[CHR_POS])
+
+        self.aggregated_df = self.aggregated_df.sort_values(by=[CHR_NUM, POSITION, "pop_order", "chr_pos_order"]) \
+                                               .drop(columns=[CHR_NUM, "pop_order", "chr_pos_order"]) \
+                                               .reset_index(drop=True)
+
+        # the index of the new entries no longer matches the rows
+        self.index = None
+
+        self.reset_column_types()
+
+
+    def cache_aggregated_file(self, file_name, sheet_name="Sheet1"):
+        """
+        Records the population digests of the inputs of the aggregated file written, and caches the aggregated dataframe
+        as read back from it if it's an xlsx (so updating it doesn't need it parsed)
+        """
+
+        self.cache.write_digests(self.digests, file_name)
+
+        if table_format(file_name, self.output_format) == FORMAT_XLSX:
+
+            # the index is written as the first (unnamed) column, and the columns are read back with the full run dtypes
+            cached_df = self.aggregated_df.astype(self.dtypes)
+            cached_df.insert(0, "Unnamed: 0", cached_df.index.values)
+
+            self.cache.write(cached_df, file_name, sheet_name)
+
+
+    def changed_populations(self, previous_df):
+        """
+        Returns the previously aggregated populations with an entry whose source, depths, VAF or gene no longer match
+        the primary and calls dataframes (matched through a Locus_Sample_Index). With duplicated entries, every population is changed.
+        """
+
+        index = Locus_Sample_Index(previous_df)
+
+        primary_rows = index.rows(self.primary_df)
+        calls_rows = index.rows(self.calls_df)
+
+        if index.has_duplicates(primary_rows) or index.has_duplicates(calls_rows):
+            return list(index.samples)
+
+        in_primary = primary_rows >= 0
+        in_calls = calls_rows >= 0
+
+        changed = np.asarray(previous_df[SOURCE].astype(str)) != self.sources(len(previous_df), primary_rows, calls_rows)
+
+        for column, values, rows, matched in [(ALT_DEPTH, self.primary_df[ALT_DEPTH], primary_rows, in_primary),
+                                              (VAF, self.primary_df[VAF], primary_rows, in_primary),
+                                              (REF_DEPTH, self.calls_df[REF_DEPTH], calls_rows, in_calls)]:
+
+            current = index.gather(np.asarray(values, dtype="float64"), rows)
+            matched_rows = rows[matched]
+
+            changed[matched_rows] |= ~np.isclose(current[matched_rows], np.asarray(previous_df[column], dtype="float64")[matched_rows], equal_nan=True)
+
+        # genes missing from the primary entries are filled in from the other entries, so only given genes are compared
+        genes = pd.Series(index.gather(np.asarray(self.primary_df[GENE], dtype="object"), primary_rows, None))
+        given = genes.notnull().values
+
+        changed |= given & (genes.values != np.asarray(previous_df[GENE], dtype="object"))
+
+        return list(pd.unique(np.asarray(previous_df[SAMPLE_NAMES], dtype="object")[changed]))
+
+
+    def reimpute_previous_values(self, previous_df, new_populations, changed_df=None):
+        """
+        Overwrites the imputed refDepth of previously aggregated entries whose <chromosome><position> pair
+        has new entries in the primary dataframe (from the new populations), or lost some (previous entries of changed populations
+        in changed_df), since their average changed
+        """
+
+        new_primary_chr_pos = self.primary_df.loc[self.primary_df[SAMPLE_NAMES].isin(new_populations), CHR_POS]
+
+        if changed_df is not None:
+            new_primary_chr_pos = pd.concat([new_primary_chr_pos, changed_df.loc[changed_df[SOURCE].astype(str) == SOURCE_PRIMARY, CHR_POS]])
+
+        affected_chr_pos = new_primary_chr_pos[new_primary_chr_pos.isin(previous_df[CHR_POS])].unique()
+
+        if len(affected_chr_pos) == 0:
+            return
+
+        # previously imputed entries are the ones found in neither the primary nor calls dataframe
+        imputed_index = previous_df.index[previous_df[CHR_POS].isin(affected_chr_pos) & previous_df[SOURCE].eq(SOURCE_IMPUTED)]
+
+        previous_df.loc[imputed_index, REF_DEPTH] = self.average_total_reads(previous_df.loc[imputed_index, CHR_POS])
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import sys, os
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+
+from mpn_aml_columns import *
+
+
+class Locus_Sample_Index:
+    """
+    Integer index of the (<chromosome><position>, sample) entries of an aggregated dataframe.
+
+    Every entry gets the key <locus number> * <number of samples> + <sample number>, and the row it is in is kept in an
+    array of all keys, so the entries of another dataframe (e.g. primary or calls) are matched to aggregated rows by position
+    instead of merging on the (string) columns. Entries of <chromosome><position> pairs or samples that are not aggregated
+    are matched to row -1.
+    """
+
+    def __init__(self, aggregated_df):
+
+        self.loci = pd.Index(np.asarray(aggregated_df[CHR_POS].unique(), dtype="object"))
+        self.samples = pd.Index(np.asarray(aggregated_df[SAMPLE_NAMES].unique(), dtype="object"))
+
+        self.n_rows = len(aggregated_df)
+
+        self.row_of_key = np.full(len(self.loci) * len(self.samples), -1, dtype="int64")
+        self.row_of_key[self.keys(aggregated_df)] = np.arange(self.n_rows)
+
+
+    def keys(self, dataframe):
+        """
+        Returns the key of each entry of dataframe (-1 if its <chromosome><position> pair or sample is not indexed)
+        """
+
+        loci = self.loci.get_indexer(np.asarray(dataframe[CHR_POS], dtype="object"))
+        samples = self.samples.get_indexer(np.asarray(dataframe[SAMPLE_NAMES], dtype="object"))
+
+        return np.where((loci >= 0) & (samples >= 0), loci * len(self.samples) + samples, -1)
+
+
+    def rows(self, dataframe):
+        """
+        Returns the aggregated row of each entry of dataframe (-1 if it has no aggregated row)
+        """
+
+        keys = self.keys(dataframe)
+
+        return np.where(keys >= 0, self.row_of_key[keys], -1)
+
+
+    def has_duplicates(self, rows):
+        """
+        Returns whether more than one entry is matched to the same aggregated row
+        """
+
+        matched = rows[rows >= 0]
+
+        return len(matched) > 0 and np.bincount(matched, minlength=self.n_rows).max() > 1
+
+
+    def gather(self, values, rows, fill_value=np.nan):
+        """
+        Returns an array with one value per aggregated row: the value of the entry matched to it (see rows),
+        or fill_value if it has none. Integer values are upcast when filled with NaN, categoricals stay categorical.
+        """
+
+        matched = rows >= 0
+
+        source = np.full(self.n_rows, -1, dtype="int64")
+        source[rows[matched]] = np.nonzero(matched)[0]
+
+        return pd.api.extensions.take(pd.Series(values).values, source, allow_fill=True, fill_value=fill_value)
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+import sys, os
+
+sys.path.append(os.environ["UTILS_DIR"] + "/common")
+
+from table_io import FORMAT_PARQUET, _require_pyarrow, read_table, write_table
+
+HASH_BLOCK_SIZE = 2**20
+
+
+def population_digests(dataframe, columns, populations):
+    """
+    Returns {population: digest} of the entries of each population in dataframe (populations has the population of each entry),
+    the digest of a population only changes if one of its entries was added, removed or changed (not if they were reordered)
+    """
+
+    hashes = pd.DataFrame({"population": np.asarray(populations, dtype="str"),
+                           "hash": pd.util.hash_pandas_object(dataframe[columns], index=False).values}).sort_values(by=["population", "hash"])
+
+    return {population: hashlib.sha256(group["hash"].values.tobytes()).hexdigest() for population, group in hashes.groupby("population", sort=False)}
+
+
+class Input_Cache:
+    """
+    Parsed copies of the xlsx files read by an aggregator, kept as parquet files in cache_dir under the content hash of the xlsx
+    (and the sheet, header and columns read), so an xlsx that hasn't changed since an earlier run isn't parsed again.
+
+    The population digests (see population_digests) of the inputs an aggregated file was made from are kept under the content hash
+    of the aggregated file, so an incremental update can tell which populations changed without comparing their previous entries.
+    """
+    def __init__(self, cache_dir):
+
+        _require_pyarrow(FORMAT_PARQUET)
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.cache_dir = cache_dir
+        self.recorded = {}
+
+
+    def file_digest(self, file_name):
+        """
+        Returns the sha256 of a file, which isn't read again while its size and modification time stay the same
+        """
+
+        stat = os.stat(file_name)
+        recorded = self.recorded.get(file_name)
+
+        if recorded and recorded[1:] == (stat.st_size, stat.st_mtime_ns):
+            return recorded[0]
+
+        sha256 = hashlib.sha256()
+
+        with open(file_name, "rb") as in_file:
+            for block in iter(lambda: in_file.read(HASH_BLOCK_SIZE), b""):
+                sha256.update(block)
+
+        self.recorded[file_name] = (sha256.hexdigest(), stat.st_size, stat.st_mtime_ns)
+
+        return sha256.hexdigest()
+
+
+    def cache_file(self, file_name, suffix, *key):
+
+        key = hashlib.sha256(json.dumps([self.file_digest(file_name)] + list(key), default=str).encode()).hexdigest()
+
+        return os.path.join(self.cache_dir, key + suffix)
+
+
+    def read(self, file_name, sheet_name=0, header=0, columns=None, dtype=None):
+        """
+        Returns the cached dataframe of a sheet of an xlsx file (None if it isn't cached)
+        """
+
+        cache_file = self.cache_file(file_name, ".parquet", sheet_name, header, columns, dtype)
+
+        if not os.path.exists(cache_file):
+            return None
+
+        return read_table(cache_file, header=header)
+
+
+    def write(self, dataframe, file_name, sheet_name=0, header=0, columns=None, dtype=None):
+        """
+        Caches the dataframe read from a sheet of an xlsx file, unless it's already cached or its columns can't be written to parquet
+        """
+
+        cache_file = self.cache_file(file_name, ".parquet", sheet_name, header, columns, dtype)
+
+        if os.path.exists(cache_file):
+            return
+
+        try:
+            # written to a temporary file first, so a cache file is never read half written
+            write_table(dataframe, cache_file + ".tmp", fmt=FORMAT_PARQUET)
+            os.replace(cache_file + ".tmp", cache_file)
+
+        except (ValueError, TypeError):
+            # e.g. an object column mixing strings and numbers
+            if os.path.exists(cache_file + ".tmp"):
+                os.remove(cache_file + ".tmp")
+
+
+    def read_digests(self, aggregated_file):
+        """
+        Returns the population digests recorded for an aggregated file (None if none were)
+        """
+
+        digests_file = self.cache_file(aggregated_file, ".digests.json")
+
+        if not os.path.exists(digests_file):
+            return None
+
+        with open(digests_file) as digests_json:
+            return json.load(digests_json)
+
+
+    def write_digests(self, digests, aggregated_file):
+
+        with open(self.cache_file(aggregated_file, ".digests.json"), "w") as digests_json:
+            json.dump(digests, digests_json)